@@ -0,0 +1,419 @@
+import io
+import json
+import time
+import shutil
+from datetime import datetime
+from datetime import timedelta
+from pathlib import Path
+import logging
+
+import cv2
+import numpy
+import PIL
+from PIL import Image
+
+from .keogram import KeogramGenerator
+from .starTrails import StarTrailGenerator
+
+from .flask.models import IndiAllSkyDbCameraTable
+from .flask.models import IndiAllSkyDbImageTable
+
+from sqlalchemy.sql.expression import false as sa_false
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllSkyKeogramStarTrailAccumulator(object):
+    """Builds the keogram and star trail for the current night (or day) as images are stored
+
+    The generator state is checkpointed to disk so it survives restarts.  The end of night
+    processing loads the checkpoint and only processes the images stored after it.
+    """
+
+    state_filename = 'state.npz'
+
+    # orphaned state is removed after this age
+    state_expire_days = 3
+
+
+    def __init__(self, config, bin_v, mask=None):
+        self.config = config
+        self.bin_v = bin_v
+
+        self._mask = mask
+
+        self.checkpoint_frames = int(self.config.get('KEOGRAM_INCREMENTAL_CHECKPOINT', 20))
+
+        self._key = None  # (camera_id, dayDate, night)
+
+        self.kg = None
+        self.stg = None
+
+        self._last_timestamp = None
+        self._frames_since_checkpoint = 0
+
+        # night/day periods that have been handed to the end of period processing
+        self._closed_keys = set()
+
+
+        if self.config.get('IMAGE_FOLDER'):
+            self.image_dir = Path(self.config['IMAGE_FOLDER']).absolute()
+        else:
+            self.image_dir = Path(__file__).parent.parent.joinpath('html', 'images').absolute()
+
+        # state may be deleted if orphaned
+        self.state_base_dir = self.image_dir.joinpath('scratch', 'accumulator')
+
+
+    def newKeogramGenerator(self):
+        kg = KeogramGenerator(
+            self.config,
+            skip_frames=self.config.get('TIMELAPSE_SKIP_FRAMES', 4),
+        )
+        kg.angle = self.config['KEOGRAM_ANGLE']
+        kg.h_scale_factor = self.config['KEOGRAM_H_SCALE']
+        kg.v_scale_factor = self.config['KEOGRAM_V_SCALE']
+        kg.crop_top = self.config.get('KEOGRAM_CROP_TOP', 0)
+        kg.crop_bottom = self.config.get('KEOGRAM_CROP_BOTTOM', 0)
+
+        return kg
+
+
+    def newStarTrailGenerator(self, camera, timelapse_dir=None):
+        stg = StarTrailGenerator(
+            self.config,
+            self.bin_v,
+            skip_frames=self.config.get('TIMELAPSE_SKIP_FRAMES', 4),
+            mask=self._mask,
+            timelapse_dir=timelapse_dir,
+        )
+        stg.max_adu = self.config['STARTRAILS_MAX_ADU']
+        stg.mask_threshold = self.config['STARTRAILS_MASK_THOLD']
+        stg.pixel_cutoff_threshold = self.config['STARTRAILS_PIXEL_THOLD']
+        stg.min_stars = self.config.get('STARTRAILS_MIN_STARS', 0)
+        stg.latitude = camera.latitude
+        stg.longitude = camera.longitude
+        stg.sun_alt_threshold = self.config['STARTRAILS_SUN_ALT_THOLD']
+
+        if self.config['STARTRAILS_MOONMODE_THOLD']:
+            stg.moonmode_alt = self.config['NIGHT_MOONMODE_ALT_DEG']
+            stg.moonmode_phase = self.config['NIGHT_MOONMODE_PHASE']
+        else:
+            stg.moon_alt_threshold = self.config['STARTRAILS_MOON_ALT_THOLD']
+            stg.moon_phase_threshold = self.config['STARTRAILS_MOON_PHASE_THOLD']
+
+        return stg
+
+
+    def getStateDir(self, camera_id, day_date, night):
+        if night:
+            timeofday = 'night'
+        else:
+            timeofday = 'day'
+
+        return self.state_base_dir.joinpath('ccd{0:d}_{1:s}_{2:s}'.format(camera_id, day_date.strftime('%Y%m%d'), timeofday))
+
+
+    def add(self, camera, image_entry, image_file_p, image_data):
+        key = (camera.id, image_entry.dayDate, bool(image_entry.night))
+
+        if key in self._closed_keys:
+            # the end of period processing already owns the state
+            return
+
+
+        if key != self._key:
+            if self._key:
+                # save the final state of the previous night/day
+                self.checkpoint()
+
+            self._start(camera, image_entry)
+
+
+        if not self.kg:
+            # not accumulating images for this night/day
+            return
+
+
+        self._processImage(image_file_p, image_data, image_entry)
+
+
+        self._frames_since_checkpoint += 1
+        if self._frames_since_checkpoint >= self.checkpoint_frames:
+            self.checkpoint()
+
+
+    def close(self, camera_id, day_date, night):
+        ### Save the final state of the night/day, later images for the period are ignored
+        key = (camera_id, day_date, bool(night))
+
+        if key == self._key:
+            self.checkpoint()
+
+            self.kg = None
+            self.stg = None
+
+        self._closed_keys.add(key)
+
+
+    def _start(self, camera, image_entry):
+        camera_id, day_date, night = camera.id, image_entry.dayDate, bool(image_entry.night)
+
+        self._key = (camera_id, day_date, night)
+        self._last_timestamp = None
+        self._frames_since_checkpoint = 0
+
+        self._expireStates()
+
+
+        self.kg = self.newKeogramGenerator()
+
+        if night:
+            self.stg = self.newStarTrailGenerator(
+                camera,
+                timelapse_dir=self.getStateDir(camera_id, day_date, night).joinpath('timelapse'),
+            )
+        else:
+            self.stg = None
+
+
+        last_timestamp = self.loadState(camera_id, day_date, night, self.kg, self.stg)
+
+        if isinstance(last_timestamp, type(None)):
+            earlier_images = self._getImageEntries(camera_id, day_date, night, before_date=image_entry.createDate).count()
+
+            if earlier_images:
+                # rebuilding the whole night here would block image processing
+                logger.warning('Incremental keogram started with %d existing images, end of night processing will use all images', earlier_images)
+                self.kg = None
+                self.stg = None
+
+            return
+
+
+        # process images stored after the last checkpoint
+        self._last_timestamp = last_timestamp
+
+        catchup_entries = self._getImageEntries(
+            camera_id,
+            day_date,
+            night,
+            after_date=datetime.fromtimestamp(last_timestamp),
+            before_date=image_entry.createDate,
+        )
+
+        catchup_start = time.time()
+        catchup_count = 0
+
+        for entry in catchup_entries:
+            entry_file_p = Path(entry.getFilesystemPath())
+
+            entry_data = self._readImage(entry_file_p)
+            if isinstance(entry_data, type(None)):
+                continue
+
+            self._processImage(entry_file_p, entry_data, entry)
+            catchup_count += 1
+
+
+        if catchup_count:
+            logger.warning('Incremental keogram caught up %d images in %0.1f s', catchup_count, time.time() - catchup_start)
+            self.checkpoint()
+
+
+    def _processImage(self, image_file_p, image_data, image_entry):
+        self.kg.processImage(image_file_p, image_data)
+
+        if self.stg:
+            if self.config.get('STARTRAILS_USE_DB_DATA', True):
+                adu = image_entry.adu
+                star_count = image_entry.stars  # can be None
+            else:
+                adu, star_count = None, None
+
+            self.stg.processImage(image_file_p, image_data, adu=adu, star_count=star_count)
+
+
+        self._last_timestamp = image_entry.createDate.timestamp()
+
+
+    def _getImageEntries(self, camera_id, day_date, night, after_date=None, before_date=None):
+        image_entries = IndiAllSkyDbImageTable.query\
+            .join(IndiAllSkyDbImageTable.camera)\
+            .filter(IndiAllSkyDbCameraTable.id == camera_id)\
+            .filter(IndiAllSkyDbImageTable.dayDate == day_date)\
+            .filter(IndiAllSkyDbImageTable.night == night)\
+            .filter(IndiAllSkyDbImageTable.exclude == sa_false())
+
+        if after_date:
+            image_entries = image_entries.filter(IndiAllSkyDbImageTable.createDate > after_date)
+
+        if before_date:
+            image_entries = image_entries.filter(IndiAllSkyDbImageTable.createDate < before_date)
+
+
+        return image_entries.order_by(IndiAllSkyDbImageTable.createDate.asc())
+
+
+    def _readImage(self, image_file_p):
+        if not image_file_p.exists():
+            logger.error('File not found: %s', image_file_p)
+            return None
+
+        if image_file_p.stat().st_size == 0:
+            return None
+
+
+        if image_file_p.suffix in ('.png',):
+            # opencv is faster than Pillow with PNG
+            image_data = cv2.imread(str(image_file_p), cv2.IMREAD_COLOR)
+
+            if isinstance(image_data, type(None)):
+                logger.error('Unable to read %s', image_file_p)
+                return None
+        else:
+            try:
+                with Image.open(str(image_file_p)) as img:
+                    image_data = cv2.cvtColor(numpy.array(img), cv2.COLOR_RGB2BGR)
+            except PIL.UnidentifiedImageError:
+                logger.error('Unable to read %s', image_file_p)
+                return None
+
+
+        return image_data
+
+
+    def checkpoint(self):
+        if not self.kg:
+            return
+
+        if isinstance(self._last_timestamp, type(None)):
+            # nothing processed
+            return
+
+
+        camera_id, day_date, night = self._key
+
+        state_dir = self.getStateDir(camera_id, day_date, night)
+        if not state_dir.exists():
+            state_dir.mkdir(mode=0o755, parents=True)
+
+
+        checkpoint_start = time.time()
+
+        arrays = dict()
+
+        metadata = {
+            'last_timestamp' : self._last_timestamp,
+            'keogram_angle'  : self.kg.angle,
+            'keogram'        : self._splitState('keogram', self.kg.getState(), arrays),
+        }
+
+        if self.stg:
+            metadata['startrail'] = self._splitState('startrail', self.stg.getState(), arrays)
+
+
+        arrays['metadata'] = numpy.array(json.dumps(metadata))
+
+
+        # write to a temporary file first in case of a crash
+        state_file_p = state_dir.joinpath(self.state_filename)
+        state_tmp_file_p = state_dir.joinpath('{0:s}.tmp'.format(self.state_filename))
+
+        with io.open(str(state_tmp_file_p), 'w+b') as f_state:
+            numpy.savez(f_state, **arrays)
+
+        state_tmp_file_p.replace(state_file_p)
+
+
+        self._frames_since_checkpoint = 0
+
+        logger.info('Incremental keogram checkpoint in %0.4f s', time.time() - checkpoint_start)
+
+
+    def loadState(self, camera_id, day_date, night, kg, stg):
+        ### returns the timestamp of the last image in the checkpoint, or None
+        state_file_p = self.getStateDir(camera_id, day_date, night).joinpath(self.state_filename)
+
+        if not state_file_p.exists():
+            return None
+
+
+        try:
+            with numpy.load(str(state_file_p), allow_pickle=False) as npz:
+                arrays = {k: npz[k] for k in npz.files}
+        except (OSError, ValueError) as e:
+            logger.error('Unable to load incremental keogram state: %s', str(e))
+            return None
+
+
+        metadata = json.loads(str(arrays.pop('metadata')))
+
+        if metadata['keogram_angle'] != kg.angle:
+            logger.warning('Keogram angle changed, ignoring incremental keogram state')
+            return None
+
+
+        kg.setState(self._joinState('keogram', metadata['keogram'], arrays))
+
+        if stg and metadata.get('startrail'):
+            stg.setState(self._joinState('startrail', metadata['startrail'], arrays))
+
+
+        logger.info('Loaded incremental keogram state: %s', state_file_p)
+
+        return metadata['last_timestamp']
+
+
+    def removeState(self, camera_id, day_date, night):
+        state_dir = self.getStateDir(camera_id, day_date, night)
+
+        if not state_dir.exists():
+            return
+
+        logger.info('Removing incremental keogram state: %s', state_dir)
+        shutil.rmtree(str(state_dir), ignore_errors=True)
+
+
+    def _expireStates(self):
+        if not self.state_base_dir.exists():
+            return
+
+        expire_ts = (datetime.now() - timedelta(days=self.state_expire_days)).timestamp()
+
+        for state_dir in self.state_base_dir.iterdir():
+            if not state_dir.is_dir():
+                continue
+
+            if state_dir.stat().st_mtime > expire_ts:
+                continue
+
+            logger.warning('Removing old incremental keogram state: %s', state_dir)
+            shutil.rmtree(str(state_dir), ignore_errors=True)
+
+
+    def _splitState(self, prefix, state, arrays):
+        # arrays are stored natively, everything else is stored as json
+        metadata = dict()
+        for k, v in state.items():
+            if isinstance(v, numpy.ndarray):
+                arrays['{0:s}__{1:s}'.format(prefix, k)] = v
+                metadata[k] = '__array__'
+            elif isinstance(v, numpy.generic):
+                metadata[k] = v.item()
+            else:
+                metadata[k] = v
+
+        return metadata
+
+
+    def _joinState(self, prefix, metadata, arrays):
+        state = dict()
+        for k, v in metadata.items():
+            if v == '__array__':
+                state[k] = arrays['{0:s}__{1:s}'.format(prefix, k)]
+            else:
+                state[k] = v
+
+        return state
@@ -46,6 +46,8 @@ from .flask.models import IndiAllSkyDbStarTrailsVideoTable
 from .flask.models import IndiAllSkyDbPanoramaImageTable
 from .flask.models import IndiAllSkyDbPanoramaVideoTable
 from .flask.models import IndiAllSkyDbTaskQueueTable
+from .flask.models import IndiAllSkyDbCalendarTable
+from .flask.models import IndiAllSkyDbImageRollupTable
 
 from sqlalchemy import or_
 from sqlalchemy.orm.exc import NoResultFound
@@ -65,6 +67,7 @@ class IndiAllSky(object):
     aurora_tasks_offset = 3600          # 60 minutes
     smoke_tasks_offset = 10800          # 3 hours
     sat_data_tasks_offset = 259200      # 3 days
+    sat_pass_tasks_offset = 3600        # 60 minutes
 
 
     def __init__(self):
@@ -112,6 +115,7 @@ class IndiAllSky(object):
         self.aurora_tasks_time = time.time()    # run asap
         self.smoke_tasks_time = time.time()     # run asap
         self.sat_data_tasks_time = time.time()  # run asap
+        self.sat_pass_tasks_time = time.time() + self.sat_pass_tasks_offset  # the tle data update predicts passes
 
 
         self.position_av = Array('f', [
@@ -167,6 +171,14 @@ class IndiAllSky(object):
         self.image_worker = None
         self.image_worker_idx = 0
 
+        self.frame_buffer = None  # shared memory is created when the workers are started
+
+        # bounded queue between the image worker and the output worker
+        self.image_output_q = Queue(maxsize=self.config.get('IMAGE_OUTPUT_QUEUE_MAX', 3))
+        self.image_output_error_q = Queue()
+        self.image_output_worker = None
+        self.image_output_worker_idx = 0
+
         self.video_q = Queue()
         self.video_error_q = Queue()
         self.video_worker = None
@@ -321,6 +333,28 @@ class IndiAllSky(object):
         return str(system_type)
 
 
+    def _initFrameBuffer(self):
+        if self.frame_buffer:
+            self.frame_buffer.close()
+            self.frame_buffer = None
+
+
+        if not self.config.get('IMAGE_SHARED_MEMORY'):
+            return
+
+
+        from .sharedFrameBuffer import IndiAllSkySharedFrameBuffer
+
+        try:
+            self.frame_buffer = IndiAllSkySharedFrameBuffer(
+                self.config.get('IMAGE_SHARED_MEMORY_SLOTS', 4),
+                self.config.get('IMAGE_SHARED_MEMORY_SLOT_MB', 128) * 1024 * 1024,
+            )
+        except OSError as e:
+            logger.error('Unable to create shared memory frame buffer, using temporary files: %s', str(e))
+            self.frame_buffer = None
+
+
     def _startCaptureWorker(self):
         from .capture import CaptureWorker
 
@@ -355,6 +389,7 @@ class IndiAllSky(object):
             self.sensors_user_av,
             self.night_v,
             self.moonmode_v,
+            frame_buffer=self.frame_buffer,
         )
         self.capture_worker.start()
 
@@ -391,8 +426,19 @@ class IndiAllSky(object):
                 pass
 
 
+            if self.frame_buffer:
+                # slots held by the failed worker are never released
+                self.frame_buffer.reset()
+
+
         self.image_worker_idx += 1
 
+        if self.config.get('IMAGE_OUTPUT_WORKER'):
+            image_output_q = self.image_output_q
+        else:
+            image_output_q = None
+
+
         logger.info('Starting Image-%d worker', self.image_worker_idx)
         self.image_worker = ImageWorker(
             self.image_worker_idx,
@@ -408,6 +454,9 @@ class IndiAllSky(object):
             self.sensors_user_av,
             self.night_v,
             self.moonmode_v,
+            frame_buffer=self.frame_buffer,
+            output_q=image_output_q,
+            video_q=self.video_q,
         )
         self.image_worker.start()
 
@@ -440,6 +489,61 @@ class IndiAllSky(object):
         self.image_worker.join()
 
 
+    def _startImageOutputWorker(self):
+        from .imageOutput import ImageOutputWorker
+
+        if not self.config.get('IMAGE_OUTPUT_WORKER'):
+            return
+
+
+        if self.image_output_worker:
+            if self.image_output_worker.is_alive():
+                return
+
+            try:
+                image_output_error, image_output_traceback = self.image_output_error_q.get_nowait()
+                for line in image_output_traceback.split('\n'):
+                    logger.error('Image output worker exception: %s', line)
+            except queue.Empty:
+                pass
+
+
+        self.image_output_worker_idx += 1
+
+        logger.info('Starting ImageOutput-%d worker', self.image_output_worker_idx)
+        self.image_output_worker = ImageOutputWorker(
+            self.image_output_worker_idx,
+            self.config,
+            self.image_output_error_q,
+            self.image_output_q,
+            self.upload_q,
+            self.video_q,
+            self.position_av,
+            self.sensors_temp_av,
+            self.sensors_user_av,
+        )
+        self.image_output_worker.start()
+
+
+    def _stopImageOutputWorker(self):
+        if not self.image_output_worker:
+            return
+
+        if not self.image_output_worker.is_alive():
+            return
+
+        if self._terminate:
+            logger.info('Terminating Image output worker')
+            self.image_output_worker.terminate()
+            self.image_output_worker.join()  # the bounded queue may be full
+            return
+
+        logger.info('Stopping Image output worker')
+
+        self.image_output_q.put({'stop' : True})
+        self.image_output_worker.join()
+
+
     def _startVideoWorker(self):
         from .video import VideoWorker
 
@@ -637,6 +741,9 @@ class IndiAllSky(object):
             self._startup()
 
 
+        self._initFrameBuffer()
+
+
         while True:
             if self._shutdown:
                 with app.app_context():
@@ -646,10 +753,14 @@ class IndiAllSky(object):
                 logger.warning('Shutting down')
                 self._stopCaptureWorker()  # stop this first so image queue is cleared out
                 self._stopImageWorker()
+                self._stopImageOutputWorker()  # stop after the image worker so the output queue is cleared out
                 self._stopVideoWorker()
                 self._stopSensorWorker()
                 self._stopFileUploadWorkers()
 
+                if self.frame_buffer:
+                    self.frame_buffer.close()
+
 
                 with app.app_context():
                     self._miscDb.addNotification(
@@ -673,6 +784,7 @@ class IndiAllSky(object):
                 self._reload = False
                 self._stopCaptureWorker()  # stop this first so image queue is cleared out
                 self._stopImageWorker()
+                self._stopImageOutputWorker()  # stop after the image worker so the output queue is cleared out
                 self._stopVideoWorker()
                 self._stopSensorWorker()
                 self._stopFileUploadWorkers()
@@ -688,6 +800,7 @@ class IndiAllSky(object):
             # restart worker if it has failed
             self._startCaptureWorker()
             self._startImageWorker()
+            self._startImageOutputWorker()
             self._startVideoWorker()
             self._startSensorWorker()
             self._startFileUploadWorkers()
@@ -724,6 +837,14 @@ class IndiAllSky(object):
             return
 
 
+        # workers are stopped, shared memory may be recreated
+        self._initFrameBuffer()
+
+
+        # the output worker is stopped, recreate the queue to apply the new size
+        self.image_output_q = Queue(maxsize=self.config.get('IMAGE_OUTPUT_QUEUE_MAX', 3))
+
+
         # indicate newer config is loaded
         self._miscDb.setState('CONFIG_ID', self._config_obj.config_id)
 
@@ -1120,6 +1241,11 @@ class IndiAllSky(object):
             db.session.rollback()
 
 
+        # bulk inserts do not update the calendar or the rollups
+        IndiAllSkyDbCalendarTable.rebuild(db.session, camera_id=camera_id)
+        IndiAllSkyDbImageRollupTable.rebuild(db.session, camera_id=camera_id)
+
+
         ### Panorama images
         file_list_panorama_images = filter(lambda p: 'panoram' in p.name, file_list_images)
 
@@ -1367,6 +1493,14 @@ class IndiAllSky(object):
             self._updateSatelliteTleData()
 
 
+        # satellite pass table roll forward
+        if self.sat_pass_tasks_time < now:
+            self.sat_pass_tasks_time = now + self.sat_pass_tasks_offset
+
+            logger.info('Creating satellite pass update task')
+            self._updateSatellitePasses()
+
+
     def _updateAuroraData(self, task_state=TaskQueueState.QUEUED):
 
         active_cameras = IndiAllSkyDbCameraTable.query\
@@ -1436,6 +1570,32 @@ class IndiAllSky(object):
         self.video_q.put({'task_id' : task.id})
 
 
+    def _updateSatellitePasses(self, task_state=TaskQueueState.QUEUED):
+
+        active_cameras = IndiAllSkyDbCameraTable.query\
+            .filter(IndiAllSkyDbCameraTable.hidden == sa_false())\
+            .order_by(IndiAllSkyDbCameraTable.id.desc())
+
+
+        for camera in active_cameras:
+            jobdata = {
+                'action' : 'updateSatellitePasses',
+                'kwargs' : {
+                    'camera_id' : camera.id,
+                },
+            }
+
+            task = IndiAllSkyDbTaskQueueTable(
+                queue=TaskQueueQueue.VIDEO,
+                state=task_state,
+                data=jobdata,
+            )
+            db.session.add(task)
+            db.session.commit()
+
+            self.video_q.put({'task_id' : task.id})
+
+
     def updateConfigLocation(self, latitude, longitude, elevation, camera_id):
         logger.warning('Updating indi-allsky config with new geographic location')
 
@@ -20,48 +20,30 @@ class IndiAllskyAuroraUpdate(object):
     ovation_json_url = 'https://services.swpc.noaa.gov/json/ovation_aurora_latest.json'
     kpindex_json_url = 'https://services.swpc.noaa.gov/products/noaa-planetary-k-index.json'
 
+    # the update tasks for each camera are run together, reuse the ovation grid
+    ovation_cache_time = 600  # seconds
+
+    # 1 degree is ~69 miles, 7 degrees should be just under 500 miles
+    ovation_radius = 7
+
+    # shared by all instances in the process
+    _ovation_grid = None
+    _ovation_grid_time = 0
+
 
     def __init__(self, config):
         self.config = config
 
         self._miscDb = miscDb(self.config)
 
-        self.ovation_json_data = None
         self.kpindex_json_data = None
 
 
     def update(self, camera):
+        ovation_grid = self.getOvationGrid()
+
+
         # allow data to be reused
-        if not self.ovation_json_data:
-            try:
-                self.ovation_json_data = self.download_json(self.ovation_json_url)
-            except json.JSONDecodeError as e:
-                logger.error('JSON parse error: %s', str(e))
-                self.ovation_json_data = None
-            except socket.gaierror as e:
-                logger.error('Name resolution error: %s', str(e))
-                self.ovation_json_data = None
-            except socket.timeout as e:
-                logger.error('Timeout error: %s', str(e))
-                self.ovation_json_data = None
-            except requests.exceptions.ConnectTimeout as e:
-                logger.error('Connection timeout: %s', str(e))
-                self.ovation_json_data = None
-            except requests.exceptions.ConnectionError as e:
-                logger.error('Connection error: %s', str(e))
-                self.ovation_json_data = None
-            except requests.exceptions.ReadTimeout as e:
-                logger.error('Connection error: %s', str(e))
-                self.ovation_json_data = None
-            except urllib3.exceptions.ReadTimeoutError as e:
-                logger.error('Connection error: %s', str(e))
-                self.ovation_json_data = None
-            except ssl.SSLCertVerificationError as e:
-                logger.error('Certificate error: %s', str(e))
-                self.ovation_json_data = None
-            except requests.exceptions.SSLError as e:
-                logger.error('Certificate error: %s', str(e))
-                self.ovation_json_data = None
 
 
         # allow data to be reused
@@ -106,8 +88,8 @@ class IndiAllskyAuroraUpdate(object):
 
         update_camera = False
 
-        if self.ovation_json_data:
-            max_ovation, avg_ovation = self.processOvationLocationData(self.ovation_json_data, latitude, longitude)
+        if not isinstance(ovation_grid, type(None)):
+            max_ovation, avg_ovation = self.processOvationLocationData(ovation_grid, latitude, longitude)
             logger.info('Max Ovation: %d', max_ovation)
             logger.info('Avg Ovation: %0.2f', avg_ovation)
 
@@ -131,6 +113,56 @@ class IndiAllskyAuroraUpdate(object):
             db.session.commit()
 
 
+    def getOvationGrid(self):
+        now = time.time()
+
+        if not isinstance(self._ovation_grid, type(None)):
+            if now - self._ovation_grid_time < self.ovation_cache_time:
+                logger.info('Reusing ovation data')
+                return self._ovation_grid
+
+
+        try:
+            ovation_json_data = self.download_json(self.ovation_json_url)
+        except json.JSONDecodeError as e:
+            logger.error('JSON parse error: %s', str(e))
+            return None
+        except socket.gaierror as e:
+            logger.error('Name resolution error: %s', str(e))
+            return None
+        except socket.timeout as e:
+            logger.error('Timeout error: %s', str(e))
+            return None
+        except requests.exceptions.ConnectTimeout as e:
+            logger.error('Connection timeout: %s', str(e))
+            return None
+        except requests.exceptions.ConnectionError as e:
+            logger.error('Connection error: %s', str(e))
+            return None
+        except requests.exceptions.ReadTimeout as e:
+            logger.error('Connection error: %s', str(e))
+            return None
+        except urllib3.exceptions.ReadTimeoutError as e:
+            logger.error('Connection error: %s', str(e))
+            return None
+        except ssl.SSLCertVerificationError as e:
+            logger.error('Certificate error: %s', str(e))
+            return None
+        except requests.exceptions.SSLError as e:
+            logger.error('Certificate error: %s', str(e))
+            return None
+
+
+        if not ovation_json_data:
+            return None
+
+
+        IndiAllskyAuroraUpdate._ovation_grid = self.loadOvationGrid(ovation_json_data)
+        IndiAllskyAuroraUpdate._ovation_grid_time = now
+
+        return self._ovation_grid
+
+
     def download_json(self, url):
         logger.warning('Downloading %s', url)
 
@@ -146,78 +178,48 @@ class IndiAllskyAuroraUpdate(object):
         return json_data
 
 
-    def processOvationLocationData(self, json_data, latitude, longitude):
-        # this will check a 5 degree by 5 degree grid and aggregate all of the ovation scores
+    def loadOvationGrid(self, json_data):
+        # coordinates are [longitude, latitude, aurora] in 1 degree steps
+        coord_array = numpy.array(json_data['coordinates'], dtype=numpy.float64)
+
+        long_array = numpy.floor(coord_array[:, 0]).astype(numpy.int32) % 360
+        lat_array = numpy.floor(coord_array[:, 1]).astype(numpy.int32) + 90
+
+        valid = (lat_array >= 0) & (lat_array <= 180)
+
+
+        # grid is indexed by [longitude, latitude + 90], missing points are nan
+        ovation_grid = numpy.full((360, 181), numpy.nan, dtype=numpy.float64)
+        ovation_grid[long_array[valid], lat_array[valid]] = coord_array[valid, 2]
+
+        return ovation_grid
+
+
+    def processOvationLocationData(self, ovation_grid, latitude, longitude):
+        # this will check a 15 degree by 15 degree grid and aggregate all of the ovation scores
 
         logger.warning('Looking up data for %0.1f, %0.1f', latitude, longitude)
 
-        if longitude < 0:
-            longitude = 360 + longitude  # logitude is negative
-
-
-        # 1 degree is ~69 miles, 7 degrees should be just under 500 miles
-
-        lat_floor = math.floor(latitude)
-        # this will not work exactly right at the north and south poles above 80 degrees latitude
-        lat_list = [
-            lat_floor - 7,
-            lat_floor - 6,
-            lat_floor - 5,
-            lat_floor - 4,
-            lat_floor - 3,
-            lat_floor - 2,
-            lat_floor - 1,
-            lat_floor,
-            lat_floor + 1,
-            lat_floor + 2,
-            lat_floor + 3,
-            lat_floor + 4,
-            lat_floor + 5,
-            lat_floor + 6,
-            lat_floor + 7,
-        ]
-
-        long_floor = math.floor(longitude)
-        long_list = [
-            long_floor - 7,  # this should cover northern and southern hemispheres
-            long_floor - 6,
-            long_floor - 5,
-            long_floor - 4,
-            long_floor - 3,
-            long_floor - 2,
-            long_floor - 1,
-            long_floor,
-            long_floor + 1,
-            long_floor + 2,
-            long_floor + 3,
-            long_floor + 4,
-            long_floor + 5,
-            long_floor + 6,
-            long_floor + 7,
-        ]
-
-
-        # fix longitudes that cross 0/360
-        for i in long_list:
-            if i < 0:
-                i = 360 + i  # i is negative
-            elif i > 360:
-                i = i - 360
-
-
-        data_list = list()
-        for i in json_data['coordinates']:
-            #logger.info('%s', i)
-
-            for long_val in long_list:
-                for lat_val in lat_list:
-                    if i[0] == long_val and i[1] == lat_val:
-                        data_list.append(int(i[2]))
-
-
-        #logger.info('Data: %s', data_list)
-
-        return max(data_list), sum(data_list) / len(data_list)
+        offset_array = numpy.arange(-self.ovation_radius, self.ovation_radius + 1)
+
+
+        # longitudes wrap around 0/360, this covers northern and southern hemispheres
+        long_index = (math.floor(longitude) + offset_array) % 360
+
+        # latitudes stop at the poles
+        lat_index = math.floor(latitude) + 90 + offset_array
+        lat_index = lat_index[(lat_index >= 0) & (lat_index <= 180)]
+
+
+        data_array = ovation_grid[numpy.ix_(long_index, lat_index)]
+        data_array = data_array[~numpy.isnan(data_array)]
+
+        if not data_array.size:
+            logger.error('No ovation data for location')
+            return 0, 0.0
+
+
+        return int(data_array.max()), float(data_array.mean())
 
 
     def processKpindexPoly(self, json_data):
@@ -0,0 +1,232 @@
+import time
+from collections import OrderedDict
+import logging
+
+from .flask import db
+
+from .flask.models import IndiAllSkyDbBadPixelMapTable
+from .flask.models import IndiAllSkyDbDarkFrameTable
+
+from sqlalchemy import func
+from sqlalchemy.sql.expression import true as sa_true
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllSkyCalibrationCache(object):
+    """Keeps merged master darks (dark + bad pixel map) in memory between frames"""
+
+    # exposures and temperatures vary between frames, old matches are dropped
+    max_matches = 1000
+
+    # calibration frame changes are detected within this many seconds
+    version_check_interval = 60
+
+
+    def __init__(self, config):
+        self.config = config
+
+        self.max_bytes = int(self.config.get('IMAGE_CALIBRATE_CACHE_MB', 256)) * 1024 * 1024
+
+        # cache key -> (dark_id, bpm_id), a value of None means no dark was found
+        # ordered from least to most recently used
+        self._match_cache = OrderedDict()
+
+        # (dark_id, bpm_id) -> master dark data, ordered from least to most recently used
+        self._data_cache = OrderedDict()
+        self._data_bytes = 0
+
+        # camera_id -> fingerprint of the active calibration frames
+        self._versions = dict()
+        self._version_check_time = dict()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def evictions(self):
+        return self._evictions
+
+    @property
+    def size_bytes(self):
+        return self._data_bytes
+
+
+    def getKey(self, camera_id, bitdepth, binmode, gain, exposure, temp, bpm):
+        # the dark query requires a dark at or above the sensor temperature, a match is only
+        # reused for the exact exposure and temperature, master darks are shared by dark id
+        # the master dark is different when the bad pixel map is merged
+        return (int(camera_id), int(bitdepth), int(binmode), int(gain), float(exposure), float(temp), bool(bpm))
+
+
+    def checkVersion(self, camera_id):
+        ### detect darks or bad pixel maps that were added, deleted, activated or deactivated
+        now = time.time()
+
+        if now < self._version_check_time.get(camera_id, 0) + self.version_check_interval:
+            return
+
+        self._version_check_time[camera_id] = now
+
+
+        dark_version = db.session.query(
+            func.count(IndiAllSkyDbDarkFrameTable.id),
+            func.max(IndiAllSkyDbDarkFrameTable.id),
+            func.sum(IndiAllSkyDbDarkFrameTable.id),
+        )\
+            .filter(IndiAllSkyDbDarkFrameTable.camera_id == camera_id)\
+            .filter(IndiAllSkyDbDarkFrameTable.active == sa_true())\
+            .one()
+
+        bpm_version = db.session.query(
+            func.count(IndiAllSkyDbBadPixelMapTable.id),
+            func.max(IndiAllSkyDbBadPixelMapTable.id),
+            func.sum(IndiAllSkyDbBadPixelMapTable.id),
+        )\
+            .filter(IndiAllSkyDbBadPixelMapTable.camera_id == camera_id)\
+            .filter(IndiAllSkyDbBadPixelMapTable.active == sa_true())\
+            .one()
+
+
+        version = (tuple(dark_version), tuple(bpm_version))
+
+        if camera_id not in self._versions:
+            self._versions[camera_id] = version
+            return
+
+        if self._versions[camera_id] == version:
+            return
+
+        logger.warning('Calibration frames changed, invalidating calibration cache for camera %d', camera_id)
+        self._versions[camera_id] = version
+        self.invalidate(camera_id=camera_id)
+
+
+    def get(self, key):
+        ### raises KeyError on a cache miss, returns None when it is known that no dark matches
+        try:
+            match = self._match_cache[key]
+        except KeyError:
+            self._misses += 1
+            raise
+
+        self._match_cache.move_to_end(key)
+
+        if isinstance(match, type(None)):
+            self._hits += 1
+            return None
+
+
+        master_dark = self.getData(*match)
+
+        if isinstance(master_dark, type(None)):
+            # data was evicted
+            self._misses += 1
+            raise KeyError(key)
+
+        self._hits += 1
+
+        return master_dark
+
+
+    def put(self, key, dark_id, bpm_id, master_dark):
+        if isinstance(dark_id, type(None)):
+            # remember that a dark was not found
+            self._putMatch(key, None)
+            return
+
+        self._putMatch(key, (dark_id, bpm_id))
+        self.setData(dark_id, bpm_id, master_dark)
+
+
+    def _putMatch(self, key, match):
+        self._match_cache[key] = match
+        self._match_cache.move_to_end(key)
+
+        while len(self._match_cache) > self.max_matches:
+            self._match_cache.popitem(last=False)
+
+
+    def getData(self, dark_id, bpm_id):
+        data_key = (dark_id, bpm_id)
+
+        try:
+            master_dark = self._data_cache[data_key]
+        except KeyError:
+            return None
+
+        self._data_cache.move_to_end(data_key)
+
+        return master_dark
+
+
+    def setData(self, dark_id, bpm_id, master_dark):
+        data_key = (dark_id, bpm_id)
+
+        if not self.max_bytes:
+            # cache disabled
+            return
+
+        if master_dark.nbytes > self.max_bytes:
+            logger.warning('Master dark (%d MB) exceeds calibration cache size', master_dark.nbytes // 1048576)
+            return
+
+
+        if data_key in self._data_cache:
+            self._data_bytes -= self._data_cache.pop(data_key).nbytes
+
+
+        while self._data_cache and (self._data_bytes + master_dark.nbytes) > self.max_bytes:
+            _, old_master_dark = self._data_cache.popitem(last=False)
+            self._data_bytes -= old_master_dark.nbytes
+            self._evictions += 1
+
+
+        # prevent accidental modification of the cached data
+        master_dark.flags.writeable = False
+
+        self._data_cache[data_key] = master_dark
+        self._data_bytes += master_dark.nbytes
+
+
+    def invalidate(self, camera_id=None):
+        if isinstance(camera_id, type(None)):
+            self._match_cache.clear()
+            self._data_cache.clear()
+            self._data_bytes = 0
+            return
+
+
+        for key in [k for k in self._match_cache.keys() if k[0] == camera_id]:
+            match = self._match_cache.pop(key)
+
+            if not match:
+                continue
+
+            try:
+                master_dark = self._data_cache.pop(match)
+                self._data_bytes -= master_dark.nbytes
+            except KeyError:
+                pass
+
+
+    def logStats(self):
+        logger.debug(
+            'Calibration cache: %d hits, %d misses, %d evictions, %d entries, %0.1f MB',
+            self._hits,
+            self._misses,
+            self._evictions,
+            len(self._data_cache),
+            self._data_bytes / 1048576,
+        )
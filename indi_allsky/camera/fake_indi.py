@@ -16,11 +16,13 @@ class FakeIndiClient(object):
         gain_v,
         bin_v,
         night_v,
+        frame_buffer=None,
     ):
         super(FakeIndiClient, self).__init__()
 
         self.config = config
         self.image_q = image_q
+        self.frame_buffer = frame_buffer
 
         self.latitude_v = latitude_v
         self.longitude_v = longitude_v
@@ -96,11 +96,13 @@ class IndiClient(PyIndi.BaseClient):
         gain_v,
         bin_v,
         night_v,
+        frame_buffer=None,
     ):
         super(IndiClient, self).__init__()
 
         self.config = config
         self.image_q = image_q
+        self.frame_buffer = frame_buffer  # shared memory transport (optional)
 
         self.position_av = position_av
 
@@ -304,18 +306,6 @@ class IndiClient(PyIndi.BaseClient):
         blobfile = io.BytesIO(imgdata)
         hdulist = fits.open(blobfile)
 
-        try:
-            f_tmpfile = tempfile.NamedTemporaryFile(mode='w+b', delete=False, suffix='.fit')
-            f_tmpfile_p = Path(f_tmpfile.name)
-
-            hdulist.writeto(f_tmpfile)
-
-            f_tmpfile.flush()
-            f_tmpfile.close()
-        except OSError as e:
-            logger.error('OSError: %s', str(e))
-            return
-
 
         #elapsed_s = time.time() - start
         #logger.info('Blob downloaded in %0.4f s', elapsed_s)
@@ -324,7 +314,6 @@ class IndiClient(PyIndi.BaseClient):
 
         ### process data in worker
         jobdata = {
-            'filename'    : str(f_tmpfile_p),
             'exposure'    : self.exposure,
             'exp_time'    : datetime.timestamp(exp_date),  # datetime objects are not json serializable
             'exp_elapsed' : exposure_elapsed_s,
@@ -346,8 +335,43 @@ class IndiClient(PyIndi.BaseClient):
         #    self.image_q.put({'task_id' : task.id})
         ###
 
+        self._queueFrame(jobdata, hdulist=hdulist)
+
+
+    def _queueFrame(self, jobdata, hdulist=None):
+        ### Common hand off of frames to the image worker
+        # frames with an hdulist are passed through shared memory if available, otherwise a temporary FITS file
+        # jobdata must already contain the filename if hdulist is not provided
+
+        if not isinstance(hdulist, type(None)):
+            if self.frame_buffer:
+                frame_metadata = self.frame_buffer.put(hdulist[0].data, header=hdulist[0].header)
+
+                if frame_metadata:
+                    jobdata['frame'] = frame_metadata
+                    self.image_q.put(jobdata)
+                    return True
+
+
+            try:
+                f_tmpfile = tempfile.NamedTemporaryFile(mode='w+b', delete=False, suffix='.fit')
+
+                hdulist.writeto(f_tmpfile)
+
+                f_tmpfile.flush()
+                f_tmpfile.close()
+            except OSError as e:
+                logger.error('OSError: %s', str(e))
+                return False
+
+
+            jobdata['filename'] = str(Path(f_tmpfile.name))
+
+
         self.image_q.put(jobdata)
 
+        return True
+
 
     def newMessage(self, d, m):
         logger.info("new Message %s", d.messageQueue(m))
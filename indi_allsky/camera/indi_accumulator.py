@@ -3,8 +3,6 @@ import copy
 import io
 import math
 from datetime import datetime
-from pathlib import Path
-import tempfile
 from pprint import pformat  # noqa: F401
 import logging
 
@@ -192,26 +190,10 @@ class IndiClientIndiAccumulator(IndiClient):
 
 
 
-        f_tmpfile = tempfile.NamedTemporaryFile(mode='w+b', delete=False, suffix='.fit')
-
-        try:
-            hdulist.writeto(f_tmpfile)
-            f_tmpfile.flush()
-            f_tmpfile.close()
-        except OSError as e:
-            logger.error('OSError: %s', str(e))
-            self.data = None
-            self.header = None
-            return
-
-
-        tmpfile_p = Path(f_tmpfile.name)
-
         exp_date = datetime.now()
 
         ### process data in worker
         jobdata = {
-            'filename'    : str(tmpfile_p),
             'exposure'    : self.exposure,
             'exp_time'    : datetime.timestamp(exp_date),  # datetime objects are not json serializable
             'exp_elapsed' : exposure_elapsed_s,
@@ -219,7 +201,10 @@ class IndiClientIndiAccumulator(IndiClient):
             'filename_t'  : self._filename_t,
         }
 
-        self.image_q.put(jobdata)
+        if not self._queueFrame(jobdata, hdulist=hdulist):
+            self.data = None
+            self.header = None
+            return
 
 
         self.camera_ready = True
@@ -41,11 +41,13 @@ class IndiClientPassive(IndiClient):
         gain_v,
         bin_v,
         night_v,
+        frame_buffer=None,
     ):
         super(IndiClient, self).__init__()
 
         self.config = config
         self.image_q = image_q
+        self.frame_buffer = frame_buffer
 
         self.latitude_v = latitude_v
         self.longitude_v = longitude_v
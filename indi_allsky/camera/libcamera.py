@@ -1,5 +1,8 @@
 import io
+import os
 import shutil
+import signal
+import atexit
 from datetime import datetime
 from collections import OrderedDict
 import time
@@ -8,6 +11,9 @@ import json
 import subprocess
 import psutil
 from pathlib import Path
+from collections import deque
+from threading import Thread
+from threading import Event
 import logging
 
 from .indi import IndiClient
@@ -22,11 +28,26 @@ logger = logging.getLogger('indi_allsky')
 
 class IndiClientLibCameraGeneric(IndiClient):
 
+    # the persistent process is not restarted for smaller exposure changes
+    persistent_exposure_tolerance = 0.1  # fraction of the running exposure
+
+
     def __init__(self, *args, **kwargs):
         super(IndiClientLibCameraGeneric, self).__init__(*args, **kwargs)
 
         self.libcamera_process = None
 
+        # persistent rpicam-still session
+        self._persistent_cmd = None
+        self._persistent_exposure = None
+        self._persistent_reader = None
+        self._persistent_session = 0
+        self._persistent_frame = 0
+        self._persistent_triggered = False
+        self._persistent_tmp_p = None
+        self._persistent_output_t = None
+        self._persistent_metadata_p = None
+
         self._exposure = None
 
         self._camera_id = None
@@ -144,19 +165,6 @@ class IndiClientLibCameraGeneric(IndiClient):
             logger.warning('*** Capturing raw images (dng) with libcamera and less than 1gb of memory can result in out-of-memory errors ***')
 
 
-        try:
-            image_tmp_f = tempfile.NamedTemporaryFile(mode='w', suffix='.{0:s}'.format(image_type), delete=True)
-            image_tmp_f.close()
-            image_tmp_p = Path(image_tmp_f.name)
-
-            metadata_tmp_f = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=True)
-            metadata_tmp_f.close()
-            metadata_tmp_p = Path(metadata_tmp_f.name)
-        except OSError as e:
-            logger.error('OSError: %s', str(e))
-            return
-
-
         try:
             binmode_option = self._getBinModeOptions(self.bin_v.value)
         except BinModeException as e:
@@ -164,10 +172,6 @@ class IndiClientLibCameraGeneric(IndiClient):
             binmode_option = ''
 
 
-        self.current_exposure_file_p = image_tmp_p
-        self.current_metadata_file_p = metadata_tmp_p
-
-
         self._exposure = exposure
 
         exposure_us = int(exposure * 1000000)
@@ -182,7 +186,6 @@ class IndiClientLibCameraGeneric(IndiClient):
                 '--denoise', 'off',
                 '--gain', '{0:d}'.format(self.gain_v.value),
                 '--shutter', '{0:d}'.format(exposure_us),
-                '--metadata', str(metadata_tmp_p),
                 '--metadata-format', 'json',
             ]
         elif image_type in ['jpg', 'png']:
@@ -196,7 +199,6 @@ class IndiClientLibCameraGeneric(IndiClient):
                 '--quality', '95',
                 '--gain', '{0:d}'.format(self.gain_v.value),
                 '--shutter', '{0:d}'.format(exposure_us),
-                '--metadata', str(metadata_tmp_p),
                 '--metadata-format', 'json',
             ]
         else:
@@ -250,7 +252,30 @@ class IndiClientLibCameraGeneric(IndiClient):
                 cmd.extend(extra_options.split(' '))
 
 
-        # Finally add output file
+        if self.config.get('LIBCAMERA', {}).get('PERSISTENT'):
+            self._persistentExposure(cmd, image_type, exposure, sync, timeout)
+            return
+
+
+        try:
+            image_tmp_f = tempfile.NamedTemporaryFile(mode='w', suffix='.{0:s}'.format(image_type), delete=True)
+            image_tmp_f.close()
+            image_tmp_p = Path(image_tmp_f.name)
+
+            metadata_tmp_f = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=True)
+            metadata_tmp_f.close()
+            metadata_tmp_p = Path(metadata_tmp_f.name)
+        except OSError as e:
+            logger.error('OSError: %s', str(e))
+            return
+
+
+        self.current_exposure_file_p = image_tmp_p
+        self.current_metadata_file_p = metadata_tmp_p
+
+
+        # Finally add metadata and output file
+        cmd.extend(['--metadata', str(metadata_tmp_p)])
         cmd.extend(['--output', str(image_tmp_p)])
 
 
@@ -296,8 +321,186 @@ class IndiClientLibCameraGeneric(IndiClient):
             self._queueImage()
 
 
+    def _persistentExposure(self, cmd, image_type, exposure, sync, timeout):
+        # rpicam-still only accepts the shutter and gain on the command line, changing them
+        # requires a restart which costs a few seconds while the camera pipeline is configured
+        cmd = [x for x in cmd if x != '--immediate']
+
+        shutter_idx = cmd.index('--shutter')
+        session_cmd = cmd[:shutter_idx] + cmd[shutter_idx + 2:]
+
+
+        if session_cmd != self._persistent_cmd or not self._libCameraPidRunning():
+            # mode, format or gain changed
+            restart = True
+        elif abs(exposure - self._persistent_exposure) > self._persistent_exposure * self.persistent_exposure_tolerance:
+            logger.info('Exposure changed from %0.6f s to %0.6f s, restarting libcamera', self._persistent_exposure, exposure)
+            restart = True
+        else:
+            restart = False
+
+
+        if restart:
+            self._stopPersistentProcess()
+
+            try:
+                self._startPersistentProcess(cmd, image_type)
+            except OSError as e:
+                logger.error('OSError: %s', str(e))
+                return
+
+            self._persistent_cmd = session_cmd
+            self._persistent_exposure = exposure
+
+
+        # report the exposure the process is running with
+        self._exposure = self._persistent_exposure
+
+
+        self.current_exposure_file_p = self._persistent_tmp_p.joinpath(self._persistent_output_t.format(self._persistent_session, self._persistent_frame))
+        self.current_metadata_file_p = self._persistent_metadata_p
+
+        # metadata is rewritten for every frame, it must not exist before the frame is complete
+        try:
+            self.current_metadata_file_p.unlink()
+        except FileNotFoundError:
+            pass
+
+
+        self.exposureStartTime = time.time()
+
+        self.active_exposure = True
+        self._persistent_triggered = False
+
+        # the capture is triggered in getCcdExposureStatus() when the process is ready
+        self._triggerPersistentExposure()
+
+
+        if sync:
+            while True:
+                camera_ready, exposure_state = self.getCcdExposureStatus()
+                if camera_ready:
+                    break
+
+                if timeout and time.time() - self.exposureStartTime > timeout:
+                    logger.error('Exposure timeout')
+                    raise TimeOutException('Timeout waiting for exposure')
+
+                time.sleep(0.05)
+
+
+    def _startPersistentProcess(self, cmd, image_type):
+        if not self._persistent_tmp_p:
+            self._persistent_tmp_p = Path(tempfile.mkdtemp(prefix='libcamera_'))
+            atexit.register(self._stopPersistentProcess)
+
+
+        # rpicam-still numbers each output file with the frame counter
+        self._persistent_session += 1
+        self._persistent_frame = 0
+        self._persistent_output_t = 'image_{0:d}_{1:06d}.' + image_type
+        self._persistent_metadata_p = self._persistent_tmp_p.joinpath('metadata_{0:d}.json'.format(self._persistent_session))
+
+        persistent_cmd = cmd + [
+            '--timeout', '0',
+            '--signal',
+            '--verbose', '2',  # viewfinder frames are logged when the process is ready
+            '--framestart', '0',
+            '--metadata', str(self._persistent_metadata_p),
+            '--output', str(self._persistent_tmp_p.joinpath('image_{0:d}_%06d.{1:s}'.format(self._persistent_session, image_type))),
+        ]
+
+        logger.info('persistent image command: %s', ' '.join(persistent_cmd))
+
+        self.libcamera_process = subprocess.Popen(
+            persistent_cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+
+        self._persistent_reader = LibCameraOutputReader(self.libcamera_process)
+        self._persistent_reader.start()
+
+
+    def _triggerPersistentExposure(self):
+        if self._persistent_triggered:
+            return
+
+        # SIGUSR1 terminates the process before rpicam-still installs the signal handler
+        if not self._persistent_reader.ready.is_set():
+            return
+
+        self.libcamera_process.send_signal(signal.SIGUSR1)
+        self._persistent_triggered = True
+
+
+    def _persistentFrameReady(self):
+        if not self._persistent_triggered:
+            return False
+
+        # metadata is written after the image
+        try:
+            with io.open(self.current_metadata_file_p, 'r') as f_metadata:
+                json.loads(f_metadata.read())
+        except FileNotFoundError:
+            return False
+        except json.JSONDecodeError:
+            # partially written
+            return False
+
+        return self.current_exposure_file_p.exists()
+
+
+    def _stopPersistentProcess(self):
+        if not self._persistent_cmd:
+            return
+
+        self._persistent_cmd = None
+        self._persistent_triggered = False
+
+        if self._libCameraPidRunning():
+            # SIGUSR2 exits rpicam-still cleanly
+            self.libcamera_process.send_signal(signal.SIGUSR2)
+
+            try:
+                self.libcamera_process.wait(timeout=5.0)
+            except subprocess.TimeoutExpired:
+                self.libcamera_process.terminate()
+
+                try:
+                    self.libcamera_process.wait(timeout=5.0)
+                except subprocess.TimeoutExpired:
+                    self.libcamera_process.kill()
+                    self.libcamera_process.wait()
+
+
+        self._persistent_reader.join(timeout=1.0)
+
+        try:
+            self._persistent_metadata_p.unlink()
+        except FileNotFoundError:
+            pass
+
+
+    def disconnectServer(self):
+        self._stopPersistentProcess()
+
+        if self._persistent_tmp_p:
+            try:
+                # frames still in the image queue are left
+                os.rmdir(str(self._persistent_tmp_p))
+            except OSError:
+                pass
+
+        super(IndiClientLibCameraGeneric, self).disconnectServer()
+
+
     def getCcdExposureStatus(self):
         # returns camera_ready, exposure_state
+        if self._persistent_cmd:
+            return self._getPersistentExposureStatus()
+
+
         if self._libCameraPidRunning():
             return False, 'BUSY'
 
@@ -324,6 +527,42 @@ class IndiClientLibCameraGeneric(IndiClient):
         return True, 'READY'
 
 
+    def _getPersistentExposureStatus(self):
+        if not self.active_exposure:
+            return True, 'READY'
+
+
+        if not self._libCameraPidRunning():
+            self.active_exposure = False
+
+            for line in self._persistent_reader.lines:
+                logger.error('libcamera-still error: %s', line)
+
+            logger.error('Persistent libcamera-still process exited: %d', self.libcamera_process.returncode)
+
+            # restarted on the next exposure
+            self._stopPersistentProcess()
+
+            return True, 'READY'
+
+
+        self._triggerPersistentExposure()
+
+        if not self._persistentFrameReady():
+            return False, 'BUSY'
+
+
+        self.active_exposure = False
+
+        self._persistent_frame += 1
+
+        self._processMetadata()
+
+        self._queueImage()
+
+        return True, 'READY'
+
+
     def _processMetadata(self):
         # read metadata to get sensor temperature
         if self.current_metadata_file_p:
@@ -446,6 +685,9 @@ class IndiClientLibCameraGeneric(IndiClient):
 
         self.active_exposure = False
 
+        # the frame counter is unknown after an abort
+        self._stopPersistentProcess()
+
         for x in range(5):
             if self._libCameraPidRunning():
                 self.libcamera_process.terminate()
@@ -488,7 +730,8 @@ class IndiClientLibCameraGeneric(IndiClient):
             #'libcamera_ccm'         : self._ccm,
         }
 
-        self.image_q.put(jobdata)
+        # files are written by an external process, always passed by filename
+        self._queueFrame(jobdata)
 
 
     def _libCameraPidRunning(self):
@@ -640,6 +883,39 @@ class IndiClientLibCameraGeneric(IndiClient):
         pass
 
 
+class LibCameraOutputReader(Thread):
+    """Reads the output of the persistent libcamera-still process
+
+    The pipe must be drained or the process blocks when it is full.  The last
+    lines are kept for error logging.
+    """
+
+    def __init__(self, libcamera_process):
+        super(LibCameraOutputReader, self).__init__()
+
+        self.name = 'LibCameraOutputReader'
+        self.daemon = True
+
+        self.libcamera_process = libcamera_process
+
+        self.ready = Event()
+        self.lines = deque(maxlen=50)
+
+
+    def run(self):
+        for line in iter(self.libcamera_process.stdout.readline, b''):
+            line = line.decode(errors='replace').rstrip()
+
+            if line.startswith('Viewfinder frame'):
+                # signal handlers are installed before the first viewfinder frame
+                self.ready.set()
+                continue
+
+            self.lines.append(line)
+
+        self.libcamera_process.stdout.close()
+
+
 class BinModeException(Exception):
     pass
 
@@ -290,7 +290,8 @@ class IndiClientPycurl(IndiClient):
             'filename_t'  : self._filename_t,
         }
 
-        self.image_q.put(jobdata)
+        # files are written by an external process, always passed by filename
+        self._queueFrame(jobdata)
 
 
     def findCcd(self, *args, **kwargs):
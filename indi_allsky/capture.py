@@ -14,8 +14,6 @@ import signal
 import logging
 import traceback
 
-import ephem
-
 from multiprocessing import Process
 #from threading import Thread
 import queue
@@ -24,6 +22,7 @@ from . import constants
 from . import camera as camera_module
 
 from .utils import IndiAllSkyDateCalcs
+from .ephemeris import IndiAllSkyEphemeris
 
 from .flask.models import TaskQueueQueue
 from .flask.models import TaskQueueState
@@ -136,6 +135,7 @@ class CaptureWorker(Process):
         sensors_user_av,
         night_v,
         moonmode_v,
+        frame_buffer=None,
     ):
 
         super(CaptureWorker, self).__init__()
@@ -160,6 +160,8 @@ class CaptureWorker(Process):
         self.night_v = night_v
         self.moonmode_v = moonmode_v
 
+        self.frame_buffer = frame_buffer
+
         self._miscDb = miscDb(self.config)
         self._dateCalcs = IndiAllSkyDateCalcs(self.config, self.position_av)
 
@@ -666,6 +668,7 @@ class CaptureWorker(Process):
             self.gain_v,
             self.bin_v,
             self.night_v,
+            frame_buffer=self.frame_buffer,
         )
 
 
@@ -1450,21 +1453,12 @@ class CaptureWorker(Process):
 
 
     def detectNight(self):
-        obs = ephem.Observer()
-        obs.lon = math.radians(self.position_av[1])
-        obs.lat = math.radians(self.position_av[0])
-        obs.elevation = self.position_av[2]
-
-        # disable atmospheric refraction calcs
-        obs.pressure = 0
+        ephemeris = IndiAllSkyEphemeris(self.position_av[0], self.position_av[1], self.position_av[2])
 
-        obs.date = datetime.now(tz=timezone.utc)  # ephem expects UTC dates
+        obs = ephemeris.observer(datetime.now(tz=timezone.utc))  # ephem expects UTC dates
 
-        sun = ephem.Sun()
-        moon = ephem.Moon()
-
-        sun.compute(obs)
-        moon.compute(obs)
+        sun = ephemeris.body('Sun', obs)
+        moon = ephemeris.body('Moon', obs)
 
         # Night
         logger.info('Sun altitude: %0.1f', math.degrees(sun.alt))
@@ -1616,6 +1610,7 @@ class CaptureWorker(Process):
                 'timespec'    : timespec,
                 'night'       : True,
                 'camera_id'   : camera.id,
+                'end_of_period' : True,
             },
         }
 
@@ -1627,7 +1622,7 @@ class CaptureWorker(Process):
         db.session.add(task)
         db.session.commit()
 
-        self.video_q.put({'task_id' : task.id})
+        self._queueEndOfPeriodTask(task, timespec, True, camera.id)
 
 
     def _generateDayKeogram(self, timespec, camera_id, task_state=TaskQueueState.QUEUED):
@@ -1653,6 +1648,7 @@ class CaptureWorker(Process):
                 'timespec'    : timespec,
                 'night'       : False,
                 'camera_id'   : camera.id,
+                'end_of_period' : True,
             },
         }
 
@@ -1664,7 +1660,24 @@ class CaptureWorker(Process):
         db.session.add(task)
         db.session.commit()
 
-        self.video_q.put({'task_id' : task.id})
+        self._queueEndOfPeriodTask(task, timespec, False, camera.id)
+
+
+    def _queueEndOfPeriodTask(self, task, timespec, night, camera_id):
+        if not self.config.get('KEOGRAM_INCREMENTAL'):
+            self.video_q.put({'task_id' : task.id})
+            return
+
+        # the image worker saves the final incremental keogram state after
+        # the last image of the period, then queues the task
+        self.image_q.put({
+            'end_of_period' : {
+                'task_id'   : task.id,
+                'timespec'  : timespec,
+                'night'     : night,
+                'camera_id' : camera_id,
+            },
+        })
 
 
     def shoot(self, exposure, sync=True, timeout=None):
@@ -1,12 +1,10 @@
 import math
 from pathlib import Path
-import numpy
 import cv2
-from PIL import Image
-from PIL import ImageFont
-from PIL import ImageDraw
 import logging
 
+from .overlayLayer import IndiAllSkyOverlayLayer
+
 logger = logging.getLogger('indi_allsky')
 
 
@@ -43,6 +41,10 @@ class IndiAllskyCardinalDirsLabel(object):
         self._diameter = 0
 
 
+        # precomposed pillow labels
+        self._layer_cache = dict()
+
+
         # most all sky lenses will flip the image horizontally and vertically
         self.az = self.config.get('LENS_AZIMUTH', 0) + 180
 
@@ -290,20 +292,41 @@ class IndiAllskyCardinalDirsLabel(object):
 
 
     def applyLabels_pillow(self, image, coord_dict):
-        img_rgb = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-        width, height  = img_rgb.size  # backwards from opencv
+        pillow_font_size = self.config.get('CARDINAL_DIRS', {}).get('PIL_FONT_SIZE', 30)
+
+        return self._applyTextLayers(image, coord_dict, pillow_font_size)
+
+
+    def _applyTextLayers(self, image, coord_dict, pillow_font_size):
+        height, width = image.shape[:2]
 
+        # the labels only change when the image size changes
+        layer_key = (width, height, pillow_font_size, tuple(coord_dict.items()))
 
+        try:
+            layer_list = self._layer_cache[layer_key]
+        except KeyError:
+            if len(self._layer_cache) > 10:
+                self._layer_cache.clear()
+
+            layer_list = self._textLayers(width, height, coord_dict, pillow_font_size)
+            self._layer_cache[layer_key] = layer_list
+
+
+        for layer in layer_list:
+            layer.apply(image)
+
+        return image
+
+
+    def _textLayers(self, width, height, coord_dict, pillow_font_size):
         if self.config['TEXT_PROPERTIES']['PIL_FONT_FILE'] == 'custom':
             pillow_font_file_p = Path(self.config['TEXT_PROPERTIES']['PIL_FONT_CUSTOM'])
         else:
             pillow_font_file_p = self.font_path.joinpath(self.config['TEXT_PROPERTIES']['PIL_FONT_FILE'])
 
 
-        pillow_font_size = self.config.get('CARDINAL_DIRS', {}).get('PIL_FONT_SIZE', 30)
-
-        font = ImageFont.truetype(str(pillow_font_file_p), pillow_font_size)
-        draw = ImageDraw.Draw(img_rgb)
+        font = IndiAllSkyOverlayLayer.getFont(pillow_font_file_p, pillow_font_size)
 
         color_rgb = list(self.config['CARDINAL_DIRS']['FONT_COLOR'])  # RGB for pillow
 
@@ -315,6 +338,7 @@ class IndiAllskyCardinalDirsLabel(object):
             stroke_width = 0
 
 
+        layer_list = list()
         for k, v in coord_dict.items():
             x, y = v
 
@@ -329,19 +353,20 @@ class IndiAllskyCardinalDirsLabel(object):
                 y = height - self.bottom_offset
 
 
-            draw.text(
-                (x, y),
+            text_layer = IndiAllSkyOverlayLayer.fromText(
                 k,
-                fill=tuple(color_rgb),
-                font=font,
+                font,
+                (x, y),
+                color_rgb,
                 stroke_width=stroke_width,
-                stroke_fill=(0, 0, 0),
                 anchor='mm',  # middle-middle
             )
 
+            if text_layer:
+                layer_list.append(text_layer)
+
 
-        # convert back to numpy array
-        return cv2.cvtColor(numpy.array(img_rgb), cv2.COLOR_RGB2BGR)
+        return layer_list
 
 
     def drawCircle(self, image):
@@ -478,56 +503,6 @@ class IndiAllskyCardinalDirsLabel(object):
 
 
     def panorama_label_pillow(self, image, coord_dict):
-        img_rgb = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-        width, height  = img_rgb.size  # backwards from opencv
-
-
-        if self.config['TEXT_PROPERTIES']['PIL_FONT_FILE'] == 'custom':
-            pillow_font_file_p = Path(self.config['TEXT_PROPERTIES']['PIL_FONT_CUSTOM'])
-        else:
-            pillow_font_file_p = self.font_path.joinpath(self.config['TEXT_PROPERTIES']['PIL_FONT_FILE'])
-
-
         pillow_font_size = self.config.get('FISH2PANO', {}).get('PIL_FONT_SIZE', 30)
 
-        font = ImageFont.truetype(str(pillow_font_file_p), pillow_font_size)
-        draw = ImageDraw.Draw(img_rgb)
-
-        color_rgb = list(self.config['CARDINAL_DIRS']['FONT_COLOR'])  # RGB for pillow
-
-
-        if self.config['TEXT_PROPERTIES']['FONT_OUTLINE']:
-            # black outline
-            stroke_width = 4
-        else:
-            stroke_width = 0
-
-
-        for k, v in coord_dict.items():
-            x, y = v
-
-            if x < self.left_offset:
-                x = self.left_offset
-            elif x > width - self.right_offset:
-                x = width - self.right_offset
-
-            if y < self.top_offset:
-                y = self.top_offset
-            elif y > height - self.bottom_offset:
-                y = height - self.bottom_offset
-
-
-            draw.text(
-                (x, y),
-                k,
-                fill=tuple(color_rgb),
-                font=font,
-                stroke_width=stroke_width,
-                stroke_fill=(0, 0, 0),
-                anchor='mm',  # middle-middle
-            )
-
-
-        # convert back to numpy array
-        return cv2.cvtColor(numpy.array(img_rgb), cv2.COLOR_RGB2BGR)
-
+        return self._applyTextLayers(image, coord_dict, pillow_font_size)
@@ -1,6 +1,8 @@
 import sys
 import os
 import time
+import copy
+import threading
 from datetime import datetime
 from datetime import timezone
 import io
@@ -125,7 +127,9 @@ class IndiAllSkyConfigBase(object):
             "IMAGE_CIRCLE"   : 2000,
             "KEOGRAM_RATIO"  : 0.15,
             "PRE_SCALE"      : 50,
+            "PROCESSES"      : 1,
             "FFMPEG_REPORT"  : False,
+            "RAW_PIPE"       : False,
         },
         "DAYTIME_CAPTURE"          : True,
         "DAYTIME_CAPTURE_SAVE"     : True,
@@ -163,6 +167,8 @@ class IndiAllSkyConfigBase(object):
         "KEOGRAM_CROP_TOP"      : 0,  # percent
         "KEOGRAM_CROP_BOTTOM"   : 0,  # percent
         "KEOGRAM_LABEL"         : True,
+        "KEOGRAM_INCREMENTAL"   : False,
+        "KEOGRAM_INCREMENTAL_CHECKPOINT" : 20,
         "LONGTERM_KEOGRAM"      : {
             "ENABLE"        : True,
             "OFFSET_X"      : 0,
@@ -181,6 +187,7 @@ class IndiAllSkyConfigBase(object):
         "STARTRAILS_USE_DB_DATA"         : True,
         "IMAGE_CALIBRATE_DARK"  : True,
         "IMAGE_CALIBRATE_BPM"   : False,
+        "IMAGE_CALIBRATE_CACHE_MB" : 256,
         "IMAGE_EXIF_PRIVACY"    : False,
         "IMAGE_FILE_TYPE" : "jpg",  # jpg, png, or tif
         "IMAGE_FILE_COMPRESSION" : {
@@ -279,6 +286,11 @@ class IndiAllSkyConfigBase(object):
         "IMAGE_QUEUE_MAX"       : 3,
         "IMAGE_QUEUE_MIN"       : 1,
         "IMAGE_QUEUE_BACKOFF"   : 0.5,
+        "IMAGE_SHARED_MEMORY"   : False,
+        "IMAGE_SHARED_MEMORY_SLOTS"   : 4,
+        "IMAGE_SHARED_MEMORY_SLOT_MB" : 128,
+        "IMAGE_OUTPUT_WORKER"   : False,
+        "IMAGE_OUTPUT_QUEUE_MAX": 3,
         "FFMPEG_FRAMERATE" : 25,
         "FFMPEG_BITRATE"   : "5000k",
         "FFMPEG_VFSCALE"   : "",
@@ -430,6 +442,7 @@ class IndiAllSkyConfigBase(object):
             "TLS"                    : True,
             "CERT_BYPASS"            : True,
             "PUBLISH_IMAGE"          : True,
+            "CHANGED_ONLY"           : False,  # unchanged retained topics are not republished
         },
         "SYNCAPI" : {
             "ENABLE"                 : False,
@@ -469,6 +482,7 @@ class IndiAllSkyConfigBase(object):
             "CAMERA_ID"              : 0,
             "EXTRA_OPTIONS"          : "",
             "EXTRA_OPTIONS_DAY"      : "",
+            "PERSISTENT"             : False,  # keep rpicam-still running between exposures
         },
         "PYCURL_CAMERA" : {
             "URL"                    : '',
@@ -1004,6 +1018,90 @@ class IndiAllSkyConfig(IndiAllSkyConfigBase):
         return config, encrypted
 
 
+class IndiAllSkyConfigCached(IndiAllSkyConfig):
+    """Latest config shared between requests in the web processes
+
+    The config is only loaded when a new config entry is saved, detected with a query
+    that does not fetch the config data.  Secrets are decrypted the first time a view
+    needs them.  The shared config must not be modified.
+    """
+
+    _cache_lock = threading.Lock()
+
+    # shared by all instances in the process
+    _cache = {
+        'key' : None,
+    }
+
+
+    def __init__(self, decrypt=False):
+        # not calling parent constructor
+        cache = self._getCache()
+
+        self._config_id = cache['config_id']
+        self._config_level = cache['config_level']
+        self._createDate = cache['createDate']
+
+        if decrypt:
+            self._config = self._getDecryptedConfig(cache)
+        else:
+            self._config = cache['config']
+
+
+    def _getCache(self):
+        latest_entry = db.session.query(
+            IndiAllSkyDbConfigTable.id,
+            IndiAllSkyDbConfigTable.createDate,
+        )\
+            .order_by(IndiAllSkyDbConfigTable.createDate.desc())\
+            .limit(1)\
+            .one()
+
+        cache_key = (latest_entry.id, latest_entry.createDate)
+
+
+        with self._cache_lock:
+            cache = self.__class__._cache
+
+            if cache['key'] == cache_key:
+                return cache
+
+
+            # not catching NoResultFound
+            config_entry = self._getConfigEntry(config_id=latest_entry.id)
+
+            config = self.base_config.copy()  # populate initial values
+            config.update(copy.deepcopy(config_entry.data))  # detach from the database entry
+
+
+            cache = {
+                'key'              : cache_key,
+                'config_id'        : config_entry.id,
+                'config_level'     : config_entry.level,
+                'createDate'       : config_entry.createDate,
+                'config'           : config,
+                'config_decrypted' : None,
+            }
+
+            self.__class__._cache = cache
+
+            logger.info('Loaded config id %d', config_entry.id)
+
+
+        return cache
+
+
+    def _getDecryptedConfig(self, cache):
+        with self._cache_lock:
+            if isinstance(cache['config_decrypted'], type(None)):
+                # decrypting modifies the nested values
+                self._config = copy.deepcopy(cache['config'])
+                cache['config_decrypted'] = self._decrypt_passwords()
+
+
+        return cache['config_decrypted']
+
+
 class IndiAllSkyConfigUtil(IndiAllSkyConfig):
 
     def __init__(self):
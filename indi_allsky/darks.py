@@ -8,6 +8,7 @@ import json
 import subprocess
 from datetime import datetime
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import logging
 
@@ -890,6 +891,16 @@ class IndiAllSkyDarks(object):
 
         image_bitpix = None
 
+
+        s = stacking_class(self.gain_v, self.bin_v)
+        s.bitmax = self.bitmax
+        s.hotpixel_adu_percent = self.hotpixel_adu_percent
+
+        # frames are folded into the stack while the next exposure is taken
+        stack_executor = ThreadPoolExecutor(max_workers=1)
+        stack_future = None
+
+
         i = 1
         while i <= self.count:
             # sometimes image data is bad, take images until we reach the desired number
@@ -929,22 +940,28 @@ class IndiAllSkyDarks(object):
             image_bitpix = hdulist[0].header['BITPIX']
 
 
-            f_tmp_fit = tempfile.NamedTemporaryFile(dir=tmp_fit_dir_p, suffix='.fit', delete=False)
-            hdulist.writeto(f_tmp_fit)
-            f_tmp_fit.flush()
-            f_tmp_fit.close()
-
-            #logger.info('FIT: %s', f_tmp_fit.name)
-
             m_avg = numpy.mean(hdulist[0].data)
             logger.info('Image average adu: %0.2f', m_avg)
 
+
+            if stack_future:
+                # only one frame is held while waiting to be stacked
+                stack_future.result()
+
+            stack_future = stack_executor.submit(s.add, hdulist, tmp_fit_dir_p)
+
             self.getCcdTemperature()
             logger.info('Camera temperature: %0.2f', self.sensors_temp_av[0])
 
             i += 1  # increment
 
 
+        if stack_future:
+            stack_future.result()
+
+        stack_executor.shutdown()
+
+
         # libcamera does not know the temperature until the first exposure is taken
         exp_date = datetime.now()
         date_str = exp_date.strftime('%Y%m%d_%H%M%S')
@@ -971,12 +988,8 @@ class IndiAllSkyDarks(object):
         full_bpm_filename_p = self.darks_dir.joinpath(bpm_filename)
 
 
-        s = stacking_class(self.gain_v, self.bin_v)
-        s.bitmax = self.bitmax
-        s.hotpixel_adu_percent = self.hotpixel_adu_percent
-
-        bpm_adu_avg = s.buildBadPixelMap(tmp_fit_dir_p, full_bpm_filename_p, exposure_f, image_bitpix)
-        dark_adu_avg = s.stack(tmp_fit_dir_p, full_dark_filename_p, exposure_f, image_bitpix)
+        bpm_adu_avg = s.buildBadPixelMap(full_bpm_filename_p, exposure_f)
+        dark_adu_avg = s.stack(full_dark_filename_p, exposure_f)
 
         bpm_metadata = {
             'type'       : constants.BPM_FRAME,
@@ -1173,6 +1186,20 @@ class IndiAllSkyDarks(object):
 
 
 class IndiAllSkyDarksProcessor(object):
+    """Folds dark frames into a master dark and bad pixel map as they arrive
+
+    Frames are added to a running sum and maximum, so memory use does not grow
+    with the number of frames.  Stacking methods that need every frame keep
+    them on disk and read them back in row tiles.
+    """
+
+    # frames are only written to disk when the stacking method needs them
+    keep_frames = False
+
+    # memory used by each tile when frames are read back from disk
+    tile_mem_limit = 100000000  # bytes
+
+
     def __init__(self, gain_v, bin_v):
         self.gain_v = gain_v
         self.bin_v = bin_v
@@ -1181,6 +1208,16 @@ class IndiAllSkyDarksProcessor(object):
 
         self._bitmax = 0
 
+        self.image_bitpix = None
+        self.numpy_type = None
+
+        self.frame_count = 0
+        self.frame_list = list()  # temporary fits files
+
+        self._header = None
+        self._sum = None
+        self._max = None
+
 
     @property
     def bitmax(self):
@@ -1200,40 +1237,84 @@ class IndiAllSkyDarksProcessor(object):
         self._hotpixel_adu_percent = int(new_hotpixel_adu_percent)
 
 
+    def add(self, hdulist, tmp_fit_dir_p):
+        ### Fold a frame into the running sum and max
+        data = hdulist[0].data
 
-    def buildBadPixelMap(self, tmp_fit_dir_p, filename_p, exposure, image_bitpix):
-        from astropy.io import fits
+        if not self.frame_count:
+            self.image_bitpix = hdulist[0].header['BITPIX']
+            self.numpy_type = self._numpyType(self.image_bitpix)
 
-        logger.info('Building bad pixel map for exposure %0.1fs, gain %d, bin %d', exposure, self.gain_v.value, self.bin_v.value)
+            if self.numpy_type in (numpy.uint8, numpy.uint16):
+                # enough for 65536 16-bit frames
+                sum_type = numpy.uint32
+            elif self.numpy_type == numpy.uint32:
+                sum_type = numpy.uint64
+            else:
+                sum_type = numpy.float64
+
+            self._sum = numpy.zeros(data.shape, dtype=sum_type)
+            self._max = numpy.zeros(data.shape, dtype=self.numpy_type)
+
+
+        numpy.add(self._sum, data, out=self._sum, casting='unsafe')
+        numpy.maximum(self._max, data, out=self._max, casting='unsafe')
+
+        self.frame_count += 1
+
+        # the last frame header is reused for the stacked data
+        self._header = hdulist[0].header.copy()
+
+
+        if self.keep_frames:
+            f_tmp_fit = tempfile.NamedTemporaryFile(dir=tmp_fit_dir_p, suffix='.fit', delete=False)
+            hdulist.writeto(f_tmp_fit)
+            f_tmp_fit.flush()
+            f_tmp_fit.close()
+
+            #logger.info('FIT: %s', f_tmp_fit.name)
 
+            self.frame_list.append(Path(f_tmp_fit.name))
+
+
+    def _numpyType(self, image_bitpix):
         if image_bitpix == 16:
-            numpy_type = numpy.uint16
+            return numpy.uint16
         elif image_bitpix == 8:
-            numpy_type = numpy.uint8
+            return numpy.uint8
         elif image_bitpix == -32:
-            numpy_type = numpy.float32
+            return numpy.float32
         elif image_bitpix == 32:
-            numpy_type = numpy.uint32
-        else:
-            raise Exception('Unknown bits per pixel')
+            return numpy.uint32
+
+        raise Exception('Unknown bits per pixel')
+
+
+    def _rowTiles(self, shape, bytes_per_value):
+        ### Yields slices of rows that fit in tile_mem_limit
+        row_values = int(numpy.prod(shape)) // shape[-2]
 
+        tile_rows = max(1, self.tile_mem_limit // (row_values * bytes_per_value))
 
-        image_data = list()
-        hdulist = None
-        for item in Path(tmp_fit_dir_p).iterdir():
-            #logger.info('Found item: %s', item)
-            if item.is_file() and item.suffix in ['.fit']:
-                #logger.info('Found fit: %s', item)
-                hdulist = fits.open(item)
-                image_data.append(hdulist[0].data)
+        for y in range(0, shape[-2], tile_rows):
+            # rows are the second to last axis for mono and RGB data
+            yield (Ellipsis, slice(y, min(y + tile_rows, shape[-2])), slice(None))
 
 
-        bpm = numpy.zeros(image_data[0].shape, dtype=numpy_type)
+    def _writeFits(self, data, filename_p):
+        from astropy.io import fits
+
+        hdu = fits.PrimaryHDU(data, header=self._header)
+        hdulist = fits.HDUList([hdu])
+
+        hdulist.writeto(filename_p)
+
 
+    def buildBadPixelMap(self, filename_p, exposure):
+        logger.info('Building bad pixel map for exposure %0.1fs, gain %d, bin %d', exposure, self.gain_v.value, self.bin_v.value)
 
-        # take the max values of each pixel from each image
-        for image in image_data:
-            bpm = numpy.maximum(bpm, image)
+        # max values of each pixel from each image
+        bpm = self._max
 
 
         max_val = numpy.amax(bpm)
@@ -1242,59 +1323,38 @@ class IndiAllSkyDarksProcessor(object):
         if self.bitmax:
             bitmax_percent = ((2 ** self.bitmax) - 1) * (self.hotpixel_adu_percent / 100.0)
         else:
-            if numpy_type in (numpy.float32, numpy.uint32):
+            if self.numpy_type in (numpy.float32, numpy.uint32):
                 # assume 16bit max
                 bitmax_percent = ((2 ** 16) - 1) * (self.hotpixel_adu_percent / 100.0)
             else:
-                bitmax_percent = ((2 ** image_bitpix) - 1) * (self.hotpixel_adu_percent / 100.0)
+                bitmax_percent = ((2 ** self.image_bitpix) - 1) * (self.hotpixel_adu_percent / 100.0)
 
         bpm[bpm < bitmax_percent] = 0  # filter all values less than max value
 
         bpm_adu_avg = numpy.mean(bpm)
         logger.info('Master BPM average adu: %0.2f', bpm_adu_avg)
 
-        hdulist[0].data = bpm
-
-        # reuse the last fits file for the stacked data
-        hdulist.writeto(filename_p)
+        self._writeFits(bpm, filename_p)
 
         return bpm_adu_avg
 
 
-    def stack(self, tmp_fit_dir_p, filename_p, exposure, image_bitpix):
+    def stack(self, filename_p, exposure):
         raise Exception('Must be redefined in sub-class')
 
 
 class IndiAllSkyDarksAverage(IndiAllSkyDarksProcessor):
-    def stack(self, tmp_fit_dir_p, filename_p, exposure, image_bitpix):
-        from astropy.io import fits
-
+    def stack(self, filename_p, exposure):
         logger.info('Stacking dark frames for exposure %0.1fs, gain %d, bin %d', exposure, self.gain_v.value, self.bin_v.value)
 
-        if image_bitpix == 16:
-            numpy_type = numpy.uint16
-        elif image_bitpix == 8:
-            numpy_type = numpy.uint8
-        elif image_bitpix == -32:
-            numpy_type = numpy.float32
-        elif image_bitpix == 32:
-            numpy_type = numpy.uint32
-        else:
-            raise Exception('Unknown bits per pixel')
-
-        image_data = list()
-        hdulist = None
-        for item in Path(tmp_fit_dir_p).iterdir():
-            #logger.info('Found item: %s', item)
-            if item.is_file() and item.suffix in ('.fit',):
-                #logger.info('Found fit: %s', item)
-                hdulist = fits.open(item)
-                image_data.append(hdulist[0].data)
+        start = time.time()
 
+        avg_data = numpy.empty(self._sum.shape, dtype=self.numpy_type)
 
-        start = time.time()
+        # divide in tiles to limit the size of the float intermediate
+        for rows in self._rowTiles(self._sum.shape, 8):
+            avg_data[rows] = (self._sum[rows] / self.frame_count).astype(self.numpy_type)
 
-        avg_data = (numpy.sum(image_data, axis=0) / len(image_data)).astype(numpy_type)
         #logger.info('Avg dims: %s', str(avg_data.shape))
 
         elapsed_s = time.time() - start
@@ -1303,61 +1363,71 @@ class IndiAllSkyDarksAverage(IndiAllSkyDarksProcessor):
         dark_adu_avg = numpy.mean(avg_data)
         logger.info('Master Dark average adu: %0.2f', dark_adu_avg)
 
-        hdulist[0].data = avg_data
-
-        # reuse the last fits file for the stacked data
-        hdulist.writeto(filename_p)
+        self._writeFits(avg_data, filename_p)
 
         return dark_adu_avg
 
 
 class IndiAllSkyDarksSigmaClip(IndiAllSkyDarksProcessor):
-    def stack(self, tmp_fit_dir_p, filename_p, exposure, image_bitpix):
-        from astropy.stats import mad_std
-        import ccdproc
 
-        logger.info('Stacking dark frames for exposure %0.1fs, gain %d, bin %d', exposure, self.gain_v.value, self.bin_v.value)
+    keep_frames = True
 
-        if image_bitpix == 16:
-            numpy_type = numpy.uint16
-        elif image_bitpix == 8:
-            numpy_type = numpy.uint8
-        elif image_bitpix == -32:
-            numpy_type = numpy.float32
-        elif image_bitpix == 32:
-            numpy_type = numpy.uint32
-        else:
-            raise Exception('Unknown bits per pixel')
+    # pixels further than this many deviations from the median are excluded from the average
+    sigma_clip_thresh = 5
 
-        dark_images = ccdproc.ImageFileCollection(tmp_fit_dir_p)
 
-        cal_darks = dark_images.files_filtered(exptime=exposure, include_path=True)
+    def stack(self, filename_p, exposure):
+        from astropy.io import fits
+        from astropy.stats import sigma_clip
 
+        logger.info('Stacking dark frames for exposure %0.1fs, gain %d, bin %d', exposure, self.gain_v.value, self.bin_v.value)
 
         start = time.time()
 
-        combined_dark = ccdproc.combine(
-            cal_darks,
-            method='average',
-            sigma_clip=True,
-            sigma_clip_low_thresh=5,
-            sigma_clip_high_thresh=5,
-            sigma_clip_func=numpy.ma.median,
-            signma_clip_dev_func=mad_std,
-            dtype=numpy_type,
-            mem_limit=350000000,
-        )
+        # unsigned data is stored with BZERO, scaling is applied to each tile
+        hdulist_list = [fits.open(f, memmap=True, do_not_scale_image_data=True) for f in self.frame_list]
+
+        combined_data = numpy.empty(self._sum.shape, dtype=self.numpy_type)
+
+        # each tile holds the same rows from every frame as float64
+        for rows in self._rowTiles(self._sum.shape, 8 * len(hdulist_list)):
+            tile_data = numpy.stack([self._scaledSection(hdulist[0], rows) for hdulist in hdulist_list])
+
+            clipped_data = sigma_clip(
+                tile_data,
+                sigma_lower=self.sigma_clip_thresh,
+                sigma_upper=self.sigma_clip_thresh,
+                maxiters=1,
+                cenfunc='median',
+                stdfunc='mad_std',
+                axis=0,
+            )
+
+            combined_data[rows] = clipped_data.mean(axis=0).filled(0).astype(self.numpy_type)
+
+
+        for hdulist in hdulist_list:
+            hdulist.close()
+
 
         elapsed_s = time.time() - start
         logger.info('Exposure sigma clip stacked in %0.4f s', elapsed_s)
 
 
-        combined_dark.meta['combined'] = True
-
-        dark_adu_avg = numpy.mean(combined_dark[0].data, axis=0)
+        dark_adu_avg = numpy.mean(combined_data)
         logger.info('Master Dark average adu: %0.2f', dark_adu_avg)
 
-        combined_dark.write(filename_p)
+        self._header['COMBINED'] = True
+        self._writeFits(combined_data, filename_p)
 
         return dark_adu_avg
 
+
+    def _scaledSection(self, hdu, rows):
+        # section only reads the requested rows from the file
+        data = hdu.section[rows].astype(numpy.float64)
+
+        data *= hdu.header.get('BSCALE', 1)
+        data += hdu.header.get('BZERO', 0)
+
+        return data
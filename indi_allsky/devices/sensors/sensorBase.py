@@ -3,6 +3,12 @@ import math
 
 class SensorBase(object):
 
+    # seconds between updates in SensorWorker
+    update_interval = 15
+
+    # a running update is reported as stalled after this many seconds
+    update_timeout = 30
+
 
     def __init__(self, *args, **kwargs):
         self.config = args[0]
@@ -19,6 +19,11 @@ logger = logging.getLogger('indi_allsky')
 
 class TempApiAmbientWeather(SensorBase):
 
+    # API data is only refreshed every next_run_offset seconds
+    update_interval = 60
+    update_timeout = 60
+
+
     ### https://ambientweather.docs.apiary.io/#
     ###
     ### [ {
@@ -17,6 +17,11 @@ logger = logging.getLogger('indi_allsky')
 
 class TempApiAstrospheric(SensorBase):
 
+    # API data is only refreshed every next_run_offset seconds
+    update_interval = 60
+    update_timeout = 60
+
+
     URL = 'https://astrosphericpublicaccess.azurewebsites.net/api/GetForecastData_V1'
 
 
@@ -19,6 +19,11 @@ logger = logging.getLogger('indi_allsky')
 
 class TempApiEcowitt(SensorBase):
 
+    # API data is only refreshed every next_run_offset seconds
+    update_interval = 60
+    update_timeout = 60
+
+
     ### https://doc.ecowitt.net/web/#/apiv3en?page_id=17
     ###
     ### {
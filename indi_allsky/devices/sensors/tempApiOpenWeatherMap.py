@@ -46,6 +46,11 @@ logger = logging.getLogger('indi_allsky')
 
 class TempApiOpenWeatherMap(SensorBase):
 
+    # API data is only refreshed every next_run_offset seconds
+    update_interval = 60
+    update_timeout = 60
+
+
     UNITS = 'metric'
     URL_TEMPLATE = 'https://api.openweathermap.org/data/2.5/weather?lat={latitude:0.1f}&lon={longitude:0.1f}&units={units:s}&appid={apikey:s}'
 
@@ -19,6 +19,11 @@ logger = logging.getLogger('indi_allsky')
 
 class TempApiWeatherUnderground(SensorBase):
 
+    # API data is only refreshed every next_run_offset seconds
+    update_interval = 60
+    update_timeout = 60
+
+
     ### https://www.ibm.com/docs/en/environmental-intel-suite?topic=apis-pws-observations-current-conditions
 
     UNITS = 's'  # s = metric_si
@@ -10,6 +10,11 @@ logger = logging.getLogger('indi_allsky')
 
 class TempSensorDht2x(SensorBase):
 
+    # DHT reads are bit-banged and retried by the library, slow to return
+    update_interval = 30
+    update_timeout = 60
+
+
     def update(self):
 
         try:
@@ -12,6 +12,11 @@ logger = logging.getLogger('indi_allsky')
 
 class TempSensorDs18x20(SensorBase):
 
+    # 1-wire conversions take up to 750ms per read, the bus may stall
+    update_interval = 30
+    update_timeout = 60
+
+
     METADATA = {
         'name' : 'DS18x20',
         'description' : 'DS18x20 1-wire Temperature Sensor',
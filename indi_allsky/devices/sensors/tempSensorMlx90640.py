@@ -10,6 +10,11 @@ logger = logging.getLogger('indi_allsky')
 
 class TempSensorMlx90640(SensorBase):
 
+    # full frame transfers over I2C are slow
+    update_interval = 30
+    update_timeout = 60
+
+
     SENSOR_WIDTH = 32
     SENSOR_HEIGHT = 24
 
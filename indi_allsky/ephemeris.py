@@ -0,0 +1,211 @@
+import math
+import threading
+import logging
+
+import ephem
+
+from .flask import db
+from .flask.models import IndiAllSkyDbTleDataTable
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllSkyEphemeris(object):
+    """Sun, moon, planet and satellite calculations for a location
+
+    Positions are computed on every call.  Rise, set, transit and satellite
+    pass times are cached until they pass, and parsed TLE data is cached until
+    the TLE table changes.  The caches are shared by all instances in the
+    process.
+    """
+
+    # never up and always up results are checked again after this many seconds
+    circumpolar_recheck = 3600
+
+    # expired events are removed when the cache grows past this size
+    event_cache_max = 500
+
+
+    # (position, body, event, horizon, use_center) -> (date, error, expire date)
+    _event_cache = dict()
+
+    # (group, title) -> satellite body
+    _tle_cache = dict()
+    _tle_version = None
+
+    _lock = threading.Lock()
+
+
+    def __init__(self, latitude, longitude, elevation):
+        self.latitude = latitude
+        self.longitude = longitude
+
+        # this can be eventually removed
+        if isinstance(elevation, type(None)):
+            elevation = 0
+
+        self.elevation = elevation
+
+
+    def observer(self, utcnow):
+        obs = ephem.Observer()
+        obs.lon = math.radians(self.longitude)
+        obs.lat = math.radians(self.latitude)
+        obs.elevation = self.elevation
+
+        # disable atmospheric refraction calcs
+        obs.pressure = 0
+
+        obs.date = utcnow  # ephem expects UTC dates
+
+        return obs
+
+
+    def body(self, body_name, obs):
+        body = getattr(ephem, body_name)()
+        body.compute(obs)
+
+        return body
+
+
+    def nextRising(self, body_name, utcnow, horizon=0.0, use_center=False):
+        return self._event(body_name, 'next_rising', utcnow, horizon, use_center)
+
+
+    def nextSetting(self, body_name, utcnow, horizon=0.0, use_center=False):
+        return self._event(body_name, 'next_setting', utcnow, horizon, use_center)
+
+
+    def nextTransit(self, body_name, utcnow):
+        return self._event(body_name, 'next_transit', utcnow, 0.0, False)
+
+
+    def _event(self, body_name, event, utcnow, horizon, use_center):
+        ### Returns an ephem.Date, raises ephem.NeverUpError and ephem.AlwaysUpError
+        now_date = ephem.Date(utcnow)
+
+        event_key = (self.latitude, self.longitude, self.elevation, body_name, event, horizon, use_center)
+
+        cached = self._event_cache.get(event_key)
+        if cached:
+            event_date, error, expire_date = cached
+
+            if now_date < expire_date:
+                if error:
+                    raise error('{0:s} {1:s} is circumpolar'.format(body_name, event))
+
+                return event_date
+
+
+        obs = self.observer(utcnow)
+        obs.horizon = math.radians(horizon)
+
+        body = self.body(body_name, obs)
+
+        try:
+            if event == 'next_transit':
+                event_date = obs.next_transit(body)
+            else:
+                event_date = getattr(obs, event)(body, use_center=use_center)
+        except (ephem.NeverUpError, ephem.AlwaysUpError) as e:
+            recheck_date = ephem.Date(now_date + self.circumpolar_recheck * ephem.second)
+            self._cacheEvent(event_key, (None, e.__class__, recheck_date), now_date)
+            raise
+
+
+        self._cacheEvent(event_key, (event_date, None, event_date), now_date)
+
+        return event_date
+
+
+    def _cacheEvent(self, event_key, value, now_date):
+        with self._lock:
+            if len(self._event_cache) > self.event_cache_max:
+                for k, v in list(self._event_cache.items()):
+                    if v[2] <= now_date:
+                        self._event_cache.pop(k, None)
+
+            self._event_cache[event_key] = value
+
+
+    def satellites(self, satellite_dict):
+        ### Returns a dict of satellite bodies
+        self._checkTleVersion()
+
+        satellite_data = dict()
+        for sat_key, sat_data in satellite_dict.items():
+            tle_key = (sat_data['group'], sat_data['title'])
+
+            try:
+                sat = self._tle_cache[tle_key]
+            except KeyError:
+                sat = self._loadTle(sat_data)
+                self._tle_cache[tle_key] = sat
+
+
+            if sat:
+                satellite_data[sat_key] = sat
+
+        return satellite_data
+
+
+    def nextPass(self, sat, utcnow):
+        ### Returns (rise time, rise az, max alt time, max alt, set time, set az), cached until the satellite rises
+        now_date = ephem.Date(utcnow)
+
+        event_key = (self.latitude, self.longitude, self.elevation, sat.name, 'next_pass', self._tle_version, None)
+
+        cached = self._event_cache.get(event_key)
+        if cached:
+            next_pass, error, expire_date = cached
+
+            if now_date < expire_date:
+                return next_pass
+
+
+        obs = self.observer(utcnow)
+        sat.compute(obs)
+
+        next_pass = obs.next_pass(sat)
+
+        if next_pass[0]:
+            self._cacheEvent(event_key, (next_pass, None, next_pass[0]), now_date)
+
+        return next_pass
+
+
+    def _checkTleVersion(self):
+        # TLE data is replaced when it is updated
+        tle_version = db.session.query(db.func.max(IndiAllSkyDbTleDataTable.id)).scalar()
+
+        if tle_version == self._tle_version:
+            return
+
+
+        with self._lock:
+            IndiAllSkyEphemeris._tle_cache = dict()
+            IndiAllSkyEphemeris._tle_version = tle_version
+
+
+    def _loadTle(self, sat_data):
+        # there may be multiple satellites of the same name, usually pieces of the same rocket
+        sat_entry = IndiAllSkyDbTleDataTable.query\
+            .filter(IndiAllSkyDbTleDataTable.group == sat_data['group'])\
+            .filter(IndiAllSkyDbTleDataTable.title == sat_data['title'])\
+            .order_by(IndiAllSkyDbTleDataTable.id.desc())\
+            .first()
+
+
+        if not sat_entry:
+            logger.warning('Satellite data not found: %s', sat_data['title'])
+            return None
+
+        #logger.info('Found satellite data: %s', sat_name)
+
+        try:
+            return ephem.readtle(sat_entry.title, sat_entry.line1, sat_entry.line2)
+        except ValueError as e:
+            logger.error('Satellite TLE data error: %s', str(e))
+            return None
+
@@ -16,6 +16,10 @@ logger = logging.getLogger('indi_allsky')
 
 
 class boto3_minio(GenericFileTransfer):
+
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(boto3_minio, self).__init__(*args, **kwargs)
 
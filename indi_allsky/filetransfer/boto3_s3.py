@@ -15,6 +15,10 @@ logger = logging.getLogger('indi_allsky')
 
 
 class boto3_s3(GenericFileTransfer):
+
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(boto3_s3, self).__init__(*args, **kwargs)
 
@@ -16,6 +16,10 @@ logger = logging.getLogger('indi_allsky')
 
 
 class gcp_storage(GenericFileTransfer):
+
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(gcp_storage, self).__init__(*args, **kwargs)
 
@@ -7,6 +7,14 @@ logger = logging.getLogger('indi_allsky')
 
 
 class GenericFileTransfer(object):
+
+    # connections may be kept open between transfers
+    reusable = False
+
+    # seconds before an unused connection is closed, None uses the pool default
+    idle_timeout = None
+
+
     def __init__(self, *args, **kwargs):
         self.config = args[0]
         self.delete = kwargs.get('delete', False)
@@ -19,6 +27,8 @@ class GenericFileTransfer(object):
 
         self._client = None
 
+        self.pool_key = None
+
 
     @property
     def port(self):
@@ -68,6 +78,11 @@ class GenericFileTransfer(object):
         pass
 
 
+    def healthy(self):
+        # checked before a pooled connection is reused
+        return True
+
+
     def put(self, *args, **kwargs):
         if self.delete:
             # perform delete instead of upload
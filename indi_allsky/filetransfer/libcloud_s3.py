@@ -14,6 +14,10 @@ logger = logging.getLogger('indi_allsky')
 
 
 class libcloud_s3(GenericFileTransfer):
+
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(libcloud_s3, self).__init__(*args, **kwargs)
 
@@ -17,6 +17,10 @@ logger = logging.getLogger('indi_allsky')
 
 
 class oci_storage(GenericFileTransfer):
+
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(oci_storage, self).__init__(*args, **kwargs)
 
@@ -8,26 +8,51 @@ import ssl
 import io
 import socket
 import time
+import threading
 import logging
 
 logger = logging.getLogger('indi_allsky')
 
 
 class paho_mqtt(GenericFileTransfer):
+
+    # the client stays connected and reconnects in the background
+    reusable = True
+
+    # images are usually published every exposure
+    idle_timeout = 900.0
+
+    # messages waiting to be sent to the broker, new messages are dropped when full
+    max_queued_messages = 1000
+
+    max_inflight_messages = 100
+
+    # unchanged values are republished after this many seconds
+    changed_only_refresh = 300.0
+
+
     def __init__(self, *args, **kwargs):
         super(paho_mqtt, self).__init__(*args, **kwargs)
 
         self._port = 1883
 
-        self.mq_transport = None
-        self.mq_hostname = None
-        self.mq_auth = None
-        self.mq_tls = None
+        self.client = None
+
+        self._connected = threading.Event()
+        self._connect_reason = None
+
+        # topic -> (payload, time published)
+        self._published = dict()
+
+        self._dropped = 0
 
 
     def connect(self, *args, **kwargs):
         super(paho_mqtt, self).connect(*args, **kwargs)
 
+        import paho.mqtt.client as mqtt
+
+
         transport = kwargs['transport']
         hostname = kwargs['hostname']
         username = kwargs['username']
@@ -36,38 +61,99 @@ class paho_mqtt(GenericFileTransfer):
         cert_bypass = kwargs.get('cert_bypass')
 
 
-        self.mq_transport = transport
-        self.mq_hostname = hostname
+        self.client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id='',
+            transport=transport,
+        )
 
-        if tls:
-            self.mq_tls = {
-                'ca_certs'    : '/etc/ssl/certs/ca-certificates.crt',
-                'cert_reqs'   : ssl.CERT_REQUIRED,
-                'insecure'    : False,
-            }
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
 
-            if cert_bypass:
-                self.mq_tls['cert_reqs'] = ssl.CERT_NONE
-                self.mq_tls['insecure'] = True
 
+        if tls:
+            if cert_bypass:
+                self.client.tls_set(ca_certs='/etc/ssl/certs/ca-certificates.crt', cert_reqs=ssl.CERT_NONE)
+                self.client.tls_insecure_set(True)
+            else:
+                self.client.tls_set(ca_certs='/etc/ssl/certs/ca-certificates.crt', cert_reqs=ssl.CERT_REQUIRED)
 
 
         if username:
-            self.mq_auth = {
-                'username' : username,
-                'password' : password,
-            }
+            self.client.username_pw_set(username, password=password)
+
+
+        self.client.max_queued_messages_set(self.max_queued_messages)
+        self.client.max_inflight_messages_set(self.max_inflight_messages)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+
+
+        self._connected.clear()
+        self._connect_reason = None
+
+        try:
+            self.client.connect(hostname, port=self._port, keepalive=60)
+        except socket.gaierror as e:
+            raise ConnectionFailure(str(e)) from e
+        except socket.timeout as e:
+            raise ConnectionFailure(str(e)) from e
+        except ssl.SSLCertVerificationError as e:
+            raise ConnectionFailure(str(e)) from e
+        except ConnectionRefusedError as e:
+            raise ConnectionFailure(str(e)) from e
+        except OSError as e:
+            raise ConnectionFailure(str(e)) from e
+
+
+        # network loop runs in a separate thread and handles reconnects
+        self.client.loop_start()
+
+
+        if not self._connected.wait(timeout=self.connect_timeout):
+            if self._connect_reason and self._connect_reason.is_failure:
+                raise AuthenticationFailure(str(self._connect_reason))
+
+            raise ConnectionFailure('Timeout waiting for MQTT connection')
+
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        self._connect_reason = reason_code
+
+        if reason_code.is_failure:
+            logger.error('MQTT connection failed: %s', str(reason_code))
+            return
+
+        logger.info('MQTT connected')
+        self._connected.set()
+
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self._connected.clear()
+
+        if reason_code.is_failure:
+            logger.warning('MQTT disconnected: %s', str(reason_code))
+
+
+    def healthy(self):
+        if not self.client:
+            return False
+
+        # the client may be reconnecting in the background
+        return self.client.is_connected() or self._connected.wait(timeout=self.connect_timeout)
 
 
     def close(self):
         super(paho_mqtt, self).close()
 
+        if self.client:
+            self.client.disconnect()
+            self.client.loop_stop()
+
 
     def put(self, *args, **kwargs):
         super(paho_mqtt, self).put(*args, **kwargs)
 
-        import paho.mqtt.publish as publish
-        from paho.mqtt import MQTTException
+        import paho.mqtt.client as mqtt
 
 
         local_file = kwargs['local_file']
@@ -76,6 +162,7 @@ class paho_mqtt(GenericFileTransfer):
         mq_data    = kwargs['mq_data']
         image_topic = kwargs['image_topic']
         publish_image = kwargs['publish_image']
+        changed_only = kwargs.get('changed_only')
 
         local_file_p = Path(local_file)
 
@@ -87,7 +174,7 @@ class paho_mqtt(GenericFileTransfer):
             with io.open(local_file_p, 'rb') as f_localfile:
                 message_list.append({
                     'topic'    : '/'.join((base_topic, image_topic)),
-                    'payload'  : f_localfile.read(),  # this requires paho-mqtt >= v2.0.0
+                    'payload'  : f_localfile.read(),
                     'qos'      : qos,
                     'retain'   : True,
                 })
@@ -102,35 +189,69 @@ class paho_mqtt(GenericFileTransfer):
             })
 
 
+        if not message_list:
+            raise TransferFailure('No MQTT messages to publish')
+
+
         start = time.time()
 
-        try:
-            publish.multiple(
-                message_list,
-                transport=self.mq_transport,
-                hostname=self.mq_hostname,
-                port=self._port,
-                client_id='',
-                keepalive=60,
-                auth=self.mq_auth,
-                tls=self.mq_tls,
+        message_info_list = list()
+        skipped = 0
+
+        for message in message_list:
+            if changed_only and not self._changed(message, start):
+                skipped += 1
+                continue
+
+            message_info = self.client.publish(
+                message['topic'],
+                payload=message['payload'],
+                qos=message['qos'],
+                retain=message['retain'],
             )
-        except socket.gaierror as e:
-            raise ConnectionFailure(str(e)) from e
-        except socket.timeout as e:
-            raise ConnectionFailure(str(e)) from e
-        except ssl.SSLCertVerificationError as e:
-            raise ConnectionFailure(str(e)) from e
-        except ConnectionRefusedError as e:
-            raise ConnectionFailure(str(e)) from e
-        except MQTTException as e:
-            raise AuthenticationFailure(str(e)) from e
-        except ValueError as e:
-            # this can happen if msgs is empty
-            raise TransferFailure(str(e)) from e
+
+            if message_info.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+                self._dropped += 1
+                continue
+            elif message_info.rc == mqtt.MQTT_ERR_NO_CONN:
+                raise ConnectionFailure('MQTT client is not connected')
+            elif message_info.rc != mqtt.MQTT_ERR_SUCCESS:
+                raise TransferFailure(mqtt.error_string(message_info.rc))
+
+
+            self._published[message['topic']] = (message['payload'], start)
+            message_info_list.append(message_info)
+
+
+        if self._dropped:
+            logger.warning('MQTT outbound queue full, %d messages dropped', self._dropped)
+            self._dropped = 0
+
+
+        # messages are sent asynchronously, wait for all of them to be acknowledged
+        for message_info in message_info_list:
+            try:
+                message_info.wait_for_publish(timeout=max(self.timeout - (time.time() - start), 0.1))
+            except RuntimeError as e:
+                raise ConnectionFailure(str(e)) from e
+
+            if not message_info.is_published():
+                # remaining messages are still delivered after reconnecting
+                logger.warning('Timeout waiting for MQTT messages to be published')
+                break
+
 
         upload_elapsed_s = time.time() - start
-        local_file_size = local_file_p.stat().st_size
-        logger.info('File transferred in %0.4f s (%0.2f kB/s)', upload_elapsed_s, local_file_size / upload_elapsed_s / 1024)
+        logger.info('Published %d MQTT messages (%d unchanged) in %0.4f s', len(message_info_list), skipped, upload_elapsed_s)
+
+
+    def _changed(self, message, now):
+        try:
+            last_payload, last_time = self._published[message['topic']]
+        except KeyError:
+            return True
 
+        if now - last_time > self.changed_only_refresh:
+            return True
 
+        return last_payload != message['payload']
@@ -0,0 +1,142 @@
+### Keeps file transfer clients connected between uploads
+
+import time
+import logging
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class FileTransferPool(object):
+    """Connected file transfer clients keyed by class and connection parameters
+
+    Each upload worker has its own pool, so no locking is needed.  Clients are
+    removed from the pool while in use.  Idle clients are closed after
+    idle_timeout seconds (unless the client sets its own) and checked before
+    they are reused.
+    """
+
+    idle_timeout = 120.0
+
+
+    def __init__(self):
+        # pool_key -> client
+        self._clients = dict()
+
+        # pool_key -> time of last use
+        self._last_used = dict()
+
+
+    def connect(self, client, connect_kwargs):
+        ### Returns a connected client and if it was reused
+        pool_key = self._poolKey(client, connect_kwargs)
+
+        pooled_client = self._clients.pop(pool_key, None)
+        if pooled_client:
+            idle_s = time.time() - self._last_used.pop(pool_key)
+
+            if idle_s < self._idleTimeout(pooled_client) and self._healthy(pooled_client):
+                logger.info('Reusing %s connection (idle %0.1f s)', pooled_client.__class__.__name__, idle_s)
+                return pooled_client, True
+
+            logger.info('Closing stale %s connection', pooled_client.__class__.__name__)
+            self._close(pooled_client)
+
+
+        client.pool_key = pool_key
+        client.connect(**connect_kwargs)
+
+        return client, False
+
+
+    def reconnect(self, client, connect_kwargs):
+        ### Replace a client with a new connection
+        self.discard(client)
+
+        new_client = client.__class__(client.config, delete=client.delete)
+        new_client.port = client.port
+        new_client.connect_timeout = client.connect_timeout
+        new_client.timeout = client.timeout
+        new_client.atomic = client.atomic
+
+        new_client.pool_key = client.pool_key
+        new_client.connect(**connect_kwargs)
+
+        return new_client
+
+
+    def release(self, client):
+        ### Return a working client to the pool
+        if not client.reusable or not client.pool_key:
+            self._close(client)
+            return
+
+
+        old_client = self._clients.get(client.pool_key)
+        if old_client and old_client is not client:
+            self._close(old_client)
+
+        self._clients[client.pool_key] = client
+        self._last_used[client.pool_key] = time.time()
+
+
+    def discard(self, client):
+        ### Close a client after a failure
+        self._close(client)
+
+
+    def expire(self):
+        now = time.time()
+
+        for pool_key, last_used in list(self._last_used.items()):
+            if now - last_used < self._idleTimeout(self._clients[pool_key]):
+                continue
+
+            client = self._clients.pop(pool_key)
+            self._last_used.pop(pool_key)
+
+            logger.info('Closing idle %s connection', client.__class__.__name__)
+            self._close(client)
+
+
+    def closeAll(self):
+        for client in self._clients.values():
+            self._close(client)
+
+        self._clients.clear()
+        self._last_used.clear()
+
+
+    def _poolKey(self, client, connect_kwargs):
+        return (
+            client.__class__.__name__,
+            client.delete,
+            client.port,
+            client.connect_timeout,
+            client.timeout,
+            client.atomic,
+            tuple(sorted((k, str(v)) for k, v in connect_kwargs.items())),
+        )
+
+
+    def _idleTimeout(self, client):
+        if client.idle_timeout:
+            return client.idle_timeout
+
+        return self.idle_timeout
+
+
+    def _healthy(self, client):
+        try:
+            return client.healthy()
+        except Exception as e:
+            logger.warning('%s health check failed: %s', client.__class__.__name__, str(e))
+            return False
+
+
+    def _close(self, client):
+        # connections may already be broken
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning('Error closing %s connection: %s', client.__class__.__name__, str(e))
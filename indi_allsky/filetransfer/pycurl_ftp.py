@@ -13,6 +13,10 @@ logger = logging.getLogger('indi_allsky')
 
 
 class pycurl_ftp(GenericFileTransfer):
+
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(pycurl_ftp, self).__init__(*args, **kwargs)
 
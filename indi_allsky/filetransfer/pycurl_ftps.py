@@ -14,6 +14,10 @@ logger = logging.getLogger('indi_allsky')
 
 
 class pycurl_ftps(GenericFileTransfer):
+
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(pycurl_ftps, self).__init__(*args, **kwargs)
 
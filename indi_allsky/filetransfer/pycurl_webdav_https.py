@@ -14,6 +14,10 @@ logger = logging.getLogger('indi_allsky')
 
 
 class pycurl_webdav_https(GenericFileTransfer):
+
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(pycurl_webdav_https, self).__init__(*args, **kwargs)
 
@@ -106,6 +110,10 @@ class pycurl_webdav_https(GenericFileTransfer):
         remote_file_p = Path(remote_file)
 
 
+        # the handle may have been used for a previous upload
+        self.client.setopt(pycurl.UPLOAD, 0)
+
+
         # Try to create remote folder
         dir_list = list(remote_file_p.parents)
         dir_list.reverse()  # need root dirs first
@@ -15,6 +15,10 @@ logger = logging.getLogger('indi_allsky')
 
 
 class python_ftp(GenericFileTransfer):
+
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(python_ftp, self).__init__(*args, **kwargs)
 
@@ -57,6 +61,18 @@ class python_ftp(GenericFileTransfer):
             self.client.quit()
 
 
+    def healthy(self):
+        if not self.client:
+            return False
+
+        try:
+            self.client.voidcmd('NOOP')
+        except ftplib.all_errors:
+            return False
+
+        return True
+
+
     def put(self, *args, **kwargs):
         super(python_ftp, self).put(*args, **kwargs)
 
@@ -85,6 +101,14 @@ class python_ftp(GenericFileTransfer):
                 # will return an error if the directory already exists
                 #logger.warning('FTP error creating directory: %s', str(e))
                 pass
+            except ftplib.error_temp as e:
+                raise ConnectionFailure(str(e)) from e
+            except EOFError as e:
+                raise ConnectionFailure(str(e)) from e
+            except socket.timeout as e:
+                raise ConnectionFailure(str(e)) from e
+            except ConnectionError as e:
+                raise ConnectionFailure(str(e)) from e
 
 
         start = time.time()
@@ -94,6 +118,16 @@ class python_ftp(GenericFileTransfer):
                 self.client.storbinary('STOR {0}'.format(str(remote_file_p)), f_localfile, blocksize=262144)
         except ftplib.error_perm as e:
             raise TransferFailure(str(e)) from e
+        except ftplib.error_temp as e:
+            raise ConnectionFailure(str(e)) from e
+        except EOFError as e:
+            # server closed the reused connection
+            raise ConnectionFailure(str(e)) from e
+        except socket.timeout as e:
+            raise ConnectionFailure(str(e)) from e
+        except ConnectionError as e:
+            # reset, aborted or broken pipe
+            raise ConnectionFailure(str(e)) from e
 
 
         upload_elapsed_s = time.time() - start
@@ -27,6 +27,8 @@ logger = logging.getLogger('indi_allsky')
 
 class requests_syncapi_v1(GenericFileTransfer):
 
+    reusable = True
+
     time_skew = 300  # number of seconds the client is allowed to deviate from server
 
 
@@ -59,7 +61,8 @@ class requests_syncapi_v1(GenericFileTransfer):
         self.url = endpoint_url
 
 
-        self.client = requests
+        # keep alive connections are reused by the session
+        self.client = requests.Session()
 
 
         if cert_bypass:
@@ -70,6 +73,9 @@ class requests_syncapi_v1(GenericFileTransfer):
     def close(self):
         super(requests_syncapi_v1, self).close()
 
+        if self.client:
+            self.client.close()
+
 
     def put(self, *args, **kwargs):
         super(requests_syncapi_v1, self).put(*args, **kwargs)
@@ -136,7 +142,6 @@ class requests_syncapi_v1(GenericFileTransfer):
 
         headers = {
             'Authorization' : 'Bearer {0:s}:{1:s}'.format(self.username, message_hmac),
-            'Connection'    : 'close',  # no need for keep alives
             'Content-Type'  : mp_enc.content_type,
         }
 
@@ -37,6 +37,7 @@ from .models import IndiAllSkyDbCameraTable
 from .forms import IndiAllskyCameraSelectForm
 
 from .miscDb import miscDb
+from ..ephemeris import IndiAllSkyEphemeris
 
 #from ..exceptions import ConfigSaveException
 
@@ -44,12 +45,23 @@ from .miscDb import miscDb
 class BaseView(View):
     decorators = [login_optional]  # auth based on app.config['INDI_ALLSKY_AUTH_ALL_VIEWS']
 
+    # views that modify the config need a private copy
+    cache_config = True
+
+    # views that need the decrypted passwords and keys
+    decrypt_config = False
+
+
     def __init__(self, **kwargs):
         super(BaseView, self).__init__(**kwargs)
         from ..config import IndiAllSkyConfig  # prevent circular import
+        from ..config import IndiAllSkyConfigCached
 
         # not catching exception
-        self._indi_allsky_config_obj = IndiAllSkyConfig()
+        if self.cache_config:
+            self._indi_allsky_config_obj = IndiAllSkyConfigCached(decrypt=self.decrypt_config)
+        else:
+            self._indi_allsky_config_obj = IndiAllSkyConfig()
 
         self.indi_allsky_config = self._indi_allsky_config_obj.config
 
@@ -182,33 +194,10 @@ class BaseView(View):
     def getSunSetDate(self):
         utcnow = datetime.now(tz=timezone.utc)  # ephem expects UTC dates
 
-        longitude = self.camera.longitude
-        latitude = self.camera.latitude
-        elevation = self.camera.elevation
-
-        # this can be eventually removed
-        if isinstance(elevation, type(None)):
-            elevation = 0
-
-
-        obs = ephem.Observer()
-        obs.lon = math.radians(longitude)
-        obs.lat = math.radians(latitude)
-        obs.elevation = elevation
-
-
-        # disable atmospheric refraction calcs
-        obs.pressure = 0
-
-        sun = ephem.Sun()
-
-        obs.date = utcnow
-
-        obs.horizon = math.radians(self.camera.nightSunAlt)
-        sun.compute(obs)
+        ephemeris = IndiAllSkyEphemeris(self.camera.latitude, self.camera.longitude, self.camera.elevation)
 
         try:
-            self.sun_set_date = obs.next_setting(sun, use_center=True).datetime()
+            self.sun_set_date = ephemeris.nextSetting('Sun', utcnow, horizon=self.camera.nightSunAlt, use_center=True).datetime()
             #app.logger.info('Sun set date: %s', self.sun_set_date)
         except ephem.AlwaysUpError:
             # northern hemisphere
@@ -348,20 +337,12 @@ class BaseView(View):
 
         utcnow = datetime.now(tz=timezone.utc)  # ephem expects UTC dates
 
-        obs = ephem.Observer()
-        obs.lon = math.radians(longitude)
-        obs.lat = math.radians(latitude)
-        obs.elevation = elevation
+        ephemeris = IndiAllSkyEphemeris(latitude, longitude, elevation)
 
-        # disable atmospheric refraction calcs
-        obs.pressure = 0
+        obs = ephemeris.observer(utcnow)
 
-        sun = ephem.Sun()
-        moon = ephem.Moon()
-
-        obs.date = utcnow
-        sun.compute(obs)
-        moon.compute(obs)
+        sun = ephemeris.body('Sun', obs)
+        moon = ephemeris.body('Moon', obs)
 
         data['sidereal_time'] = str(obs.sidereal_time())
 
@@ -369,7 +350,7 @@ class BaseView(View):
         sun_alt = math.degrees(sun.alt)
         data['sun_alt'] = sun_alt
 
-        sun_transit_date = obs.next_transit(sun).datetime()
+        sun_transit_date = ephemeris.nextTransit('Sun', utcnow).datetime()
         sun_transit_delta = sun_transit_date - utcnow.replace(tzinfo=None)
         if sun_transit_delta.seconds < 43200:  # 12 hours
             #rising
@@ -387,7 +368,7 @@ class BaseView(View):
         moon_phase_percent = moon.moon_phase * 100.0
         data['moon_phase'] = moon_phase_percent
 
-        moon_transit_date = obs.next_transit(moon).datetime()
+        moon_transit_date = ephemeris.nextTransit('Moon', utcnow).datetime()
         moon_transit_delta = moon_transit_date - utcnow.replace(tzinfo=None)
         if moon_transit_delta.seconds < 43200:  # 12 hours
             #rising
@@ -446,15 +427,11 @@ class BaseView(View):
             data['moon_glyph'] = moon_glyphs_waning[round((100 - moon_phase_percent) / (100 / (len(moon_glyphs_waning) - 1)))]
 
 
-        obs.date = utcnow  # reset
-        sun.compute(obs)
-
         try:
-            obs.horizon = math.radians(self.indi_allsky_config['NIGHT_SUN_ALT_DEG'])
             if self.night:
-                mode_next_change_date = obs.next_rising(sun).datetime()
+                mode_next_change_date = ephemeris.nextRising('Sun', utcnow, horizon=self.indi_allsky_config['NIGHT_SUN_ALT_DEG']).datetime()
             else:
-                mode_next_change_date = obs.next_setting(sun).datetime()
+                mode_next_change_date = ephemeris.nextSetting('Sun', utcnow, horizon=self.indi_allsky_config['NIGHT_SUN_ALT_DEG']).datetime()
 
             data['mode_next_change'] = (mode_next_change_date + timedelta(seconds=camera_utc_offset)).strftime('%H:%M')
             data['mode_next_change_h'] = (mode_next_change_date - utcnow.replace(tzinfo=None)).total_seconds() / 3600
@@ -466,11 +443,8 @@ class BaseView(View):
             data['mode_next_change_h'] = 0.0
 
 
-        obs.date = utcnow  # reset
-        sun.compute(obs)
-
         try:
-            sun_next_rise_date = obs.next_rising(sun).datetime()
+            sun_next_rise_date = ephemeris.nextRising('Sun', utcnow, horizon=self.indi_allsky_config['NIGHT_SUN_ALT_DEG']).datetime()
             data['sun_next_rise'] = (sun_next_rise_date + timedelta(seconds=camera_utc_offset)).strftime('%H:%M')
             data['sun_next_rise_h'] = (sun_next_rise_date - utcnow.replace(tzinfo=None)).total_seconds() / 3600
         except ephem.NeverUpError:
@@ -481,11 +455,8 @@ class BaseView(View):
             data['sun_next_rise_h'] = 0.0
 
 
-        obs.date = utcnow  # reset
-        sun.compute(obs)
-
         try:
-            sun_next_set_date = obs.next_setting(sun).datetime()
+            sun_next_set_date = ephemeris.nextSetting('Sun', utcnow, horizon=self.indi_allsky_config['NIGHT_SUN_ALT_DEG']).datetime()
             data['sun_next_set'] = (sun_next_set_date + timedelta(seconds=camera_utc_offset)).strftime('%H:%M')
             data['sun_next_set_h'] = (sun_next_set_date - utcnow.replace(tzinfo=None)).total_seconds() / 3600
         except ephem.NeverUpError:
@@ -496,11 +467,8 @@ class BaseView(View):
             data['sun_next_set_h'] = 0.0
 
 
-        obs.date = utcnow  # reset
-        moon.compute(obs)
-
         try:
-            moon_next_rise_date = obs.next_rising(moon).datetime()
+            moon_next_rise_date = ephemeris.nextRising('Moon', utcnow, horizon=self.indi_allsky_config['NIGHT_SUN_ALT_DEG']).datetime()
             data['moon_next_rise'] = (moon_next_rise_date + timedelta(seconds=camera_utc_offset)).strftime('%H:%M')
             data['moon_next_rise_h'] = (moon_next_rise_date - utcnow.replace(tzinfo=None)).total_seconds() / 3600
         except ephem.NeverUpError:
@@ -511,11 +479,8 @@ class BaseView(View):
             data['moon_next_rise_h'] = 0.0
 
 
-        obs.date = utcnow  # reset
-        moon.compute(obs)
-
         try:
-            moon_next_set_date = obs.next_setting(moon).datetime()
+            moon_next_set_date = ephemeris.nextSetting('Moon', utcnow, horizon=self.indi_allsky_config['NIGHT_SUN_ALT_DEG']).datetime()
             data['moon_next_set'] = (moon_next_set_date + timedelta(seconds=camera_utc_offset)).strftime('%H:%M')
             data['moon_next_set_h'] = (moon_next_set_date - utcnow.replace(tzinfo=None)).total_seconds() / 3600
         except ephem.NeverUpError:
@@ -526,12 +491,8 @@ class BaseView(View):
             data['moon_next_set_h'] = 0.0
 
 
-        obs.date = utcnow  # reset
-        sun.compute(obs)
-
         try:
-            obs.horizon = math.radians(-18.0)
-            sun_next_astro_twilight_rise_date = obs.next_rising(sun).datetime()
+            sun_next_astro_twilight_rise_date = ephemeris.nextRising('Sun', utcnow, horizon=-18.0).datetime()
             data['sun_next_astro_twilight_rise'] = (sun_next_astro_twilight_rise_date + timedelta(seconds=camera_utc_offset)).strftime('%H:%M')
             data['sun_next_astro_twilight_rise_h'] = (sun_next_astro_twilight_rise_date - utcnow.replace(tzinfo=None)).total_seconds() / 3600
         except ephem.NeverUpError:
@@ -542,12 +503,8 @@ class BaseView(View):
             data['sun_next_astro_twilight_rise_h'] = 0.0
 
 
-        obs.date = utcnow  # reset
-        sun.compute(obs)
-
         try:
-            obs.horizon = math.radians(-18.0)
-            sun_next_astro_twilight_set_date = obs.next_setting(sun).datetime()
+            sun_next_astro_twilight_set_date = ephemeris.nextSetting('Sun', utcnow, horizon=-18.0).datetime()
             data['sun_next_astro_twilight_set'] = (sun_next_astro_twilight_set_date + timedelta(seconds=camera_utc_offset)).strftime('%H:%M')
             data['sun_next_astro_twilight_set_h'] = (sun_next_astro_twilight_set_date - utcnow.replace(tzinfo=None)).total_seconds() / 3600
         except ephem.NeverUpError:
@@ -558,7 +515,6 @@ class BaseView(View):
             data['sun_next_astro_twilight_set_h'] = 0.0
 
 
-        #obs.horizon = math.radians(0.0)  # reset
         #app.logger.info('Astrometric data: %s', data)
 
         return data
@@ -829,28 +785,7 @@ class BaseView(View):
         mask_processor.image = mask_data
 
 
-        if self.indi_allsky_config.get('IMAGE_ROTATE'):
-            mask_processor.rotate_90()
-
-
-        # rotation
-        if self.indi_allsky_config.get('IMAGE_ROTATE_ANGLE'):
-            mask_processor.rotate_angle()
-
-
-        # verticle flip
-        if self.indi_allsky_config.get('IMAGE_FLIP_V'):
-            mask_processor.flip_v()
-
-
-        # horizontal flip
-        if self.indi_allsky_config.get('IMAGE_FLIP_H'):
-            mask_processor.flip_h()
-
-
-        # crop
-        if self.indi_allsky_config.get('IMAGE_CROP_ROI'):
-            mask_processor.crop_image()
+        mask_processor.transform_image()
 
 
         # scale
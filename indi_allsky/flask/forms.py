@@ -35,7 +35,6 @@ from sqlalchemy import func
 #from sqlalchemy.types import Date
 from sqlalchemy import and_
 from sqlalchemy import or_
-from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql.expression import true as sa_true
 from sqlalchemy.sql.expression import false as sa_false
 from sqlalchemy.sql.expression import null as sa_null
@@ -55,6 +54,7 @@ from .models import IndiAllSkyDbRawImageTable
 from .models import IndiAllSkyDbPanoramaImageTable
 from .models import IndiAllSkyDbPanoramaVideoTable
 from .models import IndiAllSkyDbThumbnailTable
+from .models import IndiAllSkyDbCalendarTable
 
 from . import db
 
@@ -282,6 +282,14 @@ def TIMELAPSE__PRE_SCALE_validator(form, field):
         raise ValidationError('Pre-Scaling factor must be 100 or less')
 
 
+def TIMELAPSE__PROCESSES_validator(form, field):
+    if field.data < 1:
+        raise ValidationError('Processes must be 1 or more')
+
+    if field.data > 16:
+        raise ValidationError('Processes must be 16 or less')
+
+
 def CCD_BIT_DEPTH_validator(form, field):
     if int(field.data) not in (0, 8, 10, 12, 14, 16):
         raise ValidationError('Bits must be 0, 8, 10, 12, 14, or 16 ')
@@ -919,6 +927,14 @@ def KEOGRAM_CROP_BOTTOM_validator(*args):
     KEOGRAM_CROP_TOP_validator(*args)
 
 
+def KEOGRAM_INCREMENTAL_CHECKPOINT_validator(form, field):
+    if not isinstance(field.data, int):
+        raise ValidationError('Please enter valid number')
+
+    if field.data < 1:
+        raise ValidationError('Checkpoint interval must be 1 or greater')
+
+
 def LONGTERM_KEOGRAM__OFFSET_X_validator(form, field):
     if not isinstance(field.data, int):
         raise ValidationError('Please enter valid number')
@@ -1029,6 +1045,41 @@ def IMAGE_QUEUE_BACKOFF_validator(form, field):
         raise ValidationError('Backoff multiplier must be greater than 0')
 
 
+def IMAGE_SHARED_MEMORY_SLOTS_validator(form, field):
+    if not isinstance(field.data, int):
+        raise ValidationError('Please enter valid number')
+
+    if field.data < 2:
+        raise ValidationError('Shared memory slots must be 2 or greater')
+
+
+def IMAGE_SHARED_MEMORY_SLOT_MB_validator(form, field):
+    if not isinstance(field.data, int):
+        raise ValidationError('Please enter valid number')
+
+    if field.data < 1:
+        raise ValidationError('Slot size must be 1 or greater')
+
+    if field.data > 1024:
+        raise ValidationError('Slot size must be 1024 or less')
+
+
+def IMAGE_OUTPUT_QUEUE_MAX_validator(form, field):
+    if not isinstance(field.data, int):
+        raise ValidationError('Please enter valid number')
+
+    if field.data < 1:
+        raise ValidationError('Queue max size must be 1 or greater')
+
+
+def IMAGE_CALIBRATE_CACHE_MB_validator(form, field):
+    if not isinstance(field.data, int):
+        raise ValidationError('Please enter valid number')
+
+    if field.data < 0:
+        raise ValidationError('Cache size must be 0 or greater')
+
+
 def IMAGE_FILE_TYPE_validator(form, field):
     if field.data not in ('jpg', 'png', 'tif', 'webp'):
         raise ValidationError('Please select a valid file type')
@@ -3446,7 +3497,9 @@ class IndiAllskyConfigForm(FlaskForm):
     TIMELAPSE__IMAGE_CIRCLE          = IntegerField('Image Circle Diameter', validators=[DataRequired(), TIMELAPSE__IMAGE_CIRCLE_validator])
     TIMELAPSE__KEOGRAM_RATIO         = FloatField('Keogram Ratio', validators=[DataRequired(), TIMELAPSE__KEOGRAM_RATIO_validator])
     TIMELAPSE__PRE_SCALE             = IntegerField('Pre-Scale Images', validators=[DataRequired(), TIMELAPSE__PRE_SCALE_validator])
+    TIMELAPSE__PROCESSES             = IntegerField('Pre-Processor Processes', validators=[DataRequired(), TIMELAPSE__PROCESSES_validator])
     TIMELAPSE__FFMPEG_REPORT         = BooleanField('Generate FFMPEG debug report')
+    TIMELAPSE__RAW_PIPE              = BooleanField('Stream Frames to FFMPEG')
     CAPTURE_PAUSE                    = BooleanField('Pause Capture')
     DAYTIME_CAPTURE                  = BooleanField('Daytime Capture')
     DAYTIME_CAPTURE_SAVE             = BooleanField('Daytime Save Images')
@@ -3478,6 +3531,8 @@ class IndiAllskyConfigForm(FlaskForm):
     KEOGRAM_CROP_TOP                 = IntegerField('Keogram Crop Top (%)', validators=[KEOGRAM_CROP_TOP_validator])
     KEOGRAM_CROP_BOTTOM              = IntegerField('Keogram Crop Bottom (%)', validators=[KEOGRAM_CROP_BOTTOM_validator])
     KEOGRAM_LABEL                    = BooleanField('Label Keogram')
+    KEOGRAM_INCREMENTAL              = BooleanField('Incremental Keogram/Star Trails')
+    KEOGRAM_INCREMENTAL_CHECKPOINT   = IntegerField('Incremental Checkpoint Interval', validators=[DataRequired(), KEOGRAM_INCREMENTAL_CHECKPOINT_validator])
     LONGTERM_KEOGRAM__ENABLE         = BooleanField('Enable Long Term Keogram')
     LONGTERM_KEOGRAM__OFFSET_X       = IntegerField('X Offset', validators=[LONGTERM_KEOGRAM__OFFSET_X_validator])
     LONGTERM_KEOGRAM__OFFSET_Y       = IntegerField('Y Offset', validators=[LONGTERM_KEOGRAM__OFFSET_Y_validator])
@@ -3494,6 +3549,7 @@ class IndiAllskyConfigForm(FlaskForm):
     STARTRAILS_USE_DB_DATA           = BooleanField('Star Trails Use Existing Data')
     IMAGE_CALIBRATE_DARK             = BooleanField('Apply Dark Calibration Frames')
     IMAGE_CALIBRATE_BPM              = BooleanField('Apply Bad Pixel Map Frames')
+    IMAGE_CALIBRATE_CACHE_MB         = IntegerField('Calibration Cache Size (MB)', validators=[IMAGE_CALIBRATE_CACHE_MB_validator])
     IMAGE_SAVE_FITS_PRE_DARK         = BooleanField('Save FITS Pre-Calibration')
     IMAGE_EXIF_PRIVACY               = BooleanField('Enable EXIF Privacy')
     IMAGE_FILE_TYPE                  = SelectField('Image file type', choices=IMAGE_FILE_TYPE_choices, validators=[DataRequired(), IMAGE_FILE_TYPE_validator])
@@ -3524,6 +3580,11 @@ class IndiAllskyConfigForm(FlaskForm):
     IMAGE_QUEUE_MAX                  = IntegerField('Image Queue Maximum', validators=[IMAGE_QUEUE_MAX_validator])
     IMAGE_QUEUE_MIN                  = IntegerField('Image Queue Minimum', validators=[IMAGE_QUEUE_MIN_validator])
     IMAGE_QUEUE_BACKOFF              = FloatField('Image Queue Backoff Multiplier', validators=[IMAGE_QUEUE_BACKOFF_validator])
+    IMAGE_SHARED_MEMORY              = BooleanField('Shared Memory Image Transfer')
+    IMAGE_SHARED_MEMORY_SLOTS        = IntegerField('Shared Memory Slots', validators=[DataRequired(), IMAGE_SHARED_MEMORY_SLOTS_validator])
+    IMAGE_SHARED_MEMORY_SLOT_MB      = IntegerField('Shared Memory Slot Size (MB)', validators=[DataRequired(), IMAGE_SHARED_MEMORY_SLOT_MB_validator])
+    IMAGE_OUTPUT_WORKER              = BooleanField('Image Output Worker')
+    IMAGE_OUTPUT_QUEUE_MAX           = IntegerField('Image Output Queue Maximum', validators=[DataRequired(), IMAGE_OUTPUT_QUEUE_MAX_validator])
     FISH2PANO__ENABLE                = BooleanField('Enable Fisheye to Panoramic')
     FISH2PANO__DIAMETER              = IntegerField('Diameter', validators=[DataRequired(), FISH2PANO__DIAMETER_validator])
     FISH2PANO__OFFSET_X              = IntegerField('X Offset', validators=[FISH2PANO__OFFSET_X_validator], render_kw={'readonly' : True, 'disabled' : 'disabled'})
@@ -3709,6 +3770,7 @@ class IndiAllskyConfigForm(FlaskForm):
     MQTTPUBLISH__TLS                 = BooleanField('Use TLS')
     MQTTPUBLISH__CERT_BYPASS         = BooleanField('Disable Certificate Validation')
     MQTTPUBLISH__PUBLISH_IMAGE       = BooleanField('Enable Image Publishing')
+    MQTTPUBLISH__CHANGED_ONLY        = BooleanField('Publish Changed Values Only')
     SYNCAPI__ENABLE                  = BooleanField('Enable Sync API')
     SYNCAPI__BASEURL                 = StringField('URL', validators=[SYNCAPI__BASEURL_validator], render_kw={'autocomplete' : 'new-password'})  # prevent saving BASEURL as username
     SYNCAPI__USERNAME                = StringField('Username', validators=[SYNCAPI__USERNAME_validator], render_kw={'autocomplete' : 'new-password'})
@@ -3753,6 +3815,7 @@ class IndiAllskyConfigForm(FlaskForm):
     LIBCAMERA__CAMERA_ID             = SelectField('Camera ID', choices=LIBCAMERA__CAMERA_ID_choices, validators=[LIBCAMERA__CAMERA_ID_validator])
     LIBCAMERA__EXTRA_OPTIONS         = StringField('Night libcamera extra options', validators=[LIBCAMERA__EXTRA_OPTIONS_validator])
     LIBCAMERA__EXTRA_OPTIONS_DAY     = StringField('Day libcamera extra options', validators=[LIBCAMERA__EXTRA_OPTIONS_validator])
+    LIBCAMERA__PERSISTENT            = BooleanField('Persistent libcamera process')
     PYCURL_CAMERA__URL               = StringField('pyCurl Camera URL', validators=[PYCURL_CAMERA__URL_validator])
     PYCURL_CAMERA__IMAGE_FILE_TYPE   = SelectField('File Type', choices=PYCURL_CAMERA__IMAGE_FILE_TYPE_choices, validators=[DataRequired(), PYCURL_CAMERA__IMAGE_FILE_TYPE_validator])
     PYCURL_CAMERA__USERNAME          = StringField('Username', validators=[PYCURL_CAMERA__USERNAME_validator], render_kw={'autocomplete' : 'new-password'})
@@ -4423,36 +4486,27 @@ class IndiAllskyImageViewer(FlaskForm):
 
     def getYears(self):
         years_query = db.session.query(
-            IndiAllSkyDbImageTable.createDate_year,
+            IndiAllSkyDbCalendarTable.year,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
+                    IndiAllSkyDbCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbCalendarTable.asset_type == IndiAllSkyDbImageTable.__tablename__,
                 )
         )
 
 
-        if not self.local:
-            # Do not serve local assets
-            years_query = years_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
+        years_query = self._filterCalendar(years_query)
 
 
         years_query = years_query\
             .distinct()\
-            .order_by(IndiAllSkyDbImageTable.createDate_year.desc())
+            .order_by(IndiAllSkyDbCalendarTable.year.desc())
 
 
         year_choices = []
         for y in years_query:
-            entry = (y.createDate_year, str(y.createDate_year))
+            entry = (y.year, str(y.year))
             year_choices.append(entry)
 
 
@@ -4461,40 +4515,30 @@ class IndiAllskyImageViewer(FlaskForm):
 
     def getMonths(self, year):
         months_query = db.session.query(
-            IndiAllSkyDbImageTable.createDate_year,
-            IndiAllSkyDbImageTable.createDate_month,
+            IndiAllSkyDbCalendarTable.month,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    IndiAllSkyDbImageTable.createDate_year == year,
+                    IndiAllSkyDbCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbCalendarTable.asset_type == IndiAllSkyDbImageTable.__tablename__,
+                    IndiAllSkyDbCalendarTable.year == year,
                 )
         )
 
 
-        if not self.local:
-            # Do not serve local assets
-            months_query = months_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
+        months_query = self._filterCalendar(months_query)
 
 
         months_query = months_query\
             .distinct()\
-            .order_by(IndiAllSkyDbImageTable.createDate_month.desc())
+            .order_by(IndiAllSkyDbCalendarTable.month.desc())
 
 
         month_choices = []
         for m in months_query:
-            month_name = datetime.strptime('{0} {1}'.format(year, m.createDate_month), '%Y %m')\
+            month_name = datetime.strptime('{0} {1}'.format(year, m.month), '%Y %m')\
                 .strftime('%B')
-            entry = (m.createDate_month, month_name)
+            entry = (m.month, month_name)
             month_choices.append(entry)
 
 
@@ -4503,40 +4547,29 @@ class IndiAllskyImageViewer(FlaskForm):
 
     def getDays(self, year, month):
         days_query = db.session.query(
-            IndiAllSkyDbImageTable.createDate_year,
-            IndiAllSkyDbImageTable.createDate_month,
-            IndiAllSkyDbImageTable.createDate_day,
+            IndiAllSkyDbCalendarTable.day,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    IndiAllSkyDbImageTable.createDate_year == year,
-                    IndiAllSkyDbImageTable.createDate_month == month,
+                    IndiAllSkyDbCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbCalendarTable.asset_type == IndiAllSkyDbImageTable.__tablename__,
+                    IndiAllSkyDbCalendarTable.year == year,
+                    IndiAllSkyDbCalendarTable.month == month,
                 )
         )
 
 
-        if not self.local:
-            # Do not serve local assets
-            days_query = days_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
+        days_query = self._filterCalendar(days_query)
 
 
         days_query = days_query\
             .distinct()\
-            .order_by(IndiAllSkyDbImageTable.createDate_day.desc())
+            .order_by(IndiAllSkyDbCalendarTable.day.desc())
 
 
         day_choices = []
         for d in days_query:
-            entry = (d.createDate_day, str(d.createDate_day))
+            entry = (d.day, str(d.day))
             day_choices.append(entry)
 
 
@@ -4545,48 +4578,53 @@ class IndiAllskyImageViewer(FlaskForm):
 
     def getHours(self, year, month, day):
         hours_query = db.session.query(
-            IndiAllSkyDbImageTable.createDate_year,
-            IndiAllSkyDbImageTable.createDate_month,
-            IndiAllSkyDbImageTable.createDate_day,
-            IndiAllSkyDbImageTable.createDate_hour,
+            IndiAllSkyDbCalendarTable.hour,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    IndiAllSkyDbImageTable.createDate_year == year,
-                    IndiAllSkyDbImageTable.createDate_month == month,
-                    IndiAllSkyDbImageTable.createDate_day == day,
+                    IndiAllSkyDbCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbCalendarTable.asset_type == IndiAllSkyDbImageTable.__tablename__,
+                    IndiAllSkyDbCalendarTable.year == year,
+                    IndiAllSkyDbCalendarTable.month == month,
+                    IndiAllSkyDbCalendarTable.day == day,
                 )
         )
 
 
-        if not self.local:
-            # Do not serve local assets
-            hours_query = hours_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
+        hours_query = self._filterCalendar(hours_query)
 
 
         hours_query = hours_query\
-            .distinct()\
-            .order_by(IndiAllSkyDbImageTable.createDate_hour.desc())
+            .order_by(IndiAllSkyDbCalendarTable.hour.desc())
 
 
         hour_choices = []
         for h in hours_query:
-            entry = (h.createDate_hour, str(h.createDate_hour))
+            entry = (h.hour, str(h.hour))
             hour_choices.append(entry)
 
 
         return hour_choices
 
 
+    def _filterCalendar(self, calendar_query):
+        ### the calendar summarizes images by hour
+        if self.detections_count:
+            if self.local:
+                return calendar_query.filter(IndiAllSkyDbCalendarTable.detections > 0)
+
+            # Do not serve local assets
+            return calendar_query.filter(IndiAllSkyDbCalendarTable.remote_detections > 0)
+
+
+        if not self.local:
+            # Do not serve local assets
+            return calendar_query.filter(IndiAllSkyDbCalendarTable.remote > 0)
+
+
+        return calendar_query
+
+
     def getImages(self, year, month, day, hour):
         images_query = db.session.query(
             IndiAllSkyDbImageTable,
@@ -4619,6 +4657,12 @@ class IndiAllskyImageViewer(FlaskForm):
             .order_by(IndiAllSkyDbImageTable.createDate.desc())
 
 
+        # fetch the related files for the whole hour instead of querying each image
+        fits_images = self.getRelatedImages(IndiAllSkyDbFitsImageTable, year, month, day, hour)
+        raw_images = self.getRelatedImages(IndiAllSkyDbRawImageTable, year, month, day, hour)
+        panorama_images = self.getRelatedImages(IndiAllSkyDbPanoramaImageTable, year, month, day, hour)
+
+
         images_data = list()
         for img in images_query:
             try:
@@ -4643,33 +4687,24 @@ class IndiAllskyImageViewer(FlaskForm):
 
 
             # look for fits
-            try:
-                fits_image = db.session.query(
-                    IndiAllSkyDbFitsImageTable,
-                )\
-                    .filter(IndiAllSkyDbFitsImageTable.createDate == img.createDate)\
-                    .one()
-
+            fits_image = fits_images.get(img.createDate)
+            if fits_image:
                 image_dict['fits'] = str(fits_image.getUrl(s3_prefix=self.s3_prefix, local=self.local))
                 image_dict['fits_id'] = fits_image.id
-            except NoResultFound:
+            else:
                 image_dict['fits'] = None
                 image_dict['fits_id'] = None
 
 
             # look for raw exports
+            raw_image = raw_images.get(img.createDate)
             try:
-                raw_image = db.session.query(
-                    IndiAllSkyDbRawImageTable,
-                )\
-                    .filter(IndiAllSkyDbRawImageTable.createDate == img.createDate)\
-                    .one()
-
-                image_dict['raw'] = str(raw_image.getUrl(s3_prefix=self.s3_prefix, local=self.local))
-                image_dict['raw_id'] = raw_image.id
-            except NoResultFound:
-                image_dict['raw'] = None
-                image_dict['raw_id'] = None
+                if raw_image:
+                    image_dict['raw'] = str(raw_image.getUrl(s3_prefix=self.s3_prefix, local=self.local))
+                    image_dict['raw_id'] = raw_image.id
+                else:
+                    image_dict['raw'] = None
+                    image_dict['raw_id'] = None
             except ValueError:
                 # this can happen when RAW files are exported outside of the document root
                 image_dict['raw'] = None
@@ -4677,16 +4712,11 @@ class IndiAllskyImageViewer(FlaskForm):
 
 
             # look for panorama
-            try:
-                panorama_image = db.session.query(
-                    IndiAllSkyDbPanoramaImageTable,
-                )\
-                    .filter(IndiAllSkyDbPanoramaImageTable.createDate == img.createDate)\
-                    .one()
-
+            panorama_image = panorama_images.get(img.createDate)
+            if panorama_image:
                 image_dict['panorama'] = str(panorama_image.getUrl(s3_prefix=self.s3_prefix, local=self.local))
                 image_dict['panorama_id'] = panorama_image.id
-            except NoResultFound:
+            else:
                 image_dict['panorama'] = None
                 image_dict['panorama_id'] = None
 
@@ -4697,6 +4727,32 @@ class IndiAllskyImageViewer(FlaskForm):
         return images_data
 
 
+    def getRelatedImages(self, model, year, month, day, hour):
+        ### returns a dict of entries keyed by createDate
+        related_query = db.session.query(
+            model,
+        )\
+            .filter(
+                and_(
+                    model.camera_id == self.camera_id,
+                    model.createDate_year == year,
+                    model.createDate_month == month,
+                    model.createDate_day == day,
+                    model.createDate_hour == hour,
+                )
+        )\
+            .order_by(model.id.asc())
+
+
+        related_images = dict()
+        for entry in related_query:
+            # keep the first entry
+            related_images.setdefault(entry.createDate, entry)
+
+
+        return related_images
+
+
 class IndiAllskyImageViewerPreload(IndiAllskyImageViewer):
     def __init__(self, *args, **kwargs):
         super(IndiAllskyImageViewerPreload, self).__init__(*args, **kwargs)
@@ -4757,52 +4813,53 @@ class IndiAllskyFitsImageViewer(FlaskForm):
 
     def getYears(self):
         years_query = db.session.query(
-            self.model.createDate_year,
+            IndiAllSkyDbCalendarTable.year,
         )\
-            .join(self.model.camera)\
-            .filter(IndiAllSkyDbCameraTable.id == self.camera_id)
+            .filter(
+                and_(
+                    IndiAllSkyDbCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbCalendarTable.asset_type == self.model.__tablename__,
+                )
+        )
 
 
         years_query = years_query\
             .distinct()\
-            .order_by(self.model.createDate_year.desc())
+            .order_by(IndiAllSkyDbCalendarTable.year.desc())
 
 
         year_choices = []
         for y in years_query:
-            entry = (y.createDate_year, str(y.createDate_year))
+            entry = (y.year, str(y.year))
             year_choices.append(entry)
 
 
-        #app.logger.info('Years: %s', year_choices)
-
         return year_choices
 
 
     def getMonths(self, year):
         months_query = db.session.query(
-            self.model.createDate_year,
-            self.model.createDate_month,
+            IndiAllSkyDbCalendarTable.month,
         )\
-            .join(self.model.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    self.model.createDate_year == year,
+                    IndiAllSkyDbCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbCalendarTable.asset_type == self.model.__tablename__,
+                    IndiAllSkyDbCalendarTable.year == year,
                 )
         )
 
 
         months_query = months_query\
             .distinct()\
-            .order_by(self.model.createDate_month.desc())
+            .order_by(IndiAllSkyDbCalendarTable.month.desc())
 
 
         month_choices = []
         for m in months_query:
-            month_name = datetime.strptime('{0} {1}'.format(year, m.createDate_month), '%Y %m')\
+            month_name = datetime.strptime('{0} {1}'.format(year, m.month), '%Y %m')\
                 .strftime('%B')
-            entry = (m.createDate_month, month_name)
+            entry = (m.month, month_name)
             month_choices.append(entry)
 
 
@@ -4811,28 +4868,26 @@ class IndiAllskyFitsImageViewer(FlaskForm):
 
     def getDays(self, year, month):
         days_query = db.session.query(
-            self.model.createDate_year,
-            self.model.createDate_month,
-            self.model.createDate_day,
+            IndiAllSkyDbCalendarTable.day,
         )\
-            .join(self.model.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    self.model.createDate_year == year,
-                    self.model.createDate_month == month,
+                    IndiAllSkyDbCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbCalendarTable.asset_type == self.model.__tablename__,
+                    IndiAllSkyDbCalendarTable.year == year,
+                    IndiAllSkyDbCalendarTable.month == month,
                 )
         )
 
 
         days_query = days_query\
             .distinct()\
-            .order_by(self.model.createDate_day.desc())
+            .order_by(IndiAllSkyDbCalendarTable.day.desc())
 
 
         day_choices = []
         for d in days_query:
-            entry = (d.createDate_day, str(d.createDate_day))
+            entry = (d.day, str(d.day))
             day_choices.append(entry)
 
 
@@ -4841,30 +4896,26 @@ class IndiAllskyFitsImageViewer(FlaskForm):
 
     def getHours(self, year, month, day):
         hours_query = db.session.query(
-            self.model.createDate_year,
-            self.model.createDate_month,
-            self.model.createDate_day,
-            self.model.createDate_hour,
+            IndiAllSkyDbCalendarTable.hour,
         )\
-            .join(self.model.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    self.model.createDate_year == year,
-                    self.model.createDate_month == month,
-                    self.model.createDate_day == day,
+                    IndiAllSkyDbCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbCalendarTable.asset_type == self.model.__tablename__,
+                    IndiAllSkyDbCalendarTable.year == year,
+                    IndiAllSkyDbCalendarTable.month == month,
+                    IndiAllSkyDbCalendarTable.day == day,
                 )
         )
 
 
         hours_query = hours_query\
-            .distinct()\
-            .order_by(self.model.createDate_hour.desc())
+            .order_by(IndiAllSkyDbCalendarTable.hour.desc())
 
 
         hour_choices = []
         for h in hours_query:
-            entry = (h.createDate_hour, str(h.createDate_hour))
+            entry = (h.hour, str(h.hour))
             hour_choices.append(entry)
 
 
@@ -4972,40 +5023,27 @@ class IndiAllskyGalleryViewer(FlaskForm):
 
     def getYears(self):
         years_query = db.session.query(
-            IndiAllSkyDbImageTable.createDate_year,
+            IndiAllSkyDbCalendarTable.year,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
+                    IndiAllSkyDbCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbCalendarTable.asset_type == IndiAllSkyDbImageTable.__tablename__,
                 )
         )
 
 
-        ### Disable this join to make things faster
-        #    .join(IndiAllSkyDbThumbnailTable, IndiAllSkyDbImageTable.thumbnail_uuid == IndiAllSkyDbThumbnailTable.uuid)\
-
-
-        if not self.local:
-            # Do not serve local assets
-            years_query = years_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
+        years_query = self._filterCalendar(years_query)
 
 
         years_query = years_query\
             .distinct()\
-            .order_by(IndiAllSkyDbImageTable.createDate_year.desc())
+            .order_by(IndiAllSkyDbCalendarTable.year.desc())
 
 
         year_choices = []
         for y in years_query:
-            entry = (y.createDate_year, str(y.createDate_year))
+            entry = (y.year, str(y.year))
             year_choices.append(entry)
 
 
@@ -5014,43 +5052,30 @@ class IndiAllskyGalleryViewer(FlaskForm):
 
     def getMonths(self, year):
         months_query = db.session.query(
-            IndiAllSkyDbImageTable.createDate_year,
-            IndiAllSkyDbImageTable.createDate_month,
+            IndiAllSkyDbCalendarTable.month,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    IndiAllSkyDbImageTable.createDate_year == year,
+                    IndiAllSkyDbCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbCalendarTable.asset_type == IndiAllSkyDbImageTable.__tablename__,
+                    IndiAllSkyDbCalendarTable.year == year,
                 )
         )
 
-        ### Disable this join to make things faster
-        #    .join(IndiAllSkyDbThumbnailTable, IndiAllSkyDbImageTable.thumbnail_uuid == IndiAllSkyDbThumbnailTable.uuid)\
 
-
-        if not self.local:
-            # Do not serve local assets
-            months_query = months_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
+        months_query = self._filterCalendar(months_query)
 
 
         months_query = months_query\
             .distinct()\
-            .order_by(IndiAllSkyDbImageTable.createDate_month.desc())
+            .order_by(IndiAllSkyDbCalendarTable.month.desc())
 
 
         month_choices = []
         for m in months_query:
-            month_name = datetime.strptime('{0} {1}'.format(year, m.createDate_month), '%Y %m')\
+            month_name = datetime.strptime('{0} {1}'.format(year, m.month), '%Y %m')\
                 .strftime('%B')
-            entry = (m.createDate_month, month_name)
+            entry = (m.month, month_name)
             month_choices.append(entry)
 
 
@@ -5059,44 +5084,29 @@ class IndiAllskyGalleryViewer(FlaskForm):
 
     def getDays(self, year, month):
         days_query = db.session.query(
-            IndiAllSkyDbImageTable.createDate_year,
-            IndiAllSkyDbImageTable.createDate_month,
-            IndiAllSkyDbImageTable.createDate_day,
+            IndiAllSkyDbCalendarTable.day,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    IndiAllSkyDbImageTable.createDate_year == year,
-                    IndiAllSkyDbImageTable.createDate_month == month,
+                    IndiAllSkyDbCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbCalendarTable.asset_type == IndiAllSkyDbImageTable.__tablename__,
+                    IndiAllSkyDbCalendarTable.year == year,
+                    IndiAllSkyDbCalendarTable.month == month,
                 )
         )
 
 
-        ### Disable this join to make things faster
-        #    .join(IndiAllSkyDbThumbnailTable, IndiAllSkyDbImageTable.thumbnail_uuid == IndiAllSkyDbThumbnailTable.uuid)\
-
-
-        if not self.local:
-            # Do not serve local assets
-            days_query = days_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
+        days_query = self._filterCalendar(days_query)
 
 
         days_query = days_query\
             .distinct()\
-            .order_by(IndiAllSkyDbImageTable.createDate_day.desc())
+            .order_by(IndiAllSkyDbCalendarTable.day.desc())
 
 
         day_choices = []
         for d in days_query:
-            entry = (d.createDate_day, str(d.createDate_day))
+            entry = (d.day, str(d.day))
             day_choices.append(entry)
 
 
@@ -5105,52 +5115,53 @@ class IndiAllskyGalleryViewer(FlaskForm):
 
     def getHours(self, year, month, day):
         hours_query = db.session.query(
-            IndiAllSkyDbImageTable.createDate_year,
-            IndiAllSkyDbImageTable.createDate_month,
-            IndiAllSkyDbImageTable.createDate_day,
-            IndiAllSkyDbImageTable.createDate_hour,
+            IndiAllSkyDbCalendarTable.hour,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    IndiAllSkyDbImageTable.createDate_year == year,
-                    IndiAllSkyDbImageTable.createDate_month == month,
-                    IndiAllSkyDbImageTable.createDate_day == day,
+                    IndiAllSkyDbCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbCalendarTable.asset_type == IndiAllSkyDbImageTable.__tablename__,
+                    IndiAllSkyDbCalendarTable.year == year,
+                    IndiAllSkyDbCalendarTable.month == month,
+                    IndiAllSkyDbCalendarTable.day == day,
                 )
         )
 
 
-        ### Disable this join to make things faster
-        #    .join(IndiAllSkyDbThumbnailTable, IndiAllSkyDbImageTable.thumbnail_uuid == IndiAllSkyDbThumbnailTable.uuid)\
-
-
-        if not self.local:
-            # Do not serve local assets
-            hours_query = hours_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
+        hours_query = self._filterCalendar(hours_query)
 
 
         hours_query = hours_query\
-            .distinct()\
-            .order_by(IndiAllSkyDbImageTable.createDate_hour.desc())
+            .order_by(IndiAllSkyDbCalendarTable.hour.desc())
 
 
         hour_choices = []
         for h in hours_query:
-            entry = (h.createDate_hour, str(h.createDate_hour))
+            entry = (h.hour, str(h.hour))
             hour_choices.append(entry)
 
 
         return hour_choices
 
 
+    def _filterCalendar(self, calendar_query):
+        ### the calendar summarizes images by hour
+        if self.detections_count:
+            if self.local:
+                return calendar_query.filter(IndiAllSkyDbCalendarTable.detections > 0)
+
+            # Do not serve local assets
+            return calendar_query.filter(IndiAllSkyDbCalendarTable.remote_detections > 0)
+
+
+        if not self.local:
+            # Do not serve local assets
+            return calendar_query.filter(IndiAllSkyDbCalendarTable.remote > 0)
+
+
+        return calendar_query
+
+
     def getImages(self, year, month, day, hour):
         images_query = db.session.query(
             IndiAllSkyDbImageTable,
@@ -5419,39 +5430,23 @@ class IndiAllskyVideoViewer(FlaskForm):
             }
             videos_data.append(entry)
 
-        # cannot query the DB from inside the DB query
-        for entry in videos_data:
-            dayDate = datetime.strptime(entry['dayDate'], '%Y%m%d').date()
-
-            # Querying the oldest due to a bug where regeneated files are added with the wrong dayDate
-            # fix is inbound
+        # fetch the related files for all days at once instead of querying each video
+        dayDate_list = sorted(set(datetime.strptime(entry['dayDate'], '%Y%m%d').date() for entry in videos_data))
 
-            ### Keogram
-            keogram_entry_q = IndiAllSkyDbKeogramTable.query\
-                .join(IndiAllSkyDbKeogramTable.camera)\
-                .filter(
-                    and_(
-                        IndiAllSkyDbCameraTable.id == self.camera_id,
-                        IndiAllSkyDbKeogramTable.dayDate == dayDate,
-                        IndiAllSkyDbKeogramTable.night == entry['night'],
-                    )
-                )
+        keogram_entries = self.getRelatedEntries(IndiAllSkyDbKeogramTable, dayDate_list)
+        startrail_entries = self.getRelatedEntries(IndiAllSkyDbStarTrailsTable, dayDate_list)
+        startrail_video_entries = self.getRelatedEntries(IndiAllSkyDbStarTrailsVideoTable, dayDate_list)
+        panorama_video_entries = self.getRelatedEntries(IndiAllSkyDbPanoramaVideoTable, dayDate_list)
 
+        thumbnail_uuid_list = [e.thumbnail_uuid for e in list(keogram_entries.values()) + list(startrail_entries.values()) if e.thumbnail_uuid]
+        thumbnail_entries = self.getThumbnails(thumbnail_uuid_list)
 
-            if not self.local:
-                # Do not serve local assets
-                keogram_entry_q = keogram_entry_q\
-                    .filter(
-                        or_(
-                            IndiAllSkyDbKeogramTable.remote_url != sa_null(),
-                            IndiAllSkyDbKeogramTable.s3_key != sa_null(),
-                        )
-                    )
 
+        for entry in videos_data:
+            dayDate = datetime.strptime(entry['dayDate'], '%Y%m%d').date()
 
-            keogram_entry = keogram_entry_q\
-                .order_by(IndiAllSkyDbKeogramTable.dayDate.asc())\
-                .first()  # use the oldest (asc)
+            ### Keogram
+            keogram_entry = keogram_entries.get((dayDate, entry['night']))
 
 
             if keogram_entry:
@@ -5467,9 +5462,7 @@ class IndiAllskyVideoViewer(FlaskForm):
 
 
                 if keogram_entry.thumbnail_uuid:
-                    keogram_thumbnail_entry = IndiAllSkyDbThumbnailTable.query\
-                        .filter(IndiAllSkyDbThumbnailTable.uuid == keogram_entry.thumbnail_uuid)\
-                        .first()
+                    keogram_thumbnail_entry = thumbnail_entries.get(keogram_entry.thumbnail_uuid)
 
                     if keogram_thumbnail_entry:
                         try:
@@ -5488,31 +5481,7 @@ class IndiAllskyVideoViewer(FlaskForm):
 
 
             ### Star trail
-            startrail_entry_q = IndiAllSkyDbStarTrailsTable.query\
-                .join(IndiAllSkyDbStarTrailsTable.camera)\
-                .filter(
-                    and_(
-                        IndiAllSkyDbCameraTable.id == self.camera_id,
-                        IndiAllSkyDbStarTrailsTable.dayDate == dayDate,
-                        IndiAllSkyDbStarTrailsTable.night == entry['night'],
-                    )
-                )
-
-
-            if not self.local:
-                # Do not serve local assets
-                startrail_entry_q = startrail_entry_q\
-                    .filter(
-                        or_(
-                            IndiAllSkyDbStarTrailsTable.remote_url != sa_null(),
-                            IndiAllSkyDbStarTrailsTable.s3_key != sa_null(),
-                        )
-                    )
-
-
-            startrail_entry = startrail_entry_q\
-                .order_by(IndiAllSkyDbStarTrailsTable.dayDate.asc())\
-                .first()  # use the oldest (asc)
+            startrail_entry = startrail_entries.get((dayDate, entry['night']))
 
 
             if startrail_entry:
@@ -5528,9 +5497,7 @@ class IndiAllskyVideoViewer(FlaskForm):
 
 
                 if startrail_entry.thumbnail_uuid:
-                    startrail_thumbnail_entry = IndiAllSkyDbThumbnailTable.query\
-                        .filter(IndiAllSkyDbThumbnailTable.uuid == startrail_entry.thumbnail_uuid)\
-                        .first()
+                    startrail_thumbnail_entry = thumbnail_entries.get(startrail_entry.thumbnail_uuid)
 
                     if startrail_thumbnail_entry:
                         try:
@@ -5549,31 +5516,7 @@ class IndiAllskyVideoViewer(FlaskForm):
 
 
             ### Star trail timelapses
-            startrail_video_entry_q = IndiAllSkyDbStarTrailsVideoTable.query\
-                .join(IndiAllSkyDbStarTrailsVideoTable.camera)\
-                .filter(
-                    and_(
-                        IndiAllSkyDbCameraTable.id == self.camera_id,
-                        IndiAllSkyDbStarTrailsVideoTable.dayDate == dayDate,
-                        IndiAllSkyDbStarTrailsVideoTable.night == entry['night'],
-                    )
-                )
-
-
-            if not self.local:
-                # Do not serve local assets
-                startrail_video_entry_q = startrail_video_entry_q\
-                    .filter(
-                        or_(
-                            IndiAllSkyDbStarTrailsVideoTable.remote_url != sa_null(),
-                            IndiAllSkyDbStarTrailsVideoTable.s3_key != sa_null(),
-                        )
-                    )
-
-
-            startrail_video_entry = startrail_video_entry_q\
-                .order_by(IndiAllSkyDbStarTrailsVideoTable.dayDate.asc())\
-                .first()  # use the oldest (asc)
+            startrail_video_entry = startrail_video_entries.get((dayDate, entry['night']))
 
 
             if startrail_video_entry:
@@ -5601,31 +5544,7 @@ class IndiAllskyVideoViewer(FlaskForm):
 
 
             ### Panorama timelapses
-            panorama_video_entry_q = IndiAllSkyDbPanoramaVideoTable.query\
-                .join(IndiAllSkyDbPanoramaVideoTable.camera)\
-                .filter(
-                    and_(
-                        IndiAllSkyDbCameraTable.id == self.camera_id,
-                        IndiAllSkyDbPanoramaVideoTable.dayDate == dayDate,
-                        IndiAllSkyDbPanoramaVideoTable.night == entry['night'],
-                    )
-                )
-
-
-            if not self.local:
-                # Do not serve local assets
-                panorama_video_entry_q = panorama_video_entry_q\
-                    .filter(
-                        or_(
-                            IndiAllSkyDbPanoramaVideoTable.remote_url != sa_null(),
-                            IndiAllSkyDbPanoramaVideoTable.s3_key != sa_null(),
-                        )
-                    )
-
-
-            panorama_video_entry = panorama_video_entry_q\
-                .order_by(IndiAllSkyDbPanoramaVideoTable.dayDate.asc())\
-                .first()  # use the oldest (asc)
+            panorama_video_entry = panorama_video_entries.get((dayDate, entry['night']))
 
 
             if panorama_video_entry:
@@ -5673,6 +5592,64 @@ class IndiAllskyVideoViewer(FlaskForm):
         return videos_data
 
 
+    def getRelatedEntries(self, model, dayDate_list):
+        ### returns a dict of entries keyed by (dayDate, night)
+        if not dayDate_list:
+            return dict()
+
+
+        related_query = model.query\
+            .join(model.camera)\
+            .filter(
+                and_(
+                    IndiAllSkyDbCameraTable.id == self.camera_id,
+                    model.dayDate.in_(dayDate_list),
+                )
+            )
+
+
+        if not self.local:
+            # Do not serve local assets
+            related_query = related_query\
+                .filter(
+                    or_(
+                        model.remote_url != sa_null(),
+                        model.s3_key != sa_null(),
+                    )
+                )
+
+
+        related_query = related_query\
+            .order_by(model.id.asc())
+
+
+        related_entries = dict()
+        for related_entry in related_query:
+            # Using the oldest due to a bug where regeneated files are added with the wrong dayDate
+            related_entries.setdefault((related_entry.dayDate, related_entry.night), related_entry)
+
+
+        return related_entries
+
+
+    def getThumbnails(self, thumbnail_uuid_list):
+        ### returns a dict of thumbnails keyed by uuid
+        if not thumbnail_uuid_list:
+            return dict()
+
+
+        thumbnail_query = IndiAllSkyDbThumbnailTable.query\
+            .filter(IndiAllSkyDbThumbnailTable.uuid.in_(thumbnail_uuid_list))
+
+
+        thumbnail_entries = dict()
+        for thumbnail_entry in thumbnail_query:
+            thumbnail_entries.setdefault(thumbnail_entry.uuid, thumbnail_entry)
+
+
+        return thumbnail_entries
+
+
 
 class IndiAllskyVideoViewerPreload(IndiAllskyVideoViewer):
     def __init__(self, *args, **kwargs):
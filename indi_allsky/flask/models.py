@@ -1,10 +1,24 @@
 import enum
+from datetime import timedelta
 from pathlib import Path
 
 from cryptography.fernet import Fernet
 #from cryptography.fernet import InvalidToken
 
 from sqlalchemy.sql import expression
+from sqlalchemy import event
+from sqlalchemy import select
+from sqlalchemy import insert
+from sqlalchemy import update
+from sqlalchemy import delete
+from sqlalchemy import func
+from sqlalchemy import and_
+from sqlalchemy import or_
+from sqlalchemy import case
+from sqlalchemy import literal
+from sqlalchemy import null as sa_null
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session
 
 from sqlalchemy.orm.exc import NoResultFound
 
@@ -29,11 +43,14 @@ __all__ = (
     'IndiAllSkyDbPanoramaImageTable',
     'IndiAllSkyDbPanoramaVideoTable',
     'IndiAllSkyDbLongTermKeogramTable',
+    'IndiAllSkyDbCalendarTable',
+    'IndiAllSkyDbImageRollupTable',
     'TaskQueueState', 'TaskQueueQueue', 'IndiAllSkyDbTaskQueueTable',
     'NotificationCategory', 'IndiAllSkyDbNotificationTable',
     'IndiAllSkyDbStateTable',
     'IndiAllSkyDbUserTable',
     'IndiAllSkyDbTleDataTable',
+    'IndiAllSkyDbSatellitePassTable',
 )
 
 
@@ -107,6 +124,9 @@ class IndiAllSkyDbCameraTable(db.Model):
     panoramaimages = db.relationship('IndiAllSkyDbPanoramaImageTable', back_populates='camera')
     panoramavideos = db.relationship('IndiAllSkyDbPanoramaVideoTable', back_populates='camera')
     longtermkeograms = db.relationship('IndiAllSkyDbLongTermKeogramTable', back_populates='camera')
+    calendar = db.relationship('IndiAllSkyDbCalendarTable', back_populates='camera')
+    imagerollups = db.relationship('IndiAllSkyDbImageRollupTable', back_populates='camera')
+    satellitepasses = db.relationship('IndiAllSkyDbSatellitePassTable', back_populates='camera')
 
 
     @property
@@ -807,6 +827,618 @@ class IndiAllSkyDbLongTermKeogramTable(db.Model):
     )
 
 
+class IndiAllSkyDbCalendarTable(db.Model):
+    ### Summary of assets per hour for the year/month/day/hour selections
+    ### Maintained by the session flush events at the end of this module
+    __tablename__ = 'calendar'
+
+    id = db.Column(db.Integer, primary_key=True)
+    asset_type = db.Column(db.String(length=32), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Integer, nullable=False)
+    hour = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, server_default='0', nullable=False)
+    detections = db.Column(db.Integer, server_default='0', nullable=False)
+    remote = db.Column(db.Integer, server_default='0', nullable=False)
+    remote_detections = db.Column(db.Integer, server_default='0', nullable=False)
+    camera_id = db.Column(db.Integer, db.ForeignKey('camera.id'), nullable=False)
+    camera = db.relationship('IndiAllSkyDbCameraTable', back_populates='calendar')
+
+
+    db.Index(
+        'idx_calendar_iaYmdH',
+        camera_id,
+        asset_type,
+        year,
+        month,
+        day,
+        hour,
+        unique=True,
+    )
+
+
+    def __repr__(self):
+        return '<Calendar {0:s} {1:d}-{2:d}-{3:d} {4:d}>'.format(self.asset_type, self.year, self.month, self.day, self.hour)
+
+
+    @staticmethod
+    def getAssetModels():
+        # tables summarized in the calendar
+        return (
+            IndiAllSkyDbImageTable,
+            IndiAllSkyDbFitsImageTable,
+        )
+
+
+    @staticmethod
+    def _countColumns(model):
+        if hasattr(model, 'detections'):
+            has_detections = model.detections > 0
+        else:
+            has_detections = None
+
+        has_remote = or_(
+            model.remote_url != sa_null(),
+            model.s3_key != sa_null(),
+        )
+
+
+        if isinstance(has_detections, type(None)):
+            detections_col = literal(0)
+            remote_detections_col = literal(0)
+        else:
+            detections_col = func.sum(case((has_detections, 1), else_=0))
+            remote_detections_col = func.sum(case((and_(has_detections, has_remote), 1), else_=0))
+
+
+        return (
+            func.count(model.id).label('count'),
+            detections_col.label('detections'),
+            func.sum(case((has_remote, 1), else_=0)).label('remote'),
+            remote_detections_col.label('remote_detections'),
+        )
+
+
+    @classmethod
+    def rebuild(cls, session, camera_id=None):
+        ### Regenerate the calendar from the asset tables
+        for model in cls.getAssetModels():
+            calendar_delete = delete(cls.__table__)\
+                .where(cls.__table__.c.asset_type == model.__tablename__)
+
+            if camera_id:
+                calendar_delete = calendar_delete\
+                    .where(cls.__table__.c.camera_id == camera_id)
+
+            session.execute(calendar_delete)
+
+
+            calendar_select = select(
+                model.camera_id,
+                literal(model.__tablename__),
+                model.createDate_year,
+                model.createDate_month,
+                model.createDate_day,
+                model.createDate_hour,
+                *cls._countColumns(model),
+            )\
+                .where(model.createDate_year != sa_null())\
+                .group_by(
+                    model.camera_id,
+                    model.createDate_year,
+                    model.createDate_month,
+                    model.createDate_day,
+                    model.createDate_hour,
+                )
+
+            if camera_id:
+                calendar_select = calendar_select\
+                    .where(model.camera_id == camera_id)
+
+
+            session.execute(
+                insert(cls.__table__).from_select(
+                    [
+                        'camera_id',
+                        'asset_type',
+                        'year',
+                        'month',
+                        'day',
+                        'hour',
+                        'count',
+                        'detections',
+                        'remote',
+                        'remote_detections',
+                    ],
+                    calendar_select,
+                )
+            )
+
+
+        session.commit()
+
+
+    @classmethod
+    def recount(cls, connection, model, camera_id, year, month, day, hour):
+        ### Update the summary for a single hour
+        counts = connection.execute(
+            select(*cls._countColumns(model))\
+                .where(
+                    and_(
+                        model.camera_id == camera_id,
+                        model.createDate_year == year,
+                        model.createDate_month == month,
+                        model.createDate_day == day,
+                        model.createDate_hour == hour,
+                    )
+                )
+        ).one()
+
+
+        key_filter = and_(
+            cls.__table__.c.camera_id == camera_id,
+            cls.__table__.c.asset_type == model.__tablename__,
+            cls.__table__.c.year == year,
+            cls.__table__.c.month == month,
+            cls.__table__.c.day == day,
+            cls.__table__.c.hour == hour,
+        )
+
+
+        if not counts.count:
+            connection.execute(delete(cls.__table__).where(key_filter))
+            return
+
+
+        count_values = {
+            'count'             : counts.count,
+            'detections'        : counts.detections or 0,
+            'remote'            : counts.remote or 0,
+            'remote_detections' : counts.remote_detections or 0,
+        }
+
+        result = connection.execute(update(cls.__table__).where(key_filter).values(**count_values))
+
+        if result.rowcount == 0:
+            connection.execute(
+                insert(cls.__table__).values(
+                    camera_id=camera_id,
+                    asset_type=model.__tablename__,
+                    year=year,
+                    month=month,
+                    day=day,
+                    hour=hour,
+                    **count_values,
+                )
+            )
+
+
+class IndiAllSkyDbImageRollupTable(db.Model):
+    ### Image statistics in 1, 5, 15 and 60 minute buckets for the charts
+    ### Maintained by the session flush events at the end of this module
+    __tablename__ = 'image_rollup'
+
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.Integer, nullable=False)  # minutes
+    bucket = db.Column(db.DateTime(), nullable=False)
+    first_date = db.Column(db.DateTime(), nullable=False)
+    last_date = db.Column(db.DateTime(), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    exposure_avg = db.Column(db.Float, nullable=False)
+    exposure_min = db.Column(db.Float, nullable=False)
+    exposure_max = db.Column(db.Float, nullable=False)
+    exp_elapsed_avg = db.Column(db.Float, nullable=True)
+    exp_elapsed_max = db.Column(db.Float, nullable=True)
+    process_elapsed_avg = db.Column(db.Float, nullable=True)
+    process_elapsed_max = db.Column(db.Float, nullable=True)
+    lag_avg = db.Column(db.Float, nullable=True)
+    lag_max = db.Column(db.Float, nullable=True)
+    temp_avg = db.Column(db.Float, nullable=True)
+    temp_min = db.Column(db.Float, nullable=True)
+    temp_max = db.Column(db.Float, nullable=True)
+    adu_avg = db.Column(db.Float, nullable=False)
+    adu_min = db.Column(db.Float, nullable=False)
+    adu_max = db.Column(db.Float, nullable=False)
+    sqm_avg = db.Column(db.Float, nullable=True)
+    sqm_min = db.Column(db.Float, nullable=True)
+    sqm_max = db.Column(db.Float, nullable=True)
+    stars_avg = db.Column(db.Float, nullable=True)
+    stars_min = db.Column(db.Integer, nullable=True)
+    stars_max = db.Column(db.Integer, nullable=True)
+    detections = db.Column(db.Integer, server_default='0', nullable=False)  # images with detections
+    data = db.Column(db.JSON)  # sensor averages
+    totals = db.Column(db.JSON)  # sum and count of each averaged value, new images are added to these
+    camera_id = db.Column(db.Integer, db.ForeignKey('camera.id'), nullable=False)
+    camera = db.relationship('IndiAllSkyDbCameraTable', back_populates='imagerollups')
+
+
+    db.Index(
+        'idx_image_rollup_irb',
+        camera_id,
+        resolution,
+        bucket,
+        unique=True,
+    )
+
+
+    # minutes, each bucket is contained in the next larger bucket
+    resolutions = (1, 5, 15, 60)
+
+
+    # averaged values and their min/max columns, other totals are sensor averages
+    stat_columns = {
+        'exposure'          : ('min', 'max'),
+        'exp_elapsed'       : ('max',),
+        'process_elapsed'   : ('max',),
+        'lag'               : ('max',),
+        'temp'              : ('min', 'max'),
+        'adu'               : ('min', 'max'),
+        'sqm'               : ('min', 'max'),
+        'stars'             : ('min', 'max'),
+    }
+
+
+    def __repr__(self):
+        return '<ImageRollup {0:d}m {1:%Y-%m-%d %H:%M}>'.format(self.resolution, self.bucket)
+
+
+    @staticmethod
+    def bucketStart(createDate, resolution):
+        return createDate.replace(
+            minute=(createDate.minute // resolution) * resolution,
+            second=0,
+            microsecond=0,
+        )
+
+
+    @classmethod
+    def selectResolution(cls, history_seconds, points=60):
+        ### Returns the largest resolution that still provides the requested number of points
+        for resolution in reversed(cls.resolutions):
+            if history_seconds / (resolution * 60) >= points:
+                return resolution
+
+        return cls.resolutions[0]
+
+
+    @staticmethod
+    def _imageSelect():
+        return select(
+            IndiAllSkyDbImageTable.createDate,
+            IndiAllSkyDbImageTable.exposure,
+            IndiAllSkyDbImageTable.exp_elapsed,
+            IndiAllSkyDbImageTable.process_elapsed,
+            IndiAllSkyDbImageTable.temp,
+            IndiAllSkyDbImageTable.adu,
+            IndiAllSkyDbImageTable.sqm,
+            IndiAllSkyDbImageTable.stars,
+            IndiAllSkyDbImageTable.detections,
+            IndiAllSkyDbImageTable.data,
+        )\
+            .where(IndiAllSkyDbImageTable.exclude == expression.false())\
+            .order_by(IndiAllSkyDbImageTable.createDate.asc())
+
+
+    @staticmethod
+    def _sampleValues(r, prev_date):
+        ### Returns the averaged values of a single image
+        values = {
+            'exposure'          : r.exposure,
+            'exp_elapsed'       : r.exp_elapsed,
+            'process_elapsed'   : r.process_elapsed,
+            'temp'              : r.temp,
+            'adu'               : r.adu,
+            'sqm'               : r.sqm,
+            'stars'             : r.stars,
+        }
+
+
+        # time since the previous image, including the image before the bucket
+        if prev_date:
+            values['lag'] = (r.createDate - prev_date).total_seconds()
+
+
+        if r.data:
+            for k, v in r.data.items():
+                if not k.startswith('sensor_'):
+                    continue
+
+                if isinstance(v, bool) or not isinstance(v, (int, float)):
+                    continue
+
+                values[k] = v
+
+
+        return {k: v for k, v in values.items() if not isinstance(v, type(None))}
+
+
+    @classmethod
+    def _emptyValues(cls):
+        rollup_values = {
+            'first_date'    : None,
+            'last_date'     : None,
+            'count'         : 0,
+            'detections'    : 0,
+            'data'          : dict(),
+            'totals'        : dict(),
+        }
+
+        for k, minmax in cls.stat_columns.items():
+            rollup_values['{0:s}_avg'.format(k)] = None
+
+            for m in minmax:
+                rollup_values['{0:s}_{1:s}'.format(k, m)] = None
+
+
+        return rollup_values
+
+
+    @classmethod
+    def _foldValues(cls, rollup_values, r, prev_date):
+        ### Adds a single image to the rollup values, images must be added in createDate order
+        totals = rollup_values['totals']
+
+        for k, v in cls._sampleValues(r, prev_date).items():
+            total, n = totals.get(k, (0, 0))
+            totals[k] = [total + v, n + 1]
+
+            for m in cls.stat_columns.get(k, ()):
+                col = '{0:s}_{1:s}'.format(k, m)
+                current = rollup_values[col]
+
+                if isinstance(current, type(None)):
+                    rollup_values[col] = v
+                elif m == 'min':
+                    rollup_values[col] = min(current, v)
+                else:
+                    rollup_values[col] = max(current, v)
+
+
+        for k in cls.stat_columns.keys():
+            if k in totals:
+                total, n = totals[k]
+                rollup_values['{0:s}_avg'.format(k)] = total / n
+
+        rollup_values['data'] = {k: total / n for k, (total, n) in totals.items() if k not in cls.stat_columns}
+
+
+        if isinstance(rollup_values['first_date'], type(None)):
+            rollup_values['first_date'] = r.createDate
+
+        rollup_values['last_date'] = r.createDate
+        rollup_values['count'] += 1
+
+        if r.detections:
+            rollup_values['detections'] += 1
+
+
+    @classmethod
+    def _aggregate(cls, rows, prev_date):
+        ### rows must be sorted by createDate
+        rollup_values = cls._emptyValues()
+
+        for r in rows:
+            cls._foldValues(rollup_values, r, prev_date)
+            prev_date = r.createDate
+
+        return rollup_values
+
+
+    @classmethod
+    def _hourRollups(cls, camera_id, hour_rows, prev_date):
+        ### Returns the rollups for every bucket in the hour
+        rollup_list = list()
+
+        for resolution in cls.resolutions:
+            bucket_rows = list()
+            bucket_prev_date = prev_date
+
+            for r in hour_rows:
+                if bucket_rows and cls.bucketStart(r.createDate, resolution) != cls.bucketStart(bucket_rows[0].createDate, resolution):
+                    rollup_list.append(cls._rollupEntry(camera_id, resolution, bucket_rows, bucket_prev_date))
+                    bucket_prev_date = bucket_rows[-1].createDate
+                    bucket_rows = list()
+
+                bucket_rows.append(r)
+
+            if bucket_rows:
+                rollup_list.append(cls._rollupEntry(camera_id, resolution, bucket_rows, bucket_prev_date))
+
+
+        return rollup_list
+
+
+    @classmethod
+    def _rollupEntry(cls, camera_id, resolution, bucket_rows, prev_date):
+        rollup = cls._aggregate(bucket_rows, prev_date)
+        rollup['camera_id'] = camera_id
+        rollup['resolution'] = resolution
+        rollup['bucket'] = cls.bucketStart(bucket_rows[0].createDate, resolution)
+
+        return rollup
+
+
+    @classmethod
+    def rebuild(cls, session, camera_id=None):
+        ### Regenerate the rollups from the image table
+        rollup_delete = delete(cls.__table__)
+
+        if camera_id:
+            rollup_delete = rollup_delete\
+                .where(cls.__table__.c.camera_id == camera_id)
+
+        session.execute(rollup_delete)
+
+
+        camera_select = select(IndiAllSkyDbImageTable.camera_id).distinct()
+
+        if camera_id:
+            camera_select = camera_select\
+                .where(IndiAllSkyDbImageTable.camera_id == camera_id)
+
+        camera_id_list = [r.camera_id for r in session.execute(camera_select)]
+
+
+        for c_id in camera_id_list:
+            date_range = session.execute(
+                select(
+                    func.min(IndiAllSkyDbImageTable.createDate).label('start'),
+                    func.max(IndiAllSkyDbImageTable.createDate).label('end'),
+                )\
+                    .where(IndiAllSkyDbImageTable.camera_id == c_id)
+            ).one()
+
+
+            # a day at a time to limit memory
+            prev_date = None
+            day_start = cls.bucketStart(date_range.start, 60)
+            while day_start <= date_range.end:
+                day_end = day_start + timedelta(days=1)
+
+                day_rows = session.execute(
+                    cls._imageSelect()\
+                        .where(IndiAllSkyDbImageTable.camera_id == c_id)\
+                        .where(IndiAllSkyDbImageTable.createDate >= day_start)\
+                        .where(IndiAllSkyDbImageTable.createDate < day_end)
+                ).all()
+
+
+                rollup_list = list()
+                hour_rows = list()
+                for r in day_rows:
+                    if hour_rows and cls.bucketStart(r.createDate, 60) != cls.bucketStart(hour_rows[0].createDate, 60):
+                        rollup_list.extend(cls._hourRollups(c_id, hour_rows, prev_date))
+                        prev_date = hour_rows[-1].createDate
+                        hour_rows = list()
+
+                    hour_rows.append(r)
+
+                if hour_rows:
+                    rollup_list.extend(cls._hourRollups(c_id, hour_rows, prev_date))
+                    prev_date = hour_rows[-1].createDate
+
+
+                if rollup_list:
+                    session.execute(insert(cls.__table__), rollup_list)
+
+                day_start = day_end
+
+
+        session.commit()
+
+
+    @classmethod
+    def _prevDate(cls, connection, camera_id, createDate):
+        return connection.execute(
+            select(func.max(IndiAllSkyDbImageTable.createDate))\
+                .where(IndiAllSkyDbImageTable.camera_id == camera_id)\
+                .where(IndiAllSkyDbImageTable.exclude == expression.false())\
+                .where(IndiAllSkyDbImageTable.createDate < createDate)
+        ).scalar()
+
+
+    @classmethod
+    def addImage(cls, connection, entry):
+        ### Add a new image to the buckets containing it
+        ### Returns False if the hour must be recomputed
+        if entry.exclude:
+            return True
+
+
+        bucket_dict = {resolution: cls.bucketStart(entry.createDate, resolution) for resolution in cls.resolutions}
+
+        rollup_rows = connection.execute(
+            select(cls.__table__)\
+                .where(cls.__table__.c.camera_id == entry.camera_id)\
+                .where(or_(*[
+                    and_(
+                        cls.__table__.c.resolution == resolution,
+                        cls.__table__.c.bucket == bucket,
+                    )
+                    for resolution, bucket in bucket_dict.items()
+                ]))
+        ).all()
+
+        rollup_dict = {r.resolution: r for r in rollup_rows}
+
+
+        for r in rollup_dict.values():
+            if isinstance(r.totals, type(None)):
+                # created before totals were stored
+                return False
+
+            if r.last_date > entry.createDate:
+                # the image is not the newest, the lag of the following image changes
+                return False
+
+
+        hour_rollup = rollup_dict.get(cls.resolutions[-1])
+        if hour_rollup:
+            # the newest image in the hour precedes the new image
+            prev_date = hour_rollup.last_date
+        else:
+            prev_date = cls._prevDate(connection, entry.camera_id, entry.createDate)
+
+
+        for resolution, bucket in bucket_dict.items():
+            rollup = rollup_dict.get(resolution)
+
+            if not rollup:
+                connection.execute(
+                    insert(cls.__table__).values(**cls._rollupEntry(entry.camera_id, resolution, [entry], prev_date))
+                )
+                continue
+
+
+            rollup_values = cls._emptyValues()
+            for k in rollup_values.keys():
+                rollup_values[k] = getattr(rollup, k)
+
+            rollup_values['totals'] = {k: list(v) for k, v in rollup.totals.items()}
+
+            cls._foldValues(rollup_values, entry, prev_date)
+
+            connection.execute(
+                update(cls.__table__)\
+                    .where(cls.__table__.c.id == rollup.id)\
+                    .values(**rollup_values)
+            )
+
+
+        return True
+
+
+    @classmethod
+    def rollupHour(cls, connection, camera_id, hour_start):
+        ### Recompute all of the buckets in the hour
+        hour_end = hour_start + timedelta(hours=1)
+
+        hour_rows = connection.execute(
+            cls._imageSelect()\
+                .where(IndiAllSkyDbImageTable.camera_id == camera_id)\
+                .where(IndiAllSkyDbImageTable.createDate >= hour_start)\
+                .where(IndiAllSkyDbImageTable.createDate < hour_end)
+        ).all()
+
+
+        connection.execute(
+            delete(cls.__table__)\
+                .where(cls.__table__.c.camera_id == camera_id)\
+                .where(cls.__table__.c.bucket >= hour_start)\
+                .where(cls.__table__.c.bucket < hour_end)
+        )
+
+
+        if not hour_rows:
+            return
+
+
+        prev_date = cls._prevDate(connection, camera_id, hour_start)
+
+        connection.execute(insert(cls.__table__), cls._hourRollups(camera_id, hour_rows, prev_date))
+
+
 class TaskQueueState(enum.Enum):
     MANUAL  = 'Manual'
     QUEUED  = 'Queued'
@@ -992,3 +1624,189 @@ class IndiAllSkyDbTleDataTable(db.Model):
     #next_set_az = db.Column(db.Float, nullable=True, index=True)
     #next_alt = db.Column(db.Float, nullable=True, index=True)
 
+
+class IndiAllSkyDbSatellitePassTable(db.Model):
+    ### Predicted passes for each camera location
+    ### Maintained by IndiAllskySatellitePassPredictor in satellite_pass.py
+    __tablename__ = 'satellite_pass'
+
+    id = db.Column(db.Integer, primary_key=True)
+    createDate = db.Column(db.DateTime(), nullable=False, server_default=db.func.now())
+    title = db.Column(db.String(32), nullable=False)
+    satnum = db.Column(db.Integer, nullable=False)
+    group = db.Column(db.Integer, nullable=False)
+    rise = db.Column(db.DateTime(), nullable=False, index=True)  # UTC
+    rise_az = db.Column(db.Float, nullable=False)
+    transit = db.Column(db.DateTime(), nullable=False)  # UTC
+    transit_alt = db.Column(db.Float, nullable=False)
+    set = db.Column(db.DateTime(), nullable=False, index=True)  # UTC
+    set_az = db.Column(db.Float, nullable=False)
+    sunlit_start = db.Column(db.DateTime(), nullable=True)  # UTC, null if eclipsed for the whole pass
+    sunlit_end = db.Column(db.DateTime(), nullable=True)  # UTC
+    camera_id = db.Column(db.Integer, db.ForeignKey('camera.id'), nullable=False, index=True)
+    camera = db.relationship('IndiAllSkyDbCameraTable', back_populates='satellitepasses')
+
+
+    def __repr__(self):
+        return '<SatellitePass {0:s} {1:%Y-%m-%d %H:%M:%S}>'.format(self.title, self.rise)
+
+
+### Keep the calendar summary in sync with the asset tables
+### Every add, delete and upload path goes through the session, so these events cover all of them
+_calendar_tracked_attrs = (
+    'remote_url',
+    's3_key',
+    'detections',
+    'createDate_year',
+    'createDate_month',
+    'createDate_day',
+    'createDate_hour',
+)
+
+
+@event.listens_for(Session, 'before_flush')
+def _calendar_before_flush(session, flush_context, instances):
+    asset_models = IndiAllSkyDbCalendarTable.getAssetModels()
+
+    # foreign keys of new entries are not populated until the flush
+    calendar_new = [entry for entry in session.new if isinstance(entry, asset_models)]
+
+    calendar_keys = set()
+
+    for entry in session.deleted:
+        # deleted entries must be read before the rows are removed
+        if isinstance(entry, asset_models):
+            calendar_keys.add(_calendar_key(entry))
+
+    for entry in session.dirty:
+        if not isinstance(entry, asset_models):
+            continue
+
+        entry_state = sa_inspect(entry)
+        for attr in _calendar_tracked_attrs:
+            if attr not in entry_state.attrs.keys():
+                continue
+
+            if entry_state.attrs[attr].history.has_changes():
+                calendar_keys.add(_calendar_key(entry))
+                break
+
+
+    session.info['calendar_new'] = calendar_new
+    session.info['calendar_keys'] = calendar_keys
+
+
+@event.listens_for(Session, 'after_flush')
+def _calendar_after_flush(session, flush_context):
+    calendar_keys = session.info.pop('calendar_keys', set())
+
+    for entry in session.info.pop('calendar_new', []):
+        calendar_keys.add(_calendar_key(entry))
+
+    calendar_keys.discard(None)
+
+    if not calendar_keys:
+        return
+
+    connection = session.connection()
+
+    for model, camera_id, year, month, day, hour in calendar_keys:
+        IndiAllSkyDbCalendarTable.recount(connection, model, camera_id, year, month, day, hour)
+
+
+def _calendar_key(entry):
+    if isinstance(entry.createDate_year, type(None)):
+        return None
+
+    return (
+        type(entry),
+        entry.camera_id,
+        entry.createDate_year,
+        entry.createDate_month,
+        entry.createDate_day,
+        entry.createDate_hour,
+    )
+
+
+### Keep the image rollups in sync with the image table
+### Expired images are not removed from the rollups, old rollups are expired separately
+_rollup_tracked_attrs = (
+    'exclude',
+    'exposure',
+    'adu',
+    'sqm',
+    'stars',
+    'detections',
+    'data',
+)
+
+
+@event.listens_for(Session, 'before_flush')
+def _rollup_before_flush(session, flush_context, instances):
+    # foreign keys of new entries are not populated until the flush
+    rollup_new = [entry for entry in session.new if isinstance(entry, IndiAllSkyDbImageTable)]
+
+    rollup_dirty = list()
+
+    for entry in session.dirty:
+        if not isinstance(entry, IndiAllSkyDbImageTable):
+            continue
+
+        entry_state = sa_inspect(entry)
+        for attr in _rollup_tracked_attrs:
+            if attr not in entry_state.attrs.keys():
+                continue
+
+            if entry_state.attrs[attr].history.has_changes():
+                rollup_dirty.append(entry)
+                break
+
+
+    session.info['rollup_new'] = rollup_new
+    session.info['rollup_dirty'] = rollup_dirty
+
+
+@event.listens_for(Session, 'after_flush')
+def _rollup_after_flush(session, flush_context):
+    rollup_new = session.info.pop('rollup_new', [])
+    rollup_dirty = session.info.pop('rollup_dirty', [])
+
+    if not rollup_new and not rollup_dirty:
+        return
+
+
+    # edited images change the existing statistics, the hour is recomputed
+    rollup_hours = set()
+    for entry in rollup_dirty:
+        rollup_hours.add(_rollup_key(entry))
+
+    rollup_hours.discard(None)
+
+
+    connection = session.connection()
+
+    # new images are added to the existing buckets
+    rollup_new = [entry for entry in rollup_new if not isinstance(entry.createDate, type(None))]
+
+    for entry in sorted(rollup_new, key=lambda e: e.createDate):
+        rollup_key = _rollup_key(entry)
+
+        if rollup_key in rollup_hours:
+            continue
+
+        if not IndiAllSkyDbImageRollupTable.addImage(connection, entry):
+            rollup_hours.add(rollup_key)
+
+
+    for camera_id, hour_start in rollup_hours:
+        IndiAllSkyDbImageRollupTable.rollupHour(connection, camera_id, hour_start)
+
+
+def _rollup_key(entry):
+    if isinstance(entry.createDate, type(None)):
+        return None
+
+    return (
+        entry.camera_id,
+        IndiAllSkyDbImageRollupTable.bucketStart(entry.createDate, IndiAllSkyDbImageRollupTable.resolutions[-1]),
+    )
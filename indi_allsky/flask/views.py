@@ -10,6 +10,7 @@ from pathlib import Path
 import socket
 import ipaddress
 import re
+import copy
 import psutil
 import dbus
 import ephem
@@ -20,6 +21,7 @@ from passlib.hash import argon2
 from ..version import __version__
 from .. import constants
 from ..processing import ImageProcessor
+from ..satellite_pass import IndiAllskySatellitePassPredictor
 
 from cryptography.fernet import InvalidToken
 
@@ -60,18 +62,21 @@ from .models import IndiAllSkyDbNotificationTable
 from .models import IndiAllSkyDbUserTable
 from .models import IndiAllSkyDbConfigTable
 from .models import IndiAllSkyDbTleDataTable
+from .models import IndiAllSkyDbSatellitePassTable
+from .models import IndiAllSkyDbImageRollupTable
 
 from .models import TaskQueueQueue
 from .models import TaskQueueState
 
 from sqlalchemy import func
-#from sqlalchemy import extract
-from sqlalchemy import desc
-from sqlalchemy import cast
+from sqlalchemy import extract
+#from sqlalchemy import desc
+#from sqlalchemy import cast
 from sqlalchemy import and_
 from sqlalchemy import or_
+from sqlalchemy import case
 #from sqlalchemy.types import DateTime
-from sqlalchemy.types import Integer
+#from sqlalchemy.types import Integer
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql.expression import true as sa_true
 from sqlalchemy.sql.expression import false as sa_false
@@ -788,34 +793,16 @@ class ImageLagView(TemplateView):
         camera_now_minus_3h = self.camera_now - timedelta(hours=3)
 
 
-        if app.config['SQLALCHEMY_DATABASE_URI'].startswith('mysql'):
-            createDate_s = func.date_format('%s', IndiAllSkyDbImageTable.createDate)  # mysql
-        elif app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
-            createDate_s = func.to_char(IndiAllSkyDbImageTable.createDate, '%s')  # postgres
-        else:
-            # assume sqlite
-            createDate_s = func.strftime('%s', IndiAllSkyDbImageTable.createDate)  # sqlite
-
-
-        image_lag_list = IndiAllSkyDbImageTable.query\
-            .add_columns(
-                IndiAllSkyDbImageTable.id,
-                IndiAllSkyDbImageTable.createDate,
-                IndiAllSkyDbImageTable.exposure,
-                IndiAllSkyDbImageTable.exp_elapsed,
-                IndiAllSkyDbImageTable.process_elapsed,
-                (cast(createDate_s, Integer) - func.lag(createDate_s).over(order_by=IndiAllSkyDbImageTable.createDate)).label('lag_diff'),
-            )\
-            .join(IndiAllSkyDbImageTable.camera)\
+        image_lag_list = IndiAllSkyDbImageRollupTable.query\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera.id,
-                    IndiAllSkyDbImageTable.createDate > camera_now_minus_3h,
+                    IndiAllSkyDbImageRollupTable.camera_id == self.camera.id,
+                    IndiAllSkyDbImageRollupTable.resolution == 1,
+                    IndiAllSkyDbImageRollupTable.bucket > camera_now_minus_3h,
                 )
             )\
-            .order_by(IndiAllSkyDbImageTable.createDate.desc())\
+            .order_by(IndiAllSkyDbImageRollupTable.bucket.desc())\
             .limit(50)
-        # filter is just to make it faster
 
 
         context['image_lag_list'] = image_lag_list
@@ -832,64 +819,20 @@ class RollingAduView(TemplateView):
         camera_now_minus_7d = self.camera_now - timedelta(days=7)
 
 
-        if app.config['SQLALCHEMY_DATABASE_URI'].startswith('mysql'):
-            createDate_s = func.unix_timestamp(IndiAllSkyDbImageTable.createDate)  # mysql
-
-            # this should give us average exposure, adu in 15 minute sets, during the night
-            rolling_adu_list = IndiAllSkyDbImageTable.query\
-                .add_columns(
-                    func.floor(createDate_s / 900).label('interval'),
-                    IndiAllSkyDbImageTable.createDate.label('dt'),
-                    func.count(IndiAllSkyDbImageTable.id).label('i_count'),
-                    func.avg(IndiAllSkyDbImageTable.exposure).label('exposure_avg'),
-                    func.avg(IndiAllSkyDbImageTable.adu).label('adu_avg'),
-                    func.avg(IndiAllSkyDbImageTable.sqm).label('sqm_avg'),
-                    func.avg(IndiAllSkyDbImageTable.stars).label('stars_avg'),
-                )\
-                .join(IndiAllSkyDbImageTable.camera)\
-                .filter(IndiAllSkyDbCameraTable.id == self.camera.id)\
-                .filter(
-                    and_(
-                        IndiAllSkyDbImageTable.createDate > camera_now_minus_7d,
-                        or_(
-                            IndiAllSkyDbImageTable.createDate_hour >= 22,  # night is normally between 10p and 4a, right?
-                            IndiAllSkyDbImageTable.createDate_hour <= 4,
-                        )
-                    )
-                )\
-                .group_by('interval')\
-                .order_by(desc('interval'))
-
-        elif app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
-            createDate_s = func.to_char(IndiAllSkyDbImageTable.createDate, '%s')  # postgres
-            # fixme
-        else:
-            # assume sqlite
-            createDate_s = func.strftime('%s', IndiAllSkyDbImageTable.createDate)  # sqlite
-
-            # this should give us average exposure, adu in 15 minute sets, during the night
-            rolling_adu_list = IndiAllSkyDbImageTable.query\
-                .add_columns(
-                    IndiAllSkyDbImageTable.createDate.label('dt'),
-                    func.count(IndiAllSkyDbImageTable.id).label('i_count'),
-                    func.avg(IndiAllSkyDbImageTable.exposure).label('exposure_avg'),
-                    func.avg(IndiAllSkyDbImageTable.adu).label('adu_avg'),
-                    func.avg(IndiAllSkyDbImageTable.sqm).label('sqm_avg'),
-                    func.avg(IndiAllSkyDbImageTable.stars).label('stars_avg'),
-                )\
-                .join(IndiAllSkyDbImageTable.camera)\
-                .filter(IndiAllSkyDbCameraTable.id == self.camera.id)\
-                .filter(
-                    and_(
-                        IndiAllSkyDbImageTable.createDate > camera_now_minus_7d,
-                        or_(
-                            IndiAllSkyDbImageTable.createDate_hour >= 22,  # night is normally between 10p and 4a, right?
-                            IndiAllSkyDbImageTable.createDate_hour <= 4,
-                        )
+        # this should give us average exposure, adu in 15 minute sets, during the night
+        rolling_adu_list = IndiAllSkyDbImageRollupTable.query\
+            .filter(
+                and_(
+                    IndiAllSkyDbImageRollupTable.camera_id == self.camera.id,
+                    IndiAllSkyDbImageRollupTable.resolution == 15,
+                    IndiAllSkyDbImageRollupTable.bucket > camera_now_minus_7d,
+                    or_(
+                        extract('hour', IndiAllSkyDbImageRollupTable.bucket) >= 22,  # night is normally between 10p and 4a, right?
+                        extract('hour', IndiAllSkyDbImageRollupTable.bucket) <= 4,
                     )
-                )\
-                .group_by(cast(createDate_s, Integer) / 900)\
-                .order_by(IndiAllSkyDbImageTable.createDate.desc())
+                )
+            )\
+            .order_by(IndiAllSkyDbImageRollupTable.bucket.desc())
 
 
         context['rolling_adu_list'] = rolling_adu_list
@@ -1045,19 +988,18 @@ class JsonImageLoopView(JsonView):
     def getSqmData(self, camera_id, ts_dt):
         ts_minus_minutes = ts_dt - timedelta(minutes=self.sqm_history_minutes)
 
-        sqm_images = self.model.query\
-            .add_columns(
-                func.max(self.model.sqm).label('image_max_sqm'),
-                func.min(self.model.sqm).label('image_min_sqm'),
-                func.avg(self.model.sqm).label('image_avg_sqm'),
-            )\
-            .join(IndiAllSkyDbCameraTable)\
+        # rollups only include images that are not excluded, buckets without values are not counted
+        sqm_images = db.session.query(
+            func.max(IndiAllSkyDbImageRollupTable.sqm_max).label('image_max_sqm'),
+            func.min(IndiAllSkyDbImageRollupTable.sqm_min).label('image_min_sqm'),
+            (func.sum(IndiAllSkyDbImageRollupTable.sqm_avg * IndiAllSkyDbImageRollupTable.count) / func.sum(case((IndiAllSkyDbImageRollupTable.sqm_avg != sa_null(), IndiAllSkyDbImageRollupTable.count)))).label('image_avg_sqm'),
+        )\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == camera_id,
-                    self.model.exclude == sa_false(),
-                    self.model.createDate > ts_minus_minutes,
-                    self.model.createDate < ts_dt,
+                    IndiAllSkyDbImageRollupTable.camera_id == camera_id,
+                    IndiAllSkyDbImageRollupTable.resolution == 1,
+                    IndiAllSkyDbImageRollupTable.bucket > ts_minus_minutes,
+                    IndiAllSkyDbImageRollupTable.bucket < ts_dt,
                 )
             )\
             .first()
@@ -1075,19 +1017,18 @@ class JsonImageLoopView(JsonView):
     def getStarsData(self, camera_id, ts_dt):
         ts_minus_minutes = ts_dt - timedelta(minutes=self.stars_history_minutes)
 
-        stars_images = self.model.query\
-            .add_columns(
-                func.max(self.model.stars).label('image_max_stars'),
-                func.min(self.model.stars).label('image_min_stars'),
-                func.avg(self.model.stars).label('image_avg_stars'),
-            )\
-            .join(IndiAllSkyDbCameraTable)\
+        # rollups only include images that are not excluded, buckets without values are not counted
+        stars_images = db.session.query(
+            func.max(IndiAllSkyDbImageRollupTable.stars_max).label('image_max_stars'),
+            func.min(IndiAllSkyDbImageRollupTable.stars_min).label('image_min_stars'),
+            (func.sum(IndiAllSkyDbImageRollupTable.stars_avg * IndiAllSkyDbImageRollupTable.count) / func.sum(case((IndiAllSkyDbImageRollupTable.stars_avg != sa_null(), IndiAllSkyDbImageRollupTable.count)))).label('image_avg_stars'),
+        )\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == camera_id,
-                    self.model.exclude == sa_false(),
-                    self.model.createDate > ts_minus_minutes,
-                    self.model.createDate < ts_dt,
+                    IndiAllSkyDbImageRollupTable.camera_id == camera_id,
+                    IndiAllSkyDbImageRollupTable.resolution == 1,
+                    IndiAllSkyDbImageRollupTable.bucket > ts_minus_minutes,
+                    IndiAllSkyDbImageRollupTable.bucket < ts_dt,
                 )
             )\
             .first()
@@ -1225,6 +1166,9 @@ class JsonChartView(JsonView):
 
         self.chart_history_seconds = 900
 
+        # shorter windows are charted from the individual images
+        self.chart_rollup_min_seconds = 3600
+
 
     def get_objects(self):
         camera_id = int(request.args['camera_id'])
@@ -1263,26 +1207,42 @@ class JsonChartView(JsonView):
 
         ts_minus_seconds = ts_dt - timedelta(seconds=history_seconds)
 
-        chart_query = IndiAllSkyDbImageTable.query\
-            .add_columns(
-                IndiAllSkyDbImageTable.createDate,
-                IndiAllSkyDbImageTable.sqm,
-                func.avg(IndiAllSkyDbImageTable.stars).over(order_by=IndiAllSkyDbImageTable.createDate, rows=(-5, 0)).label('stars_rolling'),
-                IndiAllSkyDbImageTable.temp,
-                IndiAllSkyDbImageTable.exposure,
+        if history_seconds < self.chart_rollup_min_seconds:
+            # columns are labeled to match the rollup table
+            chart_query = db.session.query(
+                IndiAllSkyDbImageTable.createDate.label('bucket'),
+                IndiAllSkyDbImageTable.sqm.label('sqm_avg'),
+                func.avg(IndiAllSkyDbImageTable.stars).over(order_by=IndiAllSkyDbImageTable.createDate, rows=(-5, 0)).label('stars_avg'),
+                IndiAllSkyDbImageTable.temp.label('temp_avg'),
+                IndiAllSkyDbImageTable.exposure.label('exposure_avg'),
                 IndiAllSkyDbImageTable.detections,
-                (IndiAllSkyDbImageTable.sqm - func.lag(IndiAllSkyDbImageTable.sqm).over(order_by=IndiAllSkyDbImageTable.createDate)).label('sqm_diff'),
                 IndiAllSkyDbImageTable.data,
             )\
-            .join(IndiAllSkyDbCameraTable)\
-            .filter(
-                and_(
-                    IndiAllSkyDbCameraTable.id == camera_id,
-                    IndiAllSkyDbImageTable.createDate > ts_minus_seconds,
-                    IndiAllSkyDbImageTable.createDate < ts_dt,
-                )
-            )\
-            .order_by(IndiAllSkyDbImageTable.createDate.asc())
+                .filter(
+                    and_(
+                        IndiAllSkyDbImageTable.camera_id == camera_id,
+                        IndiAllSkyDbImageTable.createDate > ts_minus_seconds,
+                        IndiAllSkyDbImageTable.createDate < ts_dt,
+                    )
+                )\
+                .order_by(IndiAllSkyDbImageTable.createDate.asc())
+        else:
+            # the number of points is limited by the rollup resolution
+            resolution = IndiAllSkyDbImageRollupTable.selectResolution(history_seconds)
+
+            # include the partial bucket at the start of the window
+            bucket_start = IndiAllSkyDbImageRollupTable.bucketStart(ts_minus_seconds, resolution)
+
+            chart_query = IndiAllSkyDbImageRollupTable.query\
+                .filter(
+                    and_(
+                        IndiAllSkyDbImageRollupTable.camera_id == camera_id,
+                        IndiAllSkyDbImageRollupTable.resolution == resolution,
+                        IndiAllSkyDbImageRollupTable.bucket >= bucket_start,
+                        IndiAllSkyDbImageRollupTable.bucket < ts_dt,
+                    )
+                )\
+                .order_by(IndiAllSkyDbImageRollupTable.bucket.asc())
 
 
         #app.logger.info('Chart SQL: %s', str(chart_query))
@@ -1323,28 +1283,31 @@ class JsonChartView(JsonView):
         custom_chart_6_key = camera_data.get('custom_chart_6_key', 'sensor_user_15')
 
 
+        sqm_prev = None
         for i in chart_query:
-            x = i.createDate.strftime('%H:%M:%S')
+            x = i.bucket.strftime('%H:%M:%S')
 
             sqm_data = {
                 'x' : x,
-                'y' : i.sqm,
+                'y' : i.sqm_avg,
             }
             chart_data['sqm'].append(sqm_data)
 
             star_data = {
                 'x' : x,
-                'y' : int(i.stars_rolling),
+                'y' : int(i.stars_avg or 0),
             }
             chart_data['stars'].append(star_data)
 
 
-            if self.indi_allsky_config.get('TEMP_DISPLAY') == 'f':
-                sensortemp = ((i.temp * 9.0) / 5.0) + 32
+            if isinstance(i.temp_avg, type(None)):
+                sensortemp = None
+            elif self.indi_allsky_config.get('TEMP_DISPLAY') == 'f':
+                sensortemp = ((i.temp_avg * 9.0) / 5.0) + 32
             elif self.indi_allsky_config.get('TEMP_DISPLAY') == 'k':
-                sensortemp = i.temp + 273.15
+                sensortemp = i.temp_avg + 273.15
             else:
-                sensortemp = i.temp
+                sensortemp = i.temp_avg
 
             temp_data = {
                 'x' : x,
@@ -1354,13 +1317,21 @@ class JsonChartView(JsonView):
 
             exp_data = {
                 'x' : x,
-                'y' : i.exposure,
+                'y' : i.exposure_avg,
             }
             chart_data['exp'].append(exp_data)
 
+
+            if isinstance(sqm_prev, type(None)) or isinstance(i.sqm_avg, type(None)):
+                sqm_diff = None
+            else:
+                sqm_diff = i.sqm_avg - sqm_prev
+
+            sqm_prev = i.sqm_avg
+
             sqm_d_data = {
                 'x' : x,
-                'y' : i.sqm_diff,
+                'y' : sqm_diff,
             }
             chart_data['sqm_d'].append(sqm_d_data)
 
@@ -1380,7 +1351,7 @@ class JsonChartView(JsonView):
             # custom chart 1
             try:
                 custom_1_y = i.data[custom_chart_1_key]
-            except KeyError:
+            except (KeyError, TypeError):
                 custom_1_y = 0
 
             custom_1_data = {
@@ -1393,7 +1364,7 @@ class JsonChartView(JsonView):
             # custom chart 2
             try:
                 custom_2_y = i.data[custom_chart_2_key]
-            except KeyError:
+            except (KeyError, TypeError):
                 custom_2_y = 0
 
             custom_2_data = {
@@ -1406,7 +1377,7 @@ class JsonChartView(JsonView):
             # custom chart 3
             try:
                 custom_3_y = i.data[custom_chart_3_key]
-            except KeyError:
+            except (KeyError, TypeError):
                 custom_3_y = 0
 
             custom_3_data = {
@@ -1419,7 +1390,7 @@ class JsonChartView(JsonView):
             # custom chart 4
             try:
                 custom_4_y = i.data[custom_chart_4_key]
-            except KeyError:
+            except (KeyError, TypeError):
                 custom_4_y = 0
 
             custom_4_data = {
@@ -1432,7 +1403,7 @@ class JsonChartView(JsonView):
             # custom chart 5
             try:
                 custom_5_y = i.data[custom_chart_5_key]
-            except KeyError:
+            except (KeyError, TypeError):
                 custom_5_y = 0
 
             custom_5_data = {
@@ -1445,7 +1416,7 @@ class JsonChartView(JsonView):
             # custom chart 6
             try:
                 custom_6_y = i.data[custom_chart_6_key]
-            except KeyError:
+            except (KeyError, TypeError):
                 custom_6_y = 0
 
             custom_6_data = {
@@ -1566,6 +1537,7 @@ class JsonChartView(JsonView):
 
 class ConfigView(FormView):
     decorators = [login_required]
+    decrypt_config = True
 
     def get_context(self):
         context = super(ConfigView, self).get_context()
@@ -1783,7 +1755,9 @@ class ConfigView(FormView):
             'TIMELAPSE__IMAGE_CIRCLE'        : self.indi_allsky_config.get('TIMELAPSE', {}).get('IMAGE_CIRCLE', 2000),
             'TIMELAPSE__KEOGRAM_RATIO'       : self.indi_allsky_config.get('TIMELAPSE', {}).get('KEOGRAM_RATIO', 0.15),
             'TIMELAPSE__PRE_SCALE'           : self.indi_allsky_config.get('TIMELAPSE', {}).get('PRE_SCALE', 50),
+            'TIMELAPSE__PROCESSES'           : self.indi_allsky_config.get('TIMELAPSE', {}).get('PROCESSES', 1),
             'TIMELAPSE__FFMPEG_REPORT'       : self.indi_allsky_config.get('TIMELAPSE', {}).get('FFMPEG_REPORT', False),
+            'TIMELAPSE__RAW_PIPE'            : self.indi_allsky_config.get('TIMELAPSE', {}).get('RAW_PIPE', False),
             'CAPTURE_PAUSE'                  : self.indi_allsky_config.get('CAPTURE_PAUSE', False),
             'DAYTIME_CAPTURE'                : self.indi_allsky_config.get('DAYTIME_CAPTURE', True),
             'DAYTIME_CAPTURE_SAVE'           : self.indi_allsky_config.get('DAYTIME_CAPTURE_SAVE', True),
@@ -1815,6 +1789,8 @@ class ConfigView(FormView):
             'KEOGRAM_CROP_TOP'               : self.indi_allsky_config.get('KEOGRAM_CROP_TOP', 0),
             'KEOGRAM_CROP_BOTTOM'            : self.indi_allsky_config.get('KEOGRAM_CROP_BOTTOM', 0),
             'KEOGRAM_LABEL'                  : self.indi_allsky_config.get('KEOGRAM_LABEL', True),
+            'KEOGRAM_INCREMENTAL'            : self.indi_allsky_config.get('KEOGRAM_INCREMENTAL', False),
+            'KEOGRAM_INCREMENTAL_CHECKPOINT' : self.indi_allsky_config.get('KEOGRAM_INCREMENTAL_CHECKPOINT', 20),
             'LONGTERM_KEOGRAM__ENABLE'       : self.indi_allsky_config.get('LONGTERM_KEOGRAM', {}).get('ENABLE', True),
             'LONGTERM_KEOGRAM__OFFSET_X'     : self.indi_allsky_config.get('LONGTERM_KEOGRAM', {}).get('OFFSET_X', 0),
             'LONGTERM_KEOGRAM__OFFSET_Y'     : self.indi_allsky_config.get('LONGTERM_KEOGRAM', {}).get('OFFSET_Y', 0),
@@ -1831,6 +1807,7 @@ class ConfigView(FormView):
             'STARTRAILS_USE_DB_DATA'         : self.indi_allsky_config.get('STARTRAILS_USE_DB_DATA', True),
             'IMAGE_CALIBRATE_DARK'           : self.indi_allsky_config.get('IMAGE_CALIBRATE_DARK', True),
             'IMAGE_CALIBRATE_BPM'            : self.indi_allsky_config.get('IMAGE_CALIBRATE_BPM', False),
+            'IMAGE_CALIBRATE_CACHE_MB'       : self.indi_allsky_config.get('IMAGE_CALIBRATE_CACHE_MB', 256),
             'IMAGE_SAVE_FITS_PRE_DARK'       : self.indi_allsky_config.get('IMAGE_SAVE_FITS_PRE_DARK', False),
             'IMAGE_EXIF_PRIVACY'             : self.indi_allsky_config.get('IMAGE_EXIF_PRIVACY', False),
             'IMAGE_FILE_TYPE'                : self.indi_allsky_config.get('IMAGE_FILE_TYPE', 'jpg'),
@@ -1902,6 +1879,11 @@ class ConfigView(FormView):
             'IMAGE_QUEUE_MAX'                : self.indi_allsky_config.get('IMAGE_QUEUE_MAX', 3),
             'IMAGE_QUEUE_MIN'                : self.indi_allsky_config.get('IMAGE_QUEUE_MIN', 1),
             'IMAGE_QUEUE_BACKOFF'            : self.indi_allsky_config.get('IMAGE_QUEUE_BACKOFF', 0.5),
+            'IMAGE_SHARED_MEMORY'            : self.indi_allsky_config.get('IMAGE_SHARED_MEMORY', False),
+            'IMAGE_SHARED_MEMORY_SLOTS'      : self.indi_allsky_config.get('IMAGE_SHARED_MEMORY_SLOTS', 4),
+            'IMAGE_SHARED_MEMORY_SLOT_MB'    : self.indi_allsky_config.get('IMAGE_SHARED_MEMORY_SLOT_MB', 128),
+            'IMAGE_OUTPUT_WORKER'            : self.indi_allsky_config.get('IMAGE_OUTPUT_WORKER', False),
+            'IMAGE_OUTPUT_QUEUE_MAX'         : self.indi_allsky_config.get('IMAGE_OUTPUT_QUEUE_MAX', 3),
             'THUMBNAILS__IMAGES_AUTO'        : self.indi_allsky_config.get('THUMBNAILS', {}).get('IMAGES_AUTO', True),
             'IMAGE_EXPIRE_DAYS'              : self.indi_allsky_config.get('IMAGE_EXPIRE_DAYS', 10),
             'IMAGE_RAW_EXPIRE_DAYS'          : self.indi_allsky_config.get('IMAGE_RAW_EXPIRE_DAYS', 10),
@@ -2028,6 +2010,7 @@ class ConfigView(FormView):
             'MQTTPUBLISH__TLS'               : self.indi_allsky_config.get('MQTTPUBLISH', {}).get('TLS', True),
             'MQTTPUBLISH__CERT_BYPASS'       : self.indi_allsky_config.get('MQTTPUBLISH', {}).get('CERT_BYPASS', True),
             'MQTTPUBLISH__PUBLISH_IMAGE'     : self.indi_allsky_config.get('MQTTPUBLISH', {}).get('PUBLISH_IMAGE', True),
+            'MQTTPUBLISH__CHANGED_ONLY'      : self.indi_allsky_config.get('MQTTPUBLISH', {}).get('CHANGED_ONLY', False),
             'SYNCAPI__ENABLE'                : self.indi_allsky_config.get('SYNCAPI', {}).get('ENABLE', False),
             'SYNCAPI__BASEURL'               : self.indi_allsky_config.get('SYNCAPI', {}).get('BASEURL', 'https://example.com/indi-allsky'),
             'SYNCAPI__USERNAME'              : self.indi_allsky_config.get('SYNCAPI', {}).get('USERNAME', ''),
@@ -2059,6 +2042,7 @@ class ConfigView(FormView):
             'LIBCAMERA__CAMERA_ID'           : str(self.indi_allsky_config.get('LIBCAMERA', {}).get('CAMERA_ID', 0)),  # string in form, int in config
             'LIBCAMERA__EXTRA_OPTIONS'       : self.indi_allsky_config.get('LIBCAMERA', {}).get('EXTRA_OPTIONS', ''),
             'LIBCAMERA__EXTRA_OPTIONS_DAY'   : self.indi_allsky_config.get('LIBCAMERA', {}).get('EXTRA_OPTIONS_DAY', ''),
+            'LIBCAMERA__PERSISTENT'          : self.indi_allsky_config.get('LIBCAMERA', {}).get('PERSISTENT', False),
             'PYCURL_CAMERA__URL'             : self.indi_allsky_config.get('PYCURL_CAMERA', {}).get('URL', ''),
             'PYCURL_CAMERA__IMAGE_FILE_TYPE' : self.indi_allsky_config.get('PYCURL_CAMERA', {}).get('IMAGE_FILE_TYPE', 'jpg'),
             'PYCURL_CAMERA__USERNAME'        : self.indi_allsky_config.get('PYCURL_CAMERA', {}).get('USERNAME', ''),
@@ -2429,6 +2413,7 @@ class ConfigView(FormView):
 class AjaxConfigView(BaseView):
     methods = ['POST']
     decorators = [login_required]
+    cache_config = False
 
     def dispatch_request(self):
         form_config = IndiAllskyConfigForm(data=request.json)
@@ -2581,7 +2566,9 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['TIMELAPSE']['IMAGE_CIRCLE']            = int(request.json['TIMELAPSE__IMAGE_CIRCLE'])
         self.indi_allsky_config['TIMELAPSE']['KEOGRAM_RATIO']           = float(request.json['TIMELAPSE__KEOGRAM_RATIO'])
         self.indi_allsky_config['TIMELAPSE']['PRE_SCALE']               = int(request.json['TIMELAPSE__PRE_SCALE'])
+        self.indi_allsky_config['TIMELAPSE']['PROCESSES']               = int(request.json['TIMELAPSE__PROCESSES'])
         self.indi_allsky_config['TIMELAPSE']['FFMPEG_REPORT']           = bool(request.json['TIMELAPSE__FFMPEG_REPORT'])
+        self.indi_allsky_config['TIMELAPSE']['RAW_PIPE']                = bool(request.json['TIMELAPSE__RAW_PIPE'])
         self.indi_allsky_config['CAPTURE_PAUSE']                        = bool(request.json['CAPTURE_PAUSE'])
         self.indi_allsky_config['DAYTIME_CAPTURE']                      = bool(request.json['DAYTIME_CAPTURE'])
         self.indi_allsky_config['DAYTIME_CAPTURE_SAVE']                 = bool(request.json['DAYTIME_CAPTURE_SAVE'])
@@ -2613,6 +2600,8 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['KEOGRAM_CROP_TOP']                     = int(request.json['KEOGRAM_CROP_TOP'])
         self.indi_allsky_config['KEOGRAM_CROP_BOTTOM']                  = int(request.json['KEOGRAM_CROP_BOTTOM'])
         self.indi_allsky_config['KEOGRAM_LABEL']                        = bool(request.json['KEOGRAM_LABEL'])
+        self.indi_allsky_config['KEOGRAM_INCREMENTAL']                  = bool(request.json['KEOGRAM_INCREMENTAL'])
+        self.indi_allsky_config['KEOGRAM_INCREMENTAL_CHECKPOINT']       = int(request.json['KEOGRAM_INCREMENTAL_CHECKPOINT'])
         self.indi_allsky_config['LONGTERM_KEOGRAM']['ENABLE']           = bool(request.json['LONGTERM_KEOGRAM__ENABLE'])
         self.indi_allsky_config['LONGTERM_KEOGRAM']['OFFSET_X']         = int(request.json['LONGTERM_KEOGRAM__OFFSET_X'])
         self.indi_allsky_config['LONGTERM_KEOGRAM']['OFFSET_Y']         = int(request.json['LONGTERM_KEOGRAM__OFFSET_Y'])
@@ -2629,6 +2618,7 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['STARTRAILS_USE_DB_DATA']               = bool(request.json['STARTRAILS_USE_DB_DATA'])
         self.indi_allsky_config['IMAGE_CALIBRATE_DARK']                 = bool(request.json['IMAGE_CALIBRATE_DARK'])
         self.indi_allsky_config['IMAGE_CALIBRATE_BPM']                  = bool(request.json['IMAGE_CALIBRATE_BPM'])
+        self.indi_allsky_config['IMAGE_CALIBRATE_CACHE_MB']             = int(request.json['IMAGE_CALIBRATE_CACHE_MB'])
         self.indi_allsky_config['IMAGE_SAVE_FITS_PRE_DARK']             = bool(request.json['IMAGE_SAVE_FITS_PRE_DARK'])
         self.indi_allsky_config['IMAGE_EXIF_PRIVACY']                   = bool(request.json['IMAGE_EXIF_PRIVACY'])
         self.indi_allsky_config['IMAGE_FILE_TYPE']                      = str(request.json['IMAGE_FILE_TYPE'])
@@ -2702,6 +2692,11 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['IMAGE_QUEUE_MAX']                      = int(request.json['IMAGE_QUEUE_MAX'])
         self.indi_allsky_config['IMAGE_QUEUE_MIN']                      = int(request.json['IMAGE_QUEUE_MIN'])
         self.indi_allsky_config['IMAGE_QUEUE_BACKOFF']                  = float(request.json['IMAGE_QUEUE_BACKOFF'])
+        self.indi_allsky_config['IMAGE_SHARED_MEMORY']                  = bool(request.json['IMAGE_SHARED_MEMORY'])
+        self.indi_allsky_config['IMAGE_SHARED_MEMORY_SLOTS']            = int(request.json['IMAGE_SHARED_MEMORY_SLOTS'])
+        self.indi_allsky_config['IMAGE_SHARED_MEMORY_SLOT_MB']          = int(request.json['IMAGE_SHARED_MEMORY_SLOT_MB'])
+        self.indi_allsky_config['IMAGE_OUTPUT_WORKER']                  = bool(request.json['IMAGE_OUTPUT_WORKER'])
+        self.indi_allsky_config['IMAGE_OUTPUT_QUEUE_MAX']               = int(request.json['IMAGE_OUTPUT_QUEUE_MAX'])
         self.indi_allsky_config['THUMBNAILS']['IMAGES_AUTO']            = bool(request.json['THUMBNAILS__IMAGES_AUTO'])
         self.indi_allsky_config['IMAGE_EXPIRE_DAYS']                    = int(request.json['IMAGE_EXPIRE_DAYS'])
         self.indi_allsky_config['IMAGE_RAW_EXPIRE_DAYS']                = int(request.json['IMAGE_RAW_EXPIRE_DAYS'])
@@ -2828,6 +2823,7 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['MQTTPUBLISH']['TLS']                   = bool(request.json['MQTTPUBLISH__TLS'])
         self.indi_allsky_config['MQTTPUBLISH']['CERT_BYPASS']           = bool(request.json['MQTTPUBLISH__CERT_BYPASS'])
         self.indi_allsky_config['MQTTPUBLISH']['PUBLISH_IMAGE']         = bool(request.json['MQTTPUBLISH__PUBLISH_IMAGE'])
+        self.indi_allsky_config['MQTTPUBLISH']['CHANGED_ONLY']          = bool(request.json['MQTTPUBLISH__CHANGED_ONLY'])
         self.indi_allsky_config['SYNCAPI']['ENABLE']                    = bool(request.json['SYNCAPI__ENABLE'])
         self.indi_allsky_config['SYNCAPI']['BASEURL']                   = str(request.json['SYNCAPI__BASEURL'])
         self.indi_allsky_config['SYNCAPI']['USERNAME']                  = str(request.json['SYNCAPI__USERNAME'])
@@ -2869,6 +2865,7 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['LIBCAMERA']['CAMERA_ID']               = int(request.json['LIBCAMERA__CAMERA_ID'])
         self.indi_allsky_config['LIBCAMERA']['EXTRA_OPTIONS']           = str(request.json['LIBCAMERA__EXTRA_OPTIONS'])
         self.indi_allsky_config['LIBCAMERA']['EXTRA_OPTIONS_DAY']       = str(request.json['LIBCAMERA__EXTRA_OPTIONS_DAY'])
+        self.indi_allsky_config['LIBCAMERA']['PERSISTENT']              = bool(request.json['LIBCAMERA__PERSISTENT'])
         self.indi_allsky_config['PYCURL_CAMERA']['URL']                 = str(request.json['PYCURL_CAMERA__URL'])
         self.indi_allsky_config['PYCURL_CAMERA']['IMAGE_FILE_TYPE']     = str(request.json['PYCURL_CAMERA__IMAGE_FILE_TYPE'])
         self.indi_allsky_config['PYCURL_CAMERA']['USERNAME']            = str(request.json['PYCURL_CAMERA__USERNAME'])
@@ -3566,7 +3563,7 @@ class Fits2JpegView(BaseView):
         filename_p = Path(fits_entry.getFilesystemPath())
 
 
-        p_config = self.indi_allsky_config.copy()
+        p_config = copy.deepcopy(self.indi_allsky_config)  # shared config must not be modified
 
 
         hdulist = fits.open(filename_p)
@@ -6231,7 +6228,7 @@ class JsonImageProcessingView(JsonView):
         filename_p = Path(fits_entry.getFilesystemPath())
 
 
-        p_config = self.indi_allsky_config.copy()
+        p_config = copy.deepcopy(self.indi_allsky_config)  # shared config must not be modified
 
         p_config['LENS_OFFSET_X']                        = int(request.json['LENS_OFFSET_X'])
         p_config['LENS_OFFSET_X']                        = int(request.json['LENS_OFFSET_Y'])
@@ -7725,6 +7722,37 @@ class AjaxAstroPanelView(BaseView):
         neptune.compute(obs)
 
 
+        # next passes are precomputed by the satellite pass predictor
+        satellite_pass = IndiAllskySatellitePassPredictor(self.indi_allsky_config)
+
+        if satellite_pass.passesCurrent(camera.id, utcnow):
+            utcnow_naive = utcnow.replace(tzinfo=None)
+
+            next_rise_subq = db.session.query(
+                IndiAllSkyDbSatellitePassTable.satnum,
+                func.min(IndiAllSkyDbSatellitePassTable.rise).label('rise'),
+            )\
+                .filter(IndiAllSkyDbSatellitePassTable.camera_id == camera.id)\
+                .filter(IndiAllSkyDbSatellitePassTable.rise >= utcnow_naive)\
+                .group_by(IndiAllSkyDbSatellitePassTable.satnum)\
+                .subquery()
+
+            next_pass_query = IndiAllSkyDbSatellitePassTable.query\
+                .join(
+                    next_rise_subq,
+                    and_(
+                        IndiAllSkyDbSatellitePassTable.satnum == next_rise_subq.c.satnum,
+                        IndiAllSkyDbSatellitePassTable.rise == next_rise_subq.c.rise,
+                    ),
+                )\
+                .filter(IndiAllSkyDbSatellitePassTable.camera_id == camera.id)
+
+            next_pass_dict = {x.satnum: x for x in next_pass_query}
+        else:
+            # passes are calculated below until the table is predicted
+            next_pass_dict = None
+
+
         satellite_list = list()
         for sat_entry in satellites_visual:
             try:
@@ -7735,20 +7763,41 @@ class AjaxAstroPanelView(BaseView):
 
             sat.compute(obs)
 
-            try:
-                next_pass = obs.next_pass(sat)
-            except ValueError as e:
-                app.logger.error('Next pass error: %s', str(e))
-                continue
+
+            if isinstance(next_pass_dict, type(None)):
+                try:
+                    next_pass = obs.next_pass(sat)
+                except ValueError as e:
+                    app.logger.error('Next pass error: %s', str(e))
+                    continue
+
+                if isinstance(next_pass[0], type(None)) or isinstance(next_pass[2], type(None)) or isinstance(next_pass[4], type(None)):
+                    # partial pass
+                    continue
+
+                pass_rise = next_pass[0].datetime()
+                pass_transit = next_pass[2].datetime()
+                pass_set = next_pass[4].datetime()
+            else:
+                try:
+                    next_pass_entry = next_pass_dict[int(sat_entry.line1[2:7])]
+                except (KeyError, ValueError):
+                    # no pass in the predicted window
+                    continue
+
+                pass_rise = next_pass_entry.rise
+                pass_transit = next_pass_entry.transit
+                pass_set = next_pass_entry.set
+
 
             sat_data = {
                 'name'      : str(sat_entry.title).upper(),
-                'rise'      : '{0:%Y-%m-%d %H:%M:%S}'.format(ephem.localtime(next_pass[0])),
-                'transit'   : '{0:%Y-%m-%d %H:%M:%S}'.format(ephem.localtime(next_pass[2])),
-                'set'       : '{0:%Y-%m-%d %H:%M:%S}'.format(ephem.localtime(next_pass[4])),
+                'rise'      : '{0:%Y-%m-%d %H:%M:%S}'.format(pass_rise.replace(tzinfo=timezone.utc).astimezone()),
+                'transit'   : '{0:%Y-%m-%d %H:%M:%S}'.format(pass_transit.replace(tzinfo=timezone.utc).astimezone()),
+                'set'       : '{0:%Y-%m-%d %H:%M:%S}'.format(pass_set.replace(tzinfo=timezone.utc).astimezone()),
                 'az'        : round(math.degrees(sat.az), 2),
                 'alt'       : round(math.degrees(sat.alt), 2),
-                'duration'  : '{0:d}'.format((ephem.localtime(next_pass[4]) - ephem.localtime(next_pass[0])).seconds),
+                'duration'  : '{0:d}'.format((pass_set - pass_rise).seconds),
                 'elevation' : int(sat.elevation / 1000),
                 'eclipsed'  : sat.eclipsed,
             }
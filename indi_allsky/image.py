@@ -6,6 +6,7 @@ from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
 import time
+from collections import deque
 import functools
 import tempfile
 import shutil
@@ -32,6 +33,8 @@ from fractions import Fraction
 from . import constants
 
 from .processing import ImageProcessor
+from .accumulator import IndiAllSkyKeogramStarTrailAccumulator
+from .maskProcessing import MaskProcessor
 from .miscUpload import miscUpload
 from .adsb import AdsbAircraftHttpWorker
 
@@ -59,41 +62,138 @@ logger = logging.getLogger('indi_allsky')
 
 
 
-class ImageWorker(Process):
+class ImageOutputRef(object):
+    """Picklable copy of the ImageData attributes needed to store and publish the final image"""
+
+    attributes = (
+        'exposure',
+        'exp_date',
+        'exp_elapsed',
+        'day_date',
+        'camera_id',
+        'camera_name',
+        'camera_uuid',
+        'target_adu',
+        'calibrated',
+        'kpindex',
+        'ovation_max',
+        'smoke_rating',
+        'sqm_value',
+        'lines',
+        'stars',
+    )
+
+
+    def __init__(self, i_ref):
+        for a in self.attributes:
+            setattr(self, a, getattr(i_ref, a))
+
+
+
+class ImagePipelineStats(object):
+    """Rolling per-stage latency and throughput of the image pipeline"""
+
+    window = 50
+
+
+    def __init__(self):
+        self._stage_times = dict()
+        self._frame_times = deque(maxlen=self.window)
+
+        self._frames = 0
+
+
+    @property
+    def frames(self):
+        return self._frames
+
+
+    @property
+    def throughput(self):
+        # images per minute
+        if len(self._frame_times) < 2:
+            return 0.0
+
+        span_s = self._frame_times[-1] - self._frame_times[0]
+        if not span_s:
+            return 0.0
+
+        return (len(self._frame_times) - 1) * 60 / span_s
+
+
+    def add(self, stage_elapsed):
+        for stage, elapsed_s in stage_elapsed.items():
+            if stage not in self._stage_times:
+                self._stage_times[stage] = deque(maxlen=self.window)
+
+            self._stage_times[stage].append(elapsed_s)
+
+
+        self._frame_times.append(time.time())
+        self._frames += 1
+
+
+    def getStats(self):
+        latency = dict()
+        for stage, times in self._stage_times.items():
+            latency[stage] = round(sum(times) / len(times), 4)
+
+        stats = {
+            'throughput' : round(self.throughput, 2),
+            'latency'    : latency,
+        }
+
+        return stats
+
+
+    def logStats(self):
+        stats = self.getStats()
+
+        logger.info(
+            'Image pipeline: %0.2f images/min, latency %s',
+            stats['throughput'],
+            ', '.join(['{0:s} {1:0.3f}s'.format(k, v) for k, v in stats['latency'].items()]),
+        )
+
+
+
+class ImageWorkerBase(Process):
+    """Shared state and output stage of the image workers
+
+    The output stage encodes, stores and publishes the final images.  It does
+    not need an ImageProcessor so the ImageOutputWorker derives from this class
+    instead of the ImageWorker.
+    """
 
     sqm_history_minutes = 30
     stars_history_minutes = 30
 
+    pipeline_stats_interval = 10  # log pipeline stats every N images
+
 
     def __init__(
         self,
-        idx,
         config,
         error_q,
-        image_q,
         upload_q,
         position_av,
-        exposure_av,
         gain_v,
         bin_v,
         sensors_temp_av,
         sensors_user_av,
         night_v,
         moonmode_v,
+        video_q=None,
     ):
-        super(ImageWorker, self).__init__()
-
-        self.name = 'Image-{0:d}'.format(idx)
+        super(ImageWorkerBase, self).__init__()
 
         self.config = config
 
         self.error_q = error_q
-        self.image_q = image_q
         self.upload_q = upload_q
 
         self.position_av = position_av  # lat, long, elev, ra, dec
 
-        self.exposure_av = exposure_av  # current, min night, min day, max
         self.gain_v = gain_v
         self.bin_v = bin_v
         self.sensors_temp_av = sensors_temp_av  # 0 ccd_temp
@@ -101,6 +201,13 @@ class ImageWorker(Process):
         self.night_v = night_v
         self.moonmode_v = moonmode_v
 
+        self.pipeline_stats = ImagePipelineStats()
+
+        # end of period keogram tasks are queued after the incremental state is saved
+        self.video_q = video_q
+
+        self._keogram_accumulator = None  # created when needed
+
         # shared between objects
         self.astrometric_data = {
             'sun_alt'       : 0.0,
@@ -149,40 +256,17 @@ class ImageWorker(Process):
 
         self.filename_t = 'ccd{0:d}_{1:s}.{2:s}'
 
-        self.adsb_worker = None
-        self.adsb_worker_idx = 0
-        self.adsb_aircraft_q = None
         self.adsb_aircraft_list = []
 
-        self.generate_mask_base = True
-
         self.target_adu_found = False
         self.current_adu_target = 0
-        self.hist_adu = []
-
-        self.sqm_value = 0
 
-        self.image_count = 0
         self.metadata_count = 0
 
-        self.image_processor = ImageProcessor(
-            self.config,
-            self.position_av,
-            self.gain_v,
-            self.bin_v,
-            self.sensors_temp_av,
-            self.sensors_user_av,
-            self.night_v,
-            self.moonmode_v,
-            self.astrometric_data,
-        )
-
         self._miscDb = miscDb(self.config)
         self._miscUpload = miscUpload(self.config, self.upload_q)
 
 
-        self._libcamera_raw = False
-
         if self.config.get('IMAGE_FOLDER'):
             self.image_dir = Path(self.config['IMAGE_FOLDER']).absolute()
         else:
@@ -191,16 +275,6 @@ class ImageWorker(Process):
         self._shutdown = False
 
 
-    @property
-    def libcamera_raw(self):
-        return self._libcamera_raw
-
-    @libcamera_raw.setter
-    def libcamera_raw(self, new_libcamera_raw):
-        self._libcamera_raw = bool(new_libcamera_raw)
-
-
-
     def sighup_handler_worker(self, signum, frame):
         logger.warning('Caught HUP signal')
 
@@ -245,838 +319,1245 @@ class ImageWorker(Process):
 
 
 
-    def saferun(self):
-        #raise Exception('Test exception handling in worker')
+    def outputImage(self, o_dict):
+        ### encode, store and publish the final image
+        output_start = time.time()
 
-        while True:
-            try:
-                i_dict = self.image_q.get(timeout=23)  # prime number
-            except queue.Empty:
-                continue
+        data = o_dict['image']
+        i_ref = o_dict['i_ref']
+        jpeg_exif = o_dict['jpeg_exif']
+        adu = o_dict['adu']
+        adu_average = o_dict['adu_average']
+        processing_elapsed_s = o_dict['processing_elapsed']
+        longterm_keogram_pixels = o_dict['longterm_keogram_pixels']
 
+        camera_id = o_dict['camera_id']
+        exposure = i_ref.exposure
+        exp_date = i_ref.exp_date
+        exp_elapsed = i_ref.exp_elapsed
 
-            if i_dict.get('stop'):
-                logger.warning('Goodbye')
-                return
+        stage_elapsed = o_dict['stage_elapsed']
+        stage_elapsed['queue'] = output_start - o_dict['queued_time']
 
-            if self._shutdown:
-                logger.warning('Goodbye')
-                return
 
+        camera = IndiAllSkyDbCameraTable.query\
+            .filter(IndiAllSkyDbCameraTable.id == camera_id)\
+            .one()
 
-            # new context for every task, reduces the effects of caching
-            with app.app_context():
-                self.processImage(i_dict)
 
+        # need this after resizing and scaling
+        final_height, final_width = data.shape[:2]
 
-    def processImage(self, i_dict):
-        ### Not using DB task queue for image processing to reduce database I/O
-        #task_id = i_dict['task_id']
 
-        #try:
-        #    task = IndiAllSkyDbTaskQueueTable.query\
-        #        .filter(IndiAllSkyDbTaskQueueTable.id == task_id)\
-        #        .filter(IndiAllSkyDbTaskQueueTable.state == TaskQueueState.QUEUED)\
-        #        .filter(IndiAllSkyDbTaskQueueTable.queue == TaskQueueQueue.IMAGE)\
-        #        .one()
+        #task.setSuccess('Image processed')
 
-        #except NoResultFound:
-        #    logger.error('Task ID %d not found', task_id)
-        #    continue
+        self.write_status_json(i_ref, adu, adu_average)  # write json status file
 
+        latest_file, new_filename = self.write_img(data, i_ref, camera, jpeg_exif=jpeg_exif)
 
-        #task.setRunning()
+        if new_filename:
+            image_metadata = {
+                'type'            : constants.IMAGE,
+                'createDate'      : int(exp_date.timestamp()),
+                'dayDate'         : i_ref.day_date.strftime('%Y%m%d'),
+                'utc_offset'      : exp_date.astimezone().utcoffset().total_seconds(),
+                'exposure'        : exposure,
+                'exp_elapsed'     : exp_elapsed,
+                'gain'            : self.gain_v.value,
+                'binmode'         : self.bin_v.value,
+                'temp'            : self.sensors_temp_av[0],
+                'adu'             : adu,
+                'stable'          : self.target_adu_found,
+                'moonmode'        : bool(self.moonmode_v.value),
+                'moonphase'       : self.astrometric_data['moon_phase'],
+                'night'           : bool(self.night_v.value),
+                'adu_roi'         : self.config['ADU_ROI'],
+                'calibrated'      : i_ref.calibrated,
+                'sqm'             : i_ref.sqm_value,
+                'stars'           : len(i_ref.stars),
+                'detections'      : len(i_ref.lines),
+                'process_elapsed' : processing_elapsed_s,
+                'kpindex'         : i_ref.kpindex,
+                'ovation_max'     : i_ref.ovation_max,
+                'smoke_rating'    : i_ref.smoke_rating,
+                'height'          : final_height,
+                'width'           : final_width,
+                'keogram_pixels'  : longterm_keogram_pixels,
+                'camera_uuid'     : i_ref.camera_uuid,
+            }
 
 
-        #filename = Path(task.data['filename'])
-        #exposure = task.data['exposure']
-        #exp_date = datetime.fromtimestamp(task.data['exp_time'])
-        #exp_elapsed = task.data['exp_elapsed']
-        #camera_id = task.data['camera_id']
-        #filename_t = task.data.get('filename_t')
-        ###
 
-        filename_p = Path(i_dict['filename'])
-        exposure = i_dict['exposure']
-        exp_date = datetime.fromtimestamp(i_dict['exp_time'])
-        exp_elapsed = i_dict['exp_elapsed']
-        camera_id = i_dict['camera_id']
-        filename_t = i_dict.get('filename_t')
+            image_add_data = dict()
+            for i, v in enumerate(self.sensors_temp_av):
+                image_add_data['sensor_temp_{0:d}'.format(i)] = v
 
+            for i, v in enumerate(self.sensors_user_av):
+                image_add_data['sensor_user_{0:d}'.format(i)] = v
 
-        # libcamera
-        libcamera_black_level = i_dict.get('libcamera_black_level', 0)
-        libcamera_awb_gains = i_dict.get('libcamera_awb_gains')
-        libcamera_ccm = i_dict.get('libcamera_ccm')
+            if self.adsb_aircraft_list:
+                image_add_data['aircraft'] = list()
 
+                for aircraft in self.adsb_aircraft_list:
+                    image_add_data['aircraft'].append(aircraft)
 
-        if self.config['CAMERA_INTERFACE'].startswith('libcamera'):
-            if filename_p.suffix == '.dng':
-                self.libcamera_raw = True
-                self.image_processor.libcamera_raw = True
-            else:
-                self.libcamera_raw = False
-                self.image_processor.libcamera_raw = False
 
+            image_metadata['data'] = image_add_data
 
-        if filename_t:
-            self.filename_t = filename_t
 
+            image_entry = self._miscDb.addImage(
+                new_filename.relative_to(self.image_dir),
+                camera_id,
+                image_metadata,
+            )
 
-        if not filename_p.exists():
-            logger.error('Frame not found: %s', filename_p)
-            #task.setFailed('Frame not found: {0:s}'.format(str(filename_p)))
-            return
 
+            if self.config.get('KEOGRAM_INCREMENTAL') and image_entry:
+                self.accumulateKeogramStarTrail(camera, image_entry, new_filename, data)
 
-        if filename_p.stat().st_size == 0:
-            logger.error('Frame is empty: %s', filename_p)
-            filename_p.unlink()
-            return
 
+            image_thumbnail_metadata = {
+                'type'       : constants.THUMBNAIL,
+                'origin'     : constants.IMAGE,
+                'createDate' : int(exp_date.timestamp()),
+                'dayDate'    : i_ref.day_date.strftime('%Y%m%d'),
+                'utc_offset' : exp_date.astimezone().utcoffset().total_seconds(),
+                'night'      : bool(self.night_v.value),
+                'camera_uuid': camera.uuid,
+            }
 
-        camera = IndiAllSkyDbCameraTable.query\
-            .filter(IndiAllSkyDbCameraTable.id == camera_id)\
-            .one()
+            image_thumbnail_entry = self._miscDb.addThumbnailImageAuto(
+                image_entry,
+                image_metadata,
+                camera.id,
+                image_thumbnail_metadata,
+                numpy_data=data,
+            )
+        else:
+            # images not being saved
+            image_entry = None
+            image_metadata = {}
+            image_thumbnail_entry = None
+            image_thumbnail_metadata = {}
 
 
-        processing_start = time.time()
+        if latest_file:
+            # build mqtt data
+            mq_topic_latest = 'latest'
 
+            mqtt_data = {
+                'exp_date' : exp_date.strftime('%Y-%m-%d %H:%M:%S'),
+                'exposure' : round(exposure, 6),
+                'gain'     : self.gain_v.value,
+                'bin'      : self.bin_v.value,
+                'temp'     : round(self.sensors_temp_av[0], 1),
+                'sunalt'   : round(self.astrometric_data['sun_alt'], 1),
+                'moonalt'  : round(self.astrometric_data['moon_alt'], 1),
+                'moonphase': round(self.astrometric_data['moon_phase'], 1),
+                'mooncycle': round(self.astrometric_data['moon_cycle'], 1),
+                'moonmode' : bool(self.moonmode_v.value),
+                'night'    : bool(self.night_v.value),
+                'sqm'      : round(i_ref.sqm_value, 1),
+                'stars'    : len(i_ref.stars),
+                'latitude' : round(self.position_av[0], 3),
+                'longitude': round(self.position_av[1], 3),
+                'elevation': int(self.position_av[2]),
+                'kpindex'  : round(i_ref.kpindex, 2),
+                'ovation_max'  : int(i_ref.ovation_max),
+                'smoke_rating' : constants.SMOKE_RATING_MAP_STR[i_ref.smoke_rating],
+                'aircraft' : len(self.adsb_aircraft_list),
+                'sidereal_time': self.astrometric_data['sidereal_time'],
+            }
 
-        ### simulate performance degradation
-        #time.sleep(30)
 
+            # publish cpu info
+            cpu_info = psutil.cpu_times_percent()
+            mqtt_data['cpu/user'] = round(cpu_info.user, 1)
+            mqtt_data['cpu/system'] = round(cpu_info.system, 1)
+            mqtt_data['cpu/nice'] = round(cpu_info.nice, 1)
+            mqtt_data['cpu/iowait'] = round(cpu_info.iowait, 1)  # io wait is not true cpu usage, not including in total
+            mqtt_data['cpu/total'] = round(cpu_info.user + cpu_info.system + cpu_info.nice, 1)
 
-        ### start fetching ADSB info
-        if self.config.get('ADSB', {}).get('ENABLE'):
-            self.adsb_aircraft_q = Queue()
-            self.adsb_worker_idx += 1
-            self.adsb_worker = AdsbAircraftHttpWorker(
-                self.adsb_worker_idx,
-                self.config,
-                self.adsb_aircraft_q,
-                self.position_av[0],  # lat
-                self.position_av[1],  # long
-                self.position_av[2],  # elev
-            )
-            self.adsb_worker.start()
 
+            # publish memory info
+            memory_info = psutil.virtual_memory()
+            memory_total = memory_info.total
+            memory_free = memory_info.free
 
-        self.image_processor.get_astrometric_data()
+            mqtt_data['memory/user'] = round((memory_info.used / memory_total) * 100.0, 1)
+            mqtt_data['memory/cached'] = round((memory_info.cached / memory_total) * 100.0, 1)
+            mqtt_data['memory/total'] = round(100 - ((memory_free * 100) / memory_total), 1)
 
 
-        try:
-            i_ref = self.image_processor.add(filename_p, exposure, exp_date, exp_elapsed, camera)
-        except BadImage as e:
-            logger.error('Bad Image: %s', str(e))
-            filename_p.unlink()
-            #task.setFailed('Bad Image: {0:s}'.format(str(filename_p)))
-            return
+            # publish disk info
+            fs_list = psutil.disk_partitions(all=False)
 
+            for fs in fs_list:
 
-        filename_p.unlink()  # original file is no longer needed
+                skip = False
+                for p in ('/snap',):
+                    if fs.mountpoint.startswith(p + '/'):
+                        skip = True
+                        break
+                    elif fs.mountpoint == p:
+                        skip = True
+                        break
 
+                if skip:
+                    continue
 
-        self.image_count += 1
 
+                try:
+                    disk_usage = psutil.disk_usage(fs.mountpoint)
+                except PermissionError as e:
+                    logger.error('PermissionError: %s', str(e))
+                    continue
 
-        if self.config.get('IMAGE_SAVE_FITS'):
-            if self.config.get('IMAGE_SAVE_FITS_PRE_DARK'):
-                logger.warning('Saving FITS without dark frame calibration')
-                self.write_fit(i_ref, camera)
+                if fs.mountpoint == '/':
+                    mqtt_data['disk/root'] = round(disk_usage.percent, 1)  # hopefully there is not a /root filesystem
+                    continue
+                else:
+                    # slash is included with filesystem name
+                    mqtt_data['disk{0:s}'.format(fs.mountpoint)] = round(disk_usage.percent, 1)
 
 
-        # use original value if not defined
-        if i_ref.libcamera_black_level:
-            libcamera_black_level = i_ref.libcamera_black_level
+            # publish temperature info
+            temp_info = psutil.sensors_temperatures()
 
+            offset = 0  # need index for shared sensor values
+            for t_key in sorted(temp_info):  # always return the keys in the same order
+                for i, t in enumerate(temp_info[t_key]):
+                    temp_c = float(t.current)
 
-        self.image_processor.calibrate(libcamera_black_level=libcamera_black_level)
+                    if self.config.get('TEMP_DISPLAY') == 'f':
+                        current_temp = (temp_c * 9.0 / 5.0) + 32
+                    elif self.config.get('TEMP_DISPLAY') == 'k':
+                        current_temp = temp_c + 273.15
+                    else:
+                        current_temp = temp_c
 
 
-        if self.config.get('IMAGE_SAVE_FITS'):
-            if not self.config.get('IMAGE_SAVE_FITS_PRE_DARK'):
-                self.write_fit(i_ref, camera)
+                    if not t.label:
+                        # use index for label name
+                        label = str(i)
+                    else:
+                        label = t.label
 
+                    topic = 'temp/{0:s}/{1:s}'.format(t_key, label)
 
-        self.image_processor.debayer()
+                    # no spaces, etc in topics
+                    topic_sub = re.sub(r'[#+\$\*\>\.\ ]', '_', topic)
 
-        self.image_processor.calculateSqm()
+                    mqtt_data[topic_sub] = round(current_temp, 1)
 
-        self.image_processor.stack()  # this populates self.image
 
+                    # update share array
+                    # temperatures always Celsius here
+                    with self.sensors_temp_av.get_lock():
+                        # index 0 is always ccd_temp
+                        self.sensors_temp_av[10 + offset] = temp_c
 
-        image_height, image_width = self.image_processor.image.shape[:2]
-        logger.info('Image: %d x %d', image_width, image_height)
+                    offset += 1
 
 
-        ### IMAGE IS CALIBRATED ###
+            # system temp sensors
+            for i, v in enumerate(self.sensors_temp_av):
+                sensor_topic = 'sensor_temp_{0:d}'.format(i)
+                mqtt_data[sensor_topic] = round(v, 1)
 
 
-        ### EXIF tags ###
-        exp_date_utc = exp_date.replace(tzinfo=timezone.utc)
+            # user sensors
+            for i, v in enumerate(self.sensors_user_av):
+                sensor_topic = 'sensor_user_{0:d}'.format(i)
+                mqtt_data[sensor_topic] = round(v, 1)
 
-        # Python 3.6, 3.7 does not support as_integer_ratio()
-        focal_length_frac = Fraction(camera.lensFocalLength).limit_denominator()
-        focal_length = (focal_length_frac.numerator, focal_length_frac.denominator)
 
-        f_number_frac = Fraction(camera.lensFocalRatio).limit_denominator()
-        f_number = (f_number_frac.numerator, f_number_frac.denominator)
+            if new_filename:
+                upload_filename = new_filename
+            else:
+                upload_filename = latest_file
 
-        exposure_time_frac = Fraction(exposure).limit_denominator(max_denominator=31250)
-        exposure_time = (exposure_time_frac.numerator, exposure_time_frac.denominator)
 
-        zeroth_ifd = {
-            piexif.ImageIFD.Model            : camera.name,
-            piexif.ImageIFD.Software         : 'indi-allsky',
-            piexif.ImageIFD.ExposureTime     : exposure_time,
-        }
-        exif_ifd = {
-            piexif.ExifIFD.DateTimeOriginal  : exp_date_utc.strftime('%Y:%m:%d %H:%M:%S'),
-            piexif.ExifIFD.LensModel         : camera.lensName,
-            piexif.ExifIFD.LensSpecification : (focal_length, focal_length, f_number, f_number),
-            piexif.ExifIFD.FocalLength       : focal_length,
-            piexif.ExifIFD.FNumber           : f_number,
-            #piexif.ExifIFD.ApertureValue  # this is not the Aperture size
-        }
+            ### upload thumbnail first
+            if image_thumbnail_entry:
+                self._miscUpload.syncapi_thumbnail(image_thumbnail_entry, image_thumbnail_metadata)  # syncapi before s3
+                self._miscUpload.s3_upload_thumbnail(image_thumbnail_entry, image_thumbnail_metadata)
 
 
-        if self.sensors_temp_av[0] > -150:
-            # Add temperature data
-            temperature_frac = Fraction(self.sensors_temp_av[0]).limit_denominator()
-            exif_ifd[piexif.ExifIFD.Temperature] = (temperature_frac.numerator, temperature_frac.denominator)
+            self._miscUpload.syncapi_image(image_entry, image_metadata)  # syncapi before s3
+            self._miscUpload.s3_upload_image(image_entry, image_metadata)
+            self._miscUpload.mqtt_publish_image(upload_filename, mq_topic_latest, mqtt_data)
+            self._miscUpload.upload_image(image_entry)
 
+            self.upload_metadata(i_ref, adu, adu_average)
 
-        jpeg_exif_dict = {
-            '0th'   : zeroth_ifd,
-            'Exif'  : exif_ifd,
-        }
 
+        stage_elapsed['output'] = time.time() - output_start
+        self.pipeline_stats.add(stage_elapsed)
 
-        if not self.config.get('IMAGE_EXIF_PRIVACY'):
-            if camera.owner:
-                zeroth_ifd[piexif.ImageIFD.Copyright] = camera.owner
+        if self.pipeline_stats.frames % self.pipeline_stats_interval == 0:
+            self.pipeline_stats.logStats()
 
 
-            long_deg, long_min, long_sec = self.decdeg2dms(camera.longitude)
-            lat_deg, lat_min, lat_sec = self.decdeg2dms(camera.latitude)
+    def accumulateKeogramStarTrail(self, camera, image_entry, image_file_p, data):
+        if not self._keogram_accumulator:
+            mask_processor = MaskProcessor(
+                self.config,
+                self.bin_v,
+            )
 
-            if long_deg < 0:
-                long_ref = 'W'
-            else:
-                long_ref = 'E'
+            self._keogram_accumulator = IndiAllSkyKeogramStarTrailAccumulator(
+                self.config,
+                self.bin_v,
+                mask=mask_processor.load_detection_mask(),
+            )
 
-            if lat_deg < 0:
-                lat_ref = 'S'
-            else:
-                lat_ref = 'N'
 
-            gps_datestamp = exp_date_utc.strftime('%Y:%m:%d')
-            gps_hour   = int(exp_date_utc.strftime('%H'))
-            gps_minute = int(exp_date_utc.strftime('%M'))
-            gps_second = int(exp_date_utc.strftime('%S'))
+        accumulate_start = time.time()
 
-            gps_ifd = {
-                piexif.GPSIFD.GPSVersionID       : (2, 2, 0, 0),
-                piexif.GPSIFD.GPSDateStamp       : gps_datestamp,
-                piexif.GPSIFD.GPSTimeStamp       : ((gps_hour, 1), (gps_minute, 1), (gps_second, 1)),
-                piexif.GPSIFD.GPSLongitudeRef    : long_ref,
-                piexif.GPSIFD.GPSLongitude       : ((int(abs(long_deg)), 1), (int(long_min), 1), (0, 1)),  # no seconds
-                piexif.GPSIFD.GPSLatitudeRef     : lat_ref,
-                piexif.GPSIFD.GPSLatitude        : ((int(abs(lat_deg)), 1), (int(lat_min), 1), (0, 1)),  # no seconds
-                #piexif.GPSIFD.GPSAltitudeRef     : 0,  # 0 = above sea level, 1 = below
-                #piexif.GPSIFD.GPSAltitude        : (0, 1),
-            }
+        self._keogram_accumulator.add(camera, image_entry, image_file_p, data)
 
-            jpeg_exif_dict['GPS'] = gps_ifd
+        logger.info('Keogram/star trail accumulated in %0.4f s', time.time() - accumulate_start)
 
 
-        jpeg_exif = piexif.dump(jpeg_exif_dict)
+    def saveKeogramStarTrailState(self):
+        if not self._keogram_accumulator:
+            return
 
+        self._keogram_accumulator.checkpoint()
 
-        # only perform this processing if libcamera is set to raw mode
-        if self.libcamera_raw:
-            # These values come from libcamera
-            if libcamera_awb_gains:
-                logger.info('Overriding Red balance: %f', libcamera_awb_gains[0])
-                logger.info('Overriding Blue balance: %f', libcamera_awb_gains[1])
-                self.config['WBR_FACTOR'] = float(libcamera_awb_gains[0])
-                self.config['WBB_FACTOR'] = float(libcamera_awb_gains[1])
 
+    def closeKeogramStarTrailPeriod(self, period):
+        if self._keogram_accumulator:
+            day_date = datetime.strptime(period['timespec'], '%Y%m%d').date()
+            self._keogram_accumulator.close(period['camera_id'], day_date, period['night'])
 
-            # Not quite working
-            if libcamera_ccm:
-                self.image_processor.apply_color_correction_matrix(libcamera_ccm)
+        self.video_q.put({'task_id' : period['task_id']})
 
 
-        if self.config.get('IMAGE_EXPORT_RAW'):
-            self.export_raw_image(i_ref, camera, jpeg_exif=jpeg_exif)
+    def upload_metadata(self, i_ref, adu, adu_average):
+        ### upload images
+        if not self.config.get('FILETRANSFER', {}).get('UPLOAD_METADATA'):
+            #logger.warning('Metadata uploading disabled')
+            return
 
+        if not self.config.get('FILETRANSFER', {}).get('UPLOAD_IMAGE'):
+            logger.warning('Metadata uploading disabled when image upload is disabled')
+            return
 
-        # Calculate ADU before stretch
-        adu = self.image_processor.calculate_8bit_adu()
-        # adu value may be updated below
 
+        self.metadata_count += 1
 
-        self.image_processor.stretch()
+        metadata_remain = self.metadata_count % int(self.config['FILETRANSFER']['UPLOAD_IMAGE'])
+        if metadata_remain != 0:
+            #next_metadata = int(self.config['FILETRANSFER']['UPLOAD_IMAGE']) - image_metadata
+            #logger.info('Next metadata upload in %d images (%d s)', next_metadata, int(self.config['EXPOSURE_PERIOD'] * next_metadata))
+            return
 
 
-        if self.config.get('CONTRAST_ENHANCE_16BIT'):
-            if not self.night_v.value and self.config['DAYTIME_CONTRAST_ENHANCE']:
-                # Contrast enhancement during the day
-                self.image_processor.contrast_clahe_16bit()
-            elif self.night_v.value and self.config['NIGHT_CONTRAST_ENHANCE']:
-                # Contrast enhancement during night
-                self.image_processor.contrast_clahe_16bit()
+        metadata = {
+            'type'                : constants.METADATA,
+            'device'              : i_ref.camera_name,
+            'night'               : self.night_v.value,
+            'temp'                : self.sensors_temp_av[0],
+            'gain'                : self.gain_v.value,
+            'exposure'            : i_ref.exposure,
+            'stable_exposure'     : int(self.target_adu_found),
+            'target_adu'          : i_ref.target_adu,
+            'current_adu_target'  : self.current_adu_target,
+            'current_adu'         : adu,
+            'adu_average'         : adu_average,
+            'sqm'                 : i_ref.sqm_value,
+            'stars'               : len(i_ref.stars),
+            'time'                : i_ref.exp_date.strftime('%s'),
+            'tz'                  : str(i_ref.exp_date.astimezone().tzinfo),
+            'utc_offset'          : i_ref.exp_date.astimezone().utcoffset().total_seconds(),
+            'sqm_data'            : self.getSqmData(i_ref.camera_id),
+            'stars_data'          : self.getStarsData(i_ref.camera_id),
+            'latitude'            : self.position_av[0],
+            'longitude'           : self.position_av[1],
+            'elevation'           : int(self.position_av[2]),
+            'sidereal_time'       : self.astrometric_data['sidereal_time'],
+            'kpindex'             : i_ref.kpindex,
+            'ovation_max'         : i_ref.ovation_max,
+            'smoke_rating'        : constants.SMOKE_RATING_MAP_STR[i_ref.smoke_rating],
+            'aircraft'            : len(self.adsb_aircraft_list),
+        }
 
 
-        self.image_processor.convert_16bit_to_8bit()
+        # system temp sensors
+        for i, v in enumerate(self.sensors_temp_av):
+            sensor_topic = 'sensor_temp_{0:d}'.format(i)
+            metadata[sensor_topic] = v
 
 
-        #with io.open('/tmp/indi_allsky_numpy.npy', 'w+b') as f_numpy:
-        #    numpy.save(f_numpy, self.image_processor.image)
-        #logger.info('Wrote Numpy data: /tmp/indi_allsky_numpy.npy')
+        # user sensors
+        for i, v in enumerate(self.sensors_user_av):
+            sensor_topic = 'sensor_user_{0:d}'.format(i)
+            metadata[sensor_topic] = v
 
 
-        # adu calculate (before processing)
-        adu, adu_average = self.calculate_exposure(adu, exposure)
+        f_tmp_metadata = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json')
 
+        json.dump(metadata, f_tmp_metadata, indent=4)
 
-        # generate a new mask base once the target ADU is found
-        # this should only only fire once per restart
-        if self.generate_mask_base and self.target_adu_found:
-            self.generate_mask_base = False
-            self.write_mask_base_img(self.image_processor.image)
+        f_tmp_metadata.flush()
+        f_tmp_metadata.close()
 
+        tmp_metadata_name_p = Path(f_tmp_metadata.name)
+        tmp_metadata_name_p.chmod(0o644)
 
-        # line detection
-        if self.night_v.value and self.config.get('DETECT_METEORS'):
-            self.image_processor.detectLines()
 
+        file_data_dict = {
+            'timestamp'    : i_ref.exp_date,
+            'ts'           : i_ref.exp_date,  # shortcut
+            'camera_uuid'  : i_ref.camera_uuid,
+            'camera_id'    : i_ref.camera_id,
+        }
 
-        # star detection
-        if self.night_v.value and self.config.get('DETECT_STARS', True):
-            self.image_processor.detectStars()
 
+        if self.night_v.value:
+            file_data_dict['timeofday'] = 'night'
+            file_data_dict['tod'] = 'night'
+        else:
+            file_data_dict['timeofday'] = 'day'
+            file_data_dict['tod'] = 'day'
 
-        # additional draw code
-        if self.config.get('DETECT_DRAW'):
-            self.image_processor.drawDetections()
 
+        # Replace parameters in names
+        remote_dir = self.config['FILETRANSFER']['REMOTE_METADATA_FOLDER'].format(**file_data_dict)
+        remote_file = self.config['FILETRANSFER']['REMOTE_METADATA_NAME'].format(**file_data_dict)
 
-        # rotation
-        self.image_processor.rotate_90()
-        self.image_processor.rotate_angle()
+        remote_file_p = Path(remote_dir).joinpath(remote_file)
 
+        # tell worker to upload file
+        jobdata = {
+            'action'       : constants.TRANSFER_UPLOAD,
+            'local_file'   : str(tmp_metadata_name_p),
+            'remote_file'  : str(remote_file_p),
+            'remove_local' : True,
+        }
 
-        # verticle flip
-        self.image_processor.flip_v()
+        upload_task = IndiAllSkyDbTaskQueueTable(
+            queue=TaskQueueQueue.UPLOAD,
+            state=TaskQueueState.QUEUED,
+            data=jobdata,
+        )
+        db.session.add(upload_task)
+        db.session.commit()
 
-        # horizontal flip
-        self.image_processor.flip_h()
+        self.upload_q.put({'task_id' : upload_task.id})
 
 
-        # crop
-        if self.config.get('IMAGE_CROP_ROI'):
-            self.image_processor.crop_image()
+    def getSqmData(self, camera_id):
+        now_minus_minutes = datetime.now() - timedelta(minutes=self.sqm_history_minutes)
 
+        sqm_images = IndiAllSkyDbImageTable.query\
+            .add_columns(
+                func.max(IndiAllSkyDbImageTable.sqm).label('image_max_sqm'),
+                func.min(IndiAllSkyDbImageTable.sqm).label('image_min_sqm'),
+                func.avg(IndiAllSkyDbImageTable.sqm).label('image_avg_sqm'),
+            )\
+            .join(IndiAllSkyDbCameraTable)\
+            .filter(IndiAllSkyDbCameraTable.id == camera_id)\
+            .filter(IndiAllSkyDbImageTable.createDate > now_minus_minutes)\
+            .first()
 
-        # green removal
-        self.image_processor.scnr()
 
+        sqm_data = {
+            'max' : sqm_images.image_max_sqm,
+            'min' : sqm_images.image_min_sqm,
+            'avg' : sqm_images.image_avg_sqm,
+        }
 
-        # white balance
-        self.image_processor.white_balance_manual_bgr()
-        self.image_processor.white_balance_auto_bgr()
+        return sqm_data
 
 
-        # saturation
-        if self.night_v.value and self.config.get('SATURATION_FACTOR', 1.0) != 1.0:
-            self.image_processor.saturation_adjust()
-        elif not self.night_v.value and self.config.get('SATURATION_FACTOR_DAY', 1.0) != 1.0:
-            self.image_processor.saturation_adjust()
+    def getStarsData(self, camera_id):
+        now_minus_minutes = datetime.now() - timedelta(minutes=self.stars_history_minutes)
 
+        stars_images = IndiAllSkyDbImageTable.query\
+            .add_columns(
+                func.max(IndiAllSkyDbImageTable.stars).label('image_max_stars'),
+                func.min(IndiAllSkyDbImageTable.stars).label('image_min_stars'),
+                func.avg(IndiAllSkyDbImageTable.stars).label('image_avg_stars'),
+            )\
+            .join(IndiAllSkyDbCameraTable)\
+            .filter(IndiAllSkyDbCameraTable.id == camera_id)\
+            .filter(IndiAllSkyDbImageTable.createDate > now_minus_minutes)\
+            .first()
 
-        if not self.config.get('CONTRAST_ENHANCE_16BIT'):
-            if not self.night_v.value and self.config['DAYTIME_CONTRAST_ENHANCE']:
-                # Contrast enhancement during the day
-                self.image_processor.contrast_clahe()
-            elif self.night_v.value and self.config['NIGHT_CONTRAST_ENHANCE']:
-                # Contrast enhancement during night
-                self.image_processor.contrast_clahe()
 
+        stars_data = {
+            'max' : stars_images.image_max_stars,
+            'min' : stars_images.image_min_stars,
+            'avg' : stars_images.image_avg_stars,
+        }
 
-        self.image_processor.colorize()
+        return stars_data
 
 
-        longterm_keogram_pixels = self.save_longterm_keogram_data(exp_date, camera_id)
+    def write_img(self, data, i_ref, camera, jpeg_exif=None):
+        f_tmpfile = tempfile.NamedTemporaryFile(mode='w+b', delete=False, suffix='.{0}'.format(self.config['IMAGE_FILE_TYPE']))
+        f_tmpfile.close()
 
+        tmpfile_name = Path(f_tmpfile.name)
 
-        self.image_processor.apply_image_circle_mask()
 
+        write_img_start = time.time()
 
-        if self.config.get('FISH2PANO', {}).get('ENABLE'):
-            if not self.image_count % self.config.get('FISH2PANO', {}).get('MODULUS', 2):
-                pano_data = self.image_processor.fish2pano()
+        # write to temporary file
+        if self.config['IMAGE_FILE_TYPE'] in ('jpg', 'jpeg'):
+            img_rgb = Image.fromarray(cv2.cvtColor(data, cv2.COLOR_BGR2RGB))
+            img_rgb.save(str(tmpfile_name), quality=self.config['IMAGE_FILE_COMPRESSION']['jpg'], exif=jpeg_exif)
+        elif self.config['IMAGE_FILE_TYPE'] in ('png',):
+            # exif does not appear to work with png
+            #img_rgb = Image.fromarray(cv2.cvtColor(data, cv2.COLOR_BGR2RGB))
+            #img_rgb.save(str(tmpfile_name), compress_level=self.config['IMAGE_FILE_COMPRESSION']['png'])
 
+            # opencv is faster than Pillow with PNG
+            cv2.imwrite(str(tmpfile_name), data, [cv2.IMWRITE_PNG_COMPRESSION, self.config['IMAGE_FILE_COMPRESSION']['png']])
+        elif self.config['IMAGE_FILE_TYPE'] in ('webp',):
+            img_rgb = Image.fromarray(cv2.cvtColor(data, cv2.COLOR_BGR2RGB))
+            img_rgb.save(str(tmpfile_name), quality=90, lossless=False, exif=jpeg_exif)
+        elif self.config['IMAGE_FILE_TYPE'] in ('tif', 'tiff'):
+            # exif does not appear to work with tiff
+            img_rgb = Image.fromarray(cv2.cvtColor(data, cv2.COLOR_BGR2RGB))
+            img_rgb.save(str(tmpfile_name), compression='tiff_lzw')
+        else:
+            tmpfile_name.unlink()
+            raise Exception('Unknown file type: %s', self.config['IMAGE_FILE_TYPE'])
 
-                if self.config.get('FISH2PANO', {}).get('ENABLE_CARDINAL_DIRS'):
-                    pano_data = self.image_processor.fish2pano_cardinal_dirs_label(pano_data)
+        write_img_elapsed_s = time.time() - write_img_start
+        logger.info('Image compressed in %0.4f s', write_img_elapsed_s)
 
 
-                self.write_panorama_img(pano_data, i_ref, camera, jpeg_exif=jpeg_exif)
+        ### Always write the latest file for web access
+        latest_file = self.image_dir.joinpath('latest.{0:s}'.format(self.config['IMAGE_FILE_TYPE']))
 
+        try:
+            latest_file.unlink()
+        except FileNotFoundError:
+            pass
 
-        self.image_processor.apply_logo_overlay()
 
+        shutil.copy2(str(tmpfile_name), str(latest_file))
+        latest_file.chmod(0o644)
 
-        self.image_processor.scale_image()
 
+        ### disable timelapse images in focus mode
+        if self.config.get('FOCUS_MODE', False):
+            logger.warning('Focus mode enabled, not saving timelapse image')
+            tmpfile_name.unlink()
+            return None, None
 
-        self.image_processor.add_border()
 
-        self.image_processor.moon_overlay()
+        ### Do not write daytime image files if daytime capture is disabled
+        if not self.night_v.value and self.config['DAYTIME_CAPTURE'] and not self.config.get('DAYTIME_CAPTURE_SAVE', True):
+            logger.info('Daytime capture is disabled')
+            tmpfile_name.unlink()
+            return latest_file, None
 
-        self.image_processor.lightgraph_overlay()
 
-        self.image_processor.orb_image()
+        ### Write the timelapse file
+        folder = self._getImageFolder(i_ref.exp_date, i_ref.day_date, camera, 'exposures')
 
-        self.image_processor.cardinal_dirs_label()
+        date_str = i_ref.exp_date.strftime('%Y%m%d_%H%M%S')
+        filename = folder.joinpath(self.filename_t.format(i_ref.camera_id, date_str, self.config['IMAGE_FILE_TYPE']))
 
+        #logger.info('Image filename: %s', filename)
 
-        # get ADS-B data
-        if self.adsb_worker:
-            try:
-                self.adsb_aircraft_list = self.adsb_aircraft_q.get(timeout=5.0)
-            except queue.Empty:
-                self.adsb_aircraft_list = []
+        if filename.exists():
+            logger.error('File exists: %s (skipping)', filename)
+            tmpfile_name.unlink()
+            return latest_file, None
 
-            self.adsb_aircraft_q.close()
-            self.adsb_aircraft_q = None
 
-            self.adsb_worker.join()
-            self.adsb_worker = None
+        shutil.copy2(str(tmpfile_name), str(filename))
+        filename.chmod(0o644)
 
+        tmpfile_name.unlink()
 
-        self.image_processor.label_image(adsb_aircraft_list=self.adsb_aircraft_list)
 
+        # set mtime to original exposure time
+        #os.utime(str(filename), (i_ref.exp_date.timestamp(), i_ref.exp_date.timestamp()))
 
-        processing_elapsed_s = time.time() - processing_start
-        logger.info('Image processed in %0.4f s', processing_elapsed_s)
+        #logger.info('Finished writing files')
 
+        return latest_file, filename
 
-        # need this after resizing and scaling
-        final_height, final_width = self.image_processor.image.shape[:2]
 
+    def write_status_json(self, i_ref, adu, adu_average):
+        status = {
+            'name'                : 'indi_json',
+            'class'               : 'ccd',
+            'device'              : i_ref.camera_name,
+            'night'               : self.night_v.value,
+            'temp'                : self.sensors_temp_av[0],
+            'gain'                : self.gain_v.value,
+            'exposure'            : i_ref.exposure,
+            'stable_exposure'     : int(self.target_adu_found),
+            'target_adu'          : i_ref.target_adu,
+            'current_adu_target'  : self.current_adu_target,
+            'current_adu'         : adu,
+            'adu_average'         : adu_average,
+            'sqm'                 : i_ref.sqm_value,
+            'stars'               : len(i_ref.stars),
+            'time'                : i_ref.exp_date.strftime('%s'),
+            'latitude'            : self.position_av[0],
+            'longitude'           : self.position_av[1],
+            'elevation'           : int(self.position_av[2]),
+            'kpindex'             : i_ref.kpindex,
+            'ovation_max'         : int(i_ref.ovation_max),
+            'smoke_rating'        : constants.SMOKE_RATING_MAP_STR[i_ref.smoke_rating],
+            'aircraft'            : len(self.adsb_aircraft_list),
+            'pipeline'            : self.pipeline_stats.getStats(),
+        }
 
-        #task.setSuccess('Image processed')
 
-        self.write_status_json(i_ref, adu, adu_average)  # write json status file
+        # system temp sensors
+        for i, v in enumerate(self.sensors_temp_av):
+            sensor_topic = 'sensor_temp_{0:d}'.format(i)
+            status[sensor_topic] = v
 
-        latest_file, new_filename = self.write_img(self.image_processor.image, i_ref, camera, jpeg_exif=jpeg_exif)
 
-        if new_filename:
-            image_metadata = {
-                'type'            : constants.IMAGE,
-                'createDate'      : int(exp_date.timestamp()),
-                'dayDate'         : i_ref.day_date.strftime('%Y%m%d'),
-                'utc_offset'      : exp_date.astimezone().utcoffset().total_seconds(),
-                'exposure'        : exposure,
-                'exp_elapsed'     : exp_elapsed,
-                'gain'            : self.gain_v.value,
-                'binmode'         : self.bin_v.value,
-                'temp'            : self.sensors_temp_av[0],
-                'adu'             : adu,
-                'stable'          : self.target_adu_found,
-                'moonmode'        : bool(self.moonmode_v.value),
-                'moonphase'       : self.astrometric_data['moon_phase'],
-                'night'           : bool(self.night_v.value),
-                'adu_roi'         : self.config['ADU_ROI'],
-                'calibrated'      : i_ref.calibrated,
-                'sqm'             : i_ref.sqm_value,
-                'stars'           : len(i_ref.stars),
-                'detections'      : len(i_ref.lines),
-                'process_elapsed' : processing_elapsed_s,
-                'kpindex'         : i_ref.kpindex,
-                'ovation_max'     : i_ref.ovation_max,
-                'smoke_rating'    : i_ref.smoke_rating,
-                'height'          : final_height,
-                'width'           : final_width,
-                'keogram_pixels'  : longterm_keogram_pixels,
-                'camera_uuid'     : i_ref.camera_uuid,
-            }
+        # user sensors
+        for i, v in enumerate(self.sensors_user_av):
+            sensor_topic = 'sensor_user_{0:d}'.format(i)
+            status[sensor_topic] = v
 
 
+        indi_allsky_status_p = Path('/var/lib/indi-allsky/indi_allsky_status.json')
 
-            image_add_data = dict()
-            for i, v in enumerate(self.sensors_temp_av):
-                image_add_data['sensor_temp_{0:d}'.format(i)] = v
+        with io.open(str(indi_allsky_status_p), 'w') as f_indi_status:
+            json.dump(status, f_indi_status, indent=4)
+            f_indi_status.flush()
+            f_indi_status.close()
 
-            for i, v in enumerate(self.sensors_user_av):
-                image_add_data['sensor_user_{0:d}'.format(i)] = v
+        indi_allsky_status_p.chmod(0o644)
 
-            if self.adsb_aircraft_list:
-                image_add_data['aircraft'] = list()
 
-                for aircraft in self.adsb_aircraft_list:
-                    image_add_data['aircraft'].append(aircraft)
+    def _getImageFolder(self, exp_date, day_date, camera, type_folder):
+        if self.night_v.value:
+            # images should be written to previous day's folder until noon
+            timeofday_str = 'night'
+        else:
+            # images should be written to current day's folder
+            timeofday_str = 'day'
 
 
-            image_metadata['data'] = image_add_data
+        day_folder = self.image_dir.joinpath(
+            'ccd_{0:s}'.format(camera.uuid),
+            type_folder,
+            '{0:s}'.format(day_date.strftime('%Y%m%d')),
+            timeofday_str,
+        )
 
+        if not day_folder.exists():
+            day_folder.mkdir(mode=0o755, parents=True)
 
-            image_entry = self._miscDb.addImage(
-                new_filename.relative_to(self.image_dir),
-                camera_id,
-                image_metadata,
-            )
+        hour_str = exp_date.strftime('%d_%H')
 
+        hour_folder = day_folder.joinpath('{0:s}'.format(hour_str))
+        if not hour_folder.exists():
+            hour_folder.mkdir(mode=0o755)
 
-            image_thumbnail_metadata = {
-                'type'       : constants.THUMBNAIL,
-                'origin'     : constants.IMAGE,
-                'createDate' : int(exp_date.timestamp()),
-                'dayDate'    : i_ref.day_date.strftime('%Y%m%d'),
-                'utc_offset' : exp_date.astimezone().utcoffset().total_seconds(),
-                'night'      : bool(self.night_v.value),
-                'camera_uuid': camera.uuid,
-            }
+        return hour_folder
 
-            image_thumbnail_entry = self._miscDb.addThumbnailImageAuto(
-                image_entry,
-                image_metadata,
-                camera.id,
-                image_thumbnail_metadata,
-                numpy_data=self.image_processor.image,
-            )
+
+
+class ImageWorker(ImageWorkerBase):
+
+    def __init__(
+        self,
+        idx,
+        config,
+        error_q,
+        image_q,
+        upload_q,
+        position_av,
+        exposure_av,
+        gain_v,
+        bin_v,
+        sensors_temp_av,
+        sensors_user_av,
+        night_v,
+        moonmode_v,
+        frame_buffer=None,
+        output_q=None,
+        video_q=None,
+    ):
+        super(ImageWorker, self).__init__(
+            config,
+            error_q,
+            upload_q,
+            position_av,
+            gain_v,
+            bin_v,
+            sensors_temp_av,
+            sensors_user_av,
+            night_v,
+            moonmode_v,
+            video_q=video_q,
+        )
+
+        self.name = 'Image-{0:d}'.format(idx)
+
+        self.image_q = image_q
+
+        self.exposure_av = exposure_av  # current, min night, min day, max
+
+        self.frame_buffer = frame_buffer
+
+        # final images are passed to the output worker if defined
+        self.output_q = output_q
+
+        self.adsb_worker = None
+        self.adsb_worker_idx = 0
+        self.adsb_aircraft_q = None
+
+        self.generate_mask_base = True
+
+        self.hist_adu = []
+
+        self.sqm_value = 0
+
+        self.image_count = 0
+
+        self.image_processor = ImageProcessor(
+            self.config,
+            self.position_av,
+            self.gain_v,
+            self.bin_v,
+            self.sensors_temp_av,
+            self.sensors_user_av,
+            self.night_v,
+            self.moonmode_v,
+            self.astrometric_data,
+        )
+
+
+        self._libcamera_raw = False
+
+
+    @property
+    def libcamera_raw(self):
+        return self._libcamera_raw
+
+    @libcamera_raw.setter
+    def libcamera_raw(self, new_libcamera_raw):
+        self._libcamera_raw = bool(new_libcamera_raw)
+
+
+
+    def saferun(self):
+        #raise Exception('Test exception handling in worker')
+
+        while True:
+            try:
+                i_dict = self.image_q.get(timeout=23)  # prime number
+            except queue.Empty:
+                continue
+
+
+            if i_dict.get('stop'):
+                self.saveKeogramStarTrailState()
+                logger.warning('Goodbye')
+                return
+
+            if self._shutdown:
+                self.saveKeogramStarTrailState()
+                logger.warning('Goodbye')
+                return
+
+
+            if i_dict.get('end_of_period'):
+                if self.output_q:
+                    # images are stored by the output worker
+                    self.output_q.put(i_dict)
+                else:
+                    self.closeKeogramStarTrailPeriod(i_dict['end_of_period'])
+
+                continue
+
+
+            # new context for every task, reduces the effects of caching
+            with app.app_context():
+                self.processImage(i_dict)
+
+
+    def _getSharedFrame(self, frame_metadata):
+        from astropy.io import fits
+
+        data, header_str = self.frame_buffer.get(frame_metadata)
+
+        if isinstance(data, type(None)):
+            return None
+
+
+        # create a new fits container
+        hdu = fits.PrimaryHDU(data)
+        hdulist = fits.HDUList([hdu])
+
+        hdu.update_header()  # populates BITPIX, NAXIS, etc
+
+        # repopulate headers
+        if header_str:
+            hdulist[0].header.extend(fits.Header.fromstring(header_str))
+
+        return hdulist
+
+
+    def processImage(self, i_dict):
+        ### Not using DB task queue for image processing to reduce database I/O
+        #task_id = i_dict['task_id']
+
+        #try:
+        #    task = IndiAllSkyDbTaskQueueTable.query\
+        #        .filter(IndiAllSkyDbTaskQueueTable.id == task_id)\
+        #        .filter(IndiAllSkyDbTaskQueueTable.state == TaskQueueState.QUEUED)\
+        #        .filter(IndiAllSkyDbTaskQueueTable.queue == TaskQueueQueue.IMAGE)\
+        #        .one()
+
+        #except NoResultFound:
+        #    logger.error('Task ID %d not found', task_id)
+        #    continue
+
+
+        #task.setRunning()
+
+
+        #filename = Path(task.data['filename'])
+        #exposure = task.data['exposure']
+        #exp_date = datetime.fromtimestamp(task.data['exp_time'])
+        #exp_elapsed = task.data['exp_elapsed']
+        #camera_id = task.data['camera_id']
+        #filename_t = task.data.get('filename_t')
+        ###
+
+        frame_metadata = i_dict.get('frame')
+        if frame_metadata:
+            # frame passed in shared memory, release the slot as soon as possible
+            filename_p = None
+            hdulist = self._getSharedFrame(frame_metadata)
+
+            if isinstance(hdulist, type(None)):
+                logger.error('Frame lost from shared memory')
+                return
         else:
-            # images not being saved
-            image_entry = None
-            image_metadata = {}
-            image_thumbnail_entry = None
-            image_thumbnail_metadata = {}
+            filename_p = Path(i_dict['filename'])
+            hdulist = None
 
+        exposure = i_dict['exposure']
+        exp_date = datetime.fromtimestamp(i_dict['exp_time'])
+        exp_elapsed = i_dict['exp_elapsed']
+        camera_id = i_dict['camera_id']
+        filename_t = i_dict.get('filename_t')
 
-        if latest_file:
-            # build mqtt data
-            mq_topic_latest = 'latest'
 
-            mqtt_data = {
-                'exp_date' : exp_date.strftime('%Y-%m-%d %H:%M:%S'),
-                'exposure' : round(exposure, 6),
-                'gain'     : self.gain_v.value,
-                'bin'      : self.bin_v.value,
-                'temp'     : round(self.sensors_temp_av[0], 1),
-                'sunalt'   : round(self.astrometric_data['sun_alt'], 1),
-                'moonalt'  : round(self.astrometric_data['moon_alt'], 1),
-                'moonphase': round(self.astrometric_data['moon_phase'], 1),
-                'mooncycle': round(self.astrometric_data['moon_cycle'], 1),
-                'moonmode' : bool(self.moonmode_v.value),
-                'night'    : bool(self.night_v.value),
-                'sqm'      : round(i_ref.sqm_value, 1),
-                'stars'    : len(i_ref.stars),
-                'latitude' : round(self.position_av[0], 3),
-                'longitude': round(self.position_av[1], 3),
-                'elevation': int(self.position_av[2]),
-                'kpindex'  : round(i_ref.kpindex, 2),
-                'ovation_max'  : int(i_ref.ovation_max),
-                'smoke_rating' : constants.SMOKE_RATING_MAP_STR[i_ref.smoke_rating],
-                'aircraft' : len(self.adsb_aircraft_list),
-                'sidereal_time': self.astrometric_data['sidereal_time'],
-            }
+        # libcamera
+        libcamera_black_level = i_dict.get('libcamera_black_level', 0)
+        libcamera_awb_gains = i_dict.get('libcamera_awb_gains')
+        libcamera_ccm = i_dict.get('libcamera_ccm')
+
+
+        if self.config['CAMERA_INTERFACE'].startswith('libcamera'):
+            if filename_p and filename_p.suffix == '.dng':
+                self.libcamera_raw = True
+                self.image_processor.libcamera_raw = True
+            else:
+                self.libcamera_raw = False
+                self.image_processor.libcamera_raw = False
+
+
+        if filename_t:
+            self.filename_t = filename_t
+
+
+        if filename_p:
+            if not filename_p.exists():
+                logger.error('Frame not found: %s', filename_p)
+                #task.setFailed('Frame not found: {0:s}'.format(str(filename_p)))
+                return
+
+
+            if filename_p.stat().st_size == 0:
+                logger.error('Frame is empty: %s', filename_p)
+                filename_p.unlink()
+                return
+
+
+        camera = IndiAllSkyDbCameraTable.query\
+            .filter(IndiAllSkyDbCameraTable.id == camera_id)\
+            .one()
+
+
+        processing_start = time.time()
+
+
+        ### simulate performance degradation
+        #time.sleep(30)
+
+
+        ### start fetching ADSB info
+        if self.config.get('ADSB', {}).get('ENABLE'):
+            self.adsb_aircraft_q = Queue()
+            self.adsb_worker_idx += 1
+            self.adsb_worker = AdsbAircraftHttpWorker(
+                self.adsb_worker_idx,
+                self.config,
+                self.adsb_aircraft_q,
+                self.position_av[0],  # lat
+                self.position_av[1],  # long
+                self.position_av[2],  # elev
+            )
+            self.adsb_worker.start()
+
+
+        self.image_processor.get_astrometric_data(camera.id)
+
+
+        try:
+            i_ref = self.image_processor.add(filename_p, exposure, exp_date, exp_elapsed, camera, hdulist=hdulist)
+        except BadImage as e:
+            logger.error('Bad Image: %s', str(e))
+
+            if filename_p:
+                filename_p.unlink()
+
+            #task.setFailed('Bad Image: {0:s}'.format(str(filename_p)))
+            return
+
+
+        if filename_p:
+            filename_p.unlink()  # original file is no longer needed
+
+
+        self.image_count += 1
+
+
+        if self.config.get('IMAGE_SAVE_FITS'):
+            if self.config.get('IMAGE_SAVE_FITS_PRE_DARK'):
+                logger.warning('Saving FITS without dark frame calibration')
+                self.write_fit(i_ref, camera)
+
+
+        # use original value if not defined
+        if i_ref.libcamera_black_level:
+            libcamera_black_level = i_ref.libcamera_black_level
+
+
+        self.image_processor.calibrate(libcamera_black_level=libcamera_black_level)
+
+
+        if self.config.get('IMAGE_SAVE_FITS'):
+            if not self.config.get('IMAGE_SAVE_FITS_PRE_DARK'):
+                self.write_fit(i_ref, camera)
+
+
+        self.image_processor.debayer()
+
+        self.image_processor.calculateSqm()
+
+        self.image_processor.stack()  # this populates self.image
+
+        decode_elapsed_s = time.time() - processing_start
+        enhance_start = time.time()
+
+
+        image_height, image_width = self.image_processor.image.shape[:2]
+        logger.info('Image: %d x %d', image_width, image_height)
+
+
+        ### IMAGE IS CALIBRATED ###
+
+
+        ### EXIF tags ###
+        exp_date_utc = exp_date.replace(tzinfo=timezone.utc)
+
+        # Python 3.6, 3.7 does not support as_integer_ratio()
+        focal_length_frac = Fraction(camera.lensFocalLength).limit_denominator()
+        focal_length = (focal_length_frac.numerator, focal_length_frac.denominator)
+
+        f_number_frac = Fraction(camera.lensFocalRatio).limit_denominator()
+        f_number = (f_number_frac.numerator, f_number_frac.denominator)
+
+        exposure_time_frac = Fraction(exposure).limit_denominator(max_denominator=31250)
+        exposure_time = (exposure_time_frac.numerator, exposure_time_frac.denominator)
+
+        zeroth_ifd = {
+            piexif.ImageIFD.Model            : camera.name,
+            piexif.ImageIFD.Software         : 'indi-allsky',
+            piexif.ImageIFD.ExposureTime     : exposure_time,
+        }
+        exif_ifd = {
+            piexif.ExifIFD.DateTimeOriginal  : exp_date_utc.strftime('%Y:%m:%d %H:%M:%S'),
+            piexif.ExifIFD.LensModel         : camera.lensName,
+            piexif.ExifIFD.LensSpecification : (focal_length, focal_length, f_number, f_number),
+            piexif.ExifIFD.FocalLength       : focal_length,
+            piexif.ExifIFD.FNumber           : f_number,
+            #piexif.ExifIFD.ApertureValue  # this is not the Aperture size
+        }
+
+
+        if self.sensors_temp_av[0] > -150:
+            # Add temperature data
+            temperature_frac = Fraction(self.sensors_temp_av[0]).limit_denominator()
+            exif_ifd[piexif.ExifIFD.Temperature] = (temperature_frac.numerator, temperature_frac.denominator)
+
+
+        jpeg_exif_dict = {
+            '0th'   : zeroth_ifd,
+            'Exif'  : exif_ifd,
+        }
+
+
+        if not self.config.get('IMAGE_EXIF_PRIVACY'):
+            if camera.owner:
+                zeroth_ifd[piexif.ImageIFD.Copyright] = camera.owner
+
+
+            long_deg, long_min, long_sec = self.decdeg2dms(camera.longitude)
+            lat_deg, lat_min, lat_sec = self.decdeg2dms(camera.latitude)
 
+            if long_deg < 0:
+                long_ref = 'W'
+            else:
+                long_ref = 'E'
 
-            # publish cpu info
-            cpu_info = psutil.cpu_times_percent()
-            mqtt_data['cpu/user'] = round(cpu_info.user, 1)
-            mqtt_data['cpu/system'] = round(cpu_info.system, 1)
-            mqtt_data['cpu/nice'] = round(cpu_info.nice, 1)
-            mqtt_data['cpu/iowait'] = round(cpu_info.iowait, 1)  # io wait is not true cpu usage, not including in total
-            mqtt_data['cpu/total'] = round(cpu_info.user + cpu_info.system + cpu_info.nice, 1)
+            if lat_deg < 0:
+                lat_ref = 'S'
+            else:
+                lat_ref = 'N'
 
+            gps_datestamp = exp_date_utc.strftime('%Y:%m:%d')
+            gps_hour   = int(exp_date_utc.strftime('%H'))
+            gps_minute = int(exp_date_utc.strftime('%M'))
+            gps_second = int(exp_date_utc.strftime('%S'))
 
-            # publish memory info
-            memory_info = psutil.virtual_memory()
-            memory_total = memory_info.total
-            memory_free = memory_info.free
+            gps_ifd = {
+                piexif.GPSIFD.GPSVersionID       : (2, 2, 0, 0),
+                piexif.GPSIFD.GPSDateStamp       : gps_datestamp,
+                piexif.GPSIFD.GPSTimeStamp       : ((gps_hour, 1), (gps_minute, 1), (gps_second, 1)),
+                piexif.GPSIFD.GPSLongitudeRef    : long_ref,
+                piexif.GPSIFD.GPSLongitude       : ((int(abs(long_deg)), 1), (int(long_min), 1), (0, 1)),  # no seconds
+                piexif.GPSIFD.GPSLatitudeRef     : lat_ref,
+                piexif.GPSIFD.GPSLatitude        : ((int(abs(lat_deg)), 1), (int(lat_min), 1), (0, 1)),  # no seconds
+                #piexif.GPSIFD.GPSAltitudeRef     : 0,  # 0 = above sea level, 1 = below
+                #piexif.GPSIFD.GPSAltitude        : (0, 1),
+            }
 
-            mqtt_data['memory/user'] = round((memory_info.used / memory_total) * 100.0, 1)
-            mqtt_data['memory/cached'] = round((memory_info.cached / memory_total) * 100.0, 1)
-            mqtt_data['memory/total'] = round(100 - ((memory_free * 100) / memory_total), 1)
+            jpeg_exif_dict['GPS'] = gps_ifd
 
 
-            # publish disk info
-            fs_list = psutil.disk_partitions(all=False)
+        jpeg_exif = piexif.dump(jpeg_exif_dict)
 
-            for fs in fs_list:
 
-                skip = False
-                for p in ('/snap',):
-                    if fs.mountpoint.startswith(p + '/'):
-                        skip = True
-                        break
-                    elif fs.mountpoint == p:
-                        skip = True
-                        break
+        # only perform this processing if libcamera is set to raw mode
+        if self.libcamera_raw:
+            # These values come from libcamera
+            if libcamera_awb_gains:
+                logger.info('Overriding Red balance: %f', libcamera_awb_gains[0])
+                logger.info('Overriding Blue balance: %f', libcamera_awb_gains[1])
+                self.config['WBR_FACTOR'] = float(libcamera_awb_gains[0])
+                self.config['WBB_FACTOR'] = float(libcamera_awb_gains[1])
 
-                if skip:
-                    continue
 
+            # Not quite working
+            if libcamera_ccm:
+                self.image_processor.apply_color_correction_matrix(libcamera_ccm)
 
-                try:
-                    disk_usage = psutil.disk_usage(fs.mountpoint)
-                except PermissionError as e:
-                    logger.error('PermissionError: %s', str(e))
-                    continue
 
-                if fs.mountpoint == '/':
-                    mqtt_data['disk/root'] = round(disk_usage.percent, 1)  # hopefully there is not a /root filesystem
-                    continue
-                else:
-                    # slash is included with filesystem name
-                    mqtt_data['disk{0:s}'.format(fs.mountpoint)] = round(disk_usage.percent, 1)
+        if self.config.get('IMAGE_EXPORT_RAW'):
+            self.export_raw_image(i_ref, camera, jpeg_exif=jpeg_exif)
 
 
-            # publish temperature info
-            temp_info = psutil.sensors_temperatures()
+        # Calculate ADU before stretch
+        adu = self.image_processor.calculate_8bit_adu()
+        # adu value may be updated below
 
-            offset = 0  # need index for shared sensor values
-            for t_key in sorted(temp_info):  # always return the keys in the same order
-                for i, t in enumerate(temp_info[t_key]):
-                    temp_c = float(t.current)
 
-                    if self.config.get('TEMP_DISPLAY') == 'f':
-                        current_temp = (temp_c * 9.0 / 5.0) + 32
-                    elif self.config.get('TEMP_DISPLAY') == 'k':
-                        current_temp = temp_c + 273.15
-                    else:
-                        current_temp = temp_c
+        self.image_processor.stretch()
 
 
-                    if not t.label:
-                        # use index for label name
-                        label = str(i)
-                    else:
-                        label = t.label
+        if self.config.get('CONTRAST_ENHANCE_16BIT'):
+            if not self.night_v.value and self.config['DAYTIME_CONTRAST_ENHANCE']:
+                # Contrast enhancement during the day
+                self.image_processor.contrast_clahe_16bit()
+            elif self.night_v.value and self.config['NIGHT_CONTRAST_ENHANCE']:
+                # Contrast enhancement during night
+                self.image_processor.contrast_clahe_16bit()
 
-                    topic = 'temp/{0:s}/{1:s}'.format(t_key, label)
 
-                    # no spaces, etc in topics
-                    topic_sub = re.sub(r'[#+\$\*\>\.\ ]', '_', topic)
+        self.image_processor.convert_16bit_to_8bit()
 
-                    mqtt_data[topic_sub] = round(current_temp, 1)
 
+        #with io.open('/tmp/indi_allsky_numpy.npy', 'w+b') as f_numpy:
+        #    numpy.save(f_numpy, self.image_processor.image)
+        #logger.info('Wrote Numpy data: /tmp/indi_allsky_numpy.npy')
 
-                    # update share array
-                    # temperatures always Celsius here
-                    with self.sensors_temp_av.get_lock():
-                        # index 0 is always ccd_temp
-                        self.sensors_temp_av[10 + offset] = temp_c
 
-                    offset += 1
+        # adu calculate (before processing)
+        adu, adu_average = self.calculate_exposure(adu, exposure)
 
 
-            # system temp sensors
-            for i, v in enumerate(self.sensors_temp_av):
-                sensor_topic = 'sensor_temp_{0:d}'.format(i)
-                mqtt_data[sensor_topic] = round(v, 1)
+        # generate a new mask base once the target ADU is found
+        # this should only only fire once per restart
+        if self.generate_mask_base and self.target_adu_found:
+            self.generate_mask_base = False
+            self.write_mask_base_img(self.image_processor.image)
 
 
-            # user sensors
-            for i, v in enumerate(self.sensors_user_av):
-                sensor_topic = 'sensor_user_{0:d}'.format(i)
-                mqtt_data[sensor_topic] = round(v, 1)
+        # line detection
+        if self.night_v.value and self.config.get('DETECT_METEORS'):
+            self.image_processor.detectLines()
 
 
-            if new_filename:
-                upload_filename = new_filename
-            else:
-                upload_filename = latest_file
+        # star detection
+        if self.night_v.value and self.config.get('DETECT_STARS', True):
+            self.image_processor.detectStars()
 
 
-            ### upload thumbnail first
-            if image_thumbnail_entry:
-                self._miscUpload.syncapi_thumbnail(image_thumbnail_entry, image_thumbnail_metadata)  # syncapi before s3
-                self._miscUpload.s3_upload_thumbnail(image_thumbnail_entry, image_thumbnail_metadata)
+        # additional draw code
+        if self.config.get('DETECT_DRAW'):
+            self.image_processor.drawDetections()
 
 
-            self._miscUpload.syncapi_image(image_entry, image_metadata)  # syncapi before s3
-            self._miscUpload.s3_upload_image(image_entry, image_metadata)
-            self._miscUpload.mqtt_publish_image(upload_filename, mq_topic_latest, mqtt_data)
-            self._miscUpload.upload_image(image_entry)
+        # rotation, flips, and crop
+        self.image_processor.transform_image()
 
-            self.upload_metadata(i_ref, adu, adu_average)
 
+        # green removal
+        self.image_processor.scnr()
 
-    def decdeg2dms(self, dd):
-        is_positive = dd >= 0
-        dd = abs(dd)
-        minutes, seconds = divmod(dd * 3600, 60)
-        degrees, minutes = divmod(minutes, 60)
-        degrees = degrees if is_positive else -degrees
-        return degrees, minutes, seconds
 
+        # white balance
+        self.image_processor.white_balance_manual_bgr()
+        self.image_processor.white_balance_auto_bgr()
 
-    def upload_metadata(self, i_ref, adu, adu_average):
-        ### upload images
-        if not self.config.get('FILETRANSFER', {}).get('UPLOAD_METADATA'):
-            #logger.warning('Metadata uploading disabled')
-            return
 
-        if not self.config.get('FILETRANSFER', {}).get('UPLOAD_IMAGE'):
-            logger.warning('Metadata uploading disabled when image upload is disabled')
-            return
+        # saturation
+        if self.night_v.value and self.config.get('SATURATION_FACTOR', 1.0) != 1.0:
+            self.image_processor.saturation_adjust()
+        elif not self.night_v.value and self.config.get('SATURATION_FACTOR_DAY', 1.0) != 1.0:
+            self.image_processor.saturation_adjust()
 
 
-        self.metadata_count += 1
+        if not self.config.get('CONTRAST_ENHANCE_16BIT'):
+            if not self.night_v.value and self.config['DAYTIME_CONTRAST_ENHANCE']:
+                # Contrast enhancement during the day
+                self.image_processor.contrast_clahe()
+            elif self.night_v.value and self.config['NIGHT_CONTRAST_ENHANCE']:
+                # Contrast enhancement during night
+                self.image_processor.contrast_clahe()
 
-        metadata_remain = self.metadata_count % int(self.config['FILETRANSFER']['UPLOAD_IMAGE'])
-        if metadata_remain != 0:
-            #next_metadata = int(self.config['FILETRANSFER']['UPLOAD_IMAGE']) - image_metadata
-            #logger.info('Next metadata upload in %d images (%d s)', next_metadata, int(self.config['EXPOSURE_PERIOD'] * next_metadata))
-            return
 
+        self.image_processor.colorize()
 
-        metadata = {
-            'type'                : constants.METADATA,
-            'device'              : i_ref.camera_name,
-            'night'               : self.night_v.value,
-            'temp'                : self.sensors_temp_av[0],
-            'gain'                : self.gain_v.value,
-            'exposure'            : i_ref.exposure,
-            'stable_exposure'     : int(self.target_adu_found),
-            'target_adu'          : i_ref.target_adu,
-            'current_adu_target'  : self.current_adu_target,
-            'current_adu'         : adu,
-            'adu_average'         : adu_average,
-            'sqm'                 : i_ref.sqm_value,
-            'stars'               : len(i_ref.stars),
-            'time'                : i_ref.exp_date.strftime('%s'),
-            'tz'                  : str(i_ref.exp_date.astimezone().tzinfo),
-            'utc_offset'          : i_ref.exp_date.astimezone().utcoffset().total_seconds(),
-            'sqm_data'            : self.getSqmData(i_ref.camera_id),
-            'stars_data'          : self.getStarsData(i_ref.camera_id),
-            'latitude'            : self.position_av[0],
-            'longitude'           : self.position_av[1],
-            'elevation'           : int(self.position_av[2]),
-            'sidereal_time'       : self.astrometric_data['sidereal_time'],
-            'kpindex'             : i_ref.kpindex,
-            'ovation_max'         : i_ref.ovation_max,
-            'smoke_rating'        : constants.SMOKE_RATING_MAP_STR[i_ref.smoke_rating],
-            'aircraft'            : len(self.adsb_aircraft_list),
-        }
 
+        longterm_keogram_pixels = self.save_longterm_keogram_data(exp_date, camera_id)
 
-        # system temp sensors
-        for i, v in enumerate(self.sensors_temp_av):
-            sensor_topic = 'sensor_temp_{0:d}'.format(i)
-            metadata[sensor_topic] = v
 
+        self.image_processor.apply_image_circle_mask()
 
-        # user sensors
-        for i, v in enumerate(self.sensors_user_av):
-            sensor_topic = 'sensor_user_{0:d}'.format(i)
-            metadata[sensor_topic] = v
 
+        if self.config.get('FISH2PANO', {}).get('ENABLE'):
+            if not self.image_count % self.config.get('FISH2PANO', {}).get('MODULUS', 2):
+                pano_data = self.image_processor.fish2pano()
 
-        f_tmp_metadata = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json')
 
-        json.dump(metadata, f_tmp_metadata, indent=4)
+                if self.config.get('FISH2PANO', {}).get('ENABLE_CARDINAL_DIRS'):
+                    pano_data = self.image_processor.fish2pano_cardinal_dirs_label(pano_data)
 
-        f_tmp_metadata.flush()
-        f_tmp_metadata.close()
 
-        tmp_metadata_name_p = Path(f_tmp_metadata.name)
-        tmp_metadata_name_p.chmod(0o644)
+                self.write_panorama_img(pano_data, i_ref, camera, jpeg_exif=jpeg_exif)
 
 
-        file_data_dict = {
-            'timestamp'    : i_ref.exp_date,
-            'ts'           : i_ref.exp_date,  # shortcut
-            'camera_uuid'  : i_ref.camera_uuid,
-            'camera_id'    : i_ref.camera_id,
-        }
+        enhance_elapsed_s = time.time() - enhance_start
+        annotate_start = time.time()
 
 
-        if self.night_v.value:
-            file_data_dict['timeofday'] = 'night'
-            file_data_dict['tod'] = 'night'
-        else:
-            file_data_dict['timeofday'] = 'day'
-            file_data_dict['tod'] = 'day'
+        self.image_processor.apply_logo_overlay()
 
 
-        # Replace parameters in names
-        remote_dir = self.config['FILETRANSFER']['REMOTE_METADATA_FOLDER'].format(**file_data_dict)
-        remote_file = self.config['FILETRANSFER']['REMOTE_METADATA_NAME'].format(**file_data_dict)
+        self.image_processor.scale_image()
 
-        remote_file_p = Path(remote_dir).joinpath(remote_file)
 
-        # tell worker to upload file
-        jobdata = {
-            'action'       : constants.TRANSFER_UPLOAD,
-            'local_file'   : str(tmp_metadata_name_p),
-            'remote_file'  : str(remote_file_p),
-            'remove_local' : True,
-        }
+        self.image_processor.add_border()
 
-        upload_task = IndiAllSkyDbTaskQueueTable(
-            queue=TaskQueueQueue.UPLOAD,
-            state=TaskQueueState.QUEUED,
-            data=jobdata,
-        )
-        db.session.add(upload_task)
-        db.session.commit()
+        self.image_processor.moon_overlay()
 
-        self.upload_q.put({'task_id' : upload_task.id})
+        self.image_processor.lightgraph_overlay()
 
+        self.image_processor.orb_image()
 
-    def getSqmData(self, camera_id):
-        now_minus_minutes = datetime.now() - timedelta(minutes=self.sqm_history_minutes)
+        self.image_processor.cardinal_dirs_label()
 
-        sqm_images = IndiAllSkyDbImageTable.query\
-            .add_columns(
-                func.max(IndiAllSkyDbImageTable.sqm).label('image_max_sqm'),
-                func.min(IndiAllSkyDbImageTable.sqm).label('image_min_sqm'),
-                func.avg(IndiAllSkyDbImageTable.sqm).label('image_avg_sqm'),
-            )\
-            .join(IndiAllSkyDbCameraTable)\
-            .filter(IndiAllSkyDbCameraTable.id == camera_id)\
-            .filter(IndiAllSkyDbImageTable.createDate > now_minus_minutes)\
-            .first()
 
+        # get ADS-B data
+        if self.adsb_worker:
+            try:
+                self.adsb_aircraft_list = self.adsb_aircraft_q.get(timeout=5.0)
+            except queue.Empty:
+                self.adsb_aircraft_list = []
 
-        sqm_data = {
-            'max' : sqm_images.image_max_sqm,
-            'min' : sqm_images.image_min_sqm,
-            'avg' : sqm_images.image_avg_sqm,
-        }
+            self.adsb_aircraft_q.close()
+            self.adsb_aircraft_q = None
 
-        return sqm_data
+            self.adsb_worker.join()
+            self.adsb_worker = None
 
 
-    def getStarsData(self, camera_id):
-        now_minus_minutes = datetime.now() - timedelta(minutes=self.stars_history_minutes)
+        self.image_processor.label_image(adsb_aircraft_list=self.adsb_aircraft_list)
 
-        stars_images = IndiAllSkyDbImageTable.query\
-            .add_columns(
-                func.max(IndiAllSkyDbImageTable.stars).label('image_max_stars'),
-                func.min(IndiAllSkyDbImageTable.stars).label('image_min_stars'),
-                func.avg(IndiAllSkyDbImageTable.stars).label('image_avg_stars'),
-            )\
-            .join(IndiAllSkyDbCameraTable)\
-            .filter(IndiAllSkyDbCameraTable.id == camera_id)\
-            .filter(IndiAllSkyDbImageTable.createDate > now_minus_minutes)\
-            .first()
 
+        processing_elapsed_s = time.time() - processing_start
+        logger.info('Image processed in %0.4f s', processing_elapsed_s)
 
-        stars_data = {
-            'max' : stars_images.image_max_stars,
-            'min' : stars_images.image_min_stars,
-            'avg' : stars_images.image_avg_stars,
+        stage_elapsed = {
+            'decode'   : decode_elapsed_s,
+            'enhance'  : enhance_elapsed_s,
+            'annotate' : time.time() - annotate_start,
         }
 
-        return stars_data
+
+        ### hand off to the output stage
+        o_dict = {
+            'image'                  : self.image_processor.image,
+            'i_ref'                  : ImageOutputRef(i_ref),
+            'camera_id'              : camera_id,
+            'jpeg_exif'              : jpeg_exif,
+            'adu'                    : adu,
+            'adu_average'            : adu_average,
+            'processing_elapsed'     : processing_elapsed_s,
+            'longterm_keogram_pixels': longterm_keogram_pixels,
+            'filename_t'             : self.filename_t,
+            'target_adu_found'       : self.target_adu_found,
+            'current_adu_target'     : self.current_adu_target,
+            'adsb_aircraft_list'     : self.adsb_aircraft_list,
+            'astrometric_data'       : copy.copy(self.astrometric_data),
+            'night'                  : self.night_v.value,
+            'moonmode'               : self.moonmode_v.value,
+            'gain'                   : self.gain_v.value,
+            'binmode'                : self.bin_v.value,
+            'stage_elapsed'          : stage_elapsed,
+            'queued_time'            : time.time(),
+        }
+
+        if self.output_q:
+            # blocks when the output stage falls behind
+            self.output_q.put(o_dict)
+        else:
+            self.outputImage(o_dict)
+
+
+    def decdeg2dms(self, dd):
+        is_positive = dd >= 0
+        dd = abs(dd)
+        minutes, seconds = divmod(dd * 3600, 60)
+        degrees, minutes = divmod(minutes, 60)
+        degrees = degrees if is_positive else -degrees
+        return degrees, minutes, seconds
 
 
     def write_fit(self, i_ref, camera):
@@ -1361,174 +1842,6 @@ class ImageWorker(Process):
         tmpfile_name.unlink()
 
 
-    def write_img(self, data, i_ref, camera, jpeg_exif=None):
-        f_tmpfile = tempfile.NamedTemporaryFile(mode='w+b', delete=False, suffix='.{0}'.format(self.config['IMAGE_FILE_TYPE']))
-        f_tmpfile.close()
-
-        tmpfile_name = Path(f_tmpfile.name)
-
-
-        write_img_start = time.time()
-
-        # write to temporary file
-        if self.config['IMAGE_FILE_TYPE'] in ('jpg', 'jpeg'):
-            img_rgb = Image.fromarray(cv2.cvtColor(data, cv2.COLOR_BGR2RGB))
-            img_rgb.save(str(tmpfile_name), quality=self.config['IMAGE_FILE_COMPRESSION']['jpg'], exif=jpeg_exif)
-        elif self.config['IMAGE_FILE_TYPE'] in ('png',):
-            # exif does not appear to work with png
-            #img_rgb = Image.fromarray(cv2.cvtColor(data, cv2.COLOR_BGR2RGB))
-            #img_rgb.save(str(tmpfile_name), compress_level=self.config['IMAGE_FILE_COMPRESSION']['png'])
-
-            # opencv is faster than Pillow with PNG
-            cv2.imwrite(str(tmpfile_name), data, [cv2.IMWRITE_PNG_COMPRESSION, self.config['IMAGE_FILE_COMPRESSION']['png']])
-        elif self.config['IMAGE_FILE_TYPE'] in ('webp',):
-            img_rgb = Image.fromarray(cv2.cvtColor(data, cv2.COLOR_BGR2RGB))
-            img_rgb.save(str(tmpfile_name), quality=90, lossless=False, exif=jpeg_exif)
-        elif self.config['IMAGE_FILE_TYPE'] in ('tif', 'tiff'):
-            # exif does not appear to work with tiff
-            img_rgb = Image.fromarray(cv2.cvtColor(data, cv2.COLOR_BGR2RGB))
-            img_rgb.save(str(tmpfile_name), compression='tiff_lzw')
-        else:
-            tmpfile_name.unlink()
-            raise Exception('Unknown file type: %s', self.config['IMAGE_FILE_TYPE'])
-
-        write_img_elapsed_s = time.time() - write_img_start
-        logger.info('Image compressed in %0.4f s', write_img_elapsed_s)
-
-
-        ### Always write the latest file for web access
-        latest_file = self.image_dir.joinpath('latest.{0:s}'.format(self.config['IMAGE_FILE_TYPE']))
-
-        try:
-            latest_file.unlink()
-        except FileNotFoundError:
-            pass
-
-
-        shutil.copy2(str(tmpfile_name), str(latest_file))
-        latest_file.chmod(0o644)
-
-
-        ### disable timelapse images in focus mode
-        if self.config.get('FOCUS_MODE', False):
-            logger.warning('Focus mode enabled, not saving timelapse image')
-            tmpfile_name.unlink()
-            return None, None
-
-
-        ### Do not write daytime image files if daytime capture is disabled
-        if not self.night_v.value and self.config['DAYTIME_CAPTURE'] and not self.config.get('DAYTIME_CAPTURE_SAVE', True):
-            logger.info('Daytime capture is disabled')
-            tmpfile_name.unlink()
-            return latest_file, None
-
-
-        ### Write the timelapse file
-        folder = self._getImageFolder(i_ref.exp_date, i_ref.day_date, camera, 'exposures')
-
-        date_str = i_ref.exp_date.strftime('%Y%m%d_%H%M%S')
-        filename = folder.joinpath(self.filename_t.format(i_ref.camera_id, date_str, self.config['IMAGE_FILE_TYPE']))
-
-        #logger.info('Image filename: %s', filename)
-
-        if filename.exists():
-            logger.error('File exists: %s (skipping)', filename)
-            tmpfile_name.unlink()
-            return latest_file, None
-
-
-        shutil.copy2(str(tmpfile_name), str(filename))
-        filename.chmod(0o644)
-
-        tmpfile_name.unlink()
-
-
-        # set mtime to original exposure time
-        #os.utime(str(filename), (i_ref.exp_date.timestamp(), i_ref.exp_date.timestamp()))
-
-        #logger.info('Finished writing files')
-
-        return latest_file, filename
-
-
-    def write_status_json(self, i_ref, adu, adu_average):
-        status = {
-            'name'                : 'indi_json',
-            'class'               : 'ccd',
-            'device'              : i_ref.camera_name,
-            'night'               : self.night_v.value,
-            'temp'                : self.sensors_temp_av[0],
-            'gain'                : self.gain_v.value,
-            'exposure'            : i_ref.exposure,
-            'stable_exposure'     : int(self.target_adu_found),
-            'target_adu'          : i_ref.target_adu,
-            'current_adu_target'  : self.current_adu_target,
-            'current_adu'         : adu,
-            'adu_average'         : adu_average,
-            'sqm'                 : i_ref.sqm_value,
-            'stars'               : len(i_ref.stars),
-            'time'                : i_ref.exp_date.strftime('%s'),
-            'latitude'            : self.position_av[0],
-            'longitude'           : self.position_av[1],
-            'elevation'           : int(self.position_av[2]),
-            'kpindex'             : i_ref.kpindex,
-            'ovation_max'         : int(i_ref.ovation_max),
-            'smoke_rating'        : constants.SMOKE_RATING_MAP_STR[i_ref.smoke_rating],
-            'aircraft'            : len(self.adsb_aircraft_list),
-
-        }
-
-
-        # system temp sensors
-        for i, v in enumerate(self.sensors_temp_av):
-            sensor_topic = 'sensor_temp_{0:d}'.format(i)
-            status[sensor_topic] = v
-
-
-        # user sensors
-        for i, v in enumerate(self.sensors_user_av):
-            sensor_topic = 'sensor_user_{0:d}'.format(i)
-            status[sensor_topic] = v
-
-
-        indi_allsky_status_p = Path('/var/lib/indi-allsky/indi_allsky_status.json')
-
-        with io.open(str(indi_allsky_status_p), 'w') as f_indi_status:
-            json.dump(status, f_indi_status, indent=4)
-            f_indi_status.flush()
-            f_indi_status.close()
-
-        indi_allsky_status_p.chmod(0o644)
-
-
-    def _getImageFolder(self, exp_date, day_date, camera, type_folder):
-        if self.night_v.value:
-            # images should be written to previous day's folder until noon
-            timeofday_str = 'night'
-        else:
-            # images should be written to current day's folder
-            timeofday_str = 'day'
-
-
-        day_folder = self.image_dir.joinpath(
-            'ccd_{0:s}'.format(camera.uuid),
-            type_folder,
-            '{0:s}'.format(day_date.strftime('%Y%m%d')),
-            timeofday_str,
-        )
-
-        if not day_folder.exists():
-            day_folder.mkdir(mode=0o755, parents=True)
-
-        hour_str = exp_date.strftime('%d_%H')
-
-        hour_folder = day_folder.joinpath('{0:s}'.format(hour_str))
-        if not hour_folder.exists():
-            hour_folder.mkdir(mode=0o755)
-
-        return hour_folder
-
-
     def write_panorama_img(self, pano_data, i_ref, camera, jpeg_exif=None):
         panorama_height, panorama_width = pano_data.shape[:2]
 
@@ -1796,4 +2109,3 @@ class ImageWorker(Process):
 
 
         return rgb_pixel_list
-
@@ -0,0 +1,98 @@
+from multiprocessing import Value
+import queue
+import logging
+
+from .image import ImageWorkerBase
+
+from .flask import create_app
+
+
+app = create_app()
+
+logger = logging.getLogger('indi_allsky')
+
+
+
+class ImageOutputWorker(ImageWorkerBase):
+    """Final stage of the image pipeline
+
+    Encodes, stores and publishes the images processed by the ImageWorker.  A single
+    output worker consumes the queue so images are stored in the order they were captured.
+    """
+
+    def __init__(
+        self,
+        idx,
+        config,
+        error_q,
+        output_q,
+        upload_q,
+        video_q,
+        position_av,
+        sensors_temp_av,
+        sensors_user_av,
+    ):
+        # the night/moonmode/gain/bin values are restored from each image,
+        # the live values may have already changed for the next exposure
+        super(ImageOutputWorker, self).__init__(
+            config,
+            error_q,
+            upload_q,
+            position_av,
+            Value('i', -1),  # gain_v
+            Value('i', 1),  # bin_v
+            sensors_temp_av,
+            sensors_user_av,
+            Value('i', -1),  # night_v
+            Value('i', -1),  # moonmode_v
+            video_q=video_q,
+        )
+
+        self.name = 'ImageOutput-{0:d}'.format(idx)
+
+        self.output_q = output_q
+
+
+    def saferun(self):
+        while True:
+            try:
+                o_dict = self.output_q.get(timeout=23)  # prime number
+            except queue.Empty:
+                continue
+
+
+            if o_dict.get('stop'):
+                self.saveKeogramStarTrailState()
+                logger.warning('Goodbye')
+                return
+
+            if self._shutdown:
+                self.saveKeogramStarTrailState()
+                logger.warning('Goodbye')
+                return
+
+
+            if o_dict.get('end_of_period'):
+                self.closeKeogramStarTrailPeriod(o_dict['end_of_period'])
+                continue
+
+
+            # new context for every task, reduces the effects of caching
+            with app.app_context():
+                self.outputImage(o_dict)
+
+
+    def outputImage(self, o_dict):
+        # restore the state at the time the image was processed
+        self.night_v.value = o_dict['night']
+        self.moonmode_v.value = o_dict['moonmode']
+        self.gain_v.value = o_dict['gain']
+        self.bin_v.value = o_dict['binmode']
+
+        self.filename_t = o_dict['filename_t']
+        self.target_adu_found = o_dict['target_adu_found']
+        self.current_adu_target = o_dict['current_adu_target']
+        self.adsb_aircraft_list = o_dict['adsb_aircraft_list']
+        self.astrometric_data.update(o_dict['astrometric_data'])
+
+        super(ImageOutputWorker, self).outputImage(o_dict)
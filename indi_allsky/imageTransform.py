@@ -0,0 +1,191 @@
+### Applies the configured rotation, flip and crop operations in a single pass
+
+import time
+import cv2
+import numpy
+import logging
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllSkyImageTransform(object):
+    """Composes rotation, flips and cropping into one transform
+
+    Without an arbitrary rotation angle all operations are numpy views and only the
+    final image is copied.  With a rotation angle, all operations are combined into a
+    single affine matrix.  Transforms are planned once per image size.
+    """
+
+    rotate_90_options = {
+        'ROTATE_90_CLOCKWISE'        : cv2.ROTATE_90_CLOCKWISE,
+        'ROTATE_90_COUNTERCLOCKWISE' : cv2.ROTATE_90_COUNTERCLOCKWISE,
+        'ROTATE_180'                 : cv2.ROTATE_180,
+    }
+
+
+    def __init__(self, config, bin_v):
+        self.config = config
+        self.bin_v = bin_v
+
+        # (height, width, bin) -> plan
+        self._plans = dict()
+
+
+    def apply(self, image, log=True):
+        ### returns None if no operations are configured
+        height, width = image.shape[:2]
+
+        plan_key = (height, width, self.bin_v.value)
+
+        try:
+            plan = self._plans[plan_key]
+        except KeyError:
+            plan = self._generatePlan(height, width)
+            self._plans[plan_key] = plan
+
+
+        if not plan['ops']:
+            return None
+
+
+        transform_start = time.time()
+
+        if plan['affine']:
+            new_width, new_height = plan['size']
+            transformed_image = cv2.warpAffine(image, plan['matrix'][:2], (new_width, new_height))
+        else:
+            transformed_image = image
+            for op, arg in plan['ops']:
+                if op == 'rotate_90':
+                    transformed_image = numpy.rot90(transformed_image, k=arg)
+                elif op == 'flip_v':
+                    transformed_image = transformed_image[::-1]
+                elif op == 'flip_h':
+                    transformed_image = transformed_image[:, ::-1]
+                elif op == 'crop':
+                    x1, y1, x2, y2 = arg
+                    transformed_image = transformed_image[y1:y2, x1:x2]
+
+            # views are only copied once
+            transformed_image = numpy.ascontiguousarray(transformed_image)
+
+
+        if log:
+            transform_elapsed_s = time.time() - transform_start
+            logger.info('Rotate/flip/crop in %0.4f s', transform_elapsed_s)
+
+        return transformed_image
+
+
+    def _generatePlan(self, height, width):
+        ### matrix maps source pixel coordinates to the transformed image
+        matrix = numpy.identity(3, dtype=numpy.float64)
+        ops = list()
+        affine = False
+
+
+        if self.config.get('IMAGE_ROTATE'):
+            try:
+                rotate_enum = self.rotate_90_options[self.config['IMAGE_ROTATE']]
+            except KeyError:
+                logger.error('Unknown rotation option: %s', self.config['IMAGE_ROTATE'])
+                rotate_enum = None
+
+
+            if rotate_enum == cv2.ROTATE_90_CLOCKWISE:
+                rot_90 = [[0, -1, height - 1], [1, 0, 0], [0, 0, 1]]
+                ops.append(('rotate_90', -1))
+                height, width = width, height
+            elif rotate_enum == cv2.ROTATE_90_COUNTERCLOCKWISE:
+                rot_90 = [[0, 1, 0], [-1, 0, width - 1], [0, 0, 1]]
+                ops.append(('rotate_90', 1))
+                height, width = width, height
+            elif rotate_enum == cv2.ROTATE_180:
+                rot_90 = [[-1, 0, width - 1], [0, -1, height - 1], [0, 0, 1]]
+                ops.append(('rotate_90', 2))
+            else:
+                rot_90 = None
+
+
+            if rot_90:
+                matrix = numpy.array(rot_90, dtype=numpy.float64) @ matrix
+
+
+        angle = self.config.get('IMAGE_ROTATE_ANGLE')
+        if angle:
+            keep_size = self.config.get('IMAGE_ROTATE_KEEP_SIZE')
+
+            center_x = int(width / 2)
+            center_y = int(height / 2)
+
+            rot = cv2.getRotationMatrix2D((center_x, center_y), int(angle), 1.0)
+
+
+            if keep_size:
+                bound_w = width
+                bound_h = height
+            else:
+                # rotating will change the size of the resulting image
+                abs_cos = abs(rot[0, 0])
+                abs_sin = abs(rot[0, 1])
+
+                bound_w = int(height * abs_sin + width * abs_cos)
+                bound_h = int(height * abs_cos + width * abs_sin)
+
+
+            rot[0, 2] += (bound_w / 2) - center_x
+            rot[1, 2] += (bound_h / 2) - center_y
+
+            matrix = numpy.vstack((rot, [0, 0, 1])) @ matrix
+
+
+            # width and height needs to be divisible by 2 for timelapse
+            height = bound_h - (bound_h % 2)
+            width = bound_w - (bound_w % 2)
+
+            ops.append(('rotate_angle', int(angle)))
+            affine = True
+
+
+        # verticle flip
+        if self.config.get('IMAGE_FLIP_V'):
+            matrix = numpy.array([[1, 0, 0], [0, -1, height - 1], [0, 0, 1]], dtype=numpy.float64) @ matrix
+            ops.append(('flip_v', None))
+
+
+        # horizontal flip
+        if self.config.get('IMAGE_FLIP_H'):
+            matrix = numpy.array([[-1, 0, width - 1], [0, 1, 0], [0, 0, 1]], dtype=numpy.float64) @ matrix
+            ops.append(('flip_h', None))
+
+
+        # crop
+        if self.config.get('IMAGE_CROP_ROI'):
+            # divide the coordinates by binning value
+            x1 = int(self.config['IMAGE_CROP_ROI'][0] / self.bin_v.value)
+            y1 = int(self.config['IMAGE_CROP_ROI'][1] / self.bin_v.value)
+            x2 = int(self.config['IMAGE_CROP_ROI'][2] / self.bin_v.value)
+            y2 = int(self.config['IMAGE_CROP_ROI'][3] / self.bin_v.value)
+
+            # same limits as slicing
+            x1, x2, _ = slice(x1, x2).indices(width)
+            y1, y2, _ = slice(y1, y2).indices(height)
+            x2 = max(x1, x2)
+            y2 = max(y1, y2)
+
+            matrix = numpy.array([[1, 0, -x1], [0, 1, -y1], [0, 0, 1]], dtype=numpy.float64) @ matrix
+            ops.append(('crop', (x1, y1, x2, y2)))
+
+            height = y2 - y1
+            width = x2 - x1
+
+            logger.info('New cropped size: %d x %d', width, height)
+
+
+        return {
+            'ops'    : ops,
+            'affine' : affine,
+            'matrix' : matrix,
+            'size'   : (width, height),
+        }
@@ -24,6 +24,9 @@ class KeogramGenerator(object):
     line_thickness = 2
     line_length = 35
 
+    # initial number of columns allocated for the keogram, doubled as needed
+    initial_columns = 512
+
 
     def __init__(self, config, skip_frames=0):
         self.config = config
@@ -49,15 +52,23 @@ class KeogramGenerator(object):
         #logger.info('X Offset: %d, Y Offset: %d', self.x_offset, self.y_offset)
 
 
+        self.image_width = None
+        self.image_height = None
+
         self.original_width = None
         self.original_height = None
 
         self.rotated_width = None
         self.rotated_height = None
 
-        self.keogram_data = None
+        self._keogram_buffer = None
+        self._keogram_columns = 0
         self.keogram_final = None  # will contain final resized keogram
 
+        # source coordinates of the rotated center line
+        self._map_x = None
+        self._map_y = None
+
         self.timestamps_list = list()
         self.image_processing_elapsed_s = 0
 
@@ -72,6 +83,8 @@ class KeogramGenerator(object):
     @angle.setter
     def angle(self, new_angle):
         self._angle = float(new_angle)
+        self._map_x = None  # regenerate sampling map
+        self._map_y = None
 
 
     @property
@@ -110,6 +123,24 @@ class KeogramGenerator(object):
         self._crop_bottom = int(new_crop)
 
 
+    @property
+    def keogram_data(self):
+        if isinstance(self._keogram_buffer, type(None)):
+            return None
+
+        return self._keogram_buffer[:, :self._keogram_columns]
+
+    @keogram_data.setter
+    def keogram_data(self, new_keogram_data):
+        if isinstance(new_keogram_data, type(None)):
+            self._keogram_buffer = None
+            self._keogram_columns = 0
+            return
+
+        self._keogram_buffer = numpy.array(new_keogram_data)  # copy
+        self._keogram_columns = self._keogram_buffer.shape[1]
+
+
     @property
     def shape(self):
         return self.keogram_final.shape
@@ -164,58 +195,113 @@ class KeogramGenerator(object):
         #logger.info('Original: %d x %d', image_width, image_height)
 
 
-        recenter_width = image_width + (abs(self.x_offset) * 2)
-        recenter_height = image_height + (abs(self.y_offset) * 2)
-        #logger.info('New: %d x %d', recenter_width, recenter_height)
+        if isinstance(self._map_x, type(None)):
+            # this only happens on the first image
+            self._generateSampleMap(image_height, image_width)
 
 
-        recenter_image = numpy.zeros([recenter_height, recenter_width, 3], dtype=numpy.uint8)
-        recenter_image[
-            int((recenter_height / 2) - (image_height / 2) + self.y_offset):int((recenter_height / 2) + (image_height / 2) + self.y_offset),
-            int((recenter_width / 2) - (image_width / 2) - self.x_offset):int((recenter_width / 2) + (image_width / 2) - self.x_offset),
-        ] = image  # recenter the image circle in the new image
+        if image_height != self.image_height or image_width != self.image_width:
+            # all images have to match dimensions of the first image
+            logger.error('Image with dimension mismatch: %s', filename)
+            self.timestamps_list.pop()
+            return
 
 
-        ### Draw a crosshair for reference
-        #cv2.line(f_image, (int(final_width / 2), 0), (int(final_width / 2), final_height), (0, 0, 128), 3)
-        #cv2.line(f_image, (0, int(final_height / 2)), (final_width, int(final_height / 2)), (0, 0, 128), 3)
-        #cv2.imwrite('/tmp/keogram_test.jpg', f_image, [cv2.IMWRITE_JPEG_QUALITY, 90])
-        #raise Exception()
+        # sample the center line of the recentered and rotated image
+        rotated_center_line = cv2.remap(
+            image,
+            self._map_x,
+            self._map_y,
+            cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_CONSTANT,
+            borderValue=0,
+        )
 
 
-        rotated_image = self.rotate(recenter_image)
+        if isinstance(self._keogram_buffer, type(None)):
+            new_shape = (rotated_center_line.shape[0], self.initial_columns) + rotated_center_line.shape[2:]
+            logger.info('New Shape: %s', pformat(new_shape))
 
+            new_dtype = rotated_center_line.dtype
+            logger.info('New dtype: %s', new_dtype)
 
-        rot_height, rot_width = rotated_image.shape[:2]
-        self.rotated_height = rot_height
-        self.rotated_width = rot_width
+            self._keogram_buffer = numpy.zeros(new_shape, dtype=new_dtype)
+            self._keogram_columns = 0
+        elif self._keogram_columns >= self._keogram_buffer.shape[1]:
+            # grow geometrically to keep appends amortized O(1)
+            self._keogram_buffer = numpy.concatenate((self._keogram_buffer, numpy.zeros_like(self._keogram_buffer)), axis=1)
 
-        rotated_center_line = rotated_image[:, [int(rot_width / 2)]]
 
-        if isinstance(self.keogram_data, type(None)):
-            # this only happens on the first image
+        self._keogram_buffer[:, self._keogram_columns] = rotated_center_line[:, 0]
+        self._keogram_columns += 1
+
+        self.image_processing_elapsed_s += time.time() - image_processing_start
+
+
+    def _generateSampleMap(self, image_height, image_width):
+        ### map the center line of the recentered and rotated image back to coordinates in the original image
+        recenter_width = image_width + (abs(self.x_offset) * 2)
+        recenter_height = image_height + (abs(self.y_offset) * 2)
+        #logger.info('New: %d x %d', recenter_width, recenter_height)
 
+        if isinstance(self.original_height, type(None)):
             self.original_height = recenter_height
             self.original_width = recenter_width
+        elif recenter_height != self.original_height or recenter_width != self.original_width:
+            # restored state was generated from images with different dimensions
+            return
 
-            new_shape = rotated_center_line.shape
-            logger.info('New Shape: %s', pformat(new_shape))
+        self.image_height = image_height
+        self.image_width = image_width
 
-            new_dtype = rotated_center_line.dtype
-            logger.info('New dtype: %s', new_dtype)
 
-            self.keogram_data = numpy.empty(new_shape, dtype=new_dtype)
+        # position of the original image in the recentered image
+        recenter_x1 = int((recenter_width / 2) - (image_width / 2) - self.x_offset)
+        recenter_y1 = int((recenter_height / 2) - (image_height / 2) + self.y_offset)
 
 
-        if recenter_height != self.original_height or recenter_width != self.original_width:
-            # all images have to match dimensions of the first image
-            logger.error('Image with dimension mismatch: %s', filename)
-            return
+        rot, rot_width, rot_height = self.getRotationMatrix(recenter_height, recenter_width)
+        self.rotated_height = rot_height
+        self.rotated_width = rot_width
 
+        rot_inv = cv2.invertAffineTransform(rot)
 
-        self.keogram_data = numpy.append(self.keogram_data, rotated_center_line, 1)
 
-        self.image_processing_elapsed_s += time.time() - image_processing_start
+        line_x = int(rot_width / 2)
+        line_y = numpy.arange(rot_height, dtype=numpy.float64)
+
+        src_x = (rot_inv[0, 0] * line_x) + (rot_inv[0, 1] * line_y) + rot_inv[0, 2] - recenter_x1
+        src_y = (rot_inv[1, 0] * line_x) + (rot_inv[1, 1] * line_y) + rot_inv[1, 2] - recenter_y1
+
+        self._map_x = src_x.astype(numpy.float32).reshape((rot_height, 1))
+        self._map_y = src_y.astype(numpy.float32).reshape((rot_height, 1))
+
+
+    def getState(self):
+        ### state needed to continue processing images in another process
+        state = {
+            'process_count'    : self.process_count,
+            'original_width'   : self.original_width,
+            'original_height'  : self.original_height,
+            'rotated_width'    : self.rotated_width,
+            'rotated_height'   : self.rotated_height,
+            'keogram_data'     : self.keogram_data,
+            'timestamps_list'  : self.timestamps_list,
+            'image_processing_elapsed_s' : self.image_processing_elapsed_s,
+        }
+
+        return state
+
+
+    def setState(self, state):
+        self.process_count = state['process_count']
+        self.original_width = state['original_width']
+        self.original_height = state['original_height']
+        self.rotated_width = state['rotated_width']
+        self.rotated_height = state['rotated_height']
+        self.keogram_data = state['keogram_data']
+        self.timestamps_list = list(state['timestamps_list'])
+        self.image_processing_elapsed_s = state['image_processing_elapsed_s']
 
 
     def finalize(self, outfile, camera):
@@ -369,6 +455,15 @@ class KeogramGenerator(object):
 
     def rotate(self, image):
         height, width = image.shape[:2]
+
+        rot, bound_w, bound_h = self.getRotationMatrix(height, width)
+
+        rotated = cv2.warpAffine(image, rot, (bound_w, bound_h))
+
+        return rotated
+
+
+    def getRotationMatrix(self, height, width):
         center_x = int(width / 2)
         center_y = int(height / 2)
 
@@ -383,9 +478,7 @@ class KeogramGenerator(object):
         rot[0, 2] += bound_w / 2 - center_x
         rot[1, 2] += bound_h / 2 - center_y
 
-        rotated = cv2.warpAffine(image, rot, (bound_w, bound_h))
-
-        return rotated
+        return rot, bound_w, bound_h
 
 
     def trimEdges(self, image):
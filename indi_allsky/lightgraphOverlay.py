@@ -7,10 +7,11 @@ import ephem
 import numpy
 import cv2
 from PIL import Image
-from PIL import ImageFont
 from PIL import ImageDraw
 import logging
 
+from .overlayLayer import IndiAllSkyOverlayLayer
+
 
 logger = logging.getLogger('indi_allsky')
 
@@ -376,7 +377,7 @@ class IndiAllSkyLightgraphOverlay(object):
 
         pillow_font_size = self.config.get('LIGHTGRAPH_OVERLAY', {}).get('PIL_FONT_SIZE', 20)
 
-        font = ImageFont.truetype(str(pillow_font_file_p), pillow_font_size)
+        font = IndiAllSkyOverlayLayer.getFont(pillow_font_file_p, pillow_font_size)
         draw = ImageDraw.Draw(lightgraph_rgb)
 
         color_rgb = list(self.config.get('LIGHTGRAPH_OVERLAY', {}).get('FONT_COLOR', (200, 200, 200)))  # RGB for pillow
@@ -2,9 +2,12 @@
 ### Masks are pre-rotation/flip/cropping and need these operations to be applied to processed images
 
 #import time
+from pathlib import Path
 import cv2
 import logging
 
+from .imageTransform import IndiAllSkyImageTransform
+
 
 logger = logging.getLogger('indi_allsky')
 
@@ -21,6 +24,8 @@ class MaskProcessor(object):
 
         self._image = None
 
+        self._image_transform = IndiAllSkyImageTransform(self.config, self.bin_v)
+
 
     @property
     def image(self):
@@ -31,6 +36,16 @@ class MaskProcessor(object):
         self._image = new_image
 
 
+    def transform_image(self):
+        ### same single pass transform as processed images
+        transformed_image = self._image_transform.apply(self.image, log=False)
+
+        if isinstance(transformed_image, type(None)):
+            return
+
+        self.image = transformed_image
+
+
     def rotate_90(self):
         try:
             rotate_enum = getattr(cv2, self.config['IMAGE_ROTATE'])
@@ -135,3 +150,50 @@ class MaskProcessor(object):
 
         self.image = cv2.resize(self.image, (new_width, new_height), interpolation=cv2.INTER_AREA)
 
+
+    def load_detection_mask(self):
+        ### load the detection mask and apply the same operations as processed images
+        detect_mask = self.config.get('DETECT_MASK', '')
+
+        if not detect_mask:
+            logger.warning('No detection mask defined')
+            return
+
+
+        detect_mask_p = Path(detect_mask)
+
+        try:
+            if not detect_mask_p.exists():
+                logger.error('%s does not exist', detect_mask_p)
+                return
+
+
+            if not detect_mask_p.is_file():
+                logger.error('%s is not a file', detect_mask_p)
+                return
+
+        except PermissionError as e:
+            logger.error(str(e))
+            return
+
+        mask_data = cv2.imread(str(detect_mask_p), cv2.IMREAD_GRAYSCALE)  # mono
+        if isinstance(mask_data, type(None)):
+            logger.error('%s is not a valid image', detect_mask_p)
+            return
+
+        ### any compression artifacts will be set to black
+        #mask_data[mask_data < 255] = 0  # did not quite work
+
+
+        # masks need to be rotated, flipped, cropped for post-processed images
+        self.image = mask_data
+
+        self.transform_image()
+
+
+        # scale
+        if self.config['IMAGE_SCALE'] and self.config['IMAGE_SCALE'] != 100:
+            self.scale_image()
+
+
+        return self.image
@@ -0,0 +1,150 @@
+import numpy
+from PIL import Image
+from PIL import ImageFont
+from PIL import ImageDraw
+import logging
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllSkyOverlayLayer(object):
+    """Premultiplied BGR overlay for a region of an image
+
+    Only the region covered by the layer is blended into the image, so text and
+    logos do not require converting the whole frame.  Layers that do not change
+    between frames can be kept and applied again.
+    """
+
+    # (font file, size) -> font
+    _font_cache = dict()
+
+
+    def __init__(self, x, y, color_bgr, alpha):
+        self.x = int(x)
+        self.y = int(y)
+
+        # color is multiplied by alpha
+        self.color_bgr = color_bgr  # float32 (h, w, 3)
+        self.alpha = alpha  # float32 (h, w, 1)
+
+
+    @classmethod
+    def getFont(cls, font_file, font_size):
+        font_key = (str(font_file), int(font_size))
+
+        try:
+            return cls._font_cache[font_key]
+        except KeyError:
+            pass
+
+
+        font = ImageFont.truetype(str(font_file), int(font_size))
+        cls._font_cache[font_key] = font
+
+        return font
+
+
+    @classmethod
+    def fromText(cls, text, font, pt, color_rgb, stroke_width=0, anchor='la'):
+        x, y = int(pt[0]), int(pt[1])
+
+        left, top, right, bottom = font.getbbox(text, stroke_width=stroke_width, anchor=anchor)
+
+        width = right - left
+        height = bottom - top
+
+        if width <= 0 or height <= 0:
+            # nothing to draw
+            return None
+
+
+        # the outline is drawn first in black, then the text on top
+        text_mask = Image.new('L', (width, height), 0)
+        ImageDraw.Draw(text_mask).text(
+            (-left, -top),
+            text,
+            fill=255,
+            font=font,
+            anchor=anchor,
+        )
+
+        text_alpha = numpy.asarray(text_mask, dtype=numpy.float32) / 255
+
+
+        if stroke_width:
+            stroke_mask = Image.new('L', (width, height), 0)
+            ImageDraw.Draw(stroke_mask).text(
+                (-left, -top),
+                text,
+                fill=255,
+                font=font,
+                stroke_width=stroke_width,
+                stroke_fill=255,
+                anchor=anchor,
+            )
+
+            stroke_alpha = numpy.asarray(stroke_mask, dtype=numpy.float32) / 255
+
+            alpha = 1 - ((1 - stroke_alpha) * (1 - text_alpha))
+        else:
+            alpha = text_alpha
+
+
+        color_bgr = numpy.array([int(color_rgb[2]), int(color_rgb[1]), int(color_rgb[0])], dtype=numpy.float32)
+
+        return cls(
+            x + left,
+            y + top,
+            text_alpha[:, :, numpy.newaxis] * color_bgr,
+            alpha[:, :, numpy.newaxis],
+        )
+
+
+    @classmethod
+    def fromBgra(cls, bgra_image):
+        # crop to the visible part of the image
+        visible = bgra_image[:, :, 3] > 0
+
+        if not visible.any():
+            return None
+
+
+        rows = numpy.flatnonzero(visible.any(axis=1))
+        cols = numpy.flatnonzero(visible.any(axis=0))
+
+        y1, y2 = rows[0], rows[-1] + 1
+        x1, x2 = cols[0], cols[-1] + 1
+
+        crop = bgra_image[y1:y2, x1:x2]
+
+        alpha = (crop[:, :, 3:4] / 255).astype(numpy.float32)
+
+        return cls(
+            x1,
+            y1,
+            crop[:, :, :3].astype(numpy.float32) * alpha,
+            alpha,
+        )
+
+
+    def apply(self, image):
+        ### Blend the layer into the image in place
+        image_height, image_width = image.shape[:2]
+        layer_height, layer_width = self.alpha.shape[:2]
+
+        x1 = max(self.x, 0)
+        y1 = max(self.y, 0)
+        x2 = min(self.x + layer_width, image_width)
+        y2 = min(self.y + layer_height, image_height)
+
+        if x1 >= x2 or y1 >= y2:
+            # outside of the image
+            return image
+
+
+        layer_slice = (slice(y1 - self.y, y2 - self.y), slice(x1 - self.x, x2 - self.x))
+
+        roi = image[y1:y2, x1:x2]
+        image[y1:y2, x1:x2] = (roi * (1 - self.alpha[layer_slice]) + self.color_bgr[layer_slice]).astype(image.dtype)
+
+        return image
@@ -0,0 +1,234 @@
+### Fisheye to panorama projection using a precomputed remap table
+
+import io
+import json
+import math
+import time
+import hashlib
+from pathlib import Path
+import cv2
+import numpy
+import logging
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllSkyPanoramaMap(object):
+    """Generates panoramas with the same projection as the fish2pano module
+
+    The recenter offset, rotation, polar projection, even size crop and flip are combined
+    into a single remap table.  Tables are stored on disk so they are only generated once
+    per geometry.
+    """
+
+    # increment when the projection changes to invalidate stored tables
+    map_version = 1
+
+
+    def __init__(self, config):
+        self.config = config
+
+        self._map_key = None
+        self._map1 = None
+        self._map2 = None
+        self._interpolation = cv2.INTER_NEAREST
+
+
+        if self.config.get('IMAGE_FOLDER'):
+            image_dir = Path(self.config['IMAGE_FOLDER']).absolute()
+        else:
+            image_dir = Path(__file__).parent.parent.joinpath('html', 'images').absolute()
+
+        # tables may be deleted at any time
+        self.map_dir = image_dir.joinpath('scratch', 'fish2pano')
+
+
+    def getMapKey(self, image_height, image_width):
+        fish2pano_config = self.config.get('FISH2PANO', {})
+
+        map_key = {
+            'version'  : self.map_version,
+            'height'   : int(image_height),
+            'width'    : int(image_width),
+            'x_offset' : int(self.config.get('LENS_OFFSET_X', 0)),
+            'y_offset' : int(self.config.get('LENS_OFFSET_Y', 0)),
+            'angle'    : int(fish2pano_config.get('ROTATE_ANGLE', 0)),
+            'diameter' : float(fish2pano_config.get('DIAMETER', 3000)),
+            'scale'    : float(fish2pano_config.get('SCALE', 0.3)),
+            'flip_h'   : bool(fish2pano_config.get('FLIP_H')),
+        }
+
+        return map_key
+
+
+    def apply(self, image):
+        image_height, image_width = image.shape[:2]
+
+        map_key = self.getMapKey(image_height, image_width)
+
+        if map_key != self._map_key:
+            self._loadMap(map_key)
+
+
+        return cv2.remap(image, self._map1, self._map2, self._interpolation, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+
+    def _loadMap(self, map_key):
+        map_hash = hashlib.sha1(json.dumps(map_key, sort_keys=True).encode()).hexdigest()
+        map_file_p = self.map_dir.joinpath('fish2pano_{0:s}.npz'.format(map_hash))
+
+
+        map_x = None
+        map_y = None
+
+        if map_file_p.exists():
+            try:
+                with numpy.load(str(map_file_p), allow_pickle=False) as npz:
+                    map_x = npz['map_x']
+                    map_y = npz['map_y']
+
+                logger.info('Loaded panorama map: %s', map_file_p)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error('Unable to load panorama map: %s', str(e))
+                map_x = None
+                map_y = None
+
+
+        if isinstance(map_x, type(None)):
+            map_start = time.time()
+
+            map_x, map_y = self.generateMap(map_key)
+
+            logger.info('Generated panorama map in %0.4f s', time.time() - map_start)
+
+            self._saveMap(map_file_p, map_x, map_y)
+
+
+        if map_key['angle']:
+            # rotated images are interpolated
+            self._interpolation = cv2.INTER_LINEAR
+        else:
+            # all coordinates are whole pixels
+            self._interpolation = cv2.INTER_NEAREST
+
+
+        # fixed point maps are faster than floating point maps
+        self._map1, self._map2 = cv2.convertMaps(
+            map_x,
+            map_y,
+            cv2.CV_16SC2,
+            nninterpolation=self._interpolation == cv2.INTER_NEAREST,
+        )
+
+        self._map_key = map_key
+
+
+    def _saveMap(self, map_file_p, map_x, map_y):
+        try:
+            if not self.map_dir.exists():
+                self.map_dir.mkdir(mode=0o755, parents=True)
+
+
+            # write to a temporary file first in case of a crash
+            map_tmp_file_p = map_file_p.with_name('{0:s}.tmp'.format(map_file_p.name))
+
+            with io.open(str(map_tmp_file_p), 'w+b') as f_map:
+                numpy.savez(f_map, map_x=map_x, map_y=map_y)
+
+            map_tmp_file_p.replace(map_file_p)
+        except OSError as e:
+            logger.error('Unable to save panorama map: %s', str(e))
+
+
+    def generateMap(self, map_key):
+        ### returns the source image coordinates for every panorama pixel
+        image_height = map_key['height']
+        image_width = map_key['width']
+        x_offset = map_key['x_offset']
+        y_offset = map_key['y_offset']
+
+
+        # the image circle is recentered in a larger image
+        recenter_width = image_width + (abs(x_offset) * 2)
+        recenter_height = image_height + (abs(y_offset) * 2)
+
+        recenter_x = int((recenter_width / 2) - (image_width / 2) - x_offset)
+        recenter_y = int((recenter_height / 2) - (image_height / 2) + y_offset)
+
+
+        if map_key['angle']:
+            center_x = int(recenter_width / 2)
+            center_y = int(recenter_height / 2)
+
+            rot = cv2.getRotationMatrix2D((center_x, center_y), int(map_key['angle']), 1.0)
+
+            abs_cos = abs(rot[0, 0])
+            abs_sin = abs(rot[0, 1])
+
+            rot_width = int(recenter_height * abs_sin + recenter_width * abs_cos)
+            rot_height = int(recenter_height * abs_cos + recenter_width * abs_sin)
+
+            rot[0, 2] += rot_width / 2 - center_x
+            rot[1, 2] += rot_height / 2 - center_y
+        else:
+            rot = None
+            rot_width = recenter_width
+            rot_height = recenter_height
+
+
+        center_x = int(rot_width / 2)
+        center_y = int(rot_height / 2)
+
+        radius = map_key['diameter'] / 2
+        scale = map_key['scale']
+
+
+        # same projection as fish2pano
+        pano_width = int(scale * 2 * math.pi * radius + 0.5)
+        pano_height = int(scale * radius + 0.5)
+
+        theta = (2.0 * math.pi) * numpy.arange(pano_width, dtype=numpy.float64) / pano_width
+        r_0 = radius * numpy.arange(pano_height, dtype=numpy.float64) / pano_height
+
+        pano_x = r_0[:, numpy.newaxis] * numpy.cos(theta)[numpy.newaxis, :] + center_x
+        pano_y = r_0[:, numpy.newaxis] * numpy.sin(theta)[numpy.newaxis, :] + center_y
+
+        rot_x = numpy.floor(pano_x + 0.5)
+        rot_y = numpy.floor(pano_y + 0.5)
+
+        valid = (pano_x > 0) & (rot_x < rot_width) & (pano_y > 0) & (rot_y < rot_height)
+
+
+        if not isinstance(rot, type(None)):
+            inv_rot = cv2.invertAffineTransform(rot)
+
+            recenter_x_coords = inv_rot[0, 0] * rot_x + inv_rot[0, 1] * rot_y + inv_rot[0, 2]
+            recenter_y_coords = inv_rot[1, 0] * rot_x + inv_rot[1, 1] * rot_y + inv_rot[1, 2]
+        else:
+            recenter_x_coords = rot_x
+            recenter_y_coords = rot_y
+
+
+        map_x = (recenter_x_coords - recenter_x).astype(numpy.float32)
+        map_y = (recenter_y_coords - recenter_y).astype(numpy.float32)
+
+        # pixels outside the image are black
+        map_x[~valid] = -10
+        map_y[~valid] = -10
+
+
+        # width and height needs to be divisible by 2 for timelapse
+        mod_height = pano_height % 2
+        mod_width = pano_width % 2
+
+        map_x = map_x[mod_height:, :pano_width - mod_width]  # trim the top
+        map_y = map_y[mod_height:, :pano_width - mod_width]
+
+
+        if map_key['flip_h']:
+            map_x = map_x[:, ::-1]
+            map_y = map_y[:, ::-1]
+
+
+        return numpy.ascontiguousarray(map_x), numpy.ascontiguousarray(map_y)
@@ -11,8 +11,6 @@ import numpy
 import cv2
 import PIL
 from PIL import Image
-from PIL import ImageFont
-from PIL import ImageDraw
 from fractions import Fraction
 from pprint import pformat  # noqa: F401
 import logging
@@ -30,15 +28,23 @@ from .draw import IndiAllSkyDraw
 from .scnr import IndiAllskyScnr
 from .stack import IndiAllskyStacker
 from .cardinalDirsLabel import IndiAllskyCardinalDirsLabel
+from .overlayLayer import IndiAllSkyOverlayLayer
+from .imageTransform import IndiAllSkyImageTransform
+from .panoramaMap import IndiAllSkyPanoramaMap
 from .utils import IndiAllSkyDateCalcs
+from .ephemeris import IndiAllSkyEphemeris
 from .moonOverlay import IndiAllSkyMoonOverlay
 from .lightgraphOverlay import IndiAllSkyLightgraphOverlay
+from .calibrationCache import IndiAllSkyCalibrationCache
+from .satellite_pass import IndiAllskySatellitePassPredictor
 
 from .flask.models import IndiAllSkyDbBadPixelMapTable
 from .flask.models import IndiAllSkyDbDarkFrameTable
 from .flask.models import IndiAllSkyDbTleDataTable
+from .flask.models import IndiAllSkyDbSatellitePassTable
 
 from sqlalchemy.sql.expression import true as sa_true
+from sqlalchemy.sql.expression import null as sa_null
 
 from .exceptions import TimeOutException
 from .exceptions import CalibrationNotFound
@@ -127,7 +133,6 @@ class ImageProcessor(object):
         self._image_circle_alpha_mask = None
 
         self._overlay = None
-        self._alpha_mask = None
 
         self.focus_mode = self.config.get('FOCUS_MODE', False)
 
@@ -164,8 +169,11 @@ class ImageProcessor(object):
         self._draw = IndiAllSkyDraw(self.config, self.bin_v, mask=self._detection_mask)
         self._ia_scnr = IndiAllskyScnr(self.config)
         self._cardinal_dirs_label = IndiAllskyCardinalDirsLabel(self.config)
+        self._image_transform = IndiAllSkyImageTransform(self.config, self.bin_v)
+        self._panorama_map = IndiAllSkyPanoramaMap(self.config)
         self._moon_overlay = IndiAllSkyMoonOverlay(self.config)
         self._lightgraph_overlay = IndiAllSkyLightgraphOverlay(self.config, self.position_av)
+        self._calibration_cache = IndiAllSkyCalibrationCache(self.config)
 
         self._orb = IndiAllskyOrbGenerator(self.config)
         self._orb.sun_alt_deg = self.config['NIGHT_SUN_ALT_DEG']
@@ -303,10 +311,14 @@ class ImageProcessor(object):
         self._text_font_height = int(new_height)
 
 
-    def add(self, filename, exposure, exp_date, exp_elapsed, camera):
+    def add(self, filename, exposure, exp_date, exp_elapsed, camera, hdulist=None):
         from astropy.io import fits
 
-        filename_p = Path(filename)
+        if not isinstance(hdulist, type(None)):
+            # frame was received in memory
+            filename_p = Path('memory.fit')
+        else:
+            filename_p = Path(filename)
 
 
         # clear old data as soon as possible
@@ -324,10 +336,11 @@ class ImageProcessor(object):
 
         ### Open file
         if filename_p.suffix in ['.fit', '.fits']:
-            try:
-                hdulist = fits.open(filename_p)
-            except OSError as e:
-                raise BadImage(str(e)) from e
+            if isinstance(hdulist, type(None)):
+                try:
+                    hdulist = fits.open(filename_p)
+                except OSError as e:
+                    raise BadImage(str(e)) from e
 
             #logger.info('Initial HDU Header = %s', pformat(hdulist[0].header))
             image_bitpix = hdulist[0].header['BITPIX']
@@ -724,6 +737,65 @@ class ImageProcessor(object):
 
 
     def _apply_calibration(self, data, exposure, camera_id, image_bitpix):
+        master_dark = self._get_master_dark(exposure, camera_id, image_bitpix)
+
+
+        if master_dark.shape != data.shape:
+            image_height, image_width = data.shape[:2]  # there might be a 3rd dimension for RGB data
+            dark_height, dark_width = master_dark.shape[:2]
+            logger.error('Dark frame calibration dimensions mismatch - %dx%d vs %dx%d', image_width, image_height, dark_width, dark_height)
+            raise CalibrationNotFound('Dark frame calibration dimension mismatch')
+
+
+        if data.dtype.type == numpy.float32:
+            ### cv2 does not support float32
+            data_calibrated = numpy.subtract(data, master_dark)
+
+            # cutoff values less than 0
+            data_calibrated[data_calibrated < 0] = 0
+        elif data.dtype.type == numpy.uint32:
+            ### cv2 does not support uint32
+            # cast to float so we can deal with negative numbers
+            data_calibrated = numpy.subtract(data.astype(numpy.float32), master_dark)
+
+            # cutoff values less than 0
+            data_calibrated[data_calibrated < 0] = 0
+
+            data_calibrated = data_calibrated.astype(numpy.uint32)
+        else:
+            data_calibrated = cv2.subtract(data, master_dark)
+
+        return data_calibrated
+
+
+    def _get_master_dark(self, exposure, camera_id, image_bitpix):
+        self._calibration_cache.checkVersion(camera_id)
+
+        cache_key = self._calibration_cache.getKey(
+            camera_id,
+            image_bitpix,
+            self.bin_v.value,
+            self.gain_v.value,
+            exposure,
+            self.sensors_temp_av[0],
+            self.config.get('IMAGE_CALIBRATE_BPM'),
+        )
+
+        try:
+            master_dark = self._calibration_cache.get(cache_key)
+        except KeyError:
+            master_dark = self._load_master_dark(cache_key, exposure, camera_id, image_bitpix)
+
+
+        self._calibration_cache.logStats()
+
+        if isinstance(master_dark, type(None)):
+            raise CalibrationNotFound('Dark not found')
+
+        return master_dark
+
+
+    def _load_master_dark(self, cache_key, exposure, camera_id, image_bitpix):
         from astropy.io import fits
 
         if self.config.get('IMAGE_CALIBRATE_BPM'):
@@ -830,20 +902,17 @@ class ImageProcessor(object):
                     self.sensors_temp_av[0],
                 )
 
-                raise CalibrationNotFound('Dark not found')
+                self._calibration_cache.put(cache_key, None, None, None)
+                return None
 
 
+        bpm_id = None
         if bpm_entry:
             p_bpm = Path(bpm_entry.getFilesystemPath())
             if p_bpm.exists():
-                logger.info('Matched bad pixel map: %s', p_bpm)
-                with fits.open(p_bpm) as bpm_f:
-                    bpm = bpm_f[0].data
+                bpm_id = bpm_entry.id
             else:
                 logger.error('Bad Pixel Map missing: %s', bpm_entry.filename)
-                bpm = None
-        else:
-            bpm = None
 
 
         p_dark_frame = Path(dark_frame_entry.getFilesystemPath())
@@ -852,9 +921,25 @@ class ImageProcessor(object):
             raise CalibrationNotFound('Dark file missing: {0:s}'.format(dark_frame_entry.filename))
 
 
+        # another cache key may have already loaded the same frames
+        master_dark = self._calibration_cache.getData(dark_frame_entry.id, bpm_id)
+        if not isinstance(master_dark, type(None)):
+            logger.info('Matched cached dark: %s', p_dark_frame)
+            self._calibration_cache.put(cache_key, dark_frame_entry.id, bpm_id, master_dark)
+            return master_dark
+
+
+        if bpm_id:
+            logger.info('Matched bad pixel map: %s', p_bpm)
+            with fits.open(p_bpm, memmap=False) as bpm_f:
+                bpm = bpm_f[0].data
+        else:
+            bpm = None
+
+
         logger.info('Matched dark: %s', p_dark_frame)
 
-        with fits.open(p_dark_frame) as dark_f:
+        with fits.open(p_dark_frame, memmap=False) as dark_f:
             dark = dark_f[0].data
 
 
@@ -865,32 +950,9 @@ class ImageProcessor(object):
             master_dark = dark
 
 
-        if master_dark.shape != data.shape:
-            image_height, image_width = data.shape[:2]  # there might be a 3rd dimension for RGB data
-            dark_height, dark_width = master_dark.shape[:2]
-            logger.error('Dark frame calibration dimensions mismatch - %dx%d vs %dx%d', image_width, image_height, dark_width, dark_height)
-            raise CalibrationNotFound('Dark frame calibration dimension mismatch')
-
+        self._calibration_cache.put(cache_key, dark_frame_entry.id, bpm_id, master_dark)
 
-        if data.dtype.type == numpy.float32:
-            ### cv2 does not support float32
-            data_calibrated = numpy.subtract(data, master_dark)
-
-            # cutoff values less than 0
-            data_calibrated[data_calibrated < 0] = 0
-        elif data.dtype.type == numpy.uint32:
-            ### cv2 does not support uint32
-            # cast to float so we can deal with negative numbers
-            data_calibrated = numpy.subtract(data.astype(numpy.float32), master_dark)
-
-            # cutoff values less than 0
-            data_calibrated[data_calibrated < 0] = 0
-
-            data_calibrated = data_calibrated.astype(numpy.uint32)
-        else:
-            data_calibrated = cv2.subtract(data, master_dark)
-
-        return data_calibrated
+        return master_dark
 
 
     def calculate_8bit_adu(self):
@@ -1095,6 +1157,17 @@ class ImageProcessor(object):
         self.image = numpy.right_shift(self.image, shift_factor).astype(numpy.uint8)
 
 
+    def transform_image(self):
+        ### rotation, flips, and crop in a single pass
+        transformed_image = self._image_transform.apply(self.image)
+
+        if isinstance(transformed_image, type(None)):
+            return
+
+        self.image = transformed_image
+        return True
+
+
     def rotate_90(self):
         if not self.config.get('IMAGE_ROTATE'):
             return
@@ -1614,9 +1687,9 @@ class ImageProcessor(object):
 
 
         if isinstance(self._overlay, type(None)):
-            self._overlay, self._alpha_mask = self._load_logo_overlay(self.image)
+            self._overlay = self._load_logo_overlay(self.image)
 
-            if isinstance(self._overlay, bool):
+            if not self._overlay:
                 return
 
         elif isinstance(self._overlay, bool):
@@ -1626,7 +1699,8 @@ class ImageProcessor(object):
 
         alpha_start = time.time()
 
-        self.image = (self.image * (1 - self._alpha_mask) + self._overlay * self._alpha_mask).astype(numpy.uint8)
+        # only the visible part of the logo is blended
+        self._overlay.apply(self.image)
 
         alpha_elapsed_s = time.time() - alpha_start
         logger.info('Alpha transparency in %0.4f s', alpha_elapsed_s)
@@ -1741,32 +1815,22 @@ class ImageProcessor(object):
         return numpy.maximum(masked_left, masked_right)
 
 
-    def get_astrometric_data(self):
+    def get_astrometric_data(self, camera_id):
         utcnow = datetime.now(tz=timezone.utc)  # ephem expects UTC dates
         #utcnow = datetime.now(tz=timezone.utc) - timedelta(hours=13)  # testing
 
-        obs = ephem.Observer()
-        obs.lon = math.radians(self.position_av[1])
-        obs.lat = math.radians(self.position_av[0])
-        obs.elevation = self.position_av[2]
-
-
-        # disable atmospheric refraction calcs
-        obs.pressure = 0
-
+        ephemeris = IndiAllSkyEphemeris(self.position_av[0], self.position_av[1], self.position_av[2])
 
-        obs.date = utcnow
+        obs = ephemeris.observer(utcnow)
 
         self.astrometric_data['sidereal_time'] = str(obs.sidereal_time())
 
 
-        sun = ephem.Sun()
-        sun.compute(obs)
+        sun = ephemeris.body('Sun', obs)
         self.astrometric_data['sun_alt'] = math.degrees(sun.alt)
 
 
-        moon = ephem.Moon()
-        moon.compute(obs)
+        moon = ephemeris.body('Moon', obs)
         moon_alt = math.degrees(moon.alt)
         self.astrometric_data['moon_alt'] = moon_alt
         self.astrometric_data['moon_phase'] = moon.moon_phase * 100.0
@@ -1782,103 +1846,30 @@ class ImageProcessor(object):
             self.astrometric_data['moon_up'] = 'No'
 
 
-        obs.date = utcnow  # reset
-        sun.compute(obs)
-
-        try:
-            sun_next_rise = obs.next_rising(sun)
-            self.astrometric_data['sun_next_rise'] = ephem.localtime(sun_next_rise).strftime('%H:%M')
-            self.astrometric_data['sun_next_rise_h'] = (sun_next_rise.datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
-        except ephem.NeverUpError:
-            self.astrometric_data['sun_next_rise'] = '--:--'
-            self.astrometric_data['sun_next_rise_h'] = 0.0
-        except ephem.AlwaysUpError:
-            self.astrometric_data['sun_next_rise'] = '--:--'
-            self.astrometric_data['sun_next_rise_h'] = 0.0
-
-
-        obs.date = utcnow  # reset
-        sun.compute(obs)
-
-        try:
-            sun_next_set = obs.next_setting(sun)
-            self.astrometric_data['sun_next_set'] = ephem.localtime(sun_next_set).strftime('%H:%M')
-            self.astrometric_data['sun_next_set_h'] = (sun_next_set.datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
-        except ephem.NeverUpError:
-            self.astrometric_data['sun_next_set'] = '--:--'
-            self.astrometric_data['sun_next_set_h'] = 0.0
-        except ephem.AlwaysUpError:
-            self.astrometric_data['sun_next_set'] = '--:--'
-            self.astrometric_data['sun_next_set_h'] = 0.0
-
-
-        obs.date = utcnow  # reset
-        sun.compute(obs)
-
-        try:
-            obs.horizon = math.radians(-18.0)
-            sun_next_astro_twilight_rise = obs.next_rising(sun)
-            self.astrometric_data['sun_next_astro_twilight_rise'] = ephem.localtime(sun_next_astro_twilight_rise).strftime('%H:%M')
-            self.astrometric_data['sun_next_astro_twilight_rise_h'] = (sun_next_astro_twilight_rise.datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
-        except ephem.NeverUpError:
-            self.astrometric_data['sun_next_astro_twilight_rise'] = '--:--'
-            self.astrometric_data['sun_next_astro_twilight_rise_h'] = 0.0
-        except ephem.AlwaysUpError:
-            self.astrometric_data['sun_next_astro_twilight_rise'] = '--:--'
-            self.astrometric_data['sun_next_astro_twilight_rise_h'] = 0.0
-
-
-        obs.date = utcnow  # reset
-        sun.compute(obs)
-
-        try:
-            obs.horizon = math.radians(-18.0)
-            sun_next_astro_twilight_set = obs.next_setting(sun)
-            self.astrometric_data['sun_next_astro_twilight_set'] = ephem.localtime(sun_next_astro_twilight_set).strftime('%H:%M')
-            self.astrometric_data['sun_next_astro_twilight_set_h'] = (sun_next_astro_twilight_set.datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
-        except ephem.NeverUpError:
-            self.astrometric_data['sun_next_astro_twilight_set'] = '--:--'
-            self.astrometric_data['sun_next_astro_twilight_set_h'] = 0.0
-        except ephem.AlwaysUpError:
-            self.astrometric_data['sun_next_astro_twilight_set'] = '--:--'
-            self.astrometric_data['sun_next_astro_twilight_set_h'] = 0.0
-
-
-        obs.horizon = math.radians(0.0)  # reset horizon
-        obs.date = utcnow  # reset
-        moon.compute(obs)
-
-        try:
-            moon_next_rise = obs.next_rising(moon)
-            self.astrometric_data['moon_next_rise'] = ephem.localtime(moon_next_rise).strftime('%H:%M')
-            self.astrometric_data['moon_next_rise_h'] = (moon_next_rise.datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
-        except ephem.NeverUpError:
-            self.astrometric_data['moon_next_rise'] = '--:--'
-            self.astrometric_data['moon_next_rise_h'] = 0.0
-        except ephem.AlwaysUpError:
-            self.astrometric_data['moon_next_rise'] = '--:--'
-            self.astrometric_data['moon_next_rise_h'] = 0.0
-
-
-        obs.date = utcnow  # reset
-        moon.compute(obs)
-
-        try:
-            moon_next_set = obs.next_setting(moon)
-            self.astrometric_data['moon_next_set'] = ephem.localtime(moon_next_set).strftime('%H:%M')
-            self.astrometric_data['moon_next_set_h'] = (moon_next_set.datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
-        except ephem.NeverUpError:
-            self.astrometric_data['moon_next_set'] = '--:--'
-            self.astrometric_data['moon_next_set_h'] = 0.0
-        except ephem.AlwaysUpError:
-            self.astrometric_data['moon_next_set'] = '--:--'
-            self.astrometric_data['moon_next_set_h'] = 0.0
-
-
-        obs.date = utcnow  # reset
+        # rise and set times are cached until they pass
+        event_list = (
+            ('sun_next_rise', ephemeris.nextRising, 'Sun', 0.0),
+            ('sun_next_set', ephemeris.nextSetting, 'Sun', 0.0),
+            ('sun_next_astro_twilight_rise', ephemeris.nextRising, 'Sun', -18.0),
+            ('sun_next_astro_twilight_set', ephemeris.nextSetting, 'Sun', -18.0),
+            ('moon_next_rise', ephemeris.nextRising, 'Moon', 0.0),
+            ('moon_next_set', ephemeris.nextSetting, 'Moon', 0.0),
+        )
 
-        mercury = ephem.Mercury()
-        mercury.compute(obs)
+        for key, event_func, body_name, horizon in event_list:
+            try:
+                event_date = event_func(body_name, utcnow, horizon=horizon)
+                self.astrometric_data[key] = ephem.localtime(event_date).strftime('%H:%M')
+                self.astrometric_data['{0:s}_h'.format(key)] = (event_date.datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
+            except ephem.NeverUpError:
+                self.astrometric_data[key] = '--:--'
+                self.astrometric_data['{0:s}_h'.format(key)] = 0.0
+            except ephem.AlwaysUpError:
+                self.astrometric_data[key] = '--:--'
+                self.astrometric_data['{0:s}_h'.format(key)] = 0.0
+
+
+        mercury = ephemeris.body('Mercury', obs)
         mercury_alt = math.degrees(mercury.alt)
         self.astrometric_data['mercury_alt'] = mercury_alt
 
@@ -1888,8 +1879,7 @@ class ImageProcessor(object):
             self.astrometric_data['mercury_up'] = 'No'
 
 
-        venus = ephem.Venus()
-        venus.compute(obs)
+        venus = ephemeris.body('Venus', obs)
         venus_alt = math.degrees(venus.alt)
         self.astrometric_data['venus_alt'] = venus_alt
         self.astrometric_data['venus_phase'] = venus.phase
@@ -1900,8 +1890,7 @@ class ImageProcessor(object):
             self.astrometric_data['venus_up'] = 'No'
 
 
-        mars = ephem.Mars()
-        mars.compute(obs)
+        mars = ephemeris.body('Mars', obs)
         mars_alt = math.degrees(mars.alt)
         self.astrometric_data['mars_alt'] = mars_alt
 
@@ -1911,8 +1900,7 @@ class ImageProcessor(object):
             self.astrometric_data['mars_up'] = 'No'
 
 
-        jupiter = ephem.Jupiter()
-        jupiter.compute(obs)
+        jupiter = ephemeris.body('Jupiter', obs)
         jupiter_alt = math.degrees(jupiter.alt)
         self.astrometric_data['jupiter_alt'] = jupiter_alt
 
@@ -1922,8 +1910,7 @@ class ImageProcessor(object):
             self.astrometric_data['jupiter_up'] = 'No'
 
 
-        saturn = ephem.Saturn()
-        saturn.compute(obs)
+        saturn = ephemeris.body('Saturn', obs)
         saturn_alt = math.degrees(saturn.alt)
         self.astrometric_data['saturn_alt'] = saturn_alt
 
@@ -1937,102 +1924,47 @@ class ImageProcessor(object):
         self.astrometric_data['sun_moon_sep'] = abs((ephem.separation(moon, sun) / (math.pi / 180)) - 180)
 
 
-        # satellites
-        satellite_data = self.populateSatelliteData()
-
-        iss = satellite_data.get('iss')
-        if iss:
-            iss.compute(obs)
+        # satellites, TLE data is cached until it is updated
+        satellite_data = ephemeris.satellites(self.satellite_dict)
 
-            iss_alt = math.degrees(iss.alt)
-            self.astrometric_data['iss_alt'] = iss_alt
+        satellite_pass = IndiAllskySatellitePassPredictor(self.config)
+        passes_current = satellite_pass.passesCurrent(camera_id, utcnow)
 
-            if iss_alt >= 0:
-                self.astrometric_data['iss_up'] = '{0:0.0f}°'.format(iss_alt)
-            else:
-                self.astrometric_data['iss_up'] = 'No'
-
-            try:
-                iss_next_pass = obs.next_pass(iss)
-                self.astrometric_data['iss_next_h'] = (iss_next_pass[0].datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
-                self.astrometric_data['iss_next_alt'] = math.degrees(iss_next_pass[3])
-            except ValueError as e:
-                logger.error('ISS next pass error: %s', str(e))
-                self.astrometric_data['iss_next_h'] = 0.0
-                self.astrometric_data['iss_next_alt'] = 0.0
-
-
-        hst = satellite_data.get('hst')
-        if hst:
-            hst.compute(obs)
-
-            hst_alt = math.degrees(hst.alt)
-            self.astrometric_data['hst_alt'] = hst_alt
-
-            if hst_alt >= 0:
-                self.astrometric_data['hst_up'] = '{0:0.0f}°'.format(hst_alt)
-            else:
-                self.astrometric_data['hst_up'] = 'No'
-
-            try:
-                hst_next_pass = obs.next_pass(hst)
-                self.astrometric_data['hst_next_h'] = (hst_next_pass[0].datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
-                self.astrometric_data['hst_next_alt'] = math.degrees(hst_next_pass[3])
-            except ValueError as e:
-                logger.error('HST next pass error: %s', str(e))
-                self.astrometric_data['hst_next_h'] = 0.0
-                self.astrometric_data['hst_next_alt'] = 0.0
-
-
-        tiangong = satellite_data.get('tiangong')
-        if tiangong:
-            tiangong.compute(obs)
+        for sat_key, sat in satellite_data.items():
+            sat.compute(obs)
 
-            tiangong_alt = math.degrees(tiangong.alt)
-            self.astrometric_data['tiangong_alt'] = tiangong_alt
+            sat_alt = math.degrees(sat.alt)
+            self.astrometric_data['{0:s}_alt'.format(sat_key)] = sat_alt
 
-            if tiangong_alt >= 0:
-                self.astrometric_data['tiangong_up'] = '{0:0.0f}°'.format(tiangong_alt)
+            if sat_alt >= 0:
+                self.astrometric_data['{0:s}_up'.format(sat_key)] = '{0:0.0f}°'.format(sat_alt)
             else:
-                self.astrometric_data['tiangong_up'] = 'No'
-
-            try:
-                tiangong_next_pass = obs.next_pass(tiangong)
-                self.astrometric_data['tiangong_next_h'] = (tiangong_next_pass[0].datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
-                self.astrometric_data['tiangong_next_alt'] = math.degrees(tiangong_next_pass[3])
-            except ValueError as e:
-                logger.error('TIANGONG next pass error: %s', str(e))
-                self.astrometric_data['tiangong_next_h'] = 0.0
-                self.astrometric_data['tiangong_next_alt'] = 0.0
-
-
-    def populateSatelliteData(self):
-        satellite_data = dict()
-
-        for sat_key, sat_data in self.satellite_dict.items():
-            # there may be multiple satellites of the same name, usually pieces of the same rocket
-            sat_entry = IndiAllSkyDbTleDataTable.query\
-                .filter(IndiAllSkyDbTleDataTable.group == sat_data['group'])\
-                .filter(IndiAllSkyDbTleDataTable.title == sat_data['title'])\
-                .order_by(IndiAllSkyDbTleDataTable.id.desc())\
-                .first()
-
+                self.astrometric_data['{0:s}_up'.format(sat_key)] = 'No'
+
+            if passes_current:
+                # next passes are precomputed by the satellite pass predictor
+                sat_next_pass = IndiAllSkyDbSatellitePassTable.query\
+                    .filter(IndiAllSkyDbSatellitePassTable.camera_id == camera_id)\
+                    .filter(IndiAllSkyDbSatellitePassTable.title == self.satellite_dict[sat_key]['title'])\
+                    .filter(IndiAllSkyDbSatellitePassTable.rise >= utcnow.replace(tzinfo=None))\
+                    .order_by(IndiAllSkyDbSatellitePassTable.rise.asc())\
+                    .first()
 
-            if not sat_entry:
-                logger.warning('Satellite data not found: %s', sat_data['title'])
-                continue
+                if sat_next_pass:
+                    self.astrometric_data['{0:s}_next_h'.format(sat_key)] = (sat_next_pass.rise - utcnow.replace(tzinfo=None)).total_seconds() / 3600
+                    self.astrometric_data['{0:s}_next_alt'.format(sat_key)] = sat_next_pass.transit_alt
+                    continue
 
-            #logger.info('Found satellite data: %s', sat_name)
 
+            # passes have not been predicted
             try:
-                sat = ephem.readtle(sat_entry.title, sat_entry.line1, sat_entry.line2)
+                sat_next_pass = ephemeris.nextPass(sat, utcnow)
+                self.astrometric_data['{0:s}_next_h'.format(sat_key)] = (sat_next_pass[0].datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
+                self.astrometric_data['{0:s}_next_alt'.format(sat_key)] = math.degrees(sat_next_pass[3])
             except ValueError as e:
-                logger.error('Satellite TLE data error: %s', str(e))
-                continue
-
-            satellite_data[sat_key] = sat
-
-        return satellite_data
+                logger.error('%s next pass error: %s', sat_key.upper(), str(e))
+                self.astrometric_data['{0:s}_next_h'.format(sat_key)] = 0.0
+                self.astrometric_data['{0:s}_next_alt'.format(sat_key)] = 0.0
 
 
     def get_image_label(self, i_ref, adsb_aircraft_list):
@@ -2244,7 +2176,7 @@ class ImageProcessor(object):
 
 
         # satellite tracking lines
-        satellite_tracking_lines = self.get_satellite_tracking_text()
+        satellite_tracking_lines = self.get_satellite_tracking_text(i_ref.camera_id)
         if satellite_tracking_lines:
             logger.info('Adding satellite text')
 
@@ -2426,8 +2358,7 @@ class ImageProcessor(object):
 
 
     def _label_image_pillow(self, i_ref, adsb_aircraft_list):
-        img_rgb = Image.fromarray(cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB))
-        image_width, image_height  = img_rgb.size  # backwards from opencv
+        image_height, image_width = self.image.shape[:2]
 
 
         if self.config['TEXT_PROPERTIES']['PIL_FONT_FILE'] == 'custom':
@@ -2436,16 +2367,13 @@ class ImageProcessor(object):
             pillow_font_file_p = self.font_path.joinpath(self.config['TEXT_PROPERTIES']['PIL_FONT_FILE'])
 
 
-        draw = ImageDraw.Draw(img_rgb)
-
-
         # Disabled when focus mode is enabled
         if self.focus_mode:
             logger.warning('Focus mode enabled, labels disabled')
 
             # indicate focus mode is enabled in indi-allsky
             self.drawText_pillow(
-                draw,
+                self.image,
                 'Focus Mode',
                 pillow_font_file_p,
                 self.text_size_pillow,
@@ -2456,7 +2384,7 @@ class ImageProcessor(object):
 
             self.text_xy = [image_width - 300, image_height - (self.text_font_height * 2)]
             self.drawText_pillow(
-                draw,
+                self.image,
                 i_ref.exp_date.strftime('%H:%M:%S'),
                 pillow_font_file_p,
                 self.text_size_pillow,
@@ -2465,9 +2393,6 @@ class ImageProcessor(object):
                 anchor=self.text_anchor_pillow,
             )
 
-            # convert back to numpy array
-            self.image = cv2.cvtColor(numpy.array(img_rgb), cv2.COLOR_RGB2BGR)
-
             return
 
 
@@ -2481,7 +2406,7 @@ class ImageProcessor(object):
 
 
             self.drawText_pillow(
-                draw,
+                self.image,
                 line,
                 pillow_font_file_p,
                 self.text_size_pillow,
@@ -2493,12 +2418,9 @@ class ImageProcessor(object):
             self._text_next_line()
 
 
-        # convert back to numpy array
-        self.image = cv2.cvtColor(numpy.array(img_rgb), cv2.COLOR_RGB2BGR)
-
-
-    def drawText_pillow(self, draw, text, font_file, font_size, pt, color_rgb, anchor='la'):
-        font = ImageFont.truetype(str(font_file), font_size)
+    def drawText_pillow(self, image, text, font_file, font_size, pt, color_rgb, anchor='la'):
+        # text is rendered to a tile the size of the text and only that region of the image is updated
+        font = IndiAllSkyOverlayLayer.getFont(font_file, font_size)
 
         if self.config['TEXT_PROPERTIES']['FONT_OUTLINE']:
             # black outline
@@ -2506,16 +2428,18 @@ class ImageProcessor(object):
         else:
             stroke_width = 0
 
-        draw.text(
-            pt,
+        text_layer = IndiAllSkyOverlayLayer.fromText(
             text,
-            fill=color_rgb,
-            font=font,
+            font,
+            pt,
+            color_rgb,
             stroke_width=stroke_width,
-            stroke_fill=(0, 0, 0),
             anchor=anchor,
         )
 
+        if text_layer:
+            text_layer.apply(image)
+
 
     def get_extra_text(self):
         if not self.config.get('IMAGE_EXTRA_TEXT'):
@@ -2606,7 +2530,7 @@ class ImageProcessor(object):
         return aircraft_lines
 
 
-    def get_satellite_tracking_text(self):
+    def get_satellite_tracking_text(self, camera_id):
         if not self.config.get('SATELLITE_TRACK', {}).get('ENABLE'):
             return list()
 
@@ -2636,13 +2560,6 @@ class ImageProcessor(object):
         obs.date = utcnow
 
 
-        # there may be multiple satellites of the same name, usually pieces of the same rocket
-        sat_entries = IndiAllSkyDbTleDataTable.query\
-            .filter(IndiAllSkyDbTleDataTable.group == constants.SATELLITE_VISUAL)\
-            .order_by(IndiAllSkyDbTleDataTable.id.desc())\
-            .limit(300)  # 300 is a sanity check
-
-
         satellite_lines = []
 
         for line in self.config.get('SATELLITE_TRACK', {}).get('IMAGE_LABEL_TEMPLATE_PREFIX', '').splitlines():
@@ -2654,8 +2571,50 @@ class ImageProcessor(object):
         satellite_tmpl = self.config.get('SATELLITE_TRACK', {}).get('SAT_LABEL_TEMPLATE', '')
 
 
+        # there may be multiple satellites of the same name, usually pieces of the same rocket
+        sat_entries = IndiAllSkyDbTleDataTable.query\
+            .filter(IndiAllSkyDbTleDataTable.group == constants.SATELLITE_VISUAL)\
+            .order_by(IndiAllSkyDbTleDataTable.id.desc())
+
+
+        satellite_pass = IndiAllskySatellitePassPredictor(self.config)
+
+        if satellite_pass.passesCurrent(camera_id, utcnow):
+            # only the satellites with a sunlit pass in progress are computed
+            current_passes = IndiAllSkyDbSatellitePassTable.query\
+                .filter(IndiAllSkyDbSatellitePassTable.camera_id == camera_id)\
+                .filter(IndiAllSkyDbSatellitePassTable.rise <= utcnow.replace(tzinfo=None))\
+                .filter(IndiAllSkyDbSatellitePassTable.set >= utcnow.replace(tzinfo=None))\
+                .filter(IndiAllSkyDbSatellitePassTable.transit_alt >= alt_deg_min)\
+                .filter(IndiAllSkyDbSatellitePassTable.sunlit_start != sa_null())
+
+            current_satnum_set = set()
+            current_title_set = set()
+            for sat_pass in current_passes:
+                current_satnum_set.add(sat_pass.satnum)
+                current_title_set.add(sat_pass.title)
+
+            sat_entries = sat_entries\
+                .filter(IndiAllSkyDbTleDataTable.title.in_(current_title_set))
+        else:
+            # passes have not been predicted, compute every satellite
+            current_satnum_set = None
+
+
+        sat_entries = sat_entries\
+            .limit(300)  # 300 is a sanity check
+
+
         sat_list = list()
         for sat_entry in sat_entries:
+            if not isinstance(current_satnum_set, type(None)):
+                try:
+                    if int(sat_entry.line1[2:7]) not in current_satnum_set:
+                        continue
+                except ValueError:
+                    logger.error('Satellite TLE catalog number error: %s', sat_entry.title)
+                    continue
+
 
             try:
                 sat = ephem.readtle(sat_entry.title, sat_entry.line1, sat_entry.line2)
@@ -2797,6 +2756,19 @@ class ImageProcessor(object):
         self.image = stretched_image
 
 
+    def fish2pano_map(self):
+        fish2pano_start = time.time()
+
+        # same projection as fish2pano_module() using a cached remap table
+        img_pano = self._panorama_map.apply(self.image)
+
+        fish2pano_elapsed_s = time.time() - fish2pano_start
+        logger.info('Panorama in %0.4f s', fish2pano_elapsed_s)
+
+        # original image not replaced
+        return img_pano
+
+
     def fish2pano_module(self):
         import fish2pano
 
@@ -2964,7 +2936,8 @@ class ImageProcessor(object):
 
 
     def fish2pano(self):
-        return self.fish2pano_module()
+        return self.fish2pano_map()
+        #return self.fish2pano_module()
         #return self.fish2pano_warpPolar()
 
 
@@ -3073,7 +3046,7 @@ class ImageProcessor(object):
 
         if not logo_overlay:
             logger.warning('No logo overlay defined')
-            return None, None
+            return None
 
 
         logo_overlay_p = Path(logo_overlay)
@@ -3081,45 +3054,44 @@ class ImageProcessor(object):
         try:
             if not logo_overlay_p.exists():
                 logger.error('%s does not exist', logo_overlay_p)
-                return None, None
+                return None
 
 
             if not logo_overlay_p.is_file():
                 logger.error('%s is not a file', logo_overlay_p)
-                return None, None
+                return None
 
         except PermissionError as e:
             logger.error(str(e))
-            return None, None
+            return None
 
         overlay_img = cv2.imread(str(logo_overlay_p), cv2.IMREAD_UNCHANGED)
         if isinstance(overlay_img, type(None)):
             logger.error('%s is not a valid image', logo_overlay_p)
-            return False, None  # False so the image is not retried
+            return False  # False so the image is not retried
 
 
         if overlay_img.shape[:2] != image.shape[:2]:
             logger.error('Logo dimensions do not match image')
-            return False, None  # False so the image is not retried
+            return False  # False so the image is not retried
 
 
         try:
             if overlay_img.shape[2] != 4:
                 logger.error('%s does not have an alpha channel')
-                return False, None  # False so the image is not retried
+                return False  # False so the image is not retried
         except IndexError:
             logger.error('%s does not have an alpha channel')
-            return False, None  # False so the image is not retried
-
-
-        overlay_bgr = overlay_img[:, :, :3]
-        overlay_alpha = (overlay_img[:, :, 3] / 255).astype(numpy.float32)
+            return False  # False so the image is not retried
 
 
-        alpha_mask = numpy.dstack((overlay_alpha, overlay_alpha, overlay_alpha))
+        overlay_layer = IndiAllSkyOverlayLayer.fromBgra(overlay_img)
+        if not overlay_layer:
+            logger.error('%s is fully transparent', logo_overlay_p)
+            return False  # False so the image is not retried
 
 
-        return overlay_bgr, alpha_mask
+        return overlay_layer
 
 
     def _generateAduMask(self, img):
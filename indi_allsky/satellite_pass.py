@@ -0,0 +1,265 @@
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+import math
+import time
+import logging
+
+import ephem
+
+from sqlalchemy.orm.exc import NoResultFound
+
+from . import constants
+
+from .flask import db
+from .flask.miscDb import miscDb
+from .flask.models import IndiAllSkyDbTleDataTable
+from .flask.models import IndiAllSkyDbSatellitePassTable
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllskySatellitePassPredictor(object):
+    """Precompute satellite passes for a camera location
+
+    The pass table is rebuilt when the TLE data or the camera location
+    changes, otherwise expired passes are removed and new passes are added
+    when less than window_min_hours remain.
+    """
+
+    groups = (constants.SATELLITE_VISUAL,)
+
+    # passes are predicted this far ahead
+    window_hours = 48
+
+    # roll the table forward when less than this remains
+    window_min_hours = 24
+
+    # passes in progress are included when the table is rebuilt
+    rebuild_lookback_minutes = 60
+
+    # eclipse transitions are found to this resolution
+    sunlit_step = 10  # seconds
+
+
+    def __init__(self, config):
+        self.config = config
+
+        self._miscDb = miscDb(self.config)
+
+
+    def update(self, camera):
+        utcnow = datetime.now(tz=timezone.utc)
+        now = utcnow.replace(tzinfo=None)
+
+
+        tle_version = db.session.query(db.func.max(IndiAllSkyDbTleDataTable.id)).scalar()
+        if not tle_version:
+            logger.warning('No satellite data, not predicting passes')
+            return
+
+
+        location = '{0:0.4f},{1:0.4f},{2:d}'.format(camera.latitude, camera.longitude, int(camera.elevation or 0))
+
+
+        tle_key = 'SATELLITE_PASS_TLE_{0:d}'.format(camera.id)
+        location_key = 'SATELLITE_PASS_LOCATION_{0:d}'.format(camera.id)
+        end_key = 'SATELLITE_PASS_END_{0:d}'.format(camera.id)
+
+        try:
+            state_tle_version = int(self._miscDb.getState(tle_key))
+            state_location = self._miscDb.getState(location_key)
+            state_end = datetime.fromtimestamp(float(self._miscDb.getState(end_key)), tz=timezone.utc).replace(tzinfo=None)
+        except NoResultFound:
+            state_tle_version = None
+            state_location = None
+            state_end = None
+
+
+        if state_tle_version != tle_version or state_location != location:
+            logger.warning('Rebuilding satellite pass table for camera %d', camera.id)
+
+            IndiAllSkyDbSatellitePassTable.query\
+                .filter(IndiAllSkyDbSatellitePassTable.camera_id == camera.id)\
+                .delete()
+
+            start = now - timedelta(minutes=self.rebuild_lookback_minutes)
+        else:
+            IndiAllSkyDbSatellitePassTable.query\
+                .filter(IndiAllSkyDbSatellitePassTable.camera_id == camera.id)\
+                .filter(IndiAllSkyDbSatellitePassTable.set < now)\
+                .delete()
+
+            if state_end - now > timedelta(hours=self.window_min_hours):
+                db.session.commit()
+                logger.info('Satellite pass table for camera %d is current until %s', camera.id, state_end)
+                return
+
+            # passes that rise before the end of the table were stored whole
+            start = state_end
+
+
+        end = now + timedelta(hours=self.window_hours)
+
+
+        obs = ephem.Observer()
+        obs.lat = math.radians(camera.latitude)
+        obs.lon = math.radians(camera.longitude)
+        obs.elevation = camera.elevation or 0
+
+        # disable atmospheric refraction calcs
+        obs.pressure = 0
+
+
+        sat_entries = IndiAllSkyDbTleDataTable.query\
+            .filter(IndiAllSkyDbTleDataTable.group.in_(self.groups))\
+            .order_by(IndiAllSkyDbTleDataTable.id.asc())
+
+
+        predict_start = time.time()
+
+        pass_list = list()
+        satnum_set = set()
+        for sat_entry in sat_entries:
+            try:
+                satnum = int(sat_entry.line1[2:7])
+            except ValueError:
+                logger.error('Satellite TLE catalog number error: %s', sat_entry.title)
+                continue
+
+
+            # a satellite may be listed in multiple groups
+            if satnum in satnum_set:
+                continue
+
+            satnum_set.add(satnum)
+
+
+            try:
+                sat = ephem.readtle(sat_entry.title, sat_entry.line1, sat_entry.line2)
+            except ValueError as e:
+                logger.error('Satellite TLE data error: %s', str(e))
+                continue
+
+
+            for sat_pass in self.predictPasses(obs, sat, start, end):
+                sat_pass['title'] = sat_entry.title
+                sat_pass['satnum'] = satnum
+                sat_pass['group'] = sat_entry.group
+                sat_pass['camera_id'] = camera.id
+
+                if sat_pass['set'] < now:
+                    continue
+
+                pass_list.append(sat_pass)
+
+
+        db.session.bulk_insert_mappings(IndiAllSkyDbSatellitePassTable, pass_list)
+        db.session.commit()
+
+
+        self._miscDb.setState(tle_key, tle_version)
+        self._miscDb.setState(location_key, location)
+        self._miscDb.setState(end_key, end.replace(tzinfo=timezone.utc).timestamp())
+
+
+        predict_elapsed_s = time.time() - predict_start
+        logger.warning('Predicted %d satellite passes for camera %d in %0.1f s', len(pass_list), camera.id, predict_elapsed_s)
+
+
+    def passesCurrent(self, camera_id, utcnow):
+        ### Returns True if the pass table was predicted from the current TLE data and covers now
+        tle_version = db.session.query(db.func.max(IndiAllSkyDbTleDataTable.id)).scalar()
+        if not tle_version:
+            return False
+
+
+        try:
+            state_tle_version = int(self._miscDb.getState('SATELLITE_PASS_TLE_{0:d}'.format(camera_id)))
+            state_end = float(self._miscDb.getState('SATELLITE_PASS_END_{0:d}'.format(camera_id)))
+        except NoResultFound:
+            return False
+
+
+        if state_tle_version != tle_version:
+            return False
+
+        if state_end < utcnow.timestamp():
+            return False
+
+        return True
+
+
+    def predictPasses(self, obs, sat, start, end):
+        ### Yields the passes that rise between start and end
+        obs.date = start
+        end_date = ephem.Date(end)
+
+        while True:
+            try:
+                rise_t, rise_az, transit_t, transit_alt, set_t, set_az = obs.next_pass(sat)
+            except ValueError as e:
+                # never rises or never sets
+                logger.info('%s next pass error: %s', sat.name, str(e))
+                return
+            except RuntimeError as e:
+                # decayed orbits
+                logger.info('%s next pass error: %s', sat.name, str(e))
+                return
+
+
+            if isinstance(set_t, type(None)):
+                return
+
+
+            if isinstance(rise_t, type(None)) or isinstance(transit_t, type(None)):
+                # partial pass
+                obs.date = ephem.Date(set_t + ephem.minute)
+                continue
+
+
+            if rise_t > end_date:
+                return
+
+
+            sunlit_start, sunlit_end = self.sunlitInterval(obs, sat, rise_t, set_t)
+
+
+            yield {
+                'rise'          : rise_t.datetime(),
+                'rise_az'       : math.degrees(rise_az),
+                'transit'       : transit_t.datetime(),
+                'transit_alt'   : math.degrees(transit_alt),
+                'set'           : set_t.datetime(),
+                'set_az'        : math.degrees(set_az),
+                'sunlit_start'  : sunlit_start,
+                'sunlit_end'    : sunlit_end,
+            }
+
+
+            obs.date = ephem.Date(set_t + ephem.minute)
+
+
+    def sunlitInterval(self, obs, sat, rise_t, set_t):
+        ### Returns the first and last sunlit times of the pass, a pass usually crosses the shadow once at most
+        sunlit_start = None
+        sunlit_end = None
+
+        step = self.sunlit_step * ephem.second
+
+        t = rise_t
+        while t <= set_t:
+            obs.date = t
+            sat.compute(obs)
+
+            if not sat.eclipsed:
+                if isinstance(sunlit_start, type(None)):
+                    sunlit_start = ephem.Date(t).datetime()
+
+                sunlit_end = ephem.Date(t).datetime()
+
+            t += step
+
+
+        return sunlit_start, sunlit_end
@@ -3,7 +3,7 @@ import signal
 import traceback
 import logging
 
-#from threading import Thread
+from threading import Thread
 import queue
 #import threading
 
@@ -51,7 +51,10 @@ class SensorWorker(Process):
         self.dew_heater = None
         self.fan = None
         self.sensors = [None, None, None]
+        self.sensor_schedules = list()
+        self.sensor_shutdown_timeout = 5.0  # seconds to wait for running updates on shutdown
 
+        # dew heater and fan control
         self.next_run = time.time()  # run immediately
         self.next_run_offset = 15
 
@@ -137,6 +140,7 @@ class SensorWorker(Process):
 
         self.init_sensors()  # sensors before dew heater and fan
         self.update_sensors()
+        self.wait_sensors(15.0)
 
         self.init_gpio()
         self.init_dew_heater()
@@ -161,6 +165,9 @@ class SensorWorker(Process):
             if self._shutdown:
                 logger.warning('Goodbye')
 
+                # stalled updates are daemon threads and do not block the exit
+                self.wait_sensors(self.sensor_shutdown_timeout, start=False)
+
                 # deinit devices
                 self.gpio.deinit()
                 self.fan.deinit()
@@ -169,6 +176,10 @@ class SensorWorker(Process):
                 return
 
 
+            # sensors are updated on their own schedules
+            self.update_sensors()
+
+
             now = time.time()
             if not now >= self.next_run:
                 continue
@@ -187,9 +198,6 @@ class SensorWorker(Process):
                 self.night_day_change()
 
 
-            self.update_sensors()
-
-
             if self.sensors_user_av[2]:
                 logger.info('Dew Point: %0.1f, Frost Point: %0.1f, Heat Index: %0.1f', self.sensors_user_av[2], self.sensors_user_av[3], self.sensors_user_av[5])
 
@@ -454,37 +462,90 @@ class SensorWorker(Process):
         self.sensors[2].slot = constants.SENSOR_INDEX_MAP[sensor_2_key]
 
 
-    def update_sensors(self):
-        # update sensor readings
-        for sensor in self.sensors:
-            try:
-                sensor_data = sensor.update()
+        # slow sensors do not delay the others or the dew heater and fan
+        self.sensor_schedules = [SensorSchedule(sensor) for sensor in self.sensors]
 
-                with self.sensors_user_av.get_lock():
-                    if sensor_data.get('dew_point'):
-                        self.sensors_user_av[2] = float(sensor_data['dew_point'])
 
-                    if sensor_data.get('frost_point'):
-                        self.sensors_user_av[3] = float(sensor_data['frost_point'])
+    def update_sensors(self, start=True):
+        # collect finished sensor updates and start the ones that are due
+        now = time.time()
 
-                    if sensor_data.get('heat_index'):
-                        self.sensors_user_av[5] = float(sensor_data['heat_index'])
+        for schedule in self.sensor_schedules:
+            if schedule.future:
+                if not schedule.future.done():
+                    schedule.checkTimeout(now)
+                    continue
 
-                    if sensor_data.get('wind_degrees'):
-                        self.sensors_user_av[6] = float(sensor_data['wind_degrees'])
+                self.finish_sensor_update(schedule, now)
 
-                    if sensor_data.get('sqm_mag'):
-                        self.sensors_user_av[7] = float(sensor_data['sqm_mag'])
 
+            schedule.checkStale(now)
 
-                    for i, v in enumerate(sensor_data['data']):
-                        self.sensors_user_av[sensor.slot + i] = float(v)
-            except SensorReadException as e:
-                logger.error('SensorReadException: {0:s}'.format(str(e)))
-            except OSError as e:
-                logger.error('Sensor OSError: {0:s}'.format(str(e)))
-            except IOError as e:
-                logger.error('Sensor IOError: {0:s}'.format(str(e)))
+            if not start:
+                continue
+
+            if now >= schedule.next_run:
+                schedule.future = SensorUpdateThread(schedule.sensor)
+                schedule.future.start()
+                schedule.start_time = now
+
+
+    def wait_sensors(self, timeout, start=True):
+        # wait for the running sensor updates to finish
+        wait_end = time.time() + timeout
+
+        while time.time() < wait_end:
+            if not [s for s in self.sensor_schedules if s.future and not s.future.done()]:
+                break
+
+            time.sleep(0.1)
+
+        self.update_sensors(start=start)
+
+
+    def finish_sensor_update(self, schedule, now):
+        sensor = schedule.sensor
+        future = schedule.future
+        schedule.future = None
+
+        try:
+            sensor_data = future.result()
+        except SensorReadException as e:
+            logger.error('SensorReadException: {0:s}'.format(str(e)))
+            schedule.failed(now)
+            return
+        except OSError as e:
+            logger.error('Sensor OSError: {0:s}'.format(str(e)))
+            schedule.failed(now)
+            return
+        except IOError as e:
+            logger.error('Sensor IOError: {0:s}'.format(str(e)))
+            schedule.failed(now)
+            return
+
+
+        schedule.succeeded(now)
+
+        # values in the shared arrays are kept until the next good reading
+        with self.sensors_user_av.get_lock():
+            if sensor_data.get('dew_point'):
+                self.sensors_user_av[2] = float(sensor_data['dew_point'])
+
+            if sensor_data.get('frost_point'):
+                self.sensors_user_av[3] = float(sensor_data['frost_point'])
+
+            if sensor_data.get('heat_index'):
+                self.sensors_user_av[5] = float(sensor_data['heat_index'])
+
+            if sensor_data.get('wind_degrees'):
+                self.sensors_user_av[6] = float(sensor_data['wind_degrees'])
+
+            if sensor_data.get('sqm_mag'):
+                self.sensors_user_av[7] = float(sensor_data['sqm_mag'])
+
+
+            for i, v in enumerate(sensor_data['data']):
+                self.sensors_user_av[sensor.slot + i] = float(v)
 
 
     def check_dew_heater_thresholds(self):
@@ -580,3 +641,111 @@ class SensorWorker(Process):
             self.set_fan(self.fan_level_default)
             #self.set_fan(0)
 
+
+class SensorSchedule(object):
+    """Update schedule and state for a sensor in SensorWorker
+
+    Failed updates are retried with an exponential backoff.  Updates that run
+    past the sensor timeout are reported, but a new update is not started
+    until the running one returns.
+    """
+
+    # maximum seconds between retries of a failing sensor
+    backoff_max = 600
+
+    # readings older than this many update intervals are reported as stale
+    stale_intervals = 4
+
+
+    def __init__(self, sensor):
+        self.sensor = sensor
+
+        self.future = None
+        self.start_time = 0
+        self.next_run = time.time()  # run immediately
+
+        self.failures = 0
+        self.last_update = time.time()
+
+        self._timeout_reported = False
+        self._stale_reported = False
+
+
+    def succeeded(self, now):
+        if self._stale_reported:
+            logger.warning('[%s] Sensor updated after %0.0fs', self.sensor.name, now - self.last_update)
+
+        self.failures = 0
+        self.last_update = now
+        self.next_run = self.start_time + self.sensor.update_interval
+
+        self._timeout_reported = False
+        self._stale_reported = False
+
+
+    def failed(self, now):
+        self.failures += 1
+
+        backoff = min(self.sensor.update_interval * (2 ** self.failures), self.backoff_max)
+        self.next_run = now + backoff
+
+        self._timeout_reported = False
+
+        logger.warning('[%s] Sensor update failed %d times, retrying in %ds', self.sensor.name, self.failures, backoff)
+
+
+    def checkTimeout(self, now):
+        if self._timeout_reported:
+            return
+
+        if now - self.start_time < self.sensor.update_timeout:
+            return
+
+        logger.error('[%s] Sensor update has not returned in %0.0fs', self.sensor.name, now - self.start_time)
+        self._timeout_reported = True
+
+
+    def checkStale(self, now):
+        if self._stale_reported:
+            return
+
+        if now - self.last_update < self.sensor.update_interval * self.stale_intervals:
+            return
+
+        logger.warning('[%s] Sensor values have not been updated in %0.0fs', self.sensor.name, now - self.last_update)
+        self._stale_reported = True
+
+
+class SensorUpdateThread(Thread):
+    """Runs a single sensor update
+
+    Daemon threads are used so an update that never returns does not keep
+    the SensorWorker process from exiting.  done() and result() match the
+    Future interface used by SensorSchedule.
+    """
+
+    def __init__(self, sensor):
+        super(SensorUpdateThread, self).__init__(name='SensorUpdate-{0:s}'.format(str(sensor.name)), daemon=True)
+
+        self.sensor = sensor
+
+        self._result = None
+        self._exception = None
+
+
+    def run(self):
+        try:
+            self._result = self.sensor.update()
+        except Exception as e:
+            self._exception = e
+
+
+    def done(self):
+        return not self.is_alive()
+
+
+    def result(self):
+        if self._exception:
+            raise self._exception
+
+        return self._result
@@ -0,0 +1,157 @@
+from multiprocessing import shared_memory
+from multiprocessing import Array
+import numpy
+import logging
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllSkySharedFrameBuffer(object):
+    """Ring buffer of shared memory slots used to pass raw frames from the camera client to the image worker
+
+    The buffer is created in the main process before the workers are forked.
+    Only the slot metadata passes through the image queue.
+    """
+
+    # structural keywords are regenerated when the FITS container is rebuilt
+    skip_header_keywords = ('SIMPLE', 'BITPIX', 'NAXIS', 'NAXIS1', 'NAXIS2', 'NAXIS3', 'EXTEND', 'BZERO', 'BSCALE')
+
+
+    def __init__(self, slots, slot_size):
+        self.slot_size = int(slot_size)
+
+        self._shm_list = list()
+
+        for x in range(int(slots)):
+            # pages are not allocated until they are written
+            shm = shared_memory.SharedMemory(create=True, size=self.slot_size)
+            self._shm_list.append(shm)
+
+
+        # 0 = free, 1 = in use
+        self._slot_state_a = Array('i', [0 for x in range(len(self._shm_list))])
+
+        # incremented when a slot is claimed, detects slots reused after a reset
+        self._slot_seq_a = Array('l', [0 for x in range(len(self._shm_list))], lock=False)
+
+
+        logger.info('Created %d shared memory frame slots (%d MB)', len(self._shm_list), self.slot_size // 1048576)
+
+
+    @property
+    def slots(self):
+        return len(self._shm_list)
+
+
+    def put(self, data, header=None):
+        ### returns the slot metadata, or None if the frame must be sent through a file
+        if data.nbytes > self.slot_size:
+            logger.warning('Frame (%d MB) exceeds shared memory slot size', data.nbytes // 1048576)
+            return None
+
+
+        slot, seq = self._claimSlot()
+
+        if isinstance(slot, type(None)):
+            logger.warning('No shared memory frame slots available')
+            return None
+
+
+        shm = self._shm_list[slot]
+
+        slot_data = numpy.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)
+        slot_data[:] = data
+
+
+        if header:
+            # the serialized header keeps repeated COMMENT and HISTORY cards intact
+            header = header.copy(strip=True)
+
+            for keyword in self.skip_header_keywords:
+                header.remove(keyword, ignore_missing=True, remove_all=True)
+
+            header_str = header.tostring()
+        else:
+            header_str = ''
+
+
+        slot_metadata = {
+            'slot'   : slot,
+            'seq'    : seq,
+            'shape'  : data.shape,
+            'dtype'  : data.dtype.str,
+            'header' : header_str,
+        }
+
+        return slot_metadata
+
+
+    def get(self, slot_metadata):
+        ### copy the frame out of the slot and return the slot to the producer
+        ### returns None for the data if the slot was reused after a reset
+        slot = slot_metadata['slot']
+        seq = slot_metadata['seq']
+
+        shm = self._shm_list[slot]
+
+        if self._slot_seq_a[slot] != seq:
+            logger.error('Shared memory frame slot %d was reused', slot)
+            return None, None
+
+
+        try:
+            slot_data = numpy.ndarray(slot_metadata['shape'], dtype=numpy.dtype(slot_metadata['dtype']), buffer=shm.buf)
+            data = slot_data.copy()
+        finally:
+            if self._slot_seq_a[slot] == seq:
+                self.release(slot)
+            else:
+                # the producer claimed the slot during the copy
+                logger.error('Shared memory frame slot %d was reused', slot)
+                data = None
+
+
+        return data, slot_metadata['header']
+
+
+    def _claimSlot(self):
+        with self._slot_state_a.get_lock():
+            for x in range(len(self._slot_state_a)):
+                if not self._slot_state_a[x]:
+                    self._slot_state_a[x] = 1
+                    self._slot_seq_a[x] += 1
+                    return x, self._slot_seq_a[x]
+
+        return None, None
+
+
+    def release(self, slot):
+        with self._slot_state_a.get_lock():
+            self._slot_state_a[slot] = 0
+
+
+    def reset(self):
+        ### free all slots, used when the consumer is restarted
+        ### frames still in the queue are discarded if their slot is reused
+        with self._slot_state_a.get_lock():
+            in_use = sum(self._slot_state_a)
+
+            for x in range(len(self._slot_state_a)):
+                self._slot_state_a[x] = 0
+
+
+        if in_use:
+            logger.warning('Released %d shared memory frame slots', in_use)
+
+
+    def close(self):
+        for shm in self._shm_list:
+            shm.close()
+
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+        self._shm_list = list()
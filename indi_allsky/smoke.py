@@ -32,13 +32,20 @@ class IndiAllskySmokeUpdate(object):
     })
 
 
+    # the KML is updated during the day
+    hms_cache_time = 1800  # seconds
+
+    # shared by all instances in the process
+    _hms_index = None
+    _hms_index_date = None
+    _hms_index_time = 0
+
+
     def __init__(self, config):
         self.config = config
 
         self._miscDb = miscDb(self.config)
 
-        self.hms_kml_data = None
-
 
     def update(self, camera):
         latitude = camera.latitude
@@ -79,79 +86,99 @@ class IndiAllskySmokeUpdate(object):
     def update_na_hms(self, camera):
         # this pulls data from NOAA Hazard Mapping System
         # https://www.ospo.noaa.gov/Products/land/hms.html
-        from lxml import etree
         import shapely
 
+        hms_index = self.getHmsIndex()
+
+
+        latitude = camera.latitude
+        longitude = camera.longitude
+
+
+        # look for a 1 square degree area (smoke within ~35 miles)
+        location_area = shapely.box(
+            float(longitude) - 0.5,
+            float(latitude) - 0.5,
+            float(longitude) + 0.5,
+            float(latitude) + 0.5,
+        )
+
+
+        for rating, smoke_tree in hms_index.items():
+            if len(smoke_tree.query(location_area, predicate='intersects')):
+                # first match wins
+                return rating
+
+
+        return constants.SMOKE_RATING_CLEAR  # no matches should mean clear
+
+
+    def getHmsIndex(self):
         now = datetime.now()
         #now = datetime.now() - timedelta(days=1)  # testing
 
-        hms_kml_url = self.hms_kml_base_url.format(**{'now' : now})
 
+        if not isinstance(self._hms_index, type(None)):
+            if self._hms_index_date == now.date() and time.time() - self._hms_index_time < self.hms_cache_time:
+                logger.info('Reusing HMS smoke data')
+                return self._hms_index
 
-        # allow data to be reused
-        if not self.hms_kml_data:
-            try:
-                self.hms_kml_data = self.download_kml(hms_kml_url)
-            except socket.gaierror as e:
-                logger.error('Name resolution error: %s', str(e))
-                self.hms_kml_data = None
-            except socket.timeout as e:
-                logger.error('Timeout error: %s', str(e))
-                self.hms_kml_data = None
-            except requests.exceptions.ConnectTimeout as e:
-                logger.error('Connection timeout: %s', str(e))
-                self.hms_kml_data = None
-            except requests.exceptions.ConnectionError as e:
-                logger.error('Connection error: %s', str(e))
-                self.hms_kml_data = None
-            except requests.exceptions.ReadTimeout as e:
-                logger.error('Connection error: %s', str(e))
-                self.hms_kml_data = None
-            except urllib3.exceptions.ReadTimeoutError as e:
-                logger.error('Connection error: %s', str(e))
-                self.hms_kml_data = None
-            except ssl.SSLCertVerificationError as e:
-                logger.error('Certificate error: %s', str(e))
-                self.hms_kml_data = None
-            except requests.exceptions.SSLError as e:
-                logger.error('Certificate error: %s', str(e))
-                self.hms_kml_data = None
-
-
-        if not self.hms_kml_data:
+
+        hms_kml_url = self.hms_kml_base_url.format(**{'now' : now})
+
+        try:
+            hms_kml_data = self.download_kml(hms_kml_url)
+        except socket.gaierror as e:
+            raise NoSmokeData('Name resolution error: {0:s}'.format(str(e)))
+        except socket.timeout as e:
+            raise NoSmokeData('Timeout error: {0:s}'.format(str(e)))
+        except requests.exceptions.ConnectTimeout as e:
+            raise NoSmokeData('Connection timeout: {0:s}'.format(str(e)))
+        except requests.exceptions.ConnectionError as e:
+            raise NoSmokeData('Connection error: {0:s}'.format(str(e)))
+        except requests.exceptions.ReadTimeout as e:
+            raise NoSmokeData('Connection error: {0:s}'.format(str(e)))
+        except urllib3.exceptions.ReadTimeoutError as e:
+            raise NoSmokeData('Connection error: {0:s}'.format(str(e)))
+        except ssl.SSLCertVerificationError as e:
+            raise NoSmokeData('Certificate error: {0:s}'.format(str(e)))
+        except requests.exceptions.SSLError as e:
+            raise NoSmokeData('Certificate error: {0:s}'.format(str(e)))
+
+
+        if not hms_kml_data:
             raise NoSmokeData('No KML data')
 
 
-        latitude = camera.latitude
-        longitude = camera.longitude
+        hms_index = self.loadHmsIndex(hms_kml_data)
+
+        IndiAllskySmokeUpdate._hms_index = hms_index
+        IndiAllskySmokeUpdate._hms_index_date = now.date()
+        IndiAllskySmokeUpdate._hms_index_time = time.time()
+
+        return hms_index
+
+
+    def loadHmsIndex(self, hms_kml_data):
+        # returns a spatial index of smoke polygons for each rating, heavy to light
+        from lxml import etree
+        import shapely
 
 
         try:
-            xml_root = etree.fromstring(self.hms_kml_data)
+            xml_root = etree.fromstring(hms_kml_data)
         except etree.XMLSyntaxError as e:
-            self.hms_kml_data = None  # force redownload
             raise NoSmokeData('Unable to parse XML: {0:s}'.format(str(e)))
         except ValueError as e:
-            self.hms_kml_data = None  # force redownload
             raise NoSmokeData('Unable to parse XML: {0:s}'.format(str(e)))
 
 
-        # look for a 1 square degree area (smoke within ~35 miles)
-        location_area = shapely.Polygon((
-            (float(longitude) - 0.5, float(latitude) - 0.5),
-            (float(longitude) + 0.5, float(latitude) - 0.5),
-            (float(longitude) + 0.5, float(latitude) + 0.5),
-            (float(longitude) - 0.5, float(latitude) + 0.5),
-        ))
-
-
-
         NS = {
             "kml" : "http://www.opengis.net/kml/2.2",
         }
 
 
-        found_kml_folders = False
+        hms_index = OrderedDict()
         for folder, rating in self.hms_kml_folders.items():
             p = ".//kml:Folder[contains(., '{0:s}')]".format(folder)
             #logger.info('Folder: %s', p)
@@ -162,39 +189,30 @@ class IndiAllskySmokeUpdate(object):
                 logger.error('Folder not found: %s', folder)
                 continue
 
-            found_kml_folders = True
-
-
-            for e_placemark in e_folder[0].xpath('.//kml:Placemark', namespaces=NS):
-                for e_polygon in e_placemark.xpath('.//kml:Polygon', namespaces=NS):
-                    e_coord = e_polygon.find(".//kml:coordinates", namespaces=NS)
-                    #logger.info('   %s', pformat(e_coord.text))
 
-                    coord_list = list()
-                    for line in e_coord.text.splitlines():
-                        line = line.strip()
+            smoke_polygon_list = list()
+            for e_polygon in e_folder[0].xpath('.//kml:Placemark//kml:Polygon', namespaces=NS):
+                e_coord = e_polygon.find(".//kml:coordinates", namespaces=NS)
 
-                        if not line:
-                            continue
+                # coordinates are long,lat,z tuples separated by whitespace
+                coord_list = list()
+                for coord in e_coord.text.split():
+                    p_long, p_lat, p_z = coord.split(',')
+                    coord_list.append((float(p_long), float(p_lat)))
 
-                        #logger.info('line: %s', pformat(line))
-                        p_long, p_lat, p_z = line.split(',')
-                        coord_list.append((float(p_long), float(p_lat)))
+                smoke_polygon_list.append(shapely.Polygon(coord_list))
 
-                    smoke_polygon = shapely.Polygon(coord_list)
 
-                    if location_area.intersects(smoke_polygon):
-                        # first match wins
-                        return rating
+            hms_index[rating] = shapely.STRtree(smoke_polygon_list)
+            logger.info('%s: %d polygons', folder, len(smoke_polygon_list))
 
 
-        if not found_kml_folders:
+        if not hms_index:
             # without folders, there was no data to match
             raise NoSmokeData('No folders in KML')
 
 
-        return constants.SMOKE_RATING_CLEAR  # no matches should mean clear
-
+        return hms_index
 
 
     def download_kml(self, url):
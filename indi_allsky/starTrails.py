@@ -15,6 +15,7 @@ import ephem
 import logging
 
 from .stars import IndiAllSkyStars
+from .exceptions import TimelapseException
 
 
 logger = logging.getLogger('indi_allsky')
@@ -23,7 +24,7 @@ logger = logging.getLogger('indi_allsky')
 
 class StarTrailGenerator(object):
 
-    def __init__(self, config, bin_v, skip_frames=0, mask=None):
+    def __init__(self, config, bin_v, skip_frames=0, mask=None, timelapse_dir=None):
         self.config = config
         self.bin_v = bin_v
         self.skip_frames = skip_frames
@@ -85,6 +86,10 @@ class StarTrailGenerator(object):
         self._timelapse_frame_count = 0
         self._timelapse_frame_list = list()
 
+        # TimelapseGenerator streaming frames to ffmpeg
+        self._timelapse_pipe = None
+        self._timelapse_pipe_failed = False
+
 
         if self.config['IMAGE_FOLDER']:
             self.image_dir = Path(self.config['IMAGE_FOLDER']).absolute()
@@ -98,9 +103,17 @@ class StarTrailGenerator(object):
             scratch_base_dir.mkdir(parents=True)
 
 
-        # this needs to be a class variable
-        self.timelapse_tmpdir = tempfile.TemporaryDirectory(dir=scratch_base_dir, suffix='_startrail_timelapse')    # context manager automatically deletes files when finished
-        self.timelapse_tmpdir_p = Path(self.timelapse_tmpdir.name)
+        if timelapse_dir:
+            # persistent folder, frames are kept across restarts and removed by the caller
+            self.timelapse_tmpdir = None
+            self.timelapse_tmpdir_p = Path(timelapse_dir)
+
+            if not self.timelapse_tmpdir_p.exists():
+                self.timelapse_tmpdir_p.mkdir(parents=True)
+        else:
+            # this needs to be a class variable
+            self.timelapse_tmpdir = tempfile.TemporaryDirectory(dir=scratch_base_dir, suffix='_startrail_timelapse')    # context manager automatically deletes files when finished
+            self.timelapse_tmpdir_p = Path(self.timelapse_tmpdir.name)
 
 
 
@@ -160,6 +173,16 @@ class StarTrailGenerator(object):
     def timelapse_frame_list(self, new_frame_list):
         return  # read only
 
+    @property
+    def timelapse_pipe(self):
+        return self._timelapse_pipe
+
+    @timelapse_pipe.setter
+    def timelapse_pipe(self, new_timelapse_pipe):
+        self._timelapse_pipe = new_timelapse_pipe
+        self._timelapse_pipe_failed = False
+
+
     @property
     def latitude(self):
         return self._latitude
@@ -377,7 +400,15 @@ class StarTrailGenerator(object):
 
 
         # Star trail timelapse processing
-        if self.config.get('STARTRAILS_TIMELAPSE', True):
+        if self.config.get('STARTRAILS_TIMELAPSE', True) and self._timelapse_pipe:
+            if not self._timelapse_pipe_failed:
+                try:
+                    self._timelapse_pipe.writeFrame(self.trail_image)
+                    self._timelapse_frame_count += 1
+                except TimelapseException as e:
+                    logger.error('Star trail timelapse failed: %s', str(e))
+                    self._timelapse_pipe_failed = True
+        elif self.config.get('STARTRAILS_TIMELAPSE', True):
             image_mtime = file_p.stat().st_mtime
 
             f_tmp_frame = tempfile.NamedTemporaryFile(dir=self.timelapse_tmpdir_p, suffix='.{0:s}'.format(self.config['IMAGE_FILE_TYPE']), delete=False)
@@ -413,6 +444,43 @@ class StarTrailGenerator(object):
         self.image_processing_elapsed_s += time.time() - image_processing_start
 
 
+    def getState(self):
+        ### state needed to continue processing images in another process
+        state = {
+            'process_count'     : self.process_count,
+            'original_width'    : self.original_width,
+            'original_height'   : self.original_height,
+            'pixels_cutoff'     : self.pixels_cutoff,
+            'trail_image'       : self.trail_image,
+            'placeholder_image' : self.placeholder_image,
+            'placeholder_adu'   : self.placeholder_adu,
+            'excluded_images'   : self.excluded_images,
+            'trail_count'       : self._trail_count,
+            'timelapse_frame_count' : self._timelapse_frame_count,
+            'timelapse_frame_list'  : [str(p) for p in self._timelapse_frame_list],
+            'image_processing_elapsed_s' : self.image_processing_elapsed_s,
+        }
+
+        return state
+
+
+    def setState(self, state):
+        self.process_count = state['process_count']
+        self.original_width = state['original_width']
+        self.original_height = state['original_height']
+        self.pixels_cutoff = state['pixels_cutoff']
+        self.trail_image = state['trail_image']
+        self.placeholder_image = state['placeholder_image']
+        self.placeholder_adu = state['placeholder_adu']
+        self.excluded_images = dict(state['excluded_images'])
+        self._trail_count = state['trail_count']
+        self.image_processing_elapsed_s = state['image_processing_elapsed_s']
+
+        # frames may have been removed by a previous run
+        self._timelapse_frame_list = [Path(p) for p in state['timelapse_frame_list'] if Path(p).exists()]
+        self._timelapse_frame_count = len(self._timelapse_frame_list)
+
+
     def finalize(self, outfile, camera):
         outfile_p = Path(outfile)
 
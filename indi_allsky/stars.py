@@ -18,6 +18,7 @@ class IndiAllSkyStars(object):
         self.bin_v = bin_v
 
         self._sqm_mask = mask
+        self._roi = None  # search area based on the mask
 
         self._detectionThreshold = self.config.get('DETECT_STARS_THOLD', 0.6)
 
@@ -53,7 +54,24 @@ class IndiAllSkyStars(object):
             # This only needs to be done once if a mask is not provided
             self._generateSqmMask(original_data)
 
-        masked_img = cv2.bitwise_and(original_data, original_data, mask=self._sqm_mask)
+        if isinstance(self._roi, type(None)):
+            self._generateRoi()
+
+
+        sep_start = time.time()
+
+
+        roi_x1, roi_y1, roi_x2, roi_y2 = self._roi
+
+        roi_data = original_data[roi_y1:roi_y2, roi_x1:roi_x2]
+        roi_mask = self._sqm_mask[roi_y1:roi_y2, roi_x1:roi_x2]
+
+        if roi_data.shape[0] < self.star_template_h or roi_data.shape[1] < self.star_template_w:
+            logger.warning('Star detection area is smaller than the star template')
+            return list()
+
+
+        masked_img = cv2.bitwise_and(roi_data, roi_data, mask=roi_mask)
 
         if len(original_data.shape) == 2:
             # gray scale or bayered
@@ -63,21 +81,9 @@ class IndiAllSkyStars(object):
             grey_img = cv2.cvtColor(masked_img, cv2.COLOR_BGR2GRAY)
 
 
-        sep_start = time.time()
-
-
         result = cv2.matchTemplate(grey_img, self.star_template, cv2.TM_CCOEFF_NORMED)
-        result_filter = numpy.where(result >= self._detectionThreshold)
-
-        blobs = list()
-        for pt in zip(*result_filter[::-1]):
-            for blob in blobs:
-                if (abs(pt[0] - blob[0]) < self._distanceThreshold) and (abs(pt[1] - blob[1]) < self._distanceThreshold):
-                    break
 
-            else:
-                # if none of the points are under the distance threshold, then add it
-                blobs.append(pt)
+        blobs = [(x + roi_x1, y + roi_y1) for x, y in self._findPeaks(result)]
 
 
         sep_elapsed_s = time.time() - sep_start
@@ -90,6 +96,59 @@ class IndiAllSkyStars(object):
         return blobs
 
 
+    def _findPeaks(self, result):
+        ### non-maximum suppression, only the strongest match within the distance threshold is kept
+        window = (self._distanceThreshold * 2) - 1
+        result_max = cv2.dilate(result, numpy.ones((window, window), dtype=numpy.uint8))
+
+        peaks_y, peaks_x = numpy.nonzero((result >= self._detectionThreshold) & (result >= result_max))
+
+
+        # neighboring matches with identical values are all local maximums, keep the first
+        blobs = list()
+        blob_grid = dict()
+        for x, y in zip(peaks_x.tolist(), peaks_y.tolist()):
+            grid_key = (x // self._distanceThreshold, y // self._distanceThreshold)
+
+            if self._nearBlob(x, y, grid_key, blob_grid):
+                continue
+
+            # if none of the points are under the distance threshold, then add it
+            blobs.append((x, y))
+            blob_grid.setdefault(grid_key, []).append((x, y))
+
+
+        return blobs
+
+
+    def _nearBlob(self, x, y, grid_key, blob_grid):
+        grid_x, grid_y = grid_key
+
+        # blobs within the distance threshold can only be in the neighboring grid cells
+        for g_x in (grid_x - 1, grid_x, grid_x + 1):
+            for g_y in (grid_y - 1, grid_y, grid_y + 1):
+                for blob in blob_grid.get((g_x, g_y), []):
+                    if (abs(x - blob[0]) < self._distanceThreshold) and (abs(y - blob[1]) < self._distanceThreshold):
+                        return True
+
+        return False
+
+
+    def _generateRoi(self):
+        ### only the bounding box of the mask needs to be searched
+        mask_x, mask_y, mask_w, mask_h = cv2.boundingRect(self._sqm_mask)
+
+        mask_height, mask_width = self._sqm_mask.shape[:2]
+
+        # include matches that partially overlap the mask
+        x1 = max(mask_x - self.star_template_w, 0)
+        y1 = max(mask_y - self.star_template_h, 0)
+        x2 = min(mask_x + mask_w + self.star_template_w, mask_width)
+        y2 = min(mask_y + mask_h + self.star_template_h, mask_height)
+
+        self._roi = (x1, y1, x2, y2)
+
+
     def _generateSqmMask(self, img):
         logger.info('Generating mask based on SQM_ROI')
 
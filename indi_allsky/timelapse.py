@@ -1,7 +1,9 @@
 import os
 import time
 from pathlib import Path
+import tempfile
 import subprocess
+import numpy
 import logging
 
 from . import timelapse_preprocessor
@@ -30,6 +32,16 @@ class TimelapseGenerator(object):
         self._ffmpeg_extra_options = ''
 
 
+        # raw video pipe state
+        self._pipe_video_file_p = None
+        self._pipe_subproc = None
+        self._pipe_output = None
+        self._pipe_frame_shape = None
+        self._pipe_frame_count = 0
+        self._pipe_start = None
+        self._pipe_error = None
+
+
         pp_class = getattr(timelapse_preprocessor, pre_processor_class)
         self._pre_processor = pp_class(self.config)
 
@@ -80,6 +92,17 @@ class TimelapseGenerator(object):
         return self._pre_processor
 
 
+    @property
+    def pipe_frame_count(self):
+        return self._pipe_frame_count
+
+
+    @property
+    def pipe_active(self):
+        # True between startPipe() and finishPipe()/abortPipe()
+        return not isinstance(self._pipe_video_file_p, type(None))
+
+
     def generate(self, video_file, file_list):
         video_file_p = Path(video_file)
 
@@ -95,6 +118,22 @@ class TimelapseGenerator(object):
             file_list_ordered = file_list_ordered[self.skip_frames:]
 
 
+        if self.config.get('TIMELAPSE', {}).get('RAW_PIPE') and self.pre_processor.frame_pipe_supported:
+            # frames are generated in memory and streamed to ffmpeg
+            self.startPipe(video_file_p)
+            self.pre_processor.frame_pipe = self
+
+            try:
+                self.pre_processor.main(file_list_ordered)
+            except Exception:
+                # do not leave ffmpeg running
+                self.abortPipe()
+                raise
+
+            self.finishPipe()
+            return
+
+
         # process images
         self.pre_processor.main(file_list_ordered)
         seqfolder = self.pre_processor.seqfolder
@@ -102,6 +141,53 @@ class TimelapseGenerator(object):
 
         start = time.time()
 
+        input_options = [
+            '-r', '{0:0.2f}'.format(self.framerate),
+            '-f', 'image2',
+            #'-start_number', '0',
+            #'-pattern_type', 'glob',
+            '-i', '{0:s}/%05d.{1:s}'.format(str(seqfolder), self.config['IMAGE_FILE_TYPE']),
+        ]
+
+        cmd = self._getFfmpegCmd(input_options, video_file_p)
+
+
+        try:
+            ffmpeg_subproc = subprocess.run(
+                cmd,
+                env=self._getFfmpegEnv(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                preexec_fn=lambda: os.nice(19),
+                check=True
+            )
+            elapsed_s = time.time() - start
+            logger.info('Timelapse generated in %0.4f s', elapsed_s)
+
+            for line in ffmpeg_subproc.stdout.decode().split('\n'):
+                logger.info('ffmpeg: %s', line)
+        except subprocess.CalledProcessError as e:
+            elapsed_s = time.time() - start
+
+            logger.info('FFMPEG ran for %0.4f s', elapsed_s)
+            logger.error('FFMPEG failed to generate timelapse, return code: %d', e.returncode)
+
+            for line in e.stdout.decode().split('\n'):
+                logger.error('ffmpeg: %s', line)
+
+            ### Check if video file was created
+            if video_file_p.is_file():
+                logger.error('FFMPEG created broken video file, cleaning up')
+                video_file_p.unlink()
+
+            raise TimelapseException('FFMPEG return code %d', e.returncode)
+
+
+        # set default permissions
+        video_file_p.chmod(0o644)
+
+
+    def _getFfmpegCmd(self, input_options, video_file_p):
         cmd = ['ffmpeg']
 
         # add codec options
@@ -111,11 +197,11 @@ class TimelapseGenerator(object):
         cmd.extend([
             '-y',
             '-loglevel', 'level+error',
-            '-r', '{0:0.2f}'.format(self.framerate),
-            '-f', 'image2',
-            #'-start_number', '0',
-            #'-pattern_type', 'glob',
-            '-i', '{0:s}/%05d.{1:s}'.format(str(seqfolder), self.config['IMAGE_FILE_TYPE']),
+        ])
+
+        cmd.extend(input_options)
+
+        cmd.extend([
             '-vcodec', '{0:s}'.format(self.codec),
             '-b:v', '{0:s}'.format(self.bitrate),
             #'-filter:v', 'setpts=50*PTS',
@@ -141,44 +227,191 @@ class TimelapseGenerator(object):
 
         logger.info('FFmpeg command: %s', ' '.join(cmd))
 
+        return cmd
 
+
+    def _getFfmpegEnv(self):
         ffmpeg_env = dict()
         if self.config.get('TIMELAPSE', {}).get('FFMPEG_REPORT'):
             logger.warning('*** FFMPEG debug report will be generated in /tmp ***')
             ffmpeg_env['FFREPORT'] = 'file=/tmp/ffmpeg-report-%t.log'
 
+        return ffmpeg_env
+
+
+    def startPipe(self, video_file):
+        ### ffmpeg is started when the first frame is written, the dimensions are not known before
+        self._pipe_video_file_p = Path(video_file)
+        self._pipe_subproc = None
+        self._pipe_output = None
+        self._pipe_frame_shape = None
+        self._pipe_frame_count = 0
+        self._pipe_start = time.time()
+        self._pipe_error = None
+
+
+    def writeFrame(self, image):
+        ### writes a BGR (or grayscale) frame to ffmpeg, blocks while the pipe buffer is full
+        if isinstance(self._pipe_video_file_p, type(None)):
+            raise TimelapseException('Timelapse pipe not started')
+
+        if self._pipe_error:
+            raise TimelapseException(self._pipe_error)
+
+
+        if isinstance(self._pipe_subproc, type(None)):
+            self._openPipe(image)
+
+
+        if image.shape != self._pipe_frame_shape:
+            # all frames must match the first frame
+            logger.error('Timelapse frame with dimension mismatch: %s', str(image.shape))
+            return
+
 
         try:
-            ffmpeg_subproc = subprocess.run(
+            self._pipe_subproc.stdin.write(numpy.ascontiguousarray(image).data)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg exited
+            self._pipeFailed()
+            raise TimelapseException(self._pipe_error)
+
+
+        self._pipe_frame_count += 1
+
+
+    def _openPipe(self, image):
+        image_height, image_width = image.shape[:2]
+
+        if len(image.shape) == 2:
+            pix_fmt = 'gray'
+        else:
+            pix_fmt = 'bgr24'
+
+
+        input_options = [
+            '-f', 'rawvideo',
+            '-pix_fmt', pix_fmt,
+            '-s', '{0:d}x{1:d}'.format(image_width, image_height),
+            '-framerate', '{0:0.2f}'.format(self.framerate),
+            '-i', '-',
+        ]
+
+        cmd = self._getFfmpegCmd(input_options, self._pipe_video_file_p)
+
+
+        # output is written to a file so ffmpeg can never block on a full stdout pipe
+        self._pipe_output = tempfile.TemporaryFile()
+
+        try:
+            self._pipe_subproc = subprocess.Popen(
                 cmd,
-                env=ffmpeg_env,
-                stdout=subprocess.PIPE,
+                env=self._getFfmpegEnv(),
+                stdin=subprocess.PIPE,
+                stdout=self._pipe_output,
                 stderr=subprocess.STDOUT,
                 preexec_fn=lambda: os.nice(19),
-                check=True
             )
-            elapsed_s = time.time() - start
-            logger.info('Timelapse generated in %0.4f s', elapsed_s)
+        except OSError as e:
+            logger.error('Unable to start ffmpeg: %s', str(e))
+            self._pipe_error = 'Unable to start ffmpeg'
+            raise TimelapseException(self._pipe_error)
 
-            for line in ffmpeg_subproc.stdout.decode().split('\n'):
-                logger.info('ffmpeg: %s', line)
-        except subprocess.CalledProcessError as e:
-            elapsed_s = time.time() - start
+        self._pipe_frame_shape = image.shape
+
+
+    def finishPipe(self):
+        ### returns the number of frames in the timelapse
+        if self._pipe_error:
+            self._cleanupPipe()
+            raise TimelapseException(self._pipe_error)
+
+        if isinstance(self._pipe_subproc, type(None)):
+            self._cleanupPipe()
+            raise TimelapseException('No frames written to timelapse')
+
+
+        try:
+            self._pipe_subproc.stdin.close()
+        except BrokenPipeError:
+            pass
 
+        returncode = self._pipe_subproc.wait()
+
+        elapsed_s = time.time() - self._pipe_start
+
+        if returncode:
             logger.info('FFMPEG ran for %0.4f s', elapsed_s)
-            logger.error('FFMPEG failed to generate timelapse, return code: %d', e.returncode)
+            self._pipeFailed()
+            self._cleanupPipe()
+            raise TimelapseException(self._pipe_error)
 
-            for line in e.stdout.decode().split('\n'):
-                logger.error('ffmpeg: %s', line)
 
-            ### Check if video file was created
-            if video_file_p.is_file():
-                logger.error('FFMPEG created broken video file, cleaning up')
-                video_file_p.unlink()
+        logger.info('Timelapse generated from %d frames in %0.4f s', self._pipe_frame_count, elapsed_s)
 
-            raise TimelapseException('FFMPEG return code %d', e.returncode)
+        for line in self._readPipeOutput():
+            logger.info('ffmpeg: %s', line)
 
 
         # set default permissions
-        video_file_p.chmod(0o644)
+        self._pipe_video_file_p.chmod(0o644)
+
+        self._cleanupPipe()
+
+        return self._pipe_frame_count
+
+
+    def abortPipe(self):
+        ### stop ffmpeg and remove the partial video
+        if self._pipe_subproc:
+            if isinstance(self._pipe_subproc.poll(), type(None)):
+                logger.warning('Stopping timelapse pipe')
+                self._pipe_subproc.kill()
+
+            self._pipe_subproc.wait()
+
+
+        if self._pipe_video_file_p and self._pipe_video_file_p.is_file():
+            logger.warning('Removing partial timelapse file: %s', self._pipe_video_file_p)
+            self._pipe_video_file_p.unlink()
+
+
+        self._cleanupPipe()
+
+
+    def _pipeFailed(self):
+        try:
+            self._pipe_subproc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+        returncode = self._pipe_subproc.wait()
+
+        logger.error('FFMPEG failed to generate timelapse, return code: %d', returncode)
+
+        for line in self._readPipeOutput():
+            logger.error('ffmpeg: %s', line)
+
+        ### Check if video file was created
+        if self._pipe_video_file_p.is_file():
+            logger.error('FFMPEG created broken video file, cleaning up')
+            self._pipe_video_file_p.unlink()
+
+        self._pipe_error = 'FFMPEG return code {0:d}'.format(returncode)
+
+
+    def _readPipeOutput(self):
+        if not self._pipe_output:
+            return list()
+
+        self._pipe_output.seek(0)
+        return self._pipe_output.read().decode(errors='replace').split('\n')
+
+
+    def _cleanupPipe(self):
+        if self._pipe_output:
+            self._pipe_output.close()
 
+        self._pipe_video_file_p = None
+        self._pipe_subproc = None
+        self._pipe_output = None
@@ -6,6 +6,10 @@ logger = logging.getLogger('indi_allsky')
 
 class PreProcessorBase(object):
 
+    # pre-processors that generate new frames can stream them to ffmpeg
+    frame_pipe_supported = False
+
+
     def __init__(self, *args, **kwargs):
         self.config = args[0]
 
@@ -13,6 +17,7 @@ class PreProcessorBase(object):
         self._seqfolder = None
         self._keogram = None
         self._pre_scale = 100
+        self._frame_pipe = None
 
 
         if self.config.get('IMAGE_FOLDER'):
@@ -49,6 +54,15 @@ class PreProcessorBase(object):
         #logger.info('Setting timelapse image pre-scaler to %d%%', self._pre_scale)
 
 
+    @property
+    def frame_pipe(self):
+        return self._frame_pipe
+
+    @frame_pipe.setter
+    def frame_pipe(self, new_frame_pipe):
+        self._frame_pipe = new_frame_pipe
+
+
     def main(self, *args, **kwargs):
         raise Exception()
 
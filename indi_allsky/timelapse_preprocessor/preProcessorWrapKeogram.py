@@ -1,6 +1,9 @@
+import io
 import time
 from pathlib import Path
 import tempfile
+from collections import deque
+import multiprocessing
 import numpy
 import cv2
 import PIL
@@ -15,6 +18,9 @@ logger = logging.getLogger('indi_allsky')
 
 class PreProcessorWrapKeogram(PreProcessorBase):
 
+    frame_pipe_supported = True
+
+
     def __init__(self, *args, **kwargs):
         super(PreProcessorWrapKeogram, self).__init__(*args, **kwargs)
 
@@ -25,6 +31,7 @@ class PreProcessorWrapKeogram(PreProcessorBase):
 
         self.image_circle = self.config.get('TIMELAPSE', {}).get('IMAGE_CIRCLE', 2000)
         self.keogram_ratio = self.config.get('TIMELAPSE', {}).get('KEOGRAM_RATIO', 0.15)
+        self.processes = int(self.config.get('TIMELAPSE', {}).get('PROCESSES', 1))
 
 
         border_top = self.config.get('IMAGE_BORDER', {}).get('TOP', 0)
@@ -76,60 +83,140 @@ class PreProcessorWrapKeogram(PreProcessorBase):
         self.file_list_len = len(file_list)
 
 
+        wrapper = KeogramWrapper(
+            self._keogram_image,
+            self.file_list_len,
+            scaled_image_circle,
+            scaled_x_offset,
+            scaled_y_offset,
+            self.pre_scale,
+        )
+
+
+        # frames are only encoded when they are not streamed to ffmpeg
+        if self.frame_pipe:
+            file_type, compression = None, None
+        else:
+            file_type = self.config['IMAGE_FILE_TYPE']
+            compression = self.config['IMAGE_FILE_COMPRESSION']
+
+
         process_start = time.time()
 
-        for i, f in enumerate(file_list):
-            # the symlink files must start at index 0 or ffmpeg will fail
+        if self.processes > 1:
+            frame_iter = self._poolFrames(wrapper, file_list, file_type, compression)
+        else:
+            frame_iter = (wrapper.getFrame(i, f, file_type, compression) for i, f in enumerate(file_list))
+
 
+        for i, frame in enumerate(frame_iter):
             if i % 25 == 0:
                 process_elapsed_s = time.time() - process_start
                 logger.info('Pre-processed %d of %d images (%0.3fs/image)', i, self.file_list_len, process_elapsed_s / (i + 1))
 
-            self.wrap(
-                i,
-                f,
-                self.seqfolder,
-                scaled_image_circle,
-                scaled_x_offset,
-                scaled_y_offset,
-            )
+            if isinstance(frame, type(None)):
+                continue
+
+
+            if self.frame_pipe:
+                self.frame_pipe.writeFrame(frame)
+            else:
+                # the files must start at index 0 or ffmpeg will fail
+                outfile_p = self.seqfolder.joinpath('{0:05d}.{1:s}'.format(self.image_count, self.config['IMAGE_FILE_TYPE']))
+
+                with io.open(str(outfile_p), 'wb') as f_frame:
+                    f_frame.write(frame)
+
+            self.image_count += 1
 
 
         process_elapsed_s = time.time() - process_start
         logger.info('Pre-processing in %0.4f s (%0.3fs/image)', process_elapsed_s, process_elapsed_s / len(file_list))
 
 
-    def wrap(self, i, f, seqfolder_p, image_circle, x_offset, y_offset):
-        #wrap_start = time.time()
+    def _poolFrames(self, wrapper, file_list, file_type, compression):
+        ### generate frames in a process pool, frames are returned in order
+        logger.info('Pre-processing with %d processes', self.processes)
 
-        keogram = self._keogram_image.copy()
-        keogram_height, keogram_width = keogram.shape[:2]
+        # limit the number of frames held in memory
+        max_pending = self.processes * 2
 
-        current_percent = i / self.file_list_len
+        pool = multiprocessing.Pool(
+            processes=self.processes,
+            initializer=_poolInit,
+            initargs=(wrapper, file_type, compression),
+        )
 
-        #keogram_line = int(keogram_width * current_percent)
-        keogram_line = int(keogram_width * (1 - current_percent))  # backwards
-        #logger.info('Line: %d', keogram_line)
+        try:
+            pending = deque()
+
+            for i, f in enumerate(file_list):
+                pending.append(pool.apply_async(_poolGetFrame, (i, f)))
+
+                if len(pending) >= max_pending:
+                    yield pending.popleft().get()
+
+
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            # also stops the workers when the frames are not all consumed
+            pool.terminate()
+            pool.join()
+
+
+class KeogramWrapper(object):
+    """Wraps the keogram around the image circle
 
-        line = numpy.full([keogram_height, 1, 3], 255, dtype=numpy.uint8)
-        keogram[0:keogram_height, keogram_line:keogram_line + 1] = line
+    The wrapped keogram only depends on the image dimensions, it is generated once
+    and only the marker for the current frame is added to each frame.
+    """
 
+    def __init__(self, keogram_image, file_list_len, image_circle, x_offset, y_offset, pre_scale):
+        self.keogram_image = keogram_image
+        self.file_list_len = file_list_len
+        self.image_circle = image_circle
+        self.x_offset = x_offset
+        self.y_offset = y_offset
+        self.pre_scale = pre_scale
 
-        #start_open = time.time()
+        # generated from the first image
+        self._image_shape = None
+        self._final_shape = None
+        self._image_position = None
+        self._wrapped_keogram = None
+        self._opaque_mask = None
+        self._blend_pixels = None
+        self._blend_alpha = None
+        self._blend_keogram = None
+        self._marker_pixels = None
+        self._marker_columns = None
+        self._marker_alpha = None
+        self._marker_keogram = None
+        self._marker_offsets = None
+
+
+    def getFrame(self, i, f, file_type=None, compression=None):
+        image_with_keogram = self.wrap(i, f)
+
+        if isinstance(image_with_keogram, type(None)):
+            return None
+
+        if not file_type:
+            return image_with_keogram
+
+        return self.encodeFrame(image_with_keogram, file_type, compression)
+
+
+    def wrap(self, i, f):
+        #wrap_start = time.time()
 
         try:
             with Image.open(str(f)) as img:
                 image = cv2.cvtColor(numpy.array(img), cv2.COLOR_RGB2BGR)
         except PIL.UnidentifiedImageError:
             logger.error('Unable to read %s', f)
-            return
-
-        #elapsed_open_s = time.time() - start_open
-        #logger.info('Image opened in %0.4f s', elapsed_open_s)
-
-
-        image_height, image_width = image.shape[:2]
-        #logger.info('Image: %d x %d', image_width, image_height)
+            return None
 
 
         ### Pre scale the image so there is less processing work to be done on slower systems like Raspberry Pi
@@ -140,25 +227,96 @@ class PreProcessorWrapKeogram(PreProcessorBase):
             image = cv2.resize(image, (pre_scaled_width, pre_scaled_height), interpolation=cv2.INTER_AREA)
 
 
+        if image.shape != self._image_shape:
+            self._generateWrappedKeogram(image.shape)
+
+
         image_height, image_width = image.shape[:2]
-        #logger.info('Image: %d x %d', image_width, image_height)
+        final_height, final_width = self._final_shape
+        image_y, image_x = self._image_position
 
 
-        recenter_width = image_width + (abs(x_offset) * 2)
-        recenter_height = image_height + (abs(y_offset) * 2)
-        #logger.info('New: %d x %d', recenter_width, recenter_height)
+        # recenter the image circle in the new image
+        image_with_keogram = numpy.zeros([final_height, final_width, 3], dtype=numpy.uint8)
+        image_with_keogram[
+            image_y:image_y + image_height,
+            image_x:image_x + image_width,
+        ] = image
+
+
+        keogram_width = self.keogram_image.shape[1]
+
+        current_percent = i / self.file_list_len
+
+        #keogram_line = int(keogram_width * current_percent)
+        keogram_line = int(keogram_width * (1 - current_percent))  # backwards
+        #logger.info('Line: %d', keogram_line)
+
+
+        image_with_keogram_flat = image_with_keogram.reshape((-1, 3))
+
+        if keogram_line < keogram_width:
+            marker_slice = self._getMarkerSlice(keogram_line, keogram_width)
+            marker_pixels = self._marker_pixels[marker_slice]
+            marker_image = image_with_keogram_flat[marker_pixels].astype(numpy.float32)
+
+
+        ### apply alpha mask
+        # opaque pixels are replaced, only the edges of the keogram are blended
+        numpy.copyto(image_with_keogram, self._wrapped_keogram, where=self._opaque_mask)
+
+        blend_image = image_with_keogram_flat[self._blend_pixels]
+        image_with_keogram_flat[self._blend_pixels] = (blend_image * (1 - self._blend_alpha) + self._blend_keogram).astype(numpy.uint8)
+
+
+        if keogram_line < keogram_width:
+            # distance of each pixel from the marker line in keogram columns
+            marker_distance = numpy.abs(self._marker_columns[marker_slice] - keogram_line)
+            marker_distance = numpy.minimum(marker_distance, keogram_width - marker_distance)  # wraps around
+            marker_weight = numpy.clip(1 - marker_distance, 0, 1)[:, numpy.newaxis]
+
+            marker_alpha = self._marker_alpha[marker_slice]
+            marker_keogram = self._marker_keogram[marker_slice]
+
+            # the keogram marker line is white
+            marked_keogram = numpy.clip(marker_keogram + (marker_weight * ((255 * marker_alpha) - marker_keogram)), 0, 255)
+            image_with_keogram_flat[marker_pixels] = (marker_image * (1 - marker_alpha) + marked_keogram * marker_alpha).astype(numpy.uint8)
+
+
+        mod_height = final_height % 2
+        mod_width = final_width % 2
+
+        if mod_height or mod_width:
+            # width and height needs to be divisible by 2 for timelapse
+            crop_width = final_width - mod_width
+            crop_height = final_height - mod_height
+
+            image_with_keogram = image_with_keogram[
+                0:crop_height,
+                0:crop_width,
+            ]
+
+
+        #wrap_elapsed_s = time.time() - wrap_start
+        #logger.info('Wrapped image in %0.4f s', wrap_elapsed_s)
+
+        return image_with_keogram
 
 
-        #start_recenter = time.time()
+    def _generateWrappedKeogram(self, image_shape):
+        wrap_start = time.time()
 
-        recenter_image = numpy.zeros([recenter_height, recenter_width, 3], dtype=numpy.uint8)
-        recenter_image[
-            int((recenter_height / 2) - (image_height / 2) + y_offset):int((recenter_height / 2) + (image_height / 2) + y_offset),
-            int((recenter_width / 2) - (image_width / 2) - x_offset):int((recenter_width / 2) + (image_width / 2) - x_offset),
-        ] = image  # recenter the image circle in the new image
+        image_height, image_width = image_shape[:2]
+        keogram_height, keogram_width = self.keogram_image.shape[:2]
 
-        #elapsed_recenter_s = time.time() - start_recenter
-        #logger.info('Image recentered in %0.4f s', elapsed_recenter_s)
+        image_circle = self.image_circle
+        x_offset = self.x_offset
+        y_offset = self.y_offset
+
+
+        recenter_width = image_width + (abs(x_offset) * 2)
+        recenter_height = image_height + (abs(y_offset) * 2)
+        #logger.info('New: %d x %d', recenter_width, recenter_height)
 
 
         if recenter_width < (image_circle + (keogram_height * 2) + abs(x_offset)):
@@ -174,110 +332,162 @@ class PreProcessorWrapKeogram(PreProcessorBase):
         #logger.info('Final: %d x %d', final_width, final_height)
 
 
+        # position of the image in the recentered image, and the recentered image in the final image
+        image_y = int((recenter_height / 2) - (image_height / 2) + y_offset) + int((final_height / 2) - (recenter_height / 2))
+        image_x = int((recenter_width / 2) - (image_width / 2) - x_offset) + int((final_width / 2) - (recenter_width / 2))
+
+
         # add black area at the top of the keogram to wrap around center
-        d_keogram = numpy.zeros([int((image_circle / 2) + keogram_height), keogram_width, 3], dtype=numpy.uint8)
-        d_height, d_width = d_keogram.shape[:2]
-        d_keogram[d_height - keogram_height:d_height, 0:keogram_width] = keogram
+        d_height = int((image_circle / 2) + keogram_height)
+
+        d_keogram = numpy.zeros([d_height, keogram_width, 3], dtype=numpy.uint8)
+        d_keogram[d_height - keogram_height:d_height, 0:keogram_width] = self.keogram_image
 
 
         # add alpha channel for transparency (black area)
-        d_keogram_alpha = numpy.zeros([d_height, d_width], dtype=numpy.uint8)
+        d_keogram_alpha = numpy.zeros([d_height, keogram_width], dtype=numpy.uint8)
         d_keogram_alpha[d_height - keogram_height:d_height, 0:keogram_width] = 255
         d_keogram = numpy.dstack((d_keogram, d_keogram_alpha))
 
 
-        # keogram must be sideways (top/down) to wrap
-        d_image = cv2.rotate(d_keogram, cv2.ROTATE_90_COUNTERCLOCKWISE)
+        # direction of each keogram column, used to locate the marker line
+        # vectors are used because the column index wraps around
+        column_angle = (numpy.arange(keogram_width, dtype=numpy.float32) / keogram_width) * 2 * numpy.pi
 
+        d_column = numpy.zeros([d_height, keogram_width, 2], dtype=numpy.float32)
+        d_column[d_height - keogram_height:d_height, 0:keogram_width, 0] = numpy.cos(column_angle)
+        d_column[d_height - keogram_height:d_height, 0:keogram_width, 1] = numpy.sin(column_angle)
 
-        #start_warppolar = time.time()
-
-        # wrap the keogram
-        wrapped_keogram = cv2.warpPolar(
-            d_image,
-            (final_height, final_width),  # cv2 reversed (rotated below)
-            (int(final_height / 2), int(final_width / 2)),  # reversed
-            int((image_circle / 2) + keogram_height),
-            cv2.WARP_INVERSE_MAP,
-        )
 
-        #elapsed_warppolar_s = time.time() - start_warppolar
-        #logger.info('Image warpPolar in %0.4f s', elapsed_warppolar_s)
-
-        #wrapped_keogram = cv2.rotate(wrapped_keogram, cv2.ROTATE_90_COUNTERCLOCKWISE)  # start keogram at top
-        wrapped_keogram = cv2.rotate(wrapped_keogram, cv2.ROTATE_90_CLOCKWISE)  # start keogram at bottom
+        wrapped_keogram = self._warp(d_keogram, final_height, final_width)
+        wrapped_column = self._warp(d_column, final_height, final_width)
 
 
         # separate layers
         wrapped_keogram_bgr = wrapped_keogram[:, :, :3]
         wrapped_keogram_alpha = (wrapped_keogram[:, :, 3] / 255).astype(numpy.float32)
 
-        # create alpha mask
-        alpha_mask = numpy.dstack((
-            wrapped_keogram_alpha,
-            wrapped_keogram_alpha,
-            wrapped_keogram_alpha,
-        ))
+        wrapped_keogram_bgr_flat = wrapped_keogram_bgr.reshape((-1, 3))
+        wrapped_keogram_alpha_flat = wrapped_keogram_alpha.ravel()
 
 
-        f_image = numpy.zeros([final_height, final_width, 3], dtype=numpy.uint8)
-        f_image[
-            int((final_height / 2) - (recenter_height / 2)):int((final_height / 2) + (recenter_height / 2)),
-            int((final_width / 2) - (recenter_width / 2)):int((final_width / 2) + (recenter_width / 2)),
-        ] = recenter_image
+        self._wrapped_keogram = wrapped_keogram_bgr.copy()
+        self._opaque_mask = (wrapped_keogram[:, :, 3] == 255)[:, :, numpy.newaxis]
 
 
-        #start_alpha = time.time()
+        # partially transparent pixels
+        self._blend_pixels = numpy.flatnonzero((wrapped_keogram[:, :, 3] > 0) & (wrapped_keogram[:, :, 3] < 255))
+        self._blend_alpha = wrapped_keogram_alpha_flat[self._blend_pixels][:, numpy.newaxis]
+        self._blend_keogram = wrapped_keogram_bgr_flat[self._blend_pixels] * self._blend_alpha
 
-        # apply alpha mask
-        image_with_keogram = (f_image * (1 - alpha_mask) + wrapped_keogram_bgr * alpha_mask).astype(numpy.uint8)
 
-        #elapsed_alpha_s = time.time() - start_alpha
-        #logger.info('Image alpha in %0.4f s', elapsed_alpha_s)
+        # all keogram pixels grouped by keogram column
+        keogram_pixels = numpy.flatnonzero(wrapped_keogram[:, :, 3] > 0)
 
+        wrapped_column_flat = wrapped_column.reshape((-1, 2))[keogram_pixels]
+        keogram_columns = (numpy.arctan2(wrapped_column_flat[:, 1], wrapped_column_flat[:, 0]) / (2 * numpy.pi)) * keogram_width
+        keogram_columns = numpy.mod(keogram_columns, keogram_width).astype(numpy.float32)
 
-        mod_height = final_height % 2
-        mod_width = final_width % 2
+        keogram_columns_floor = numpy.floor(keogram_columns).astype(numpy.int32) % keogram_width
 
-        if mod_height or mod_width:
-            # width and height needs to be divisible by 2 for timelapse
-            crop_width = final_width - mod_width
-            crop_height = final_height - mod_height
+        column_order = numpy.argsort(keogram_columns_floor, kind='stable')
 
-            image_with_keogram = image_with_keogram[
-                0:crop_height,
-                0:crop_width,
-            ]
+        self._marker_pixels = keogram_pixels[column_order]
+        self._marker_columns = keogram_columns[column_order]
+        self._marker_alpha = wrapped_keogram_alpha_flat[self._marker_pixels][:, numpy.newaxis]
+        self._marker_keogram = wrapped_keogram_bgr_flat[self._marker_pixels].astype(numpy.float32)
+
+        column_counts = numpy.bincount(keogram_columns_floor, minlength=keogram_width)
+        self._marker_offsets = numpy.concatenate(([0], numpy.cumsum(column_counts)))  # pixels for column c are between offsets[c] and offsets[c + 1]
+
+
+        self._image_shape = image_shape
+        self._final_shape = (final_height, final_width)
+        self._image_position = (image_y, image_x)
+
+
+        wrap_elapsed_s = time.time() - wrap_start
+        logger.info('Wrapped keogram generated in %0.4f s', wrap_elapsed_s)
+
+
+    def _getMarkerSlice(self, keogram_line, keogram_width):
+        ### pixels within one column of the marker line
+        previous_line = (keogram_line - 1) % keogram_width
+
+        if previous_line == keogram_line - 1:
+            return slice(self._marker_offsets[previous_line], self._marker_offsets[keogram_line + 1])
+
+        # first column wraps around to the last column
+        return numpy.concatenate((
+            numpy.arange(self._marker_offsets[previous_line], self._marker_offsets[previous_line + 1]),
+            numpy.arange(self._marker_offsets[keogram_line], self._marker_offsets[keogram_line + 1]),
+        ))
+
+
+    def _warp(self, d_image, final_height, final_width):
+        # keogram must be sideways (top/down) to wrap
+        d_image = cv2.rotate(d_image, cv2.ROTATE_90_COUNTERCLOCKWISE)
 
+        d_height = d_image.shape[1]
 
+
+        # wrap the keogram
+        wrapped = cv2.warpPolar(
+            d_image,
+            (final_height, final_width),  # cv2 reversed (rotated below)
+            (int(final_height / 2), int(final_width / 2)),  # reversed
+            d_height,
+            cv2.WARP_INVERSE_MAP | cv2.WARP_FILL_OUTLIERS,  # outliers are left uninitialized without WARP_FILL_OUTLIERS
+        )
+
+        #wrapped = cv2.rotate(wrapped, cv2.ROTATE_90_COUNTERCLOCKWISE)  # start keogram at top
+        wrapped = cv2.rotate(wrapped, cv2.ROTATE_90_CLOCKWISE)  # start keogram at bottom
+
+        return wrapped
+
+
+    def encodeFrame(self, image_with_keogram, file_type, compression):
         #start_compress = time.time()
 
-        outfile_p = seqfolder_p.joinpath('{0:05d}.{1:s}'.format(self.image_count, self.config['IMAGE_FILE_TYPE']))
-        if self.config['IMAGE_FILE_TYPE'] in ('jpg', 'jpeg'):
-            img_rgb = Image.fromarray(cv2.cvtColor(image_with_keogram, cv2.COLOR_BGR2RGB))
-            img_rgb.save(str(outfile_p), quality=self.config['IMAGE_FILE_COMPRESSION']['jpg'])
-        elif self.config['IMAGE_FILE_TYPE'] in ('png',):
-            #img_rgb = Image.fromarray(cv2.cvtColor(self.trail_image, cv2.COLOR_BGR2RGB))
-            #img_rgb.save(str(f_tmp_frame_p), compress_level=self.config['IMAGE_FILE_COMPRESSION']['png'])
+        f_frame = io.BytesIO()
 
+        if file_type in ('jpg', 'jpeg'):
+            img_rgb = Image.fromarray(cv2.cvtColor(image_with_keogram, cv2.COLOR_BGR2RGB))
+            img_rgb.save(f_frame, format='JPEG', quality=compression['jpg'])
+        elif file_type in ('png',):
             # opencv is faster than Pillow with PNG
-            cv2.imwrite(str(outfile_p), image_with_keogram, [cv2.IMWRITE_PNG_COMPRESSION, self.config['IMAGE_FILE_COMPRESSION']['png']])
-        elif self.config['IMAGE_FILE_TYPE'] in ('webp',):
+            _, png_data = cv2.imencode('.png', image_with_keogram, [cv2.IMWRITE_PNG_COMPRESSION, compression['png']])
+            f_frame.write(png_data.tobytes())
+        elif file_type in ('webp',):
             img_rgb = Image.fromarray(cv2.cvtColor(image_with_keogram, cv2.COLOR_BGR2RGB))
-            img_rgb.save(str(outfile_p), quality=90, lossless=False)
-        elif self.config['IMAGE_FILE_TYPE'] in ('tif', 'tiff'):
+            img_rgb.save(f_frame, format='WEBP', quality=90, lossless=False)
+        elif file_type in ('tif', 'tiff'):
             img_rgb = Image.fromarray(cv2.cvtColor(image_with_keogram, cv2.COLOR_BGR2RGB))
-            img_rgb.save(str(outfile_p), compression='tiff_lzw')
+            img_rgb.save(f_frame, format='TIFF', compression='tiff_lzw')
         else:
-            raise Exception('Unknown file type: %s', self.config['IMAGE_FILE_TYPE'])
+            raise Exception('Unknown file type: %s', file_type)
 
         #elapsed_compress_s = time.time() - start_compress
         #logger.info('Image compress in %0.4f s', elapsed_compress_s)
 
+        return f_frame.getvalue()
 
-        #wrap_elapsed_s = time.time() - wrap_start
-        #logger.info('Wrapped image in %0.4f s', wrap_elapsed_s)
 
+### process pool state
+_pool_wrapper = None
+_pool_file_type = None
+_pool_compression = None
+
+
+def _poolInit(wrapper, file_type, compression):
+    global _pool_wrapper
+    global _pool_file_type
+    global _pool_compression
+
+    _pool_wrapper = wrapper
+    _pool_file_type = file_type
+    _pool_compression = compression
 
-        self.image_count += 1
 
+def _poolGetFrame(i, f):
+    return _pool_wrapper.getFrame(i, f, _pool_file_type, _pool_compression)
@@ -19,7 +19,9 @@ from .flask.miscDb import miscDb
 from .flask import models
 
 from . import filetransfer
+from .filetransfer.pool import FileTransferPool
 
+from sqlalchemy import update
 from sqlalchemy.orm.exc import NoResultFound
 
 #from .exceptions import TimeOutException
@@ -32,6 +34,24 @@ logger = logging.getLogger('indi_allsky')
 
 
 class FileUploader(Thread):
+
+    # maximum number of queued tasks claimed at once
+    batch_size = 25
+
+    # workers are threads in the same process
+    _claim_lock = threading.Lock()
+
+    # batches are grouped by action in this order, syncapi before s3 as the tasks are queued
+    action_order = (
+        constants.TRANSFER_SYNC_V1,
+        constants.TRANSFER_S3,
+        constants.TRANSFER_UPLOAD,
+        constants.TRANSFER_MQTT,
+        constants.TRANSFER_YOUTUBE,
+        constants.DELETE_S3,
+    )
+
+
     def __init__(
         self,
         idx,
@@ -50,6 +70,9 @@ class FileUploader(Thread):
         self.error_q = error_q
         self.upload_q = upload_q
 
+        # connections are kept open between uploads
+        self._transport_pool = FileTransferPool()
+
 
         self._stopper = threading.Event()
         #self._shutdown = False
@@ -117,12 +140,14 @@ class FileUploader(Thread):
 
         while True:
             if self.stopped():
+                self._transport_pool.closeAll()
                 logger.warning('Goodbye')
                 return
 
             try:
                 u_dict = self.upload_q.get(timeout=11)  # prime number
             except queue.Empty:
+                self._transport_pool.expire()
                 continue
 
             #if u_dict.get('stop'):
@@ -134,30 +159,169 @@ class FileUploader(Thread):
             #    return
 
 
-            # new context for every task, reduces the effects of caching
+            # new context for every batch, reduces the effects of caching
             with app.app_context():
-                self.processUpload(u_dict)
+                self.processBatch(u_dict)
 
 
-    def processUpload(self, u_dict):
-        task_id = u_dict['task_id']
+    def processBatch(self, u_dict):
+        task_list = self.claimTasks(u_dict['task_id'])
+
+        if not task_list:
+            # task was already processed with another batch
+            return
 
 
+        batch_start = time.time()
+
+        task_list, coalesced_count = self.coalesceTasks(task_list)
+
+
+        # group tasks by action so connections are used consecutively
+        task_list.sort(key=self._taskOrder)
+
+
+        remaining_tasks = list(task_list)
         try:
-            task = models.IndiAllSkyDbTaskQueueTable.query\
-                .filter(models.IndiAllSkyDbTaskQueueTable.id == task_id)\
-                .filter(models.IndiAllSkyDbTaskQueueTable.state == models.TaskQueueState.QUEUED)\
-                .filter(models.IndiAllSkyDbTaskQueueTable.queue == models.TaskQueueQueue.UPLOAD)\
-                .one()
-
-        except NoResultFound:
-            logger.error('Task ID %d not found', task_id)
-            return
+            while remaining_tasks:
+                self.processUpload(remaining_tasks[0])
+                remaining_tasks.pop(0)
+        except Exception:
+            # do not leave claimed tasks running if the worker fails
+            db.session.rollback()
+
+            failed_task = remaining_tasks.pop(0)
+            if failed_task.state == models.TaskQueueState.RUNNING:
+                failed_task.setFailed('Upload worker failure')
+
+            for task in remaining_tasks:
+                task.setQueued()
+                self.upload_q.put({'task_id' : task.id})
+
+            raise
+
+
+        failed_count = len([t for t in task_list if t.state == models.TaskQueueState.FAILED])
+
+        batch_elapsed_s = time.time() - batch_start
+        logger.info(
+            'Upload batch: %d tasks, %d coalesced, %d failed in %0.4f s (%0.2f tasks/s)',
+            len(task_list),
+            coalesced_count,
+            failed_count,
+            batch_elapsed_s,
+            (len(task_list) + coalesced_count) / max(batch_elapsed_s, 0.001),
+        )
 
 
-        task.setRunning()
+    def _taskOrder(self, task):
+        action = task.data['action']
+
+        try:
+            action_idx = self.action_order.index(action)
+        except ValueError:
+            action_idx = len(self.action_order)
+
+        return (action_idx, action, task.id)
+
+
+    def claimTasks(self, task_id):
+        ### Claim the given task and the oldest queued tasks in one transaction
+        TaskQueue = models.IndiAllSkyDbTaskQueueTable
+
+        with self._claim_lock:
+            queued_query = db.session.query(
+                TaskQueue.id,
+            )\
+                .filter(TaskQueue.state == models.TaskQueueState.QUEUED)\
+                .filter(TaskQueue.queue == models.TaskQueueQueue.UPLOAD)
 
+            task_id_list = [t.id for t in queued_query.filter(TaskQueue.id == task_id)]
+
+            oldest_query = queued_query\
+                .filter(TaskQueue.id != task_id)\
+                .order_by(TaskQueue.id.asc())\
+                .limit(self.batch_size - len(task_id_list))
+
+            task_id_list.extend([t.id for t in oldest_query])
+
+            if not task_id_list:
+                return list()
+
+
+            db.session.execute(
+                update(TaskQueue)\
+                    .where(TaskQueue.id.in_(task_id_list))\
+                    .where(TaskQueue.state == models.TaskQueueState.QUEUED)\
+                    .values(state=models.TaskQueueState.RUNNING)
+            )
+            db.session.commit()
 
+
+        task_list = TaskQueue.query\
+            .filter(TaskQueue.id.in_(task_id_list))\
+            .order_by(TaskQueue.id.asc())\
+            .all()
+
+        return task_list
+
+
+    def coalesceTasks(self, task_list):
+        ### Tasks replaced by newer tasks in the same batch are not processed
+        newest_tasks = dict()
+        superseded = list()
+
+        for task in task_list:  # oldest first
+            coalesce_key = self._coalesceKey(task)
+            if not coalesce_key:
+                continue
+
+            older_task = newest_tasks.get(coalesce_key)
+            newest_tasks[coalesce_key] = task
+
+            if not older_task:
+                continue
+
+
+            if task.data['action'] == constants.TRANSFER_MQTT:
+                # retained topics from the older message are still published
+                mq_data = dict(older_task.data.get('metadata') or {})
+                mq_data.update(task.data.get('metadata') or {})
+
+                task_data = dict(task.data)
+                task_data['metadata'] = mq_data
+                task.data = task_data
+
+            superseded.append((older_task, task))
+
+
+        for older_task, task in superseded:
+            older_task.state = models.TaskQueueState.SUCCESS
+            older_task.result = 'Superseded by task {0:d}'.format(task.id)
+
+        db.session.commit()
+
+
+        superseded_ids = set(older_task.id for older_task, task in superseded)
+        return [t for t in task_list if t.id not in superseded_ids], len(superseded)
+
+
+    def _coalesceKey(self, task):
+        action = task.data['action']
+
+        if action == constants.TRANSFER_MQTT:
+            # topics are retained, only the latest values matter
+            return (action, task.data.get('image_topic'))
+
+        if action == constants.TRANSFER_SYNC_V1:
+            # the newest metadata replaces the remote entry
+            if task.data.get('model') and task.data.get('id'):
+                return (action, task.data['model'], task.data['id'])
+
+        return None
+
+
+    def processUpload(self, task):
         action = task.data['action']
 
         local_file = task.data.get('local_file')
@@ -344,6 +508,7 @@ class FileUploader(Thread):
                 'qos'         : self.config['MQTTPUBLISH']['QOS'],
                 'mq_data'     : metadata,
                 'publish_image' : self.config['MQTTPUBLISH'].get('PUBLISH_IMAGE', True),
+                'changed_only'  : self.config['MQTTPUBLISH'].get('CHANGED_ONLY', False),
             }
 
 
@@ -426,10 +591,10 @@ class FileUploader(Thread):
         start = time.time()
 
         try:
-            client.connect(**connect_kwargs)
+            client, client_reused = self._transport_pool.connect(client, connect_kwargs)
         except filetransfer.exceptions.ConnectionFailure as e:
             logger.error('Connection failure: %s', e)
-            client.close()
+            self._transport_pool.discard(client)
             task.setFailed('Connection failure')
 
             self._miscDb.addNotification(
@@ -442,7 +607,7 @@ class FileUploader(Thread):
             return
         except filetransfer.exceptions.AuthenticationFailure as e:
             logger.error('Authentication failure: %s', e)
-            client.close()
+            self._transport_pool.discard(client)
             task.setFailed('Authentication failure')
 
             self._miscDb.addNotification(
@@ -455,7 +620,7 @@ class FileUploader(Thread):
             return
         except filetransfer.exceptions.CertificateValidationFailure as e:
             logger.error('Certificate validation failure: %s', e)
-            client.close()
+            self._transport_pool.discard(client)
             task.setFailed('Certificate validation failure')
 
             self._miscDb.addNotification(
@@ -469,10 +634,19 @@ class FileUploader(Thread):
 
         # Upload file
         try:
-            response = client.put(**put_kwargs)
+            try:
+                response = client.put(**put_kwargs)
+            except filetransfer.exceptions.ConnectionFailure as e:
+                if not client_reused:
+                    raise
+
+                # idle connections may be dropped by the server or network
+                logger.warning('Pooled connection failed, reconnecting: %s', e)
+                client = self._transport_pool.reconnect(client, connect_kwargs)
+                response = client.put(**put_kwargs)
         except filetransfer.exceptions.ConnectionFailure as e:
             logger.error('Connection failure: %s', e)
-            client.close()
+            self._transport_pool.discard(client)
             task.setFailed('Connection failure')
 
             self._miscDb.addNotification(
@@ -485,7 +659,7 @@ class FileUploader(Thread):
             return
         except filetransfer.exceptions.AuthenticationFailure as e:
             logger.error('Authentication failure: %s', e)
-            client.close()
+            self._transport_pool.discard(client)
             task.setFailed('Authentication failure')
 
             self._miscDb.addNotification(
@@ -498,7 +672,7 @@ class FileUploader(Thread):
             return
         except filetransfer.exceptions.CertificateValidationFailure as e:
             logger.error('Certificate validation failure: %s', e)
-            client.close()
+            self._transport_pool.discard(client)
             task.setFailed('Certificate validation failure')
 
             self._miscDb.addNotification(
@@ -511,7 +685,7 @@ class FileUploader(Thread):
             return
         except filetransfer.exceptions.TransferFailure as e:
             logger.error('Tranfer failure: %s', e)
-            client.close()
+            self._transport_pool.discard(client)
             task.setFailed('Tranfer failure')
 
             self._miscDb.addNotification(
@@ -524,7 +698,7 @@ class FileUploader(Thread):
             return
         except filetransfer.exceptions.PermissionFailure as e:
             logger.error('Permission failure: %s', e)
-            client.close()
+            self._transport_pool.discard(client)
             task.setFailed('Permission failure')
 
             self._miscDb.addNotification(
@@ -537,8 +711,8 @@ class FileUploader(Thread):
             return
 
 
-        # close file transfer client
-        client.close()
+        # keep file transfer client for the next upload
+        self._transport_pool.release(client)
 
         upload_elapsed_s = time.time() - start
         logger.info('Upload transaction completed in %0.4f s', upload_elapsed_s)
@@ -22,12 +22,12 @@ import ephem
 from . import constants
 
 from .timelapse import TimelapseGenerator
-from .keogram import KeogramGenerator
-from .starTrails import StarTrailGenerator
+from .accumulator import IndiAllSkyKeogramStarTrailAccumulator
 from .miscUpload import miscUpload
 from .aurora import IndiAllskyAuroraUpdate
 from .smoke import IndiAllskySmokeUpdate
 from .satellite_download import IndiAllskyUpdateSatelliteData
+from .satellite_pass import IndiAllskySatellitePassPredictor
 from .maskProcessing import MaskProcessor
 
 from .flask import create_app
@@ -49,6 +49,7 @@ from .flask.models import IndiAllSkyDbFitsImageTable
 from .flask.models import IndiAllSkyDbPanoramaImageTable
 from .flask.models import IndiAllSkyDbPanoramaVideoTable
 from .flask.models import IndiAllSkyDbRawImageTable
+from .flask.models import IndiAllSkyDbImageRollupTable
 from .flask.models import IndiAllSkyDbTaskQueueTable
 
 from sqlalchemy import func
@@ -1209,20 +1210,15 @@ class VideoWorker(Process):
         logger.info('Max kpindex: %0.2f, ovation: %d, smoke rating: %s', max_kpindex, max_ovation_max, constants.SMOKE_RATING_MAP_STR[max_smoke_rating])
 
 
-        timelapse_skip_frames = self.config.get('TIMELAPSE_SKIP_FRAMES', 4)
-
-
         processing_start = time.time()
 
-        kg = KeogramGenerator(
+        accumulator = IndiAllSkyKeogramStarTrailAccumulator(
             self.config,
-            skip_frames=timelapse_skip_frames,
+            self.bin_v,
+            mask=self._detection_mask,
         )
-        kg.angle = self.config['KEOGRAM_ANGLE']
-        kg.h_scale_factor = self.config['KEOGRAM_H_SCALE']
-        kg.v_scale_factor = self.config['KEOGRAM_V_SCALE']
-        kg.crop_top = self.config.get('KEOGRAM_CROP_TOP', 0)
-        kg.crop_bottom = self.config.get('KEOGRAM_CROP_BOTTOM', 0)
+
+        kg = accumulator.newKeogramGenerator()
 
 
         keogram_metadata = {
@@ -1312,135 +1308,114 @@ class VideoWorker(Process):
             startrail_video_entry = None
 
 
-        stg = StarTrailGenerator(
-            self.config,
-            self.bin_v,
-            skip_frames=timelapse_skip_frames,
-            mask=self._detection_mask,
-        )
-        stg.max_adu = self.config['STARTRAILS_MAX_ADU']
-        stg.mask_threshold = self.config['STARTRAILS_MASK_THOLD']
-        stg.pixel_cutoff_threshold = self.config['STARTRAILS_PIXEL_THOLD']
-        stg.min_stars = self.config.get('STARTRAILS_MIN_STARS', 0)
-        stg.latitude = camera.latitude
-        stg.longitude = camera.longitude
-        stg.sun_alt_threshold = self.config['STARTRAILS_SUN_ALT_THOLD']
-
-        if self.config['STARTRAILS_MOONMODE_THOLD']:
-            stg.moonmode_alt = self.config['NIGHT_MOONMODE_ALT_DEG']
-            stg.moonmode_phase = self.config['NIGHT_MOONMODE_PHASE']
-        else:
-            stg.moon_alt_threshold = self.config['STARTRAILS_MOON_ALT_THOLD']
-            stg.moon_phase_threshold = self.config['STARTRAILS_MOON_PHASE_THOLD']
+        stg = accumulator.newStarTrailGenerator(camera)
 
-        if self.config.get('STARTRAILS_USE_DB_DATA', True):
-            logger.warning('Re-using image data for ADU and Star counts')
-        else:
-            logger.warning('Recalculating values for ADU and Star counts')
 
+        if self.config.get('KEOGRAM_INCREMENTAL'):
+            # images processed during capture do not need to be processed again
+            last_timestamp = accumulator.loadState(camera.id, d_dayDate, night, kg, stg)
 
-        # Files are presorted from the DB
-        for i, entry in enumerate(files_entries):
-            if i % 50 == 0:
-                processing_elapsed_s = time.time() - processing_start
-                logger.info('Processed %d of %d images (%0.3fs/image)', i, image_count, processing_elapsed_s / (i + 1))
+            if last_timestamp:
+                files_entries = files_entries\
+                    .filter(IndiAllSkyDbImageTable.createDate > datetime.fromtimestamp(last_timestamp))
 
-            image_file_p = Path(entry.getFilesystemPath())
+                image_count = files_entries.count()
+                logger.warning('Using incremental keogram/star trail data, %d images remaining', image_count)
 
-            if not image_file_p.exists():
-                logger.error('File not found: %s', image_file_p)
-                continue
 
-            if image_file_p.stat().st_size == 0:
-                continue
+        st_tg = None
+        try:
+            if night and self.config.get('STARTRAILS_TIMELAPSE', True):
+                st_tg = TimelapseGenerator(
+                    self.config,
+                    skip_frames=0,
+                )
 
+                st_tg.codec = self.config['FFMPEG_CODEC']
+                st_tg.framerate = self.config['FFMPEG_FRAMERATE']
+                st_tg.bitrate = self.config['FFMPEG_BITRATE']
+                st_tg.vf_scale = self.config.get('FFMPEG_VFSCALE', '')
+                st_tg.ffmpeg_extra_options = self.config.get('FFMPEG_EXTRA_OPTIONS', '')
 
-            #logger.info('Reading file: %s', p_entry)
-            if image_file_p.suffix in ('.png',):
-                # opencv is faster than Pillow with PNG
-                image_data = cv2.imread(str(image_file_p), cv2.IMREAD_COLOR)
 
-                if isinstance(image_data, type(None)):
-                    logger.error('Unable to read %s', image_file_p)
-                    continue
-            else:
-                try:
-                    with Image.open(str(image_file_p)) as img:
-                        image_data = cv2.cvtColor(numpy.array(img), cv2.COLOR_RGB2BGR)
-                except PIL.UnidentifiedImageError:
-                    logger.error('Unable to read %s', image_file_p)
-                    continue
+                if self.config.get('TIMELAPSE', {}).get('RAW_PIPE') and not stg.timelapse_frame_count:
+                    # frames are streamed to ffmpeg as they are generated
+                    # the pipe cannot be used if frames were already stored by the incremental keogram
+                    st_tg.startPipe(startrail_video_file)
+                    stg.timelapse_pipe = st_tg
 
 
-            kg.processImage(image_file_p, image_data)
+            if self.config.get('STARTRAILS_USE_DB_DATA', True):
+                logger.warning('Re-using image data for ADU and Star counts')
+            else:
+                logger.warning('Recalculating values for ADU and Star counts')
 
-            if night:
-                if self.config.get('STARTRAILS_USE_DB_DATA', True):
-                    adu = entry.adu
-                    star_count = entry.stars  # can be None
-                else:
-                    adu, star_count = None, None
 
-                stg.processImage(image_file_p, image_data, adu=adu, star_count=star_count)
+            # Files are presorted from the DB
+            for i, entry in enumerate(files_entries):
+                if i % 50 == 0:
+                    processing_elapsed_s = time.time() - processing_start
+                    logger.info('Processed %d of %d images (%0.3fs/image)', i, image_count, processing_elapsed_s / (i + 1))
 
+                image_file_p = Path(entry.getFilesystemPath())
 
-        kg.finalize(keogram_file, camera)
+                if not image_file_p.exists():
+                    logger.error('File not found: %s', image_file_p)
+                    continue
 
+                if image_file_p.stat().st_size == 0:
+                    continue
 
-        # add height and width
-        keogram_height, keogram_width = kg.shape[:2]
-        keogram_metadata['height'] = keogram_height
-        keogram_metadata['width'] = keogram_width
-        keogram_metadata['frames'] = keogram_width  # one frame per line
 
-        keogram_entry.height = keogram_height
-        keogram_entry.width = keogram_width
-        keogram_entry.frames = keogram_width  # one frame per line
+                #logger.info('Reading file: %s', p_entry)
+                if image_file_p.suffix in ('.png',):
+                    # opencv is faster than Pillow with PNG
+                    image_data = cv2.imread(str(image_file_p), cv2.IMREAD_COLOR)
 
-        keogram_entry.success = True
-        db.session.commit()
+                    if isinstance(image_data, type(None)):
+                        logger.error('Unable to read %s', image_file_p)
+                        continue
+                else:
+                    try:
+                        with Image.open(str(image_file_p)) as img:
+                            image_data = cv2.cvtColor(numpy.array(img), cv2.COLOR_RGB2BGR)
+                    except PIL.UnidentifiedImageError:
+                        logger.error('Unable to read %s', image_file_p)
+                        continue
 
 
-        keogram_thumbnail_metadata = {
-            'type'       : constants.THUMBNAIL,
-            'origin'     : constants.KEOGRAM,
-            'createDate' : int(now.timestamp()),
-            'dayDate'    : d_dayDate.strftime('%Y%m%d'),
-            'utc_offset' : now.astimezone().utcoffset().total_seconds(),
-            'night'      : night,
-            'camera_uuid': camera.uuid,
-        }
+                kg.processImage(image_file_p, image_data)
 
-        keogram_thumbnail_entry = self._miscDb.addThumbnail(
-            keogram_entry,
-            keogram_metadata,
-            camera.id,
-            keogram_thumbnail_metadata,
-            new_width=self.thumbnail_keogram_width,
-        )
+                if night:
+                    if self.config.get('STARTRAILS_USE_DB_DATA', True):
+                        adu = entry.adu
+                        star_count = entry.stars  # can be None
+                    else:
+                        adu, star_count = None, None
 
+                    stg.processImage(image_file_p, image_data, adu=adu, star_count=star_count)
 
-        if night:
-            stg.finalize(startrail_file, camera)
+
+            kg.finalize(keogram_file, camera)
 
 
             # add height and width
-            st_height, st_width = stg.shape[:2]
-            startrail_metadata['height'] = st_height
-            startrail_metadata['width'] = st_width
-            startrail_metadata['frames'] = stg.trail_count
+            keogram_height, keogram_width = kg.shape[:2]
+            keogram_metadata['height'] = keogram_height
+            keogram_metadata['width'] = keogram_width
+            keogram_metadata['frames'] = keogram_width  # one frame per line
 
-            startrail_entry.height = st_height
-            startrail_entry.width = st_width
-            startrail_entry.frames = stg.trail_count
+            keogram_entry.height = keogram_height
+            keogram_entry.width = keogram_width
+            keogram_entry.frames = keogram_width  # one frame per line
 
-            startrail_entry.success = True
+            keogram_entry.success = True
             db.session.commit()
 
 
-            startrail_thumbnail_metadata = {
+            keogram_thumbnail_metadata = {
                 'type'       : constants.THUMBNAIL,
-                'origin'     : constants.STARTRAIL,
+                'origin'     : constants.KEOGRAM,
                 'createDate' : int(now.timestamp()),
                 'dayDate'    : d_dayDate.strftime('%Y%m%d'),
                 'utc_offset' : now.astimezone().utcoffset().total_seconds(),
@@ -1448,53 +1423,89 @@ class VideoWorker(Process):
                 'camera_uuid': camera.uuid,
             }
 
-            startrail_thumbnail_entry = self._miscDb.addThumbnail(
-                startrail_entry,
-                startrail_metadata,
+            keogram_thumbnail_entry = self._miscDb.addThumbnail(
+                keogram_entry,
+                keogram_metadata,
                 camera.id,
-                startrail_thumbnail_metadata,
-                new_width=self.thumbnail_startrail_width,
+                keogram_thumbnail_metadata,
+                new_width=self.thumbnail_keogram_width,
             )
 
 
-            st_frame_count = stg.timelapse_frame_count
-            if st_frame_count >= self.config.get('STARTRAILS_TIMELAPSE_MINFRAMES', 250):
-                startrail_video_metadata['frames'] = st_frame_count  # add frame count
+            if night:
+                stg.finalize(startrail_file, camera)
+
+
+                # add height and width
+                st_height, st_width = stg.shape[:2]
+                startrail_metadata['height'] = st_height
+                startrail_metadata['width'] = st_width
+                startrail_metadata['frames'] = stg.trail_count
+
+                startrail_entry.height = st_height
+                startrail_entry.width = st_width
+                startrail_entry.frames = stg.trail_count
+
+                startrail_entry.success = True
+                db.session.commit()
+
+
+                startrail_thumbnail_metadata = {
+                    'type'       : constants.THUMBNAIL,
+                    'origin'     : constants.STARTRAIL,
+                    'createDate' : int(now.timestamp()),
+                    'dayDate'    : d_dayDate.strftime('%Y%m%d'),
+                    'utc_offset' : now.astimezone().utcoffset().total_seconds(),
+                    'night'      : night,
+                    'camera_uuid': camera.uuid,
+                }
 
-                startrail_video_entry = self._miscDb.addStarTrailVideo(
-                    startrail_video_file.relative_to(self.image_dir),
+                startrail_thumbnail_entry = self._miscDb.addThumbnail(
+                    startrail_entry,
+                    startrail_metadata,
                     camera.id,
-                    startrail_video_metadata,
+                    startrail_thumbnail_metadata,
+                    new_width=self.thumbnail_startrail_width,
                 )
 
-                try:
-                    st_tg = TimelapseGenerator(
-                        self.config,
-                        skip_frames=0,
-                    )
 
-                    st_tg.codec = self.config['FFMPEG_CODEC']
-                    st_tg.framerate = self.config['FFMPEG_FRAMERATE']
-                    st_tg.bitrate = self.config['FFMPEG_BITRATE']
-                    st_tg.vf_scale = self.config.get('FFMPEG_VFSCALE', '')
-                    st_tg.ffmpeg_extra_options = self.config.get('FFMPEG_EXTRA_OPTIONS', '')
+                st_frame_count = stg.timelapse_frame_count
+                if st_frame_count >= self.config.get('STARTRAILS_TIMELAPSE_MINFRAMES', 250):
+                    startrail_video_metadata['frames'] = st_frame_count  # add frame count
 
-                    st_tg.generate(startrail_video_file, stg.timelapse_frame_list)
+                    startrail_video_entry = self._miscDb.addStarTrailVideo(
+                        startrail_video_file.relative_to(self.image_dir),
+                        camera.id,
+                        startrail_video_metadata,
+                    )
 
-                    startrail_video_entry.success = True
-                    db.session.commit()
-                except TimelapseException:
-                    logger.error('Failed to generate startrails timelapse')
+                    try:
+                        if stg.timelapse_pipe:
+                            st_tg.finishPipe()
+                        else:
+                            st_tg.generate(startrail_video_file, stg.timelapse_frame_list)
+
+                        startrail_video_entry.success = True
+                        db.session.commit()
+                    except TimelapseException:
+                        logger.error('Failed to generate startrails timelapse')
+
+                        self._miscDb.addNotification(
+                            NotificationCategory.MEDIA,
+                            'startrail_video',
+                            'Startrails timelapse video failed to generate',
+                            expire=timedelta(hours=12),
+                        )
+                else:
+                    logger.error('Not enough frames to generate star trails timelapse: %d', st_frame_count)
+                    startrail_video_entry = None
 
-                    self._miscDb.addNotification(
-                        NotificationCategory.MEDIA,
-                        'startrail_video',
-                        'Startrails timelapse video failed to generate',
-                        expire=timedelta(hours=12),
-                    )
-            else:
-                logger.error('Not enough frames to generate star trails timelapse: %d', st_frame_count)
-                startrail_video_entry = None
+                    if stg.timelapse_pipe:
+                        st_tg.abortPipe()
+        finally:
+            if st_tg and st_tg.pipe_active:
+                # do not leave ffmpeg running if generation failed
+                st_tg.abortPipe()
 
 
 
@@ -1502,6 +1513,11 @@ class VideoWorker(Process):
         logger.warning('Total keogram/star trail processing in %0.1f s', processing_elapsed_s)
 
 
+        # manual generation may run while the period is still accumulating, keep the state until the period ends
+        if kwargs.get('end_of_period'):
+            accumulator.removeState(camera.id, d_dayDate, night)
+
+
         if keogram_entry:
             # upload thumbnail first
             if keogram_thumbnail_entry:
@@ -1761,9 +1777,36 @@ class VideoWorker(Process):
         satellite = IndiAllskyUpdateSatelliteData(self.config)
         satellite.update()
 
+
+        # passes are rebuilt from the new TLE data
+        active_cameras = IndiAllSkyDbCameraTable.query\
+            .filter(IndiAllSkyDbCameraTable.hidden == sa_false())\
+            .order_by(IndiAllSkyDbCameraTable.id.desc())
+
+        satellite_pass = IndiAllskySatellitePassPredictor(self.config)
+        for camera in active_cameras:
+            satellite_pass.update(camera)
+
+
         task.setSuccess('Satellite data updated')
 
 
+    def updateSatellitePasses(self, task, **kwargs):
+        camera_id = kwargs['camera_id']
+
+        camera = IndiAllSkyDbCameraTable.query\
+            .filter(IndiAllSkyDbCameraTable.id == camera_id)\
+            .one()
+
+
+        task.setRunning()
+
+        satellite_pass = IndiAllskySatellitePassPredictor(self.config)
+        satellite_pass.update(camera)
+
+        task.setSuccess('Satellite passes updated')
+
+
     def expireData(self, task, **kwargs):
         camera_id = kwargs['camera_id']
 
@@ -1880,6 +1923,14 @@ class VideoWorker(Process):
                 delete_count += self._deleteAssets(asset_table, id_list)
 
 
+        # rollups are not updated when images are removed
+        IndiAllSkyDbImageRollupTable.query\
+            .filter(IndiAllSkyDbImageRollupTable.camera_id == camera.id)\
+            .filter(IndiAllSkyDbImageRollupTable.bucket < cutoff_age_images)\
+            .delete()
+        db.session.commit()
+
+
         # Remove empty folders
         dir_list = list()
         self._getFolderFolders(self.image_dir, dir_list)
@@ -1961,77 +2012,11 @@ class VideoWorker(Process):
 
 
     def _load_detection_mask(self):
-        detect_mask = self.config.get('DETECT_MASK', '')
-
-        if not detect_mask:
-            logger.warning('No detection mask defined')
-            return
-
-
-        detect_mask_p = Path(detect_mask)
-
-        try:
-            if not detect_mask_p.exists():
-                logger.error('%s does not exist', detect_mask_p)
-                return
-
-
-            if not detect_mask_p.is_file():
-                logger.error('%s is not a file', detect_mask_p)
-                return
-
-        except PermissionError as e:
-            logger.error(str(e))
-            return
-
-        mask_data = cv2.imread(str(detect_mask_p), cv2.IMREAD_GRAYSCALE)  # mono
-        if isinstance(mask_data, type(None)):
-            logger.error('%s is not a valid image', detect_mask_p)
-            return
-
-        ### any compression artifacts will be set to black
-        #mask_data[mask_data < 255] = 0  # did not quite work
-
-
         mask_processor = MaskProcessor(
             self.config,
             self.bin_v,
         )
 
-
-        # masks need to be rotated, flipped, cropped for post-processed images
-        mask_processor.image = mask_data
-
-
-        if self.config.get('IMAGE_ROTATE'):
-            mask_processor.rotate_90()
-
-
-        # rotation
-        if self.config.get('IMAGE_ROTATE_ANGLE'):
-            mask_processor.rotate_angle()
-
-
-        # verticle flip
-        if self.config.get('IMAGE_FLIP_V'):
-            mask_processor.flip_v()
-
-
-        # horizontal flip
-        if self.config.get('IMAGE_FLIP_H'):
-            mask_processor.flip_h()
-
-
-        # crop
-        if self.config.get('IMAGE_CROP_ROI'):
-            mask_processor.crop_image()
-
-
-        # scale
-        if self.config['IMAGE_SCALE'] and self.config['IMAGE_SCALE'] != 100:
-            mask_processor.scale_image()
-
-
-        return mask_processor.image
+        return mask_processor.load_detection_mask()
 
 
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 #########################################################
-# This script updates the aurora and                    #
-# smoke data for all active cameras in                  #
+# This script updates the aurora, smoke and             #
+# satellite pass data for all active cameras in         #
 # the database.  This can be used in remote             #
 # indi-allsky installations                             #
 #########################################################
@@ -29,6 +29,7 @@ from indi_allsky.config import IndiAllSkyConfig
 from indi_allsky.aurora import IndiAllskyAuroraUpdate
 from indi_allsky.smoke import IndiAllskySmokeUpdate
 from indi_allsky.satellite_download import IndiAllskyUpdateSatelliteData
+from indi_allsky.satellite_pass import IndiAllskySatellitePassPredictor
 
 from indi_allsky.flask.models import IndiAllSkyDbCameraTable
 from indi_allsky.flask.models import IndiAllSkyDbTleDataTable
@@ -65,6 +66,7 @@ class AuroraDataUpdater(object):
         aurora = IndiAllskyAuroraUpdate(self.config)
         smoke = IndiAllskySmokeUpdate(self.config)
         satellite = IndiAllskyUpdateSatelliteData(self.config)
+        satellite_pass = IndiAllskySatellitePassPredictor(self.config)
 
 
         for camera in active_cameras:
@@ -91,6 +93,11 @@ class AuroraDataUpdater(object):
             satellite.update()
 
 
+        # passes are rebuilt when the TLE data changes, otherwise rolled forward
+        for camera in active_cameras:
+            satellite_pass.update(camera)
+
+
 if __name__ == "__main__":
     a = AuroraDataUpdater()
     a.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+###
+### This script regenerates the calendar summary used by the image viewer date selections
+### Safe to re-run at any time
+###
+
+import sys
+import time
+from pathlib import Path
+import logging
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+from indi_allsky.flask.models import IndiAllSkyDbCalendarTable
+
+from indi_allsky.flask import create_app
+from indi_allsky.flask import db
+
+
+# setup flask context for db access
+app = create_app()
+app.app_context().push()
+
+
+LOG_FORMATTER_STREAM = logging.Formatter('%(asctime)s [%(levelname)s] %(processName)s: %(message)s')
+LOG_HANDLER_STREAM = logging.StreamHandler()
+LOG_HANDLER_STREAM.setFormatter(LOG_FORMATTER_STREAM)
+
+
+logger = logging.getLogger('indi_allsky')
+logger.handlers.clear()
+logger.addHandler(LOG_HANDLER_STREAM)
+logger.setLevel(logging.INFO)
+
+
+class CalendarBackfill(object):
+
+    def main(self):
+        logger.warning('Regenerating calendar...')
+
+        start = time.time()
+
+        IndiAllSkyDbCalendarTable.rebuild(db.session)
+
+        calendar_count = db.session.query(IndiAllSkyDbCalendarTable).count()
+
+        elapsed_s = time.time() - start
+        logger.info('Calendar regenerated with %d entries in %0.4f s', calendar_count, elapsed_s)
+
+
+if __name__ == "__main__":
+    CalendarBackfill().main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+###
+### This script regenerates the image rollups used by the charts, SQM, ADU and lag views
+### Safe to re-run at any time
+###
+
+import sys
+import time
+import argparse
+from pathlib import Path
+import logging
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+from indi_allsky.flask.models import IndiAllSkyDbImageRollupTable
+
+from indi_allsky.flask import create_app
+from indi_allsky.flask import db
+
+
+# setup flask context for db access
+app = create_app()
+app.app_context().push()
+
+
+LOG_FORMATTER_STREAM = logging.Formatter('%(asctime)s [%(levelname)s] %(processName)s: %(message)s')
+LOG_HANDLER_STREAM = logging.StreamHandler()
+LOG_HANDLER_STREAM.setFormatter(LOG_FORMATTER_STREAM)
+
+
+logger = logging.getLogger('indi_allsky')
+logger.handlers.clear()
+logger.addHandler(LOG_HANDLER_STREAM)
+logger.setLevel(logging.INFO)
+
+
+class ImageRollupBackfill(object):
+
+    def main(self, camera_id=None):
+        logger.warning('Regenerating image rollups...')
+
+        start = time.time()
+
+        IndiAllSkyDbImageRollupTable.rebuild(db.session, camera_id=camera_id)
+
+        rollup_count = db.session.query(IndiAllSkyDbImageRollupTable).count()
+
+        elapsed_s = time.time() - start
+        logger.info('Image rollups regenerated with %d entries in %0.4f s', rollup_count, elapsed_s)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        '--camera_id',
+        '-c',
+        help='camera id (default: all cameras)',
+        type=int,
+    )
+
+    args = argparser.parse_args()
+
+    ImageRollupBackfill().main(camera_id=args.camera_id)
@@ -951,6 +951,14 @@ echo "**** Populate database fields ****"
 "${ALLSKY_DIRECTORY}/misc/populate_data.py"
 
 
+echo "**** Regenerate calendar ****"
+"${ALLSKY_DIRECTORY}/misc/calendar_backfill.py"
+
+
+echo "**** Regenerate image rollups ****"
+"${ALLSKY_DIRECTORY}/misc/image_rollup_backfill.py"
+
+
 ### Mysql
 if [[ "$USE_MYSQL_DATABASE" == "true" ]]; then
     sudo cp -f "${ALLSKY_DIRECTORY}/service/mysql_indi-allsky.conf" "$MYSQL_ETC/mariadb.conf.d/90-mysql_indi-allsky.conf"
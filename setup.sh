@@ -1993,6 +1993,14 @@ echo "**** Populate database fields ****"
 "${ALLSKY_DIRECTORY}/misc/populate_data.py"
 
 
+echo "**** Regenerate calendar ****"
+"${ALLSKY_DIRECTORY}/misc/calendar_backfill.py"
+
+
+echo "**** Regenerate image rollups ****"
+"${ALLSKY_DIRECTORY}/misc/image_rollup_backfill.py"
+
+
 if [ -f "${ALLSKY_ETC}/config.json" ]; then
     echo
     echo
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+### Compare the streaming dark stacking with loading every frame into a list
+### Generates synthetic 16-bit dark frames with hot pixels and cosmic ray hits
+
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+import numpy
+from astropy.io import fits
+from astropy.stats import sigma_clip
+import logging
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+from indi_allsky.darks import IndiAllSkyDarksAverage
+from indi_allsky.darks import IndiAllSkyDarksSigmaClip
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging
+
+
+class DarksStackBench(object):
+    hotpixel_adu_percent = 90
+
+
+    def __init__(self, width, height, count):
+        self.width = width
+        self.height = height
+        self.count = count
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_dir_p = Path(self.tmp_dir.name)
+
+        self.gain_v = ValueStandIn(100)
+        self.bin_v = ValueStandIn(1)
+
+
+    def main(self):
+        logger.info('Frames: %d x %dx%d', self.count, self.width, self.height)
+
+        logging.getLogger('indi_allsky').setLevel(logging.WARNING)
+
+
+        for stacking_class in (IndiAllSkyDarksAverage, IndiAllSkyDarksSigmaClip):
+            tracemalloc.start()
+            start = time.time()
+            stream_dark, stream_bpm = self.streamStack(stacking_class)
+            stream_elapsed_s = time.time() - start
+            stream_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            tracemalloc.start()
+            start = time.time()
+            list_dark, list_bpm = self.listStack(stacking_class)
+            list_elapsed_s = time.time() - start
+            list_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+
+            logger.info('%s', stacking_class.__name__)
+            logger.info('  Frame list: %0.2f s, peak %0.1f MB', list_elapsed_s, list_peak / 1000000)
+            logger.info('  Streaming:  %0.2f s, peak %0.1f MB', stream_elapsed_s, stream_peak / 1000000)
+            logger.info('  Max dark difference: %d', self.maxDiff(list_dark, stream_dark))
+            logger.info('  Max BPM difference: %d', self.maxDiff(list_bpm, stream_bpm))
+
+
+    def frame(self, i):
+        ### Frames are generated again for each method
+        rng = numpy.random.default_rng(i)
+
+        data = rng.normal(1000, 20, (self.height, self.width))
+
+        # the same hot pixels in every frame
+        hot_rng = numpy.random.default_rng(1000000)
+        data[hot_rng.integers(0, self.height, 200), hot_rng.integers(0, self.width, 200)] = 64000
+
+        # random cosmic ray hits
+        data[rng.integers(0, self.height, 50), rng.integers(0, self.width, 50)] = 30000
+
+        hdu = fits.PrimaryHDU(data.astype(numpy.uint16))
+
+        return fits.HDUList([hdu])
+
+
+    def streamStack(self, stacking_class):
+        frame_dir = tempfile.TemporaryDirectory(dir=self.tmp_dir_p)
+
+        s = stacking_class(self.gain_v, self.bin_v)
+        s.hotpixel_adu_percent = self.hotpixel_adu_percent
+
+        for i in range(self.count):
+            s.add(self.frame(i), Path(frame_dir.name))
+
+        dark_p = self.tmp_dir_p.joinpath('dark_{0:s}.fit'.format(stacking_class.__name__))
+        bpm_p = self.tmp_dir_p.joinpath('bpm_{0:s}.fit'.format(stacking_class.__name__))
+
+        s.buildBadPixelMap(bpm_p, 10.0)
+        s.stack(dark_p, 10.0)
+
+        return fits.getdata(dark_p), fits.getdata(bpm_p)
+
+
+    def listStack(self, stacking_class):
+        # previous implementation, every frame is held in memory
+        image_data = [self.frame(i)[0].data for i in range(self.count)]
+
+        bpm = image_data[0]
+        for data in image_data[1:]:
+            bpm = numpy.maximum(bpm, data)
+
+        bpm = bpm.copy()
+        bpm[bpm < ((2 ** 16) - 1) * (self.hotpixel_adu_percent / 100.0)] = 0
+
+
+        if stacking_class == IndiAllSkyDarksAverage:
+            dark = (numpy.sum(image_data, axis=0) / len(image_data)).astype(numpy.uint16)
+        else:
+            # astropy sigma clip over the full stack instead of ccdproc
+            clipped = sigma_clip(
+                numpy.stack(image_data).astype(numpy.float64),
+                sigma=5,
+                maxiters=1,
+                cenfunc='median',
+                stdfunc='mad_std',
+                axis=0,
+            )
+            dark = clipped.mean(axis=0).filled(0).astype(numpy.uint16)
+
+        return dark, bpm
+
+
+    def maxDiff(self, data_a, data_b):
+        return int(numpy.abs(data_a.astype(numpy.int32) - data_b.astype(numpy.int32)).max())
+
+
+class ValueStandIn(object):
+    def __init__(self, value):
+        self.value = value
+
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        '--width',
+        help='frame width',
+        type=int,
+        default=3000,
+    )
+    argparser.add_argument(
+        '--height',
+        help='frame height',
+        type=int,
+        default=2000,
+    )
+    argparser.add_argument(
+        '--count',
+        '-c',
+        help='number of frames',
+        type=int,
+        default=20,
+    )
+
+    args = argparser.parse_args()
+
+    dsb = DarksStackBench(args.width, args.height, args.count)
+    dsb.main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+### Measure syncapi upload throughput with new and pooled connections
+### Uses a local TLS server with simulated connection latency
+
+import sys
+import io
+import ssl
+import json
+import time
+import tempfile
+import threading
+from datetime import datetime
+from datetime import timedelta
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import logging
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+from indi_allsky.filetransfer import requests_syncapi_v1
+from indi_allsky.filetransfer.pool import FileTransferPool
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging
+
+
+class SyncApiStandIn(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # seconds added to every new connection to simulate a slow network
+    connect_latency = 0.1
+
+    connection_count = 0
+    request_count = 0
+
+
+    def setup(self):
+        super(SyncApiStandIn, self).setup()
+
+        SyncApiStandIn.connection_count += 1
+        time.sleep(self.connect_latency)
+
+
+    def do_PUT(self):
+        content_length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(content_length)
+
+        SyncApiStandIn.request_count += 1
+
+        body = json.dumps({'id' : SyncApiStandIn.request_count}).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, *args):
+        pass
+
+
+class FileTransferPoolBench(object):
+    upload_count = 100
+    file_size = 100 * 1024
+
+
+    def __init__(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.config = {}
+
+        self.local_file_p = Path(self.tmp_dir.name).joinpath('image.jpg')
+        with io.open(str(self.local_file_p), 'wb') as f_image:
+            f_image.write(b'\0' * self.file_size)
+
+
+    def main(self):
+        server = self.startServer()
+
+        connect_kwargs = {
+            'hostname'     : 'https://127.0.0.1:{0:d}/sync/v1/image'.format(server.server_address[1]),
+            'username'     : 'test',
+            'apikey'       : 'apikey',
+            'cert_bypass'  : True,
+        }
+
+
+        logging.getLogger('indi_allsky').setLevel(logging.WARNING)
+
+
+        SyncApiStandIn.connection_count = 0
+        new_start = time.time()
+        for x in range(self.upload_count):
+            client = requests_syncapi_v1(self.config)
+            client.connect(**connect_kwargs)
+            client.put(**self.putKwargs())
+            client.close()
+        new_elapsed_s = time.time() - new_start
+        new_connections = SyncApiStandIn.connection_count
+
+
+        pool = FileTransferPool()
+
+        SyncApiStandIn.connection_count = 0
+        pool_start = time.time()
+        for x in range(self.upload_count):
+            client, client_reused = pool.connect(requests_syncapi_v1(self.config), connect_kwargs)
+            client.put(**self.putKwargs())
+            pool.release(client)
+        pool_elapsed_s = time.time() - pool_start
+        pool_connections = SyncApiStandIn.connection_count
+
+        pool.closeAll()
+
+
+        logger.info('New connections:    %0.1f tasks/s, %d connections', self.upload_count / new_elapsed_s, new_connections)
+        logger.info('Pooled connections: %0.1f tasks/s, %d connections', self.upload_count / pool_elapsed_s, pool_connections)
+
+        server.shutdown()
+
+
+    def putKwargs(self):
+        return {
+            'metadata'   : {'type' : 1},
+            'local_file' : self.local_file_p,
+            'empty_file' : False,
+        }
+
+
+    def startServer(self):
+        cert_file_p, key_file_p = self.generateCertificate()
+
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(str(cert_file_p), str(key_file_p))
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), SyncApiStandIn)
+        server.socket = ssl_context.wrap_socket(server.socket, server_side=True)
+
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+
+        return server
+
+
+    def generateCertificate(self):
+        key = ec.generate_private_key(ec.SECP256R1())
+
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+
+        now = datetime.utcnow()
+
+        cert = x509.CertificateBuilder()\
+            .subject_name(name)\
+            .issuer_name(name)\
+            .public_key(key.public_key())\
+            .serial_number(x509.random_serial_number())\
+            .not_valid_before(now - timedelta(days=1))\
+            .not_valid_after(now + timedelta(days=1))\
+            .sign(key, hashes.SHA256())
+
+        cert_file_p = Path(self.tmp_dir.name).joinpath('cert.pem')
+        key_file_p = Path(self.tmp_dir.name).joinpath('key.pem')
+
+        with io.open(str(cert_file_p), 'wb') as f_cert:
+            f_cert.write(cert.public_bytes(serialization.Encoding.PEM))
+
+        with io.open(str(key_file_p), 'wb') as f_key:
+            f_key.write(key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.TraditionalOpenSSL,
+                encryption_algorithm=serialization.NoEncryption(),
+            ))
+
+        return cert_file_p, key_file_p
+
+
+
+if __name__ == "__main__":
+    fpb = FileTransferPoolBench()
+    fpb.main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+### Compare the HMS smoke lookup for many cameras with the previous per camera KML parsing
+### Uses a saved KML file or generates a large fixture
+
+import sys
+import io
+import time
+import math
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from lxml import etree
+import shapely
+import logging
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+from indi_allsky import constants
+from indi_allsky.smoke import IndiAllskySmokeUpdate
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging
+
+
+class HmsSmokeBench(object):
+    # polygons in each folder of the generated KML
+    polygon_count = 1500
+    polygon_points = 60
+
+    camera_count = 25
+
+
+    def __init__(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.smoke = IndiAllskySmokeUpdate({})
+
+
+    def main(self, kml_file):
+        if kml_file:
+            kml_file_p = Path(kml_file)
+        else:
+            kml_file_p = Path(self.tmp_dir.name).joinpath('hms_smoke.kml')
+            self.generateKml(kml_file_p)
+
+
+        with io.open(str(kml_file_p), 'rb') as f_kml:
+            hms_kml_data = f_kml.read()
+
+        logger.info('KML: %s (%d bytes)', kml_file_p, len(hms_kml_data))
+
+
+        random.seed(2)
+        location_list = [(random.uniform(25, 60), random.uniform(-130, -65)) for x in range(self.camera_count)]
+
+
+        logging.getLogger('indi_allsky').setLevel(logging.WARNING)
+
+
+        legacy_start = time.time()
+        legacy_list = [self.legacyRating(hms_kml_data, lat, long) for lat, long in location_list]
+        legacy_elapsed_s = time.time() - legacy_start
+
+
+        index_start = time.time()
+        hms_index = self.smoke.loadHmsIndex(hms_kml_data)
+        load_elapsed_s = time.time() - index_start
+
+        index_list = [self.indexRating(hms_index, lat, long) for lat, long in location_list]
+        index_elapsed_s = time.time() - index_start
+
+
+        logger.info('Per camera parsing: %0.3f s for %d cameras', legacy_elapsed_s, self.camera_count)
+        logger.info('Spatial index:      %0.3f s for %d cameras (%0.3f s to load)', index_elapsed_s, self.camera_count, load_elapsed_s)
+
+        if legacy_list != index_list:
+            logger.error('Ratings do not match: %s != %s', legacy_list, index_list)
+            sys.exit(1)
+
+        logger.info('Ratings match: %s', ', '.join(constants.SMOKE_RATING_MAP_STR[r] for r in index_list))
+
+
+    def indexRating(self, hms_index, latitude, longitude):
+        camera = CameraStandIn(latitude, longitude)
+
+        # bypass the download
+        self.smoke.getHmsIndex = lambda: hms_index
+
+        return self.smoke.update_na_hms(camera)
+
+
+    def legacyRating(self, hms_kml_data, latitude, longitude):
+        # previous implementation, the KML is parsed for every camera
+        xml_root = etree.fromstring(hms_kml_data)
+
+        location_area = shapely.Polygon((
+            (float(longitude) - 0.5, float(latitude) - 0.5),
+            (float(longitude) + 0.5, float(latitude) - 0.5),
+            (float(longitude) + 0.5, float(latitude) + 0.5),
+            (float(longitude) - 0.5, float(latitude) + 0.5),
+        ))
+
+        NS = {
+            "kml" : "http://www.opengis.net/kml/2.2",
+        }
+
+        for folder, rating in self.smoke.hms_kml_folders.items():
+            p = ".//kml:Folder[contains(., '{0:s}')]".format(folder)
+            e_folder = xml_root.xpath(p, namespaces=NS)
+
+            if not e_folder:
+                continue
+
+            for e_placemark in e_folder[0].xpath('.//kml:Placemark', namespaces=NS):
+                for e_polygon in e_placemark.xpath('.//kml:Polygon', namespaces=NS):
+                    e_coord = e_polygon.find(".//kml:coordinates", namespaces=NS)
+
+                    coord_list = list()
+                    for line in e_coord.text.splitlines():
+                        line = line.strip()
+
+                        if not line:
+                            continue
+
+                        p_long, p_lat, p_z = line.split(',')
+                        coord_list.append((float(p_long), float(p_lat)))
+
+                    smoke_polygon = shapely.Polygon(coord_list)
+
+                    if location_area.intersects(smoke_polygon):
+                        return rating
+
+        return constants.SMOKE_RATING_CLEAR
+
+
+    def generateKml(self, kml_file_p):
+        random.seed(1)
+
+        with io.open(str(kml_file_p), 'w') as f_kml:
+            f_kml.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f_kml.write('<kml xmlns="http://www.opengis.net/kml/2.2">\n<Document>\n')
+
+            for folder, radius in (('Smoke (Light)', 1.5), ('Smoke (Medium)', 0.8), ('Smoke (Heavy)', 0.3)):
+                f_kml.write('<Folder>\n<name>{0:s}</name>\n'.format(folder))
+
+                for x in range(self.polygon_count):
+                    center_long = random.uniform(-140, -50)
+                    center_lat = random.uniform(20, 70)
+
+                    f_kml.write('<Placemark>\n<name>{0:d}</name>\n'.format(x))
+                    f_kml.write('<Polygon><outerBoundaryIs><LinearRing><coordinates>\n')
+
+                    for i in range(self.polygon_points + 1):
+                        angle = 2 * math.pi * (i % self.polygon_points) / self.polygon_points
+                        f_kml.write('{0:0.4f},{1:0.4f},0\n'.format(
+                            center_long + radius * math.cos(angle),
+                            center_lat + radius * math.sin(angle),
+                        ))
+
+                    f_kml.write('</coordinates></LinearRing></outerBoundaryIs></Polygon>\n</Placemark>\n')
+
+                f_kml.write('</Folder>\n')
+
+            f_kml.write('</Document>\n</kml>\n')
+
+
+class CameraStandIn(object):
+    def __init__(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        '--kml',
+        '-k',
+        help='saved HMS smoke KML file',
+        type=str,
+    )
+
+    args = argparser.parse_args()
+
+    hsb = HmsSmokeBench()
+    hsb.main(args.kml)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+### Compare full frame Pillow labels with text tiles applied to the image region
+### Also compares the full frame logo blend with the cropped logo layer
+
+import sys
+import time
+from pathlib import Path
+import numpy
+import cv2
+from PIL import Image
+from PIL import ImageFont
+from PIL import ImageDraw
+import logging
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+from indi_allsky.overlayLayer import IndiAllSkyOverlayLayer
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging
+
+
+class LabelOverlayBench(object):
+    # 20MP
+    width = 5472
+    height = 3648
+
+    rounds = 5
+
+    font_file = Path(__file__).parent.absolute().parent.joinpath('indi_allsky', 'fonts', 'hack', 'Hack-Bold.ttf')
+    font_size = 60
+    stroke_width = 4
+
+    label_lines = [
+        '20240728 04:15:30',
+        'Exposure 15.000000',
+        'Gain 100',
+        'Temp 12.5C',
+        'Stars 1234',
+        'Sun -35.2 / Moon 12.4',
+        'Moon Phase 87.2%',
+    ]
+
+
+    def __init__(self):
+        numpy.random.seed(1)
+        self.image = numpy.random.randint(0, 255, (self.height, self.width, 3), dtype=numpy.uint8)
+
+        # logo in the bottom right corner
+        self.logo = numpy.zeros((self.height, self.width, 4), dtype=numpy.uint8)
+        self.logo[self.height - 400:self.height - 100, self.width - 700:self.width - 100] = (40, 200, 240, 180)
+
+
+    def main(self):
+        logger.info('Image: %dx%d', self.width, self.height)
+
+        full_image, full_elapsed_s = self.bench(self.labelFullFrame)
+        layer_image, layer_elapsed_s = self.bench(self.labelLayers)
+
+        logger.info('Full frame labels: %0.4f s', full_elapsed_s)
+        logger.info('Text tile labels:  %0.4f s', layer_elapsed_s)
+        logger.info('Max pixel difference: %d', self.maxDiff(full_image, layer_image))
+
+
+        full_image, full_elapsed_s = self.bench(self.logoFullFrame)
+        layer_image, layer_elapsed_s = self.bench(self.logoLayer)
+
+        logger.info('Full frame logo:   %0.4f s', full_elapsed_s)
+        logger.info('Cropped logo:      %0.4f s', layer_elapsed_s)
+        logger.info('Max pixel difference: %d', self.maxDiff(full_image, layer_image))
+
+
+    def bench(self, label_func):
+        elapsed_list = list()
+
+        for x in range(self.rounds):
+            image = self.image.copy()
+
+            start = time.time()
+            image = label_func(image)
+            elapsed_list.append(time.time() - start)
+
+        return image, min(elapsed_list)
+
+
+    def maxDiff(self, image_a, image_b):
+        return int(numpy.abs(image_a.astype(numpy.int16) - image_b.astype(numpy.int16)).max())
+
+
+    def labelFullFrame(self, image):
+        # previous implementation
+        img_rgb = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        draw = ImageDraw.Draw(img_rgb)
+
+        for i, line in enumerate(self.label_lines):
+            font = ImageFont.truetype(str(self.font_file), self.font_size)
+
+            draw.text(
+                (30, 30 + (i * self.font_size)),
+                line,
+                fill=(200, 200, 200),
+                font=font,
+                stroke_width=self.stroke_width,
+                stroke_fill=(0, 0, 0),
+                anchor='la',
+            )
+
+        return cv2.cvtColor(numpy.array(img_rgb), cv2.COLOR_RGB2BGR)
+
+
+    def labelLayers(self, image):
+        for i, line in enumerate(self.label_lines):
+            font = IndiAllSkyOverlayLayer.getFont(self.font_file, self.font_size)
+
+            text_layer = IndiAllSkyOverlayLayer.fromText(
+                line,
+                font,
+                (30, 30 + (i * self.font_size)),
+                (200, 200, 200),
+                stroke_width=self.stroke_width,
+                anchor='la',
+            )
+
+            text_layer.apply(image)
+
+        return image
+
+
+    def logoFullFrame(self, image):
+        # previous implementation, the mask is loaded once
+        if not hasattr(self, '_alpha_mask'):
+            overlay_alpha = (self.logo[:, :, 3] / 255).astype(numpy.float32)
+            self._alpha_mask = numpy.dstack((overlay_alpha, overlay_alpha, overlay_alpha))
+
+        return (image * (1 - self._alpha_mask) + self.logo[:, :, :3] * self._alpha_mask).astype(numpy.uint8)
+
+
+    def logoLayer(self, image):
+        # the layer is loaded once
+        if not hasattr(self, '_logo_layer'):
+            self._logo_layer = IndiAllSkyOverlayLayer.fromBgra(self.logo)
+
+        return self._logo_layer.apply(image)
+
+
+
+if __name__ == "__main__":
+    lob = LabelOverlayBench()
+    lob.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+### Compare starting libcamera-still for every exposure with the persistent process
+### Uses fake_libcamera-still, which simulates camera initialization time
+
+import sys
+import time
+import queue
+import argparse
+from pathlib import Path
+from multiprocessing import Value
+import logging
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+from indi_allsky.camera.libcamera import IndiClientLibCameraImx477
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging
+
+
+class LibCameraPersistentBench(object):
+    fake_exec = Path(__file__).parent.absolute().joinpath('fake_libcamera-still')
+
+
+    def __init__(self, exposure, count):
+        self.exposure = exposure
+        self.count = count
+
+
+    def main(self):
+        logging.getLogger('indi_allsky').setLevel(logging.WARNING)
+
+        self.bench('Process per exposure', False)
+        self.bench('Persistent process', True)
+
+
+    def bench(self, name, persistent):
+        config = {
+            'LIBCAMERA' : {
+                'IMAGE_FILE_TYPE_DAY' : 'jpg',
+                'PERSISTENT'          : persistent,
+            },
+        }
+
+        image_q = queue.Queue()
+
+        client = IndiClientLibCameraImx477(
+            config,
+            image_q,
+            None,
+            Value('i', 1),  # gain
+            Value('i', 1),  # bin
+            Value('i', 0),  # night
+        )
+
+        client.findCcd()
+        client.ccd_device.driver_exec = str(self.fake_exec)
+
+
+        start = time.time()
+        for x in range(self.count):
+            if x == self.count // 2:
+                # the persistent process is restarted for new settings
+                client.setCcdGain(2)
+
+            client.setCcdExposure(self.exposure, sync=True, timeout=60)
+
+        elapsed_s = time.time() - start
+
+
+        client._stopPersistentProcess()
+
+
+        frame_count = 0
+        while not image_q.empty():
+            jobdata = image_q.get()
+
+            filename_p = Path(jobdata['filename'])
+            if not filename_p.exists():
+                logger.error('Frame not found: %s', filename_p)
+                sys.exit(1)
+
+            filename_p.unlink()
+            frame_count += 1
+
+
+        if frame_count != self.count:
+            logger.error('Expected %d frames, received %d', self.count, frame_count)
+            sys.exit(1)
+
+
+        logger.info(
+            '%-20s %d x %0.3fs exposures in %0.2f s (%0.2f s per frame), temp %0.1f',
+            name,
+            self.count,
+            self.exposure,
+            elapsed_s,
+            elapsed_s / self.count,
+            client.getCcdTemperature(),
+        )
+
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        '--exposure',
+        '-e',
+        help='exposure time',
+        type=float,
+        default=0.01,
+    )
+    argparser.add_argument(
+        '--count',
+        '-c',
+        help='number of exposures',
+        type=int,
+        default=10,
+    )
+
+    args = argparser.parse_args()
+
+    lcpb = LibCameraPersistentBench(args.exposure, args.count)
+    lcpb.main()
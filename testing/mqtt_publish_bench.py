@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+### Compare one-shot MQTT publishing with the persistent client
+### Uses a minimal local MQTT 3.1.1 broker stand-in with simulated connection latency
+
+import sys
+import io
+import time
+import struct
+import tempfile
+import threading
+import socketserver
+from pathlib import Path
+import logging
+
+import paho.mqtt.publish as publish
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+from indi_allsky.filetransfer import paho_mqtt
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging
+
+
+class BrokerStandIn(socketserver.BaseRequestHandler):
+    # seconds added to every new connection to simulate a slow network
+    connect_latency = 0.1
+
+    connection_count = 0
+    message_count = 0
+    retained = dict()
+
+    _lock = threading.Lock()
+
+
+    def handle(self):
+        time.sleep(self.connect_latency)
+
+        with self._lock:
+            BrokerStandIn.connection_count += 1
+
+
+        while True:
+            try:
+                packet_type, flags, body = self.readPacket()
+            except EOFError:
+                return
+
+
+            if packet_type == 1:  # CONNECT
+                self.request.sendall(b'\x20\x02\x00\x00')
+            elif packet_type == 3:  # PUBLISH
+                qos = (flags >> 1) & 0x03
+
+                topic_len = struct.unpack('!H', body[:2])[0]
+                topic = body[2:2 + topic_len].decode()
+                offset = 2 + topic_len
+
+                if qos:
+                    packet_id = body[offset:offset + 2]
+                    offset += 2
+
+                with self._lock:
+                    BrokerStandIn.message_count += 1
+                    BrokerStandIn.retained[topic] = body[offset:]
+
+                if qos == 1:
+                    self.request.sendall(b'\x40\x02' + packet_id)  # PUBACK
+                elif qos == 2:
+                    self.request.sendall(b'\x50\x02' + packet_id)  # PUBREC
+            elif packet_type == 6:  # PUBREL
+                self.request.sendall(b'\x70\x02' + body[:2])  # PUBCOMP
+            elif packet_type == 12:  # PINGREQ
+                self.request.sendall(b'\xd0\x00')
+            elif packet_type == 14:  # DISCONNECT
+                return
+
+
+    def readPacket(self):
+        header = self.readBytes(1)[0]
+
+        remaining = 0
+        multiplier = 1
+        while True:
+            b = self.readBytes(1)[0]
+            remaining += (b & 0x7f) * multiplier
+            multiplier *= 128
+
+            if not b & 0x80:
+                break
+
+        return header >> 4, header & 0x0f, self.readBytes(remaining)
+
+
+    def readBytes(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise EOFError()
+
+            data += chunk
+
+        return data
+
+
+class ThreadingBroker(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MqttPublishBench(object):
+    frame_count = 50
+    sensor_count = 60
+    image_size = 50 * 1024
+    qos = 1
+
+    base_topic = 'indi-allsky'
+
+
+    def __init__(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.local_file_p = Path(self.tmp_dir.name).joinpath('latest.jpg')
+        with io.open(str(self.local_file_p), 'wb') as f_image:
+            f_image.write(b'\0' * self.image_size)
+
+
+    def main(self):
+        broker = ThreadingBroker(('127.0.0.1', 0), BrokerStandIn)
+        self.port = broker.server_address[1]
+
+        broker_thread = threading.Thread(target=broker.serve_forever, daemon=True)
+        broker_thread.start()
+
+
+        logging.getLogger('indi_allsky').setLevel(logging.WARNING)
+
+
+        self.bench('One-shot publish', self.publishMultiple)
+        self.bench('Persistent client', lambda x: self.publishClient(x, False))
+        self.bench('Changed only', lambda x: self.publishClient(x, True))
+
+
+        broker.shutdown()
+
+
+    def bench(self, name, publish_func):
+        BrokerStandIn.connection_count = 0
+        BrokerStandIn.message_count = 0
+
+        self.client = None
+
+        start = time.time()
+        for x in range(self.frame_count):
+            publish_func(x)
+        elapsed_s = time.time() - start
+
+        if self.client:
+            self.client.close()
+
+        logger.info(
+            '%-18s %6.1f frames/s, %d connections, %d messages',
+            name,
+            self.frame_count / elapsed_s,
+            BrokerStandIn.connection_count,
+            BrokerStandIn.message_count,
+        )
+
+
+    def mqData(self, frame):
+        mq_data = dict()
+
+        # most sensor values do not change between frames
+        for i in range(self.sensor_count):
+            if i < 5:
+                mq_data['sensor_{0:d}'.format(i)] = frame
+            else:
+                mq_data['sensor_{0:d}'.format(i)] = i
+
+        return mq_data
+
+
+    def publishMultiple(self, frame):
+        message_list = list()
+
+        with io.open(str(self.local_file_p), 'rb') as f_image:
+            message_list.append({
+                'topic'   : '/'.join((self.base_topic, 'latest')),
+                'payload' : f_image.read(),
+                'qos'     : self.qos,
+                'retain'  : True,
+            })
+
+        for k, v in self.mqData(frame).items():
+            message_list.append({
+                'topic'   : '/'.join((self.base_topic, k)),
+                'payload' : v,
+                'qos'     : self.qos,
+                'retain'  : True,
+            })
+
+        publish.multiple(
+            message_list,
+            hostname='127.0.0.1',
+            port=self.port,
+            client_id='',
+            keepalive=60,
+        )
+
+
+    def connectClient(self):
+        client = paho_mqtt({})
+        client.port = self.port
+
+        client.connect(
+            transport='tcp',
+            hostname='127.0.0.1',
+            username='',
+            password='',
+            tls=False,
+            cert_bypass=False,
+        )
+
+        return client
+
+
+    def publishClient(self, frame, changed_only):
+        if not self.client:
+            self.client = self.connectClient()
+
+        self.client.put(
+            local_file=self.local_file_p,
+            image_topic='latest',
+            base_topic=self.base_topic,
+            qos=self.qos,
+            mq_data=self.mqData(frame),
+            publish_image=True,
+            changed_only=changed_only,
+        )
+
+
+
+if __name__ == "__main__":
+    mpb = MqttPublishBench()
+    mpb.main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+### Compare sequential sensor updates with the scheduled SensorWorker updates
+### A local HTTP stand-in emulates a slow and failing OpenWeatherMap API
+
+import sys
+import time
+import json
+import threading
+import http.server
+from pathlib import Path
+from multiprocessing import Array
+from multiprocessing import Value
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+from indi_allsky.sensor import SensorWorker
+from indi_allsky.sensor import SensorSchedule
+from indi_allsky.devices import sensors as indi_allsky_sensors
+from indi_allsky.devices.exceptions import SensorReadException
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging
+
+
+class WeatherApiStandIn(http.server.BaseHTTPRequestHandler):
+    # seconds before each response
+    response_delay = 4.0
+
+    # the first requests fail
+    error_count = 1
+
+    request_count = 0
+
+
+    def do_GET(self):
+        WeatherApiStandIn.request_count += 1
+
+        time.sleep(self.response_delay)
+
+        if self.request_count <= self.error_count:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+
+        r_data = {
+            'main' : {
+                'temp'       : 12.5,
+                'feels_like' : 11.0,
+                'humidity'   : 80,
+                'pressure'   : 1013,
+            },
+            'clouds' : {
+                'all' : 20,
+            },
+        }
+
+        body = json.dumps(r_data).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, *args):
+        pass
+
+
+class SensorWorkerBench(object):
+    duration = 20
+
+    # dew heater and fan control
+    control_tick = 1.0
+
+
+    def __init__(self):
+        self.config = {
+            'LOCATION_LATITUDE'  : 33.0,
+            'LOCATION_LONGITUDE' : -84.0,
+            'TEMP_SENSOR' : {
+                'OPENWEATHERMAP_APIKEY' : 'standin',
+            },
+        }
+
+
+    def main(self):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), WeatherApiStandIn)
+        self.port = server.server_address[1]
+
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+
+
+        logging.getLogger('indi_allsky').setLevel(logging.WARNING)
+
+
+        self.bench('Sequential', self.sequentialUpdate)
+        self.bench('Scheduled', self.scheduledUpdate)
+
+
+        server.shutdown()
+
+
+    def bench(self, name, update_func):
+        WeatherApiStandIn.request_count = 0
+
+        worker = self.createWorker()
+
+
+        tick_list = list()
+        next_tick = time.time()
+
+        start = time.time()
+        while time.time() - start < self.duration:
+            time.sleep(0.1)
+
+            update_func(worker)
+
+            now = time.time()
+            if now >= next_tick:
+                tick_list.append(now)
+                next_tick = now + self.control_tick
+
+
+        if worker.sensor_executor:
+            worker.sensor_executor.shutdown(wait=True)
+
+
+        tick_gap_list = [b - a for a, b in zip(tick_list, tick_list[1:])]
+
+        logger.info(
+            '%-10s control ticks: %d, max gap: %0.1fs, generator updates: %d, API requests: %d, temp: %0.1f',
+            name,
+            len(tick_list),
+            max(tick_gap_list),
+            worker.sensors[1].value_1,
+            WeatherApiStandIn.request_count,
+            worker.sensors_user_av[worker.sensors[0].slot],
+        )
+
+
+    def createWorker(self):
+        worker = SensorWorker(
+            0,
+            self.config,
+            None,
+            None,
+            Array('f', [0.0 for x in range(30)]),
+            Array('f', [0.0 for x in range(30)]),
+            Value('i', 1),
+        )
+
+        api_sensor = indi_allsky_sensors.temp_api_openweathermap(self.config, 'API', worker.night_v)
+        api_sensor.url = 'http://127.0.0.1:{0:d}/data/2.5/weather'.format(self.port)
+        api_sensor.next_run_offset = 0  # bypass the internal cache
+        api_sensor.update_interval = 2
+        api_sensor.update_timeout = 3
+        api_sensor.slot = 10
+
+        generator_sensor = indi_allsky_sensors.sensor_data_generator(self.config, 'Generator', worker.night_v)
+        generator_sensor.update_interval = 1
+        generator_sensor.slot = 20
+
+        simulator_sensor = indi_allsky_sensors.sensor_simulator(self.config, 'Simulator', worker.night_v)
+        simulator_sensor.slot = 25
+
+        worker.sensors = [api_sensor, generator_sensor, simulator_sensor]
+
+        return worker
+
+
+    def sequentialUpdate(self, worker):
+        # previous implementation, all sensors are updated on the control tick
+        now = time.time()
+        if now < getattr(worker, '_bench_next_run', 0):
+            return
+
+        worker._bench_next_run = now + self.control_tick
+
+        for sensor in worker.sensors:
+            try:
+                sensor_data = sensor.update()
+            except SensorReadException:
+                continue
+
+            for i, v in enumerate(sensor_data['data']):
+                worker.sensors_user_av[sensor.slot + i] = float(v)
+
+
+    def scheduledUpdate(self, worker):
+        if not worker.sensor_executor:
+            # normally created in init_sensors()
+            worker.sensor_executor = ThreadPoolExecutor(max_workers=len(worker.sensors))
+            worker.sensor_schedules = [SensorSchedule(sensor) for sensor in worker.sensors]
+
+        worker.update_sensors()
+
+
+
+if __name__ == "__main__":
+    swb = SensorWorkerBench()
+    swb.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+### Compare the star detection implementations on a synthetic star field
+
+import sys
+import time
+from pathlib import Path
+import cv2
+import numpy
+import logging
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+from indi_allsky.stars import IndiAllSkyStars
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging
+
+
+class FakeBin(object):
+    value = 1
+
+
+class StarsBench(object):
+    rounds = 5
+
+    ### 1k
+    width  = 1920
+    height = 1080
+
+    ### 4k
+    #width  = 3840
+    #height = 2160
+
+    star_count = 2000
+
+
+    def __init__(self):
+        self.config = {
+            'IMAGE_FOLDER'      : '/tmp',
+            'DETECT_STARS_THOLD': 0.6,
+            'DETECT_DRAW'       : False,
+            'SQM_ROI'           : [],
+            'SQM_FOV_DIV'       : 4,
+        }
+
+        self.image = self.generateStarField()
+
+
+    def generateStarField(self):
+        rng = numpy.random.default_rng(12345)
+
+        # sky background with noise
+        image = rng.normal(20, 4, (self.height, self.width)).astype(numpy.float32)
+
+        star_x = rng.integers(0, self.width, self.star_count)
+        star_y = rng.integers(0, self.height, self.star_count)
+        star_brightness = rng.uniform(40, 235, self.star_count)
+
+        for x, y, b in zip(star_x, star_y, star_brightness):
+            cv2.circle(image, (int(x), int(y)), int(rng.integers(1, 4)), float(b), cv2.FILLED)
+
+        image = cv2.GaussianBlur(image, (5, 5), 1.0)
+
+        image = numpy.clip(image, 0, 255).astype(numpy.uint8)
+
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+    def detectObjectsLoop(self, stars, original_data):
+        ### previous implementation
+        masked_img = cv2.bitwise_and(original_data, original_data, mask=stars._sqm_mask)
+        grey_img = cv2.cvtColor(masked_img, cv2.COLOR_BGR2GRAY)
+
+        result = cv2.matchTemplate(grey_img, stars.star_template, cv2.TM_CCOEFF_NORMED)
+        result_filter = numpy.where(result >= stars._detectionThreshold)
+
+        blobs = list()
+        for pt in zip(*result_filter[::-1]):
+            for blob in blobs:
+                if (abs(pt[0] - blob[0]) < stars._distanceThreshold) and (abs(pt[1] - blob[1]) < stars._distanceThreshold):
+                    break
+
+            else:
+                blobs.append(pt)
+
+        return blobs
+
+
+    def main(self):
+        stars = IndiAllSkyStars(self.config, FakeBin())
+
+        # generate the mask and search area
+        stars.detectObjects(self.image)
+
+        logging.getLogger('indi_allsky').setLevel(logging.WARNING)
+
+
+        loop_start = time.time()
+        for x in range(self.rounds):
+            loop_blobs = self.detectObjectsLoop(stars, self.image)
+        loop_elapsed_s = (time.time() - loop_start) / self.rounds
+
+
+        nms_start = time.time()
+        for x in range(self.rounds):
+            nms_blobs = stars.detectObjects(self.image)
+        nms_elapsed_s = (time.time() - nms_start) / self.rounds
+
+
+        logger.info('Loop: %d objects, %0.1fms', len(loop_blobs), loop_elapsed_s * 1000)
+        logger.info('NMS:  %d objects, %0.1fms', len(nms_blobs), nms_elapsed_s * 1000)
+
+
+        # objects found by both implementations
+        nms_a = numpy.array(nms_blobs, dtype=numpy.int32).reshape((-1, 2))
+        matched = 0
+        for x, y in loop_blobs:
+            distance = numpy.abs(nms_a - (x, y)).max(axis=1)
+            if distance.size and distance.min() < stars._distanceThreshold:
+                matched += 1
+
+        logger.info('Matched: %d of %d objects', matched, len(loop_blobs))
+
+
+
+if __name__ == "__main__":
+    sb = StarsBench()
+    sb.main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# Regression check for the number of queries used by the image and video viewers
+# Uses a temporary SQLite database
+
+import os
+import sys
+import json
+import tempfile
+from datetime import datetime
+from datetime import timedelta
+from pathlib import Path
+import logging
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+
+tmp_dir = tempfile.TemporaryDirectory()
+
+flask_config = {
+    'SQLALCHEMY_DATABASE_URI'        : 'sqlite:///{0:s}/indi-allsky.sqlite'.format(tmp_dir.name),
+    'SQLALCHEMY_TRACK_MODIFICATIONS' : False,
+    'MIGRATION_FOLDER'               : '{0:s}/migrations'.format(tmp_dir.name),
+    'SECRET_KEY'                     : 'secretkey',
+    'WTF_CSRF_ENABLED'               : False,
+    'INDI_ALLSKY_IMAGE_FOLDER'       : '/var/www/html/allsky/images',
+}
+
+flask_config_file = Path(tmp_dir.name).joinpath('flask.json')
+with open(str(flask_config_file), 'w') as f_config:
+    json.dump(flask_config, f_config)
+
+os.environ['INDI_ALLSKY_FLASK_CONFIG'] = str(flask_config_file)
+
+
+from indi_allsky.flask import create_app
+
+# setup flask context for db access
+app = create_app()
+app.app_context().push()
+
+from indi_allsky.flask import db
+from indi_allsky.flask.models import IndiAllSkyDbCameraTable
+from indi_allsky.flask.models import IndiAllSkyDbImageTable
+from indi_allsky.flask.models import IndiAllSkyDbFitsImageTable
+from indi_allsky.flask.models import IndiAllSkyDbRawImageTable
+from indi_allsky.flask.models import IndiAllSkyDbPanoramaImageTable
+from indi_allsky.flask.models import IndiAllSkyDbVideoTable
+from indi_allsky.flask.models import IndiAllSkyDbKeogramTable
+from indi_allsky.flask.models import IndiAllSkyDbStarTrailsTable
+from indi_allsky.flask.models import IndiAllSkyDbStarTrailsVideoTable
+from indi_allsky.flask.models import IndiAllSkyDbPanoramaVideoTable
+from indi_allsky.flask.models import IndiAllSkyDbThumbnailTable
+
+from indi_allsky.flask.forms import IndiAllskyImageViewer
+from indi_allsky.flask.forms import IndiAllskyVideoViewer
+
+from sqlalchemy import event
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging
+
+
+class ViewerQueryCount(object):
+    # an hour of 15 second exposures
+    image_count = 240
+
+    # queries expected regardless of the number of images
+    max_image_queries = 4
+    max_video_queries = 6
+
+
+    def __init__(self):
+        self._query_count = 0
+
+
+    def main(self):
+        db.create_all()
+
+        camera = IndiAllSkyDbCameraTable(
+            name='Test Camera',
+            friendlyName='Test Camera',
+        )
+        db.session.add(camera)
+        db.session.commit()
+
+        self.camera_id = camera.id
+
+
+        start_date = datetime(2024, 7, 28, 4, 0, 0)
+        self.addImages(start_date)
+        self.addVideos(start_date.date())
+
+        event.listen(db.engine, 'before_cursor_execute', self._countQuery)
+
+
+        failed = False
+
+        with app.test_request_context():
+            form_viewer = IndiAllskyImageViewer(camera_id=self.camera_id, local=True)
+
+            self._query_count = 0
+            images_data = form_viewer.getImages(start_date.year, start_date.month, start_date.day, start_date.hour)
+            image_queries = self._query_count
+
+            logger.info('Image viewer: %d images, %d queries', len(images_data), image_queries)
+
+            if len(images_data) != self.image_count or not all(i['fits'] and i['raw'] and i['panorama'] for i in images_data):
+                logger.error('Image viewer returned incomplete data')
+                failed = True
+
+            if image_queries > self.max_image_queries:
+                logger.error('Image viewer used %d queries, expected at most %d', image_queries, self.max_image_queries)
+                failed = True
+
+
+            form_video_viewer = IndiAllskyVideoViewer(camera_id=self.camera_id, local=True)
+
+            self._query_count = 0
+            videos_data = form_video_viewer.getVideos(start_date.year, start_date.month, 'all')
+            video_queries = self._query_count
+
+            logger.info('Video viewer: %d videos, %d queries', len(videos_data), video_queries)
+
+            if not all(v['keogram_id'] > 0 and v['startrail_id'] > 0 and v['keogram_thumbnail'] != 'None' for v in videos_data):
+                logger.error('Video viewer returned incomplete data')
+                failed = True
+
+            if video_queries > self.max_video_queries:
+                logger.error('Video viewer used %d queries, expected at most %d', video_queries, self.max_video_queries)
+                failed = True
+
+
+        if failed:
+            sys.exit(1)
+
+        logger.info('Passed')
+
+
+    def _countQuery(self, conn, cursor, statement, parameters, context, executemany):
+        self._query_count += 1
+
+
+    def addImages(self, start_date):
+        for x in range(self.image_count):
+            createDate = start_date + timedelta(seconds=x * 15)
+
+            file_kwargs = {
+                'createDate'       : createDate,
+                'createDate_year'  : createDate.year,
+                'createDate_month' : createDate.month,
+                'createDate_day'   : createDate.day,
+                'createDate_hour'  : createDate.hour,
+                'dayDate'          : createDate.date(),
+                'exposure'         : 15.0,
+                'gain'             : 100,
+                'night'            : True,
+                'camera_id'        : self.camera_id,
+            }
+
+            db.session.add(IndiAllSkyDbImageTable(filename='image_{0:d}.jpg'.format(x), adu=20.0, **file_kwargs))
+            db.session.add(IndiAllSkyDbFitsImageTable(filename='image_{0:d}.fit'.format(x), **file_kwargs))
+            db.session.add(IndiAllSkyDbRawImageTable(filename='image_{0:d}.png'.format(x), **file_kwargs))
+            db.session.add(IndiAllSkyDbPanoramaImageTable(filename='panorama_{0:d}.jpg'.format(x), **file_kwargs))
+
+        db.session.commit()
+
+
+    def addVideos(self, start_day):
+        for x in range(28):
+            dayDate = start_day - timedelta(days=x)
+
+            if dayDate.month != start_day.month:
+                break
+
+            for night in (True, False):
+                name = '{0:s}_{1:d}'.format(dayDate.strftime('%Y%m%d'), int(night))
+
+                file_kwargs = {
+                    'dayDate'   : dayDate,
+                    'night'     : night,
+                    'camera_id' : self.camera_id,
+                }
+
+                keogram_thumbnail_uuid = 'k{0:s}'.format(name)
+                startrail_thumbnail_uuid = 's{0:s}'.format(name)
+
+                db.session.add(IndiAllSkyDbVideoTable(filename='video_{0:s}.mp4'.format(name), dayDate_year=dayDate.year, dayDate_month=dayDate.month, **file_kwargs))
+                db.session.add(IndiAllSkyDbKeogramTable(filename='keogram_{0:s}.jpg'.format(name), thumbnail_uuid=keogram_thumbnail_uuid, **file_kwargs))
+                db.session.add(IndiAllSkyDbStarTrailsTable(filename='startrail_{0:s}.jpg'.format(name), thumbnail_uuid=startrail_thumbnail_uuid, **file_kwargs))
+                db.session.add(IndiAllSkyDbStarTrailsVideoTable(filename='startrail_{0:s}.mp4'.format(name), **file_kwargs))
+                db.session.add(IndiAllSkyDbPanoramaVideoTable(filename='panorama_{0:s}.mp4'.format(name), **file_kwargs))
+                db.session.add(IndiAllSkyDbThumbnailTable(uuid=keogram_thumbnail_uuid, filename='keogram_{0:s}_thumb.jpg'.format(name), camera_id=self.camera_id))
+                db.session.add(IndiAllSkyDbThumbnailTable(uuid=startrail_thumbnail_uuid, filename='startrail_{0:s}_thumb.jpg'.format(name), camera_id=self.camera_id))
+
+        db.session.commit()
+
+
+
+if __name__ == "__main__":
+    vqc = ViewerQueryCount()
+    vqc.main()